@@ -6,6 +6,7 @@ The `urlpatterns` list routes URLs to views. For more information please see:
 """
 
 from arvelloapp import views
+from arvello_fiscal import views as fiscal_views
 from django.contrib import admin
 from django.urls import path
 from django.shortcuts import redirect
@@ -39,12 +40,14 @@ document_patterns = [
     path('inventory_label/<int:pk>/', views.inventory_label, name='inventory_label'),
     path('product_label/<int:pk>/', views.product_label, name='product_label'),
     path('invoices/send_email/<int:invoice_id>/', views.send_invoice_email, name='send_invoice_email'),
+    path('invoices/send_email/', views.send_invoice_emails, name='send_invoice_emails'),
     path('mark_offer_finished/<int:offer_id>/', views.mark_offer_finished, name='mark_offer_finished'),
 ]
 
 table_exports = [
     path('export_inventory_excel/', views.export_inventory_to_excel, name='export_inventory_to_excel'),
     path('export_inventory_csv/', views.export_inventory_to_csv, name='export_inventory_to_csv'),
+    path('export/<str:name>.<str:file_format>', views.export_table, name='export_table'),
 ]
 
 # Financijski URL-ovi
@@ -60,6 +63,9 @@ hr_patterns = [
     path('employees/', views.employees, name='employees'),
     path('salaries/', views.salaries, name='salaries'),
     path('payslip/<int:salary_id>/', views.salary_payslip, name='salary_payslip'),
+    path('payslip/<int:salary_id>/send/', views.send_payslip, name='send_payslip'),
+    path('payslips/send/', views.send_period_payslips, name='send_period_payslips'),
+    path('payslips/zip/', views.download_period_payslips, name='download_period_payslips'),
     path('employee-api/<int:employee_id>/', views.employee_api, name='employee_api'),
 ]
 
@@ -101,12 +107,15 @@ api_patterns = [
 fiscal_patterns = [
     path('fiscal/configs/', views.fiscal_configs, name='fiscal_configs'),
     path('invoices/<int:invoice_id>/fiscal/retry/', views.retry_fiscalization, name='retry_fiscalization'),
+    path('fiscal/dashboard/', fiscal_views.fiscal_dashboard, name='fiscal_dashboard'),
+    path('metrics', fiscal_views.prometheus_metrics, name='fiscal_metrics'),
 ]
 
 # Admin/Superuser URL-ovi
 admin_patterns = [
     path('email-config/', views.email_config, name='email_config'),
     path('court-registry-config/', views.court_registry_config, name='court_registry_config'),
+    path('profiling/stats/', views.profiling_stats, name='profiling_stats'),
 ]
 
 # User URL-ovi
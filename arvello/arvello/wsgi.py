@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'arvello.settings')
 
 application = get_wsgi_application()
+
+# Pokreni procese za izradu PDF-a unaprijed kako prvi zahtjev ne bi čekao
+from arvelloapp.utils.pdf_pool import warm_pool  # noqa: E402
+
+warm_pool()
@@ -1,4 +1,6 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+from ..documents import FiscalDocumentData, build_fiscal_document
 
 
 class ProviderAdapter:
@@ -6,6 +8,33 @@ class ProviderAdapter:
 
     def __init__(self, mode: str = "production"):
         self.mode = mode
+        # HTTP session (keep-alive) set by the adapter registry; None uses plain requests calls
+        self.session = None
+        self._keys = {}
+
+    @property
+    def http(self):
+        """Object with requests' post/get API: the pooled session or the requests module."""
+        if self.session is not None:
+            return self.session
+        import requests
+        return requests
+
+    def loaded_key(self, name: str, loader):
+        """Return a key/certificate loaded once per adapter instance."""
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = loader()
+        return key
+
+    @staticmethod
+    def fiscal_document(document: Any):
+        """Return FiscalDocumentData for an invoice (or the data itself); None for other documents."""
+        if isinstance(document, FiscalDocumentData):
+            return document
+        if hasattr(document, 'get_fiscal_data'):
+            return build_fiscal_document(document)
+        return None
 
     def prepare_payload(self, document: Any) -> Dict:
         """Map domain document to provider payload."""
@@ -23,6 +52,18 @@ class ProviderAdapter:
         """Parse provider response into structured dict."""
         raise NotImplementedError()
 
+    def http_request(self, signed_payload: Any) -> Optional[Dict]:
+        """Describe the HTTP POST `send` would make (url, content, headers, timeout).
+
+        Used by senders with their own HTTP client (fiscal_async_worker). None
+        means the adapter answers without HTTP (sandbox); use `send` then.
+        """
+        return None
+
+    def parse_http_response(self, signed_payload: Any, text: str) -> Dict:
+        """Parse the body of a successful response to `http_request` like `send` does."""
+        raise NotImplementedError()
+
     def fiscalize(self, document: Any) -> Dict:
         """High-level fiscalization method that orchestrates the process."""
         payload = self.prepare_payload(document)
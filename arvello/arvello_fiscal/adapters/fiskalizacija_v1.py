@@ -1,5 +1,7 @@
 import logging
+import uuid
 from .base import ProviderAdapter
+from .xml_templates import F1_ENVELOPE, F1_VAT, SOAP_NS, SoapPayload
 from lxml import etree
 from datetime import datetime
 import xmlsec
@@ -8,6 +10,14 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Payment method mapping (NacinPlac)
+PAYMENT_METHODS = {
+    'cash': 'G',
+    'card': 'K',
+    'bank_transfer': 'C',
+    'other': 'C'
+}
+
 
 class FiskalizacijaV1Adapter(ProviderAdapter):
     """Adapter for Fiskalizacija v1 (XML + PKI signing).
@@ -21,100 +31,76 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         self.cert_meta = cert_meta or {}
 
     def prepare_payload(self, document):
-        """Priprema XML payload za fiskalizaciju v1."""
-        if hasattr(document, 'get_fiscal_data'):
-            fiscal_data = document.get_fiscal_data()
-            return self._create_racun_zahtjev_xml(fiscal_data)
+        """Priprema SOAP payload (RacunZahtjev u omotnici) za fiskalizaciju v1."""
+        fiscal_document = self.fiscal_document(document)
+        if fiscal_document is not None:
+            return self.build_payload(fiscal_document.as_dict())
         else:
             # Legacy fallback
             return self._create_basic_xml(document)
-    
-    def _create_racun_zahtjev_xml(self, fiscal_data):
-        """Stvara RacunZahtjev XML strukturu prema F1 fiskalnim specifikacijama."""
-        from lxml import etree
-        import uuid
-        from datetime import datetime
-        
-        # Namespace
-        ns = 'tns'
-        ns_uri = 'http://www.apis-it.hr/fin/2012/types/f73'
-        
-        # Generate unique ID and UUID
-        uri_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        
-        # Root element
-        root = etree.Element(f'{{{ns_uri}}}RacunZahtjev', nsmap={ns: ns_uri})
-        root.set('Id', uri_id)
-        
+
+    def build_payload(self, fiscal_data):
+        """Popunjava kopiju predloška SOAP omotnice s RacunZahtjev prema F1 specifikacijama.
+
+        Vraća SoapPayload; potpisuje se na mjestu i serijalizira jednom u sign_payload.
+        """
+        envelope, slots = F1_ENVELOPE.new()
+        request = slots['request']
+        request.set('Id', str(uuid.uuid4()))
+
         # Zaglavlje (Header)
-        zaglavlje = etree.SubElement(root, f'{{{ns_uri}}}Zaglavlje')
-        etree.SubElement(zaglavlje, f'{{{ns_uri}}}IdPoruke').text = message_id
-        etree.SubElement(zaglavlje, f'{{{ns_uri}}}DatumVrijeme').text = datetime.utcnow().strftime('%d.%m.%YT%H:%M:%S')
-        
-        # Racun (Invoice)
-        racun = etree.SubElement(root, f'{{{ns_uri}}}Racun')
-        
+        slots['message_id'].text = str(uuid.uuid4())
+        slots['sent_at'].text = datetime.utcnow().strftime('%d.%m.%YT%H:%M:%S')
+
         # Issuer data
         issuer = fiscal_data['issuer_data']
-        etree.SubElement(racun, f'{{{ns_uri}}}Oib').text = issuer['oib']
-        etree.SubElement(racun, f'{{{ns_uri}}}USustPdv').text = '1'  # Always 1 for VAT payers
-        
+        slots['oib'].text = issuer['oib']
+
         # Invoice timestamp - must be exact to the second
         invoice = fiscal_data['invoice_data']
         invoice_datetime = f"{invoice['date']}T{datetime.now().strftime('%H:%M:%S')}"  # Use current time for demo
-        etree.SubElement(racun, f'{{{ns_uri}}}DatVrijeme').text = invoice_datetime.replace('-', '.')
-        
-        # Sequence type: P (location level) or N (device level)
-        etree.SubElement(racun, f'{{{ns_uri}}}OznSlijed').text = 'P'
-        
-        # Invoice number breakdown
-        br_rac = etree.SubElement(racun, f'{{{ns_uri}}}BrRac')
-        # Parse invoice number components (assuming format: sequential/location/device)
-        number_parts = invoice['number'].split('/')
-        if len(number_parts) >= 3:
-            etree.SubElement(br_rac, f'{{{ns_uri}}}BrOznRac').text = number_parts[0]
-            etree.SubElement(br_rac, f'{{{ns_uri}}}OznPosPr').text = number_parts[1]
-            etree.SubElement(br_rac, f'{{{ns_uri}}}OznNapUr').text = number_parts[2]
-        else:
-            # Fallback if number format is different
-            etree.SubElement(br_rac, f'{{{ns_uri}}}BrOznRac').text = invoice['number']
-            etree.SubElement(br_rac, f'{{{ns_uri}}}OznPosPr').text = invoice.get('fiscal_location', 'POS1')
-            etree.SubElement(br_rac, f'{{{ns_uri}}}OznNapUr').text = invoice.get('fiscal_device_id', 'DEV1')
-        
+        slots['issued_at'].text = invoice_datetime.replace('-', '.')
+
+        # Invoice number breakdown (sequential/location/device)
+        br_ozn_rac, ozn_pos_pr, ozn_nap_ur = self._number_parts(invoice)
+        slots['number'].text = br_ozn_rac
+        slots['location'].text = ozn_pos_pr
+        slots['device'].text = ozn_nap_ur
+
         # PDV (VAT) information
-        pdv = etree.SubElement(racun, f'{{{ns_uri}}}Pdv')
         for vat_rate, vat_data in fiscal_data['vat_summary'].items():
-            porez = etree.SubElement(pdv, f'{{{ns_uri}}}Porez')
-            etree.SubElement(porez, f'{{{ns_uri}}}Stopa').text = f"{vat_rate:.2f}"
-            etree.SubElement(porez, f'{{{ns_uri}}}Osnovica').text = f"{vat_data['base_amount']:.2f}"
-            etree.SubElement(porez, f'{{{ns_uri}}}Iznos').text = f"{vat_data['vat_amount']:.2f}"
-        
+            porez, porez_slots = F1_VAT.new()
+            porez_slots['rate'].text = f"{vat_rate:.2f}"
+            porez_slots['base'].text = f"{vat_data['base_amount']:.2f}"
+            porez_slots['amount'].text = f"{vat_data['vat_amount']:.2f}"
+            slots['vat'].append(porez)
+
         # Total amount
         totals = fiscal_data['totals']
-        etree.SubElement(racun, f'{{{ns_uri}}}IznosUkupno').text = f"{totals['total_amount']:.2f}"
-        
+        slots['total'].text = f"{totals['total_amount']:.2f}"
+
         # Payment method mapping
-        payment_mapping = {
-            'cash': 'G',
-            'card': 'K',
-            'bank_transfer': 'C',
-            'other': 'C'
-        }
-        payment_method = payment_mapping.get(invoice.get('payment_method', 'cash'), 'G')
-        etree.SubElement(racun, f'{{{ns_uri}}}NacinPlac').text = payment_method
-        
+        slots['payment_method'].text = PAYMENT_METHODS.get(invoice.get('payment_method', 'cash'), 'G')
+
         # Operator OIB
-        etree.SubElement(racun, f'{{{ns_uri}}}OibOper').text = invoice.get('fiscal_operator_oib') or issuer['oib']
-        
-        # Security code (ZastKod) - calculate properly
-        zast_kod = self._calculate_security_code(fiscal_data)
-        etree.SubElement(racun, f'{{{ns_uri}}}ZastKod').text = zast_kod
-        
-        # Delivery note (NakDost) - 0 for retail pickup, 1 for delivery
-        etree.SubElement(racun, f'{{{ns_uri}}}NakDost').text = '0'
-        
-        return etree.tostring(root, pretty_print=True, encoding='utf-8', xml_declaration=True)
+        slots['operator_oib'].text = invoice.get('fiscal_operator_oib') or issuer['oib']
+
+        # Security code (ZastKod) - same timestamp as DatVrijeme
+        slots['zki'].text = self._calculate_security_code(fiscal_data, dat_vrijeme=invoice_datetime)
+
+        return SoapPayload(envelope=envelope, document=request, invoice_id=invoice['number'])
+
+    def _create_racun_zahtjev_xml(self, fiscal_data):
+        """Stvara samostalni RacunZahtjev XML (bez SOAP omotnice)."""
+        return self.build_payload(fiscal_data).document_bytes()
+
+    @staticmethod
+    def _number_parts(invoice):
+        number_parts = invoice['number'].split('/')
+        if len(number_parts) >= 3:
+            return number_parts[0], number_parts[1], number_parts[2]
+        # Fallback if number format is different
+        return invoice['number'], invoice.get('fiscal_location', 'POS1'), invoice.get('fiscal_device_id', 'DEV1')
     
     def _calculate_security_code(self, fiscal_data, dat_vrijeme=None):
         """Calculate ZastKod (security code) per Croatian fiscalization spec.
@@ -125,9 +111,8 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         3. MD5 hash the signature bytes to produce the ZKI
         """
         import hashlib
-        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives import hashes
         from cryptography.hazmat.primitives.asymmetric import padding
-        from cryptography.hazmat.backends import default_backend
         
         issuer = fiscal_data['issuer_data']
         invoice = fiscal_data['invoice_data']
@@ -141,15 +126,7 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         oib = issuer['oib']
         
         # Parse invoice number components
-        number_parts = invoice['number'].split('/')
-        if len(number_parts) >= 3:
-            br_ozn_rac = number_parts[0]
-            ozn_pos_pr = number_parts[1]
-            ozn_nap_ur = number_parts[2]
-        else:
-            br_ozn_rac = invoice['number']
-            ozn_pos_pr = invoice.get('fiscal_location', 'POS1')
-            ozn_nap_ur = invoice.get('fiscal_device_id', 'DEV1')
+        br_ozn_rac, ozn_pos_pr, ozn_nap_ur = self._number_parts(invoice)
         
         iznos_ukupno = f"{totals['total_amount']:.2f}"
         
@@ -163,19 +140,7 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
             return hashlib.md5(unsigned_string.encode('utf-8')).hexdigest()
         
         try:
-            # Load private key
-            with open(key_path, 'rb') as key_file:
-                key_data = key_file.read()
-            
-            password = self.cert_meta.get('password')
-            if password:
-                password = password.encode('utf-8')
-            
-            private_key = serialization.load_pem_private_key(
-                key_data,
-                password=password,
-                backend=default_backend()
-            )
+            private_key = self.loaded_key('zki', self._load_private_key)
             
             # Sign with RSA-SHA1 (PKCS#1 v1.5 padding)
             signature = private_key.sign(
@@ -193,6 +158,30 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
             # Fallback for testing - should not happen in production
             return hashlib.md5(unsigned_string.encode('utf-8')).hexdigest()
     
+    def _load_private_key(self):
+        """Load the private key used for ZKI (loaded once per cached adapter)."""
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.backends import default_backend
+        
+        with open(self.cert_meta['key_path'], 'rb') as key_file:
+            key_data = key_file.read()
+        
+        password = self.cert_meta.get('password')
+        if password:
+            password = password.encode('utf-8')
+        
+        return serialization.load_pem_private_key(
+            key_data,
+            password=password,
+            backend=default_backend()
+        )
+
+    def _load_signing_key(self):
+        """Load the xmlsec key with its certificate for XML-DSIG."""
+        key = xmlsec.Key.from_file(self.cert_meta['key_path'], xmlsec.KeyFormat.PEM)
+        key.load_cert_from_file(self.cert_meta['cert_path'], xmlsec.KeyFormat.PEM)
+        return key
+
     def _create_basic_xml(self, document):
         """Legacy XML creation for backward compatibility."""
         root = etree.Element('ObrazacJOPPD')
@@ -212,10 +201,11 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         return xml
 
     def sign_payload(self, payload):
-        """Sign the RacunZahtjev XML with XML-DSig."""
+        """Sign the RacunZahtjev in place inside its SOAP envelope and serialize once."""
+        payload = self._soap_payload(payload)
         if self.mode == 'sandbox':
-            # For sandbox, skip actual signing and just wrap in SOAP envelope
-            return self._create_soap_envelope(payload)
+            # For sandbox, skip actual signing
+            return payload.serialize()
         
         # Production signing logic
         cert_path = self.cert_meta.get('cert_path')
@@ -223,8 +213,7 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         if not cert_path or not key_path:
             raise ValueError("Certificate and key paths required for production signing")
 
-        # Parse XML
-        root = etree.fromstring(payload)
+        root = payload.document
         
         # Create signature template - MUST use RSA_SHA1 per Croatian fiscalization spec
         signature_node = xmlsec.template.create(root, xmlsec.Transform.EXCL_C14N, xmlsec.Transform.RSA_SHA1)
@@ -233,60 +222,62 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
         # Add reference with URI to the RacunZahtjev element - SHA1 digest
         uri_id = root.get('Id')
         ref = xmlsec.template.add_reference(signature_node, xmlsec.Transform.SHA1, uri=f"#{uri_id}")
+        xmlsec.template.add_transform(ref, xmlsec.Transform.ENVELOPED)
         xmlsec.template.add_transform(ref, xmlsec.Transform.EXCL_C14N)
         
         # Add key info
         key_info = xmlsec.template.ensure_key_info(signature_node)
         xmlsec.template.add_x509_data(key_info)
         
-        # Load key
-        key = xmlsec.Key.from_file(key_path, xmlsec.KeyFormat.PEM)
-        key.load_cert_from_file(cert_path, xmlsec.KeyFormat.PEM)
-        
-        # Sign
+        # Sign (Id must be registered for the #uri reference to resolve)
         ctx = xmlsec.SignatureContext()
-        ctx.key = key
+        ctx.key = self.loaded_key('xmlsec', self._load_signing_key)
+        ctx.register_id(root, 'Id')
         ctx.sign(signature_node)
         
-        # Convert to string for SOAP envelope
-        signed_xml_str = etree.tostring(root, encoding='utf-8', xml_declaration=False).decode('utf-8')
-        soap_envelope = self._create_soap_envelope(signed_xml_str)
-        
-        return soap_envelope
+        return payload.serialize()
     
-    def _create_soap_envelope(self, signed_xml):
-        """Wrap signed XML in SOAP envelope."""
-        soap_ns = 'http://schemas.xmlsoap.org/soap/envelope/'
-        
-        # Handle both string and bytes input
-        if isinstance(signed_xml, bytes):
-            signed_xml = signed_xml.decode('utf-8')
-        
-        # Remove XML declaration if present
-        if signed_xml.startswith('<?xml'):
-            signed_xml = signed_xml.split('?>', 1)[1].strip()
-        
-        # Parse signed XML
-        signed_root = etree.fromstring(signed_xml)
-        
-        # Create SOAP envelope
-        envelope = etree.Element(f'{{{soap_ns}}}Envelope', nsmap={'soapenv': soap_ns})
-        body = etree.SubElement(envelope, f'{{{soap_ns}}}Body')
-        
-        # Import and append the signed RacunZahtjev
-        body.append(signed_root)
-        
-        return etree.tostring(envelope, encoding='utf-8', xml_declaration=True)
+    def _soap_payload(self, payload):
+        """Return a SoapPayload; legacy XML bytes/str are parsed once and wrapped."""
+        if isinstance(payload, SoapPayload):
+            return payload
+        return self._create_soap_envelope(payload)
 
-    def send(self, signed_payload):
+    def _create_soap_envelope(self, xml):
+        """Wrap standalone RacunZahtjev XML in a SOAP envelope (legacy input)."""
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        document = etree.fromstring(xml)
+        envelope = etree.Element(f'{{{SOAP_NS}}}Envelope', nsmap={'soapenv': SOAP_NS})
+        body = etree.SubElement(envelope, f'{{{SOAP_NS}}}Body')
+        body.append(document)
+        return SoapPayload(envelope=envelope, document=document)
+
+    def http_request(self, signed_payload):
+        """HTTP POST to CIS for a signed envelope; None in sandbox mode."""
         if self.mode == 'sandbox' or not self.endpoint:
+            return None
+        return {
+            'url': self.endpoint,
+            'content': signed_payload,
+            'headers': {'Content-Type': 'text/xml; charset=utf-8'},
+            'timeout': 30,
+        }
+
+    def parse_http_response(self, signed_payload, text):
+        return self._parse_soap_response(text)
+
+    def send(self, signed_payload):
+        request = self.http_request(signed_payload)
+        if request is None:
             return {'status': 'OK', 'message': 'sandbox response', 'jir': 'V1-SANDBOX-JIR'}
 
-        headers = {'Content-Type': 'text/xml; charset=utf-8'}
         try:
-            response = requests.post(self.endpoint, data=signed_payload, headers=headers, timeout=30)
+            response = self.http.post(
+                request['url'], data=request['content'], headers=request['headers'], timeout=request['timeout'],
+            )
             response.raise_for_status()
-            return self._parse_soap_response(response.text)
+            return self.parse_http_response(signed_payload, response.text)
         except requests.RequestException as e:
             logger.error(f'HTTP request failed: {e}')
             raise
@@ -294,7 +285,8 @@ class FiskalizacijaV1Adapter(ProviderAdapter):
     def _parse_soap_response(self, soap_response):
         """Parse SOAP response and extract RacunOdgovor data."""
         try:
-            root = etree.fromstring(soap_response)
+            # lxml rejects str input with an encoding declaration (as CIS sends it)
+            root = etree.fromstring(soap_response.encode('utf-8') if isinstance(soap_response, str) else soap_response)
             
             # Find RacunOdgovor in SOAP body
             ns = {'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
@@ -20,6 +20,9 @@ import hashlib
 from datetime import datetime
 from decimal import Decimal
 from .base import ProviderAdapter
+from .xml_templates import (
+    F2_ENVELOPE, F2_INVOICE_LINE, F2_TAX_SUBTOTAL, SOAP_NS, SoapPayload, remove,
+)
 from lxml import etree
 import requests
 
@@ -34,7 +37,6 @@ UBL_NS = 'urn:oasis:names:specification:ubl:schema:xsd:Invoice-2'
 CBC_NS = 'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2'
 CAC_NS = 'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2'
 DS_NS = 'http://www.w3.org/2000/09/xmldsig#'
-SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
 
 NSMAP = {
     None: UBL_NS,
@@ -42,6 +44,14 @@ NSMAP = {
     'cac': CAC_NS,
 }
 
+# Payment means code mapping (UNCL 4461)
+PAYMENT_MEANS_CODES = {
+    'cash': '10',           # In cash
+    'card': '48',           # Bank card
+    'bank_transfer': '30',  # Credit transfer
+    'other': '1',           # Instrument not defined
+}
+
 
 class FINAeRacunAdapter(ProviderAdapter):
     """Adapter for FINA eRačun (Croatian B2B/B2G electronic invoicing).
@@ -56,19 +66,20 @@ class FINAeRacunAdapter(ProviderAdapter):
         self.cert_meta = cert_meta or {}
 
     def prepare_payload(self, document):
-        """Prepare UBL 2.1 Invoice XML for FINA eRačun."""
-        if hasattr(document, 'get_fiscal_data'):
-            fiscal_data = document.get_fiscal_data()
-            return self._create_ubl_invoice(fiscal_data)
+        """Prepare UBL 2.1 Invoice in the FINA SOAP envelope (SoapPayload)."""
+        fiscal_document = self.fiscal_document(document)
+        if fiscal_document is not None:
+            return self.build_payload(fiscal_document.as_dict())
         else:
             # Legacy fallback - create minimal UBL from dict
             return self._create_basic_ubl(document)
 
-    def _create_ubl_invoice(self, fiscal_data):
-        """Create UBL 2.1 Invoice XML per FINA eRačun specification.
+    def build_payload(self, fiscal_data):
+        """Fill a copy of the SOAP/UBL 2.1 skeleton per FINA eRačun specification.
         
         Structure follows EN 16931 (European e-invoicing semantic data model)
-        and Croatian national rules for B2B/B2G invoicing.
+        and Croatian national rules for B2B/B2G invoicing. The invoice is
+        signed in place and the envelope serialized once in sign_payload.
         """
         # Generate unique invoice UUID
         invoice_uuid = str(uuid.uuid4())
@@ -78,185 +89,99 @@ class FINAeRacunAdapter(ProviderAdapter):
         totals = fiscal_data['totals']
         buyer = fiscal_data.get('buyer_data') or {}
         
-        # Create root Invoice element
-        root = etree.Element('{%s}Invoice' % UBL_NS, nsmap=NSMAP)
-        
-        # UBL Version ID
-        etree.SubElement(root, '{%s}UBLVersionID' % CBC_NS).text = '2.1'
-        
-        # Customization ID - FINA Croatia profile
-        etree.SubElement(root, '{%s}CustomizationID' % CBC_NS).text = \
-            'urn:cen.eu:en16931:2017#compliant#urn:fina.hr:eracun'
-        
-        # Profile ID - FINA eRačun
-        etree.SubElement(root, '{%s}ProfileID' % CBC_NS).text = 'HR:ERACUN'
+        envelope, slots = F2_ENVELOPE.new()
+        slots['document_uuid'].text = invoice_uuid
         
-        # Invoice ID (unique identifier)
-        etree.SubElement(root, '{%s}ID' % CBC_NS).text = invoice['number']
-        
-        # Invoice UUID
-        etree.SubElement(root, '{%s}UUID' % CBC_NS).text = invoice_uuid
-        
-        # Issue Date
-        etree.SubElement(root, '{%s}IssueDate' % CBC_NS).text = invoice['date']
-        
-        # Due Date
+        # Invoice identification and dates
+        slots['number'].text = invoice['number']
+        slots['uuid'].text = invoice_uuid
+        slots['issue_date'].text = invoice['date']
         if invoice.get('due_date'):
-            etree.SubElement(root, '{%s}DueDate' % CBC_NS).text = invoice['due_date']
-        
-        # Invoice Type Code (380 = Commercial invoice)
-        etree.SubElement(root, '{%s}InvoiceTypeCode' % CBC_NS).text = '380'
-        
-        # Note (optional)
+            slots['due_date'].text = invoice['due_date']
+        else:
+            remove(slots['due_date'])
         if invoice.get('notes'):
-            etree.SubElement(root, '{%s}Note' % CBC_NS).text = invoice['notes']
-        
-        # Document Currency Code
-        etree.SubElement(root, '{%s}DocumentCurrencyCode' % CBC_NS).text = 'EUR'
+            slots['note'].text = invoice['notes']
+        else:
+            remove(slots['note'])
         
         # Accounting Supplier Party (Seller/Issuer)
-        supplier_party = etree.SubElement(root, '{%s}AccountingSupplierParty' % CAC_NS)
-        party = etree.SubElement(supplier_party, '{%s}Party' % CAC_NS)
-        
-        # Seller endpoint ID (OIB)
-        endpoint = etree.SubElement(party, '{%s}EndpointID' % CBC_NS, schemeID='HR:OIB')
-        endpoint.text = issuer['oib']
-        
-        # Seller identification
-        party_id = etree.SubElement(party, '{%s}PartyIdentification' % CAC_NS)
-        etree.SubElement(party_id, '{%s}ID' % CBC_NS, schemeID='HR:OIB').text = issuer['oib']
-        
-        # Seller name
-        party_name = etree.SubElement(party, '{%s}PartyName' % CAC_NS)
-        etree.SubElement(party_name, '{%s}Name' % CBC_NS).text = issuer['name']
-        
-        # Seller postal address
-        postal_addr = etree.SubElement(party, '{%s}PostalAddress' % CAC_NS)
-        etree.SubElement(postal_addr, '{%s}StreetName' % CBC_NS).text = issuer.get('address', '')
-        etree.SubElement(postal_addr, '{%s}CityName' % CBC_NS).text = issuer.get('city', '')
-        etree.SubElement(postal_addr, '{%s}PostalZone' % CBC_NS).text = issuer.get('postal_code', '')
-        country = etree.SubElement(postal_addr, '{%s}Country' % CAC_NS)
-        etree.SubElement(country, '{%s}IdentificationCode' % CBC_NS).text = 'HR'
-        
-        # Seller VAT ID
+        slots['seller_endpoint'].text = issuer['oib']
+        slots['seller_id'].text = issuer['oib']
+        slots['seller_name'].text = issuer['name']
+        slots['seller_street'].text = issuer.get('address', '')
+        slots['seller_city'].text = issuer.get('city', '')
+        slots['seller_postal_zone'].text = issuer.get('postal_code', '')
         if issuer.get('vat_id'):
-            tax_scheme = etree.SubElement(party, '{%s}PartyTaxScheme' % CAC_NS)
-            etree.SubElement(tax_scheme, '{%s}CompanyID' % CBC_NS).text = issuer['vat_id']
-            scheme = etree.SubElement(tax_scheme, '{%s}TaxScheme' % CAC_NS)
-            etree.SubElement(scheme, '{%s}ID' % CBC_NS).text = 'VAT'
-        
-        # Seller legal entity
-        legal_entity = etree.SubElement(party, '{%s}PartyLegalEntity' % CAC_NS)
-        etree.SubElement(legal_entity, '{%s}RegistrationName' % CBC_NS).text = issuer['name']
-        etree.SubElement(legal_entity, '{%s}CompanyID' % CBC_NS, schemeID='HR:OIB').text = issuer['oib']
+            slots['seller_vat_id'].text = issuer['vat_id']
+        else:
+            remove(slots['seller_tax_scheme'])
+        slots['seller_registration_name'].text = issuer['name']
+        slots['seller_company_id'].text = issuer['oib']
         
         # Accounting Customer Party (Buyer)
-        customer_party = etree.SubElement(root, '{%s}AccountingCustomerParty' % CAC_NS)
-        buyer_party = etree.SubElement(customer_party, '{%s}Party' % CAC_NS)
-        
         if buyer:
-            # Buyer endpoint ID (OIB)
-            buyer_endpoint = etree.SubElement(buyer_party, '{%s}EndpointID' % CBC_NS, schemeID='HR:OIB')
-            buyer_endpoint.text = buyer.get('oib', '')
-            
-            # Buyer identification
-            buyer_party_id = etree.SubElement(buyer_party, '{%s}PartyIdentification' % CAC_NS)
-            etree.SubElement(buyer_party_id, '{%s}ID' % CBC_NS, schemeID='HR:OIB').text = buyer.get('oib', '')
-            
-            # Buyer name
-            buyer_name = etree.SubElement(buyer_party, '{%s}PartyName' % CAC_NS)
-            etree.SubElement(buyer_name, '{%s}Name' % CBC_NS).text = buyer.get('name', '')
-            
-            # Buyer postal address
-            buyer_postal = etree.SubElement(buyer_party, '{%s}PostalAddress' % CAC_NS)
-            etree.SubElement(buyer_postal, '{%s}StreetName' % CBC_NS).text = buyer.get('address', '')
-            etree.SubElement(buyer_postal, '{%s}CityName' % CBC_NS).text = buyer.get('city', '')
-            etree.SubElement(buyer_postal, '{%s}PostalZone' % CBC_NS).text = buyer.get('postal_code', '')
-            buyer_country = etree.SubElement(buyer_postal, '{%s}Country' % CAC_NS)
-            etree.SubElement(buyer_country, '{%s}IdentificationCode' % CBC_NS).text = 'HR'
-            
-            # Buyer legal entity
-            buyer_legal = etree.SubElement(buyer_party, '{%s}PartyLegalEntity' % CAC_NS)
-            etree.SubElement(buyer_legal, '{%s}RegistrationName' % CBC_NS).text = buyer.get('name', '')
+            slots['buyer_endpoint'].text = buyer.get('oib', '')
+            slots['buyer_id'].text = buyer.get('oib', '')
+            slots['buyer_name'].text = buyer.get('name', '')
+            slots['buyer_street'].text = buyer.get('address', '')
+            slots['buyer_city'].text = buyer.get('city', '')
+            slots['buyer_postal_zone'].text = buyer.get('postal_code', '')
+            slots['buyer_registration_name'].text = buyer.get('name', '')
+        else:
+            for child in list(slots['buyer_party']):
+                slots['buyer_party'].remove(child)
         
         # Payment Means
-        payment_means = etree.SubElement(root, '{%s}PaymentMeans' % CAC_NS)
-        # Payment means code mapping
-        payment_code_map = {
-            'cash': '10',           # In cash
-            'card': '48',           # Bank card
-            'bank_transfer': '30',  # Credit transfer
-            'other': '1',           # Instrument not defined
-        }
-        code = payment_code_map.get(invoice.get('payment_method', 'bank_transfer'), '30')
-        etree.SubElement(payment_means, '{%s}PaymentMeansCode' % CBC_NS).text = code
+        code = PAYMENT_MEANS_CODES.get(invoice.get('payment_method', 'bank_transfer'), '30')
+        slots['payment_means_code'].text = code
         
         # Tax Total
-        tax_total = etree.SubElement(root, '{%s}TaxTotal' % CAC_NS)
+        vat_summary = fiscal_data.get('vat_summary', {})
         total_vat = Decimal('0.00')
-        for vat_data in fiscal_data.get('vat_summary', {}).values():
+        for vat_data in vat_summary.values():
             total_vat += Decimal(str(vat_data.get('vat_amount', 0)))
-        
-        etree.SubElement(tax_total, '{%s}TaxAmount' % CBC_NS, currencyID='EUR').text = f'{total_vat:.2f}'
+        slots['tax_amount'].text = f'{total_vat:.2f}'
         
         # Tax subtotals by rate
-        for vat_rate, vat_data in fiscal_data.get('vat_summary', {}).items():
-            tax_subtotal = etree.SubElement(tax_total, '{%s}TaxSubtotal' % CAC_NS)
-            etree.SubElement(tax_subtotal, '{%s}TaxableAmount' % CBC_NS, currencyID='EUR').text = \
-                f"{vat_data['base_amount']:.2f}"
-            etree.SubElement(tax_subtotal, '{%s}TaxAmount' % CBC_NS, currencyID='EUR').text = \
-                f"{vat_data['vat_amount']:.2f}"
-            
-            tax_category = etree.SubElement(tax_subtotal, '{%s}TaxCategory' % CAC_NS)
-            etree.SubElement(tax_category, '{%s}ID' % CBC_NS).text = 'S'  # Standard rate
-            etree.SubElement(tax_category, '{%s}Percent' % CBC_NS).text = f'{vat_rate:.2f}'
-            tax_scheme = etree.SubElement(tax_category, '{%s}TaxScheme' % CAC_NS)
-            etree.SubElement(tax_scheme, '{%s}ID' % CBC_NS).text = 'VAT'
+        for vat_rate, vat_data in vat_summary.items():
+            subtotal, subtotal_slots = F2_TAX_SUBTOTAL.new()
+            subtotal_slots['taxable_amount'].text = f"{vat_data['base_amount']:.2f}"
+            subtotal_slots['tax_amount'].text = f"{vat_data['vat_amount']:.2f}"
+            subtotal_slots['percent'].text = f'{vat_rate:.2f}'
+            slots['tax_total'].append(subtotal)
         
         # Legal Monetary Total
-        legal_total = etree.SubElement(root, '{%s}LegalMonetaryTotal' % CAC_NS)
         line_ext = Decimal(str(totals.get('subtotal', totals['total_amount']) - float(total_vat)))
-        etree.SubElement(legal_total, '{%s}LineExtensionAmount' % CBC_NS, currencyID='EUR').text = f'{line_ext:.2f}'
-        etree.SubElement(legal_total, '{%s}TaxExclusiveAmount' % CBC_NS, currencyID='EUR').text = f'{line_ext:.2f}'
-        etree.SubElement(legal_total, '{%s}TaxInclusiveAmount' % CBC_NS, currencyID='EUR').text = \
-            f"{totals['total_amount']:.2f}"
-        etree.SubElement(legal_total, '{%s}PayableAmount' % CBC_NS, currencyID='EUR').text = \
-            f"{totals['total_amount']:.2f}"
+        slots['line_extension_amount'].text = f'{line_ext:.2f}'
+        slots['tax_exclusive_amount'].text = f'{line_ext:.2f}'
+        slots['tax_inclusive_amount'].text = f"{totals['total_amount']:.2f}"
+        slots['payable_amount'].text = f"{totals['total_amount']:.2f}"
         
         # Invoice Lines
+        root = slots['invoice']
         line_num = 1
-        for vat_rate, vat_data in fiscal_data.get('vat_summary', {}).items():
+        for vat_rate, vat_data in vat_summary.items():
             for item in vat_data.get('items', []):
-                inv_line = etree.SubElement(root, '{%s}InvoiceLine' % CAC_NS)
-                etree.SubElement(inv_line, '{%s}ID' % CBC_NS).text = str(line_num)
-                
-                etree.SubElement(inv_line, '{%s}InvoicedQuantity' % CBC_NS, unitCode='C62').text = \
-                    str(item.get('quantity', 1))
-                etree.SubElement(inv_line, '{%s}LineExtensionAmount' % CBC_NS, currencyID='EUR').text = \
-                    f"{item.get('base_amount', 0):.2f}"
-                
-                # Item
-                item_elem = etree.SubElement(inv_line, '{%s}Item' % CAC_NS)
-                etree.SubElement(item_elem, '{%s}Name' % CBC_NS).text = item.get('name', '')
-                
-                # Item tax category
-                item_tax_cat = etree.SubElement(item_elem, '{%s}ClassifiedTaxCategory' % CAC_NS)
-                etree.SubElement(item_tax_cat, '{%s}ID' % CBC_NS).text = 'S'
-                etree.SubElement(item_tax_cat, '{%s}Percent' % CBC_NS).text = f'{vat_rate:.2f}'
-                item_tax_scheme = etree.SubElement(item_tax_cat, '{%s}TaxScheme' % CAC_NS)
-                etree.SubElement(item_tax_scheme, '{%s}ID' % CBC_NS).text = 'VAT'
-                
-                # Price
-                price = etree.SubElement(inv_line, '{%s}Price' % CAC_NS)
-                etree.SubElement(price, '{%s}PriceAmount' % CBC_NS, currencyID='EUR').text = \
-                    f"{item.get('unit_price', 0):.2f}"
-                
+                line, line_slots = F2_INVOICE_LINE.new()
+                line_slots['line_id'].text = str(line_num)
+                line_slots['quantity'].text = str(item.get('quantity', 1))
+                line_slots['line_extension_amount'].text = f"{item.get('base_amount', 0):.2f}"
+                line_slots['name'].text = item.get('name', '')
+                line_slots['percent'].text = f'{vat_rate:.2f}'
+                line_slots['price_amount'].text = f"{item.get('unit_price', 0):.2f}"
+                root.append(line)
                 line_num += 1
         
+        return SoapPayload(envelope=envelope, document=root, uuid=invoice_uuid, invoice_id=invoice['number'])
+
+    def _create_ubl_invoice(self, fiscal_data):
+        """Create standalone UBL 2.1 Invoice XML (without the SOAP envelope)."""
+        payload = self.build_payload(fiscal_data)
         return {
-            'xml': etree.tostring(root, pretty_print=True, encoding='utf-8', xml_declaration=True),
-            'uuid': invoice_uuid,
-            'invoice_id': invoice['number'],
+            'xml': payload.document_bytes(),
+            'uuid': payload.uuid,
+            'invoice_id': payload.invoice_id,
         }
 
     def _create_basic_ubl(self, document):
@@ -277,26 +202,26 @@ class FINAeRacunAdapter(ProviderAdapter):
         """Sign UBL Invoice XML with XML-DSIG for FINA eRačun.
         
         FINA requires XML Digital Signature (XML-DSIG) using enveloped signature.
-        The signature uses RSA-SHA256 for the signature algorithm.
+        The signature uses RSA-SHA256 for the signature algorithm. The invoice
+        is signed in place inside the SOAP envelope, which is serialized once.
         """
-        xml_bytes = payload['xml']
+        payload = self._soap_payload(payload)
         
         if self.mode == 'sandbox':
             # Skip signing for sandbox mode
-            return self._wrap_in_soap_envelope(xml_bytes, payload['uuid'])
+            return self._signed(payload)
         
         cert_path = self.cert_meta.get('cert_path')
         key_path = self.cert_meta.get('key_path')
         
         if not cert_path or not key_path:
             logger.warning('Certificate and key not provided, skipping signature')
-            return self._wrap_in_soap_envelope(xml_bytes, payload['uuid'])
+            return self._signed(payload)
         
         try:
             import xmlsec
             
-            # Parse XML
-            root = etree.fromstring(xml_bytes)
+            root = payload.document
             
             # Add Id attribute to root for reference
             root.set('Id', 'invoice-data')
@@ -322,62 +247,77 @@ class FINAeRacunAdapter(ProviderAdapter):
             key_info = xmlsec.template.ensure_key_info(signature_node)
             xmlsec.template.add_x509_data(key_info)
             
-            # Load private key and certificate
-            key = xmlsec.Key.from_file(key_path, xmlsec.KeyFormat.PEM)
-            key.load_cert_from_file(cert_path, xmlsec.KeyFormat.PEM)
-            
-            # Sign
+            # Sign (Id must be registered for the #uri reference to resolve)
             ctx = xmlsec.SignatureContext()
-            ctx.key = key
+            ctx.key = self.loaded_key('xmlsec', self._load_signing_key)
+            ctx.register_id(root, 'Id')
             ctx.sign(signature_node)
             
-            signed_xml = etree.tostring(root, encoding='utf-8', xml_declaration=True)
-            return self._wrap_in_soap_envelope(signed_xml, payload['uuid'])
+            return self._signed(payload)
             
         except ImportError:
             logger.error('xmlsec library not available for signing')
-            return self._wrap_in_soap_envelope(xml_bytes, payload['uuid'])
+            return self._signed(payload)
         except Exception as e:
             logger.error(f'Failed to sign UBL invoice: {e}')
             raise
 
-    def _wrap_in_soap_envelope(self, xml_content, invoice_uuid):
-        """Wrap signed UBL XML in SOAP envelope for FINA web service."""
-        if isinstance(xml_content, bytes):
-            xml_content = xml_content.decode('utf-8')
-        
-        # Remove XML declaration if present (will be in SOAP envelope)
-        if xml_content.startswith('<?xml'):
-            xml_content = xml_content.split('?>', 1)[1].strip()
+    def _load_signing_key(self):
+        """Load private key and certificate (once per cached adapter)."""
+        import xmlsec
         
-        # Parse the invoice XML
+        key = xmlsec.Key.from_file(self.cert_meta['key_path'], xmlsec.KeyFormat.PEM)
+        key.load_cert_from_file(self.cert_meta['cert_path'], xmlsec.KeyFormat.PEM)
+        return key
+
+    @staticmethod
+    def _signed(payload):
+        return {
+            'soap_envelope': payload.serialize(),
+            'uuid': payload.uuid,
+        }
+
+    def _soap_payload(self, payload):
+        """Return a SoapPayload; legacy {'xml', 'uuid'} dicts are parsed once and wrapped."""
+        if isinstance(payload, SoapPayload):
+            return payload
+        return self._wrap_in_soap_envelope(payload['xml'], payload['uuid'])
+
+    def _wrap_in_soap_envelope(self, xml_content, invoice_uuid):
+        """Wrap standalone UBL XML in the FINA SOAP envelope (legacy input)."""
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
         invoice_root = etree.fromstring(xml_content)
         
-        # Create SOAP envelope
-        envelope = etree.Element('{%s}Envelope' % SOAP_NS, nsmap={'soapenv': SOAP_NS})
-        header = etree.SubElement(envelope, '{%s}Header' % SOAP_NS)
-        body = etree.SubElement(envelope, '{%s}Body' % SOAP_NS)
-        
-        # FINA SendInvoice request wrapper
-        send_req_ns = 'http://fina.hr/eracun/sendInvoice'
-        send_invoice = etree.SubElement(body, '{%s}SendInvoiceRequest' % send_req_ns, 
-                                        nsmap={'send': send_req_ns})
-        
-        # Document UUID
-        etree.SubElement(send_invoice, '{%s}DocumentUUID' % send_req_ns).text = invoice_uuid
-        
-        # Attach the invoice
-        invoice_data = etree.SubElement(send_invoice, '{%s}InvoiceData' % send_req_ns)
-        invoice_data.append(invoice_root)
+        envelope, slots = F2_ENVELOPE.new()
+        slots['document_uuid'].text = invoice_uuid
+        # Replace the skeleton invoice with the given one
+        skeleton_invoice = slots['invoice']
+        skeleton_invoice.getparent().replace(skeleton_invoice, invoice_root)
         
+        return SoapPayload(envelope=envelope, document=invoice_root, uuid=invoice_uuid)
+
+    def http_request(self, signed_payload):
+        """HTTP POST to FINA eRačun for a signed envelope; None in sandbox mode."""
+        if self.mode == 'sandbox' or not self.endpoint:
+            return None
         return {
-            'soap_envelope': etree.tostring(envelope, encoding='utf-8', xml_declaration=True),
-            'uuid': invoice_uuid,
+            'url': self.endpoint,
+            'content': signed_payload['soap_envelope'],
+            'headers': {
+                'Content-Type': 'text/xml; charset=utf-8',
+                'SOAPAction': 'http://fina.hr/eracun/sendInvoice',
+            },
+            'timeout': 60,
         }
 
+    def parse_http_response(self, signed_payload, text):
+        return self._parse_soap_response(text, signed_payload.get('uuid'))
+
     def send(self, signed_payload):
         """Send signed SOAP envelope to FINA eRačun web service."""
-        if self.mode == 'sandbox' or not self.endpoint:
+        request = self.http_request(signed_payload)
+        if request is None:
             # Return sandbox response
             return {
                 'status': 'OK',
@@ -386,21 +326,16 @@ class FINAeRacunAdapter(ProviderAdapter):
                 'fina_reference': f'FINA-SANDBOX-{datetime.utcnow().strftime("%Y%m%d%H%M%S")}',
             }
         
-        headers = {
-            'Content-Type': 'text/xml; charset=utf-8',
-            'SOAPAction': 'http://fina.hr/eracun/sendInvoice',
-        }
-        
         try:
-            response = requests.post(
-                self.endpoint,
-                data=signed_payload['soap_envelope'],
-                headers=headers,
-                timeout=60,
+            response = self.http.post(
+                request['url'],
+                data=request['content'],
+                headers=request['headers'],
+                timeout=request['timeout'],
                 verify=True,  # Verify SSL certificates
             )
             response.raise_for_status()
-            return self._parse_soap_response(response.text, signed_payload.get('uuid'))
+            return self.parse_http_response(signed_payload, response.text)
             
         except requests.Timeout:
             logger.error('FINA eRačun request timed out')
@@ -491,7 +426,7 @@ class FINAeRacunAdapter(ProviderAdapter):
         try:
             # Send a simple ping/test request if FINA provides one
             # For now, just check if endpoint is reachable
-            response = requests.get(self.endpoint.replace('/SendInvoice', ''), timeout=10)
+            response = self.http.get(self.endpoint.replace('/SendInvoice', ''), timeout=10)
             return response.status_code < 500
         except Exception:
             return False
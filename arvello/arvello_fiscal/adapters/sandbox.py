@@ -5,19 +5,20 @@ class SandboxAdapter(ProviderAdapter):
     """Simple sandbox adapter that echoes payload and returns success."""
 
     def prepare_payload(self, document):
-        # Handle Invoice objects with full fiscal data
-        if hasattr(document, 'get_fiscal_data'):  # It's an Invoice with fiscal methods
-            fiscal_data = document.get_fiscal_data()
+        # Handle Invoice objects (or prebuilt FiscalDocumentData) with full fiscal data
+        fiscal_document = self.fiscal_document(document)
+        if fiscal_document is not None:
+            fiscal_data = fiscal_document.as_dict()
             return {
                 'document_type': 'invoice',
-                'document_id': str(document.id),
-                'invoice_number': document.number,
-                'created_at': document.date_created.isoformat() if document.date_created else None,
-                'sales_channel': document.sales_channel,
+                'document_id': str(fiscal_document.invoice.id),
+                'invoice_number': fiscal_document.invoice.number,
+                'created_at': fiscal_document.invoice.created_at,
+                'sales_channel': fiscal_document.invoice.sales_channel,
                 'fiscal_data': fiscal_data,
-                'items_count': len(fiscal_data.get('items', [])),
-                'total_amount': fiscal_data.get('totals', {}).get('total_amount'),
-                'vat_summary': fiscal_data.get('vat_summary', {}),
+                'items_count': len(fiscal_document.lines),
+                'total_amount': fiscal_data['totals']['total_amount'],
+                'vat_summary': fiscal_data['vat_summary'],
             }
         # Handle Invoice objects (legacy)
         elif hasattr(document, 'number'):  # It's an Invoice
@@ -0,0 +1,244 @@
+"""Precompiled XML skeletons and the single-serialization SOAP payload pipeline.
+
+Static parts of the F1 (RacunZahtjev) and F2 (UBL Invoice) SOAP messages are
+parsed once at import time. Elements that receive per-document values are
+marked with a `slot="name"` attribute in the template; the attribute is
+stripped at compile time and the element's child-index path is remembered,
+so `XmlSkeleton.new()` is a deep copy plus a few list lookups.
+
+Adapters fill the copy, sign the inner document element in place inside the
+SOAP envelope and serialize the envelope exactly once (`SoapPayload.serialize`),
+instead of serializing, re-parsing and wrapping the document for each stage.
+"""
+import copy
+from dataclasses import dataclass
+from typing import Optional
+
+from lxml import etree
+
+SLOT_ATTRIBUTE = 'slot'
+
+_PARSER = etree.XMLParser(remove_blank_text=True)
+
+
+class XmlSkeleton:
+    """Template parsed once; `new()` returns a fresh copy and its slot elements."""
+
+    def __init__(self, xml: str):
+        self._root = etree.fromstring(xml.encode('utf-8'), _PARSER)
+        self._slots = {}
+        for element in self._root.iter():
+            name = element.attrib.pop(SLOT_ATTRIBUTE, None)
+            if name is not None:
+                self._slots[name] = self._index_path(element)
+
+    @staticmethod
+    def _index_path(element):
+        path = []
+        parent = element.getparent()
+        while parent is not None:
+            path.append(parent.index(element))
+            element, parent = parent, parent.getparent()
+        return tuple(reversed(path))
+
+    def new(self):
+        """Return (root, slots) where slots maps slot names to elements of the copy."""
+        root = copy.deepcopy(self._root)
+        slots = {}
+        for name, path in self._slots.items():
+            element = root
+            for index in path:
+                element = element[index]
+            slots[name] = element
+        return root, slots
+
+
+@dataclass
+class SoapPayload:
+    """SOAP envelope tree with the document element that gets signed."""
+    envelope: etree._Element
+    document: etree._Element
+    uuid: Optional[str] = None
+    invoice_id: Optional[str] = None
+
+    def serialize(self) -> bytes:
+        return etree.tostring(self.envelope, encoding='utf-8', xml_declaration=True)
+
+    def document_bytes(self, pretty_print=True) -> bytes:
+        """Serialize only the document element (standalone XML, e.g. for archiving)."""
+        return etree.tostring(self.document, pretty_print=pretty_print, encoding='utf-8', xml_declaration=True)
+
+
+def remove(element):
+    """Remove an optional template element from its parent."""
+    element.getparent().remove(element)
+
+
+SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+F1_NS = 'http://www.apis-it.hr/fin/2012/types/f73'
+UBL_NS = 'urn:oasis:names:specification:ubl:schema:xsd:Invoice-2'
+CBC_NS = 'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2'
+CAC_NS = 'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2'
+FINA_SEND_NS = 'http://fina.hr/eracun/sendInvoice'
+
+
+F1_ENVELOPE = XmlSkeleton(f'''
+<soapenv:Envelope xmlns:soapenv="{SOAP_NS}">
+  <soapenv:Body>
+    <tns:RacunZahtjev xmlns:tns="{F1_NS}" slot="request">
+      <tns:Zaglavlje>
+        <tns:IdPoruke slot="message_id"/>
+        <tns:DatumVrijeme slot="sent_at"/>
+      </tns:Zaglavlje>
+      <tns:Racun>
+        <tns:Oib slot="oib"/>
+        <tns:USustPdv>1</tns:USustPdv>
+        <tns:DatVrijeme slot="issued_at"/>
+        <tns:OznSlijed>P</tns:OznSlijed>
+        <tns:BrRac>
+          <tns:BrOznRac slot="number"/>
+          <tns:OznPosPr slot="location"/>
+          <tns:OznNapUr slot="device"/>
+        </tns:BrRac>
+        <tns:Pdv slot="vat"/>
+        <tns:IznosUkupno slot="total"/>
+        <tns:NacinPlac slot="payment_method"/>
+        <tns:OibOper slot="operator_oib"/>
+        <tns:ZastKod slot="zki"/>
+        <tns:NakDost>0</tns:NakDost>
+      </tns:Racun>
+    </tns:RacunZahtjev>
+  </soapenv:Body>
+</soapenv:Envelope>
+''')
+
+F1_VAT = XmlSkeleton(f'''
+<tns:Porez xmlns:tns="{F1_NS}">
+  <tns:Stopa slot="rate"/>
+  <tns:Osnovica slot="base"/>
+  <tns:Iznos slot="amount"/>
+</tns:Porez>
+''')
+
+F2_ENVELOPE = XmlSkeleton(f'''
+<soapenv:Envelope xmlns:soapenv="{SOAP_NS}">
+  <soapenv:Header/>
+  <soapenv:Body>
+    <send:SendInvoiceRequest xmlns:send="{FINA_SEND_NS}">
+      <send:DocumentUUID slot="document_uuid"/>
+      <send:InvoiceData>
+        <Invoice xmlns="{UBL_NS}" xmlns:cbc="{CBC_NS}" xmlns:cac="{CAC_NS}" slot="invoice">
+          <cbc:UBLVersionID>2.1</cbc:UBLVersionID>
+          <cbc:CustomizationID>urn:cen.eu:en16931:2017#compliant#urn:fina.hr:eracun</cbc:CustomizationID>
+          <cbc:ProfileID>HR:ERACUN</cbc:ProfileID>
+          <cbc:ID slot="number"/>
+          <cbc:UUID slot="uuid"/>
+          <cbc:IssueDate slot="issue_date"/>
+          <cbc:DueDate slot="due_date"/>
+          <cbc:InvoiceTypeCode>380</cbc:InvoiceTypeCode>
+          <cbc:Note slot="note"/>
+          <cbc:DocumentCurrencyCode>EUR</cbc:DocumentCurrencyCode>
+          <cac:AccountingSupplierParty>
+            <cac:Party>
+              <cbc:EndpointID schemeID="HR:OIB" slot="seller_endpoint"/>
+              <cac:PartyIdentification>
+                <cbc:ID schemeID="HR:OIB" slot="seller_id"/>
+              </cac:PartyIdentification>
+              <cac:PartyName>
+                <cbc:Name slot="seller_name"/>
+              </cac:PartyName>
+              <cac:PostalAddress>
+                <cbc:StreetName slot="seller_street"/>
+                <cbc:CityName slot="seller_city"/>
+                <cbc:PostalZone slot="seller_postal_zone"/>
+                <cac:Country>
+                  <cbc:IdentificationCode>HR</cbc:IdentificationCode>
+                </cac:Country>
+              </cac:PostalAddress>
+              <cac:PartyTaxScheme slot="seller_tax_scheme">
+                <cbc:CompanyID slot="seller_vat_id"/>
+                <cac:TaxScheme>
+                  <cbc:ID>VAT</cbc:ID>
+                </cac:TaxScheme>
+              </cac:PartyTaxScheme>
+              <cac:PartyLegalEntity>
+                <cbc:RegistrationName slot="seller_registration_name"/>
+                <cbc:CompanyID schemeID="HR:OIB" slot="seller_company_id"/>
+              </cac:PartyLegalEntity>
+            </cac:Party>
+          </cac:AccountingSupplierParty>
+          <cac:AccountingCustomerParty>
+            <cac:Party slot="buyer_party">
+              <cbc:EndpointID schemeID="HR:OIB" slot="buyer_endpoint"/>
+              <cac:PartyIdentification>
+                <cbc:ID schemeID="HR:OIB" slot="buyer_id"/>
+              </cac:PartyIdentification>
+              <cac:PartyName>
+                <cbc:Name slot="buyer_name"/>
+              </cac:PartyName>
+              <cac:PostalAddress>
+                <cbc:StreetName slot="buyer_street"/>
+                <cbc:CityName slot="buyer_city"/>
+                <cbc:PostalZone slot="buyer_postal_zone"/>
+                <cac:Country>
+                  <cbc:IdentificationCode>HR</cbc:IdentificationCode>
+                </cac:Country>
+              </cac:PostalAddress>
+              <cac:PartyLegalEntity>
+                <cbc:RegistrationName slot="buyer_registration_name"/>
+              </cac:PartyLegalEntity>
+            </cac:Party>
+          </cac:AccountingCustomerParty>
+          <cac:PaymentMeans>
+            <cbc:PaymentMeansCode slot="payment_means_code"/>
+          </cac:PaymentMeans>
+          <cac:TaxTotal slot="tax_total">
+            <cbc:TaxAmount currencyID="EUR" slot="tax_amount"/>
+          </cac:TaxTotal>
+          <cac:LegalMonetaryTotal>
+            <cbc:LineExtensionAmount currencyID="EUR" slot="line_extension_amount"/>
+            <cbc:TaxExclusiveAmount currencyID="EUR" slot="tax_exclusive_amount"/>
+            <cbc:TaxInclusiveAmount currencyID="EUR" slot="tax_inclusive_amount"/>
+            <cbc:PayableAmount currencyID="EUR" slot="payable_amount"/>
+          </cac:LegalMonetaryTotal>
+        </Invoice>
+      </send:InvoiceData>
+    </send:SendInvoiceRequest>
+  </soapenv:Body>
+</soapenv:Envelope>
+''')
+
+F2_TAX_SUBTOTAL = XmlSkeleton(f'''
+<cac:TaxSubtotal xmlns:cbc="{CBC_NS}" xmlns:cac="{CAC_NS}">
+  <cbc:TaxableAmount currencyID="EUR" slot="taxable_amount"/>
+  <cbc:TaxAmount currencyID="EUR" slot="tax_amount"/>
+  <cac:TaxCategory>
+    <cbc:ID>S</cbc:ID>
+    <cbc:Percent slot="percent"/>
+    <cac:TaxScheme>
+      <cbc:ID>VAT</cbc:ID>
+    </cac:TaxScheme>
+  </cac:TaxCategory>
+</cac:TaxSubtotal>
+''')
+
+F2_INVOICE_LINE = XmlSkeleton(f'''
+<cac:InvoiceLine xmlns:cbc="{CBC_NS}" xmlns:cac="{CAC_NS}">
+  <cbc:ID slot="line_id"/>
+  <cbc:InvoicedQuantity unitCode="C62" slot="quantity"/>
+  <cbc:LineExtensionAmount currencyID="EUR" slot="line_extension_amount"/>
+  <cac:Item>
+    <cbc:Name slot="name"/>
+    <cac:ClassifiedTaxCategory>
+      <cbc:ID>S</cbc:ID>
+      <cbc:Percent slot="percent"/>
+      <cac:TaxScheme>
+        <cbc:ID>VAT</cbc:ID>
+      </cac:TaxScheme>
+    </cac:ClassifiedTaxCategory>
+  </cac:Item>
+  <cac:Price>
+    <cbc:PriceAmount currencyID="EUR" slot="price_amount"/>
+  </cac:Price>
+</cac:InvoiceLine>
+''')
@@ -2,10 +2,12 @@ from django.contrib import admin
 from django import forms
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
-from .models import FiscalDocument, FiscalRequest, FiscalResponse, FiscalConfig, FiscalCertificate, FiscalLocation, FiscalDevice
+from .archive import ArchiveError
+from .models import FiscalDocument, FiscalRequest, FiscalResponse, FiscalConfig, FiscalCertificate, FiscalLocation, FiscalDevice, FiscalSequenceBlock, FiscalHealthProbe
 from .services.fiscal_service import FiscalService
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+import json
 import os
 
 
@@ -75,6 +77,11 @@ class FiscalConfigForm(forms.ModelForm):
         return cleaned_data
 
 
+def archive_error_display(ref, error):
+    """Archive reference and error for a blob that cannot be loaded (the change page still opens)."""
+    return format_html('<p class="errornote">Arhivirani zapis nije dostupan: {}</p><pre>{}</pre>', error, ref)
+
+
 @admin.register(FiscalDocument)
 class FiscalDocumentAdmin(admin.ModelAdmin):
     list_display = ('document_type', 'document_id', 'company_id', 'status', 'created_at')
@@ -83,9 +90,29 @@ class FiscalDocumentAdmin(admin.ModelAdmin):
 
 @admin.register(FiscalRequest)
 class FiscalRequestAdmin(admin.ModelAdmin):
-    list_display = ('fiscal_document', 'idempotency_key', 'status', 'attempt_count', 'created_at')
+    list_display = ('fiscal_document', 'idempotency_key', 'status', 'attempt_count', 'created_at', 'is_archived')
+    list_filter = ('status', ('archived_at', admin.EmptyFieldListFilter))
     search_fields = ('idempotency_key',)
-    readonly_fields = ('payload',)
+    list_select_related = ('fiscal_document',)
+    exclude = ('payload',)
+    readonly_fields = ('payload_display', 'payload_ref', 'archived_at')
+
+    def get_queryset(self, request):
+        # Payload blobs are loaded only on the change page (payload_display)
+        return super().get_queryset(request).defer('payload')
+
+    def is_archived(self, obj):
+        return bool(obj.payload_ref)
+    is_archived.short_description = 'Arhivirano'
+    is_archived.boolean = True
+
+    def payload_display(self, obj):
+        try:
+            payload = obj.get_payload()
+        except ArchiveError as e:
+            return archive_error_display(obj.payload_ref, e)
+        return format_html('<pre>{}</pre>', json.dumps(payload, indent=2, ensure_ascii=False, default=str))
+    payload_display.short_description = 'Payload'
     # actions = ['resend_requests']
 
     # def resend_requests(self, request, queryset):
@@ -115,8 +142,28 @@ class FiscalRequestAdmin(admin.ModelAdmin):
 
 @admin.register(FiscalResponse)
 class FiscalResponseAdmin(admin.ModelAdmin):
-    list_display = ('fiscal_request', 'response_code', 'received_at')
-    readonly_fields = ('raw_response', 'parsed')
+    list_display = ('fiscal_request', 'response_code', 'received_at', 'is_archived')
+    list_filter = (('archived_at', admin.EmptyFieldListFilter),)
+    exclude = ('raw_response',)
+    readonly_fields = ('raw_response_display', 'raw_response_ref', 'archived_at', 'parsed')
+    list_select_related = ('fiscal_request',)
+
+    def get_queryset(self, request):
+        # Neither the response nor the related request payload is needed for the list
+        return super().get_queryset(request).defer('raw_response', 'parsed', 'fiscal_request__payload')
+
+    def is_archived(self, obj):
+        return bool(obj.raw_response_ref)
+    is_archived.short_description = 'Arhivirano'
+    is_archived.boolean = True
+
+    def raw_response_display(self, obj):
+        try:
+            raw_response = obj.get_raw_response()
+        except ArchiveError as e:
+            return archive_error_display(obj.raw_response_ref, e)
+        return format_html('<pre>{}</pre>', raw_response or '')
+    raw_response_display.short_description = 'Raw response'
 
 
 @admin.register(FiscalConfig)
@@ -261,3 +308,28 @@ class FiscalDeviceAdmin(admin.ModelAdmin):
             'fields': ('is_active',),
         }),
     )
+
+
+@admin.register(FiscalSequenceBlock)
+class FiscalSequenceBlockAdmin(admin.ModelAdmin):
+    """Read-only view of reserved sequence blocks (gap accounting)."""
+    list_display = ('device', 'first_number', 'last_number', 'used_count', 'unused_count', 'worker', 'reserved_at', 'released_at')
+    list_filter = ('device__location__fiscal_config',)
+    list_select_related = ('device__location',)
+    search_fields = ('device__device_id', 'worker')
+    readonly_fields = ('device', 'first_number', 'last_number', 'used_count', 'worker', 'reserved_at', 'released_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(FiscalHealthProbe)
+class FiscalHealthProbeAdmin(admin.ModelAdmin):
+    """Health check results recorded by manage.py fiscal_probe."""
+    list_display = ('fiscal_config', 'adapter', 'ok', 'rtt_ms', 'checked_at')
+    list_filter = ('ok', 'adapter')
+    list_select_related = ('fiscal_config',)
+    readonly_fields = ('fiscal_config', 'adapter', 'ok', 'rtt_ms', 'error', 'checked_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -5,3 +5,7 @@ class ArvelloFiscalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'arvello_fiscal'
     verbose_name = 'Arvello Fiscalization'
+
+    def ready(self):
+        # Import signals to connect them
+        import arvello_fiscal.signals  # noqa: F401
@@ -0,0 +1,209 @@
+"""Compressed, content-addressed archive for fiscal request/response blobs.
+
+`FiscalRequest.payload` and `FiscalResponse.raw_response` hold the full
+JSON/XML of every exchange with CIS/FINA. They are needed while a request is
+being sent and rarely afterwards, so `archive_old_payloads` moves blobs older
+than `FISCAL_ARCHIVE['ARCHIVE_AFTER_DAYS']` into compressed files and leaves
+only a reference (`<codec>:<sha256>`) in the row. The models load archived
+blobs lazily (`FiscalRequest.get_payload`, `FiscalResponse.get_raw_response`).
+
+Files are named by the SHA-256 of the uncompressed content, so identical
+blobs (repeated responses, retried requests) are stored once and a file is
+never rewritten. zstd is used when the `zstandard` package is installed,
+gzip otherwise; the codec of each file is part of its reference, so both can
+be read regardless of the current setting.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_EXTENSIONS = {'zstd': 'zst', 'gzip': 'gz'}
+
+
+class ArchiveError(Exception):
+    """Archived blob is missing or does not match its reference."""
+
+
+def archive_settings():
+    return getattr(settings, 'FISCAL_ARCHIVE', {})
+
+
+def archive_root():
+    return archive_settings().get('ARCHIVE_DIR') or os.path.join(settings.BASE_DIR, 'fiscal_archive')
+
+
+def default_codec():
+    codec = archive_settings().get('CODEC', 'zstd')
+    if codec == 'zstd' and zstandard is None:
+        return 'gzip'
+    return codec
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ArchiveError('zstd archive requires the zstandard package')
+        return zstandard.ZstdCompressor(level=archive_settings().get('ZSTD_LEVEL', 10)).compress(data)
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise ArchiveError(f'Unknown archive codec: {codec}')
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ArchiveError('zstd archive requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    raise ArchiveError(f'Unknown archive codec: {codec}')
+
+
+def blob_path(ref, root=None):
+    codec, digest = _split_ref(ref)
+    return os.path.join(root or archive_root(), digest[:2], digest[2:4], f'{digest}.{CODEC_EXTENSIONS[codec]}')
+
+
+def _split_ref(ref):
+    codec, _, digest = ref.partition(':')
+    if codec not in CODEC_EXTENSIONS or len(digest) != 64:
+        raise ArchiveError(f'Invalid archive reference: {ref}')
+    return codec, digest
+
+
+def store(data, codec=None, root=None):
+    """Store bytes in the archive and return their reference."""
+    codec = codec or default_codec()
+    ref = f'{codec}:{hashlib.sha256(data).hexdigest()}'
+    path = blob_path(ref, root)
+    if os.path.exists(path):
+        return ref
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file and rename, so readers never see a partial blob
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(compress(data, codec))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return ref
+
+
+def load(ref, root=None):
+    """Return the uncompressed bytes of an archived blob."""
+    codec, digest = _split_ref(ref)
+    try:
+        with open(blob_path(ref, root), 'rb') as blob:
+            data = decompress(blob.read(), codec)
+    except FileNotFoundError:
+        raise ArchiveError(f'Archived blob not found: {ref}')
+    except ArchiveError:
+        raise
+    except Exception as e:
+        # Truncated or garbled blob that the codec cannot decompress
+        raise ArchiveError(f'Archived blob is corrupt: {ref}') from e
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ArchiveError(f'Archived blob is corrupt: {ref}')
+    return data
+
+
+def archive_old_payloads(days=None, batch_size=500, codec=None, dry_run=False, root=None):
+    """Move request payloads and raw responses older than `days` into the archive.
+
+    Each row is updated only after its blob is on disk, and only if it has not
+    been archived in the meantime, so the function can be interrupted and rerun.
+    Returns counts and (uncompressed) bytes per model.
+    """
+    from .models import FiscalRequest, FiscalResponse
+
+    if days is None:
+        days = archive_settings().get('ARCHIVE_AFTER_DAYS', 90)
+    cutoff = timezone.now() - timedelta(days=days)
+    codec = codec or default_codec()
+
+    requests = FiscalRequest.objects.filter(
+        created_at__lt=cutoff, payload__isnull=False, payload_ref__isnull=True,
+    ).exclude(status='queued')
+    responses = FiscalResponse.objects.filter(
+        received_at__lt=cutoff, raw_response__isnull=False, raw_response_ref__isnull=True,
+    )
+    return {
+        'requests': _archive_rows(requests, 'payload', 'payload_ref', FiscalRequest.encode_payload,
+                                  batch_size, codec, dry_run, root),
+        'responses': _archive_rows(responses, 'raw_response', 'raw_response_ref', str.encode,
+                                   batch_size, codec, dry_run, root),
+    }
+
+
+def _archive_rows(queryset, field, ref_field, encode, batch_size, codec, dry_run, root):
+    model = queryset.model
+    count = size = 0
+    last_pk = 0
+    while True:
+        # Keyset pagination: archived rows drop out of the queryset, skipped rows must not repeat
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', field)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        now = timezone.now()
+        for pk, value in batch:
+            data = encode(value)
+            size += len(data)
+            count += 1
+            if dry_run:
+                continue
+            ref = store(data, codec, root)
+            model.objects.filter(pk=pk).filter(**{f'{ref_field}__isnull': True}).update(
+                **{field: None, ref_field: ref, 'archived_at': now}
+            )
+    return {'count': count, 'bytes': size}
+
+
+def prune_orphans(root=None, min_age_seconds=24 * 3600, dry_run=False):
+    """Delete archived blobs no longer referenced by any request or response.
+
+    Blobs younger than `min_age_seconds` are kept: an archive run may have
+    written them without having updated its row yet.
+    """
+    from .models import FiscalRequest, FiscalResponse
+
+    root = root or archive_root()
+    referenced = set(
+        FiscalRequest.objects.filter(payload_ref__isnull=False).values_list('payload_ref', flat=True).iterator()
+    )
+    referenced.update(
+        FiscalResponse.objects.filter(raw_response_ref__isnull=False)
+        .values_list('raw_response_ref', flat=True).iterator()
+    )
+    referenced_paths = {os.path.normpath(blob_path(ref, root)) for ref in referenced}
+
+    removed = 0
+    threshold = time.time() - min_age_seconds
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(directory, filename))
+            if path in referenced_paths or os.path.getmtime(path) > threshold:
+                continue
+            removed += 1
+            if not dry_run:
+                os.unlink(path)
+    return removed
+
@@ -0,0 +1,242 @@
+"""Asyncio sender for queued fiscal requests (manage.py fiscal_async_worker).
+
+`send_fiscal_request` holds a worker thread for the whole CIS/FINA round trip
+(up to 60 s for FINA). `AsyncFiscalSender` instead keeps hundreds of
+requests in flight from one process over pooled httpx connections:
+
+- queued `FiscalRequest`s are claimed in batches (`claim`): their status is
+  set to 'sending' with a claim timestamp in one UPDATE, so concurrent
+  workers never send the same request; rows stuck in 'sending' longer than
+  `CLAIM_LEASE_SECONDS` (crashed worker) are claimed again;
+- payloads are signed in a thread with the cached adapter of the company
+  (same adapter, keys and metrics as the Celery task);
+- the HTTP POST described by `adapter.http_request` is sent with httpx, with
+  a global concurrency cap and one per endpoint, optionally HTTP/2;
+- results are written back in batches (`FiscalResponse` bulk insert, one
+  UPDATE per resulting status for requests and documents).
+
+Adapters without HTTP (sandbox) are answered through `adapter.send`.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import connection as db_connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import FiscalDocument, FiscalRequest, FiscalResponse
+from .services.adapter_registry import adapter_registry
+
+logger = logging.getLogger(__name__)
+
+# How long claimed requests stay reserved for the worker sending them
+CLAIM_LEASE_SECONDS = 600
+
+
+@dataclass
+class SendJob:
+    request_id: int
+    document_id: int
+    adapter: Any
+    signed: Any = None
+    http: Optional[dict] = None
+    status: str = 'error'
+    parsed: Optional[dict] = None
+    raw: Optional[str] = None
+
+
+@dataclass
+class SenderStats:
+    sent: int = 0
+    failed: int = 0
+    errors: int = 0
+    batches_written: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.errors
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def claim(batch_size):
+    """Claim up to batch_size queued requests for this worker; returns FiscalRequests."""
+    now = timezone.now()
+    claimable = Q(status='queued') | Q(status='sending', last_attempt_at__lt=now - timedelta(seconds=CLAIM_LEASE_SECONDS))
+    with transaction.atomic():
+        queryset = FiscalRequest.objects.filter(claimable)
+        if db_connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.order_by('created_at', 'id').values_list('id', flat=True)[:batch_size])
+        # The claim timestamp identifies our rows if another worker raced for the same ids
+        FiscalRequest.objects.filter(claimable, id__in=ids).update(
+            status='sending', last_attempt_at=now, attempt_count=F('attempt_count') + 1,
+        )
+    return list(
+        FiscalRequest.objects.filter(id__in=ids, status='sending', last_attempt_at=now)
+        .select_related('fiscal_document').order_by('id')
+    )
+
+
+def prepare(requests):
+    """Resolve adapters and sign payloads; requests that fail here are returned as finished jobs."""
+    jobs = []
+    for fr in requests:
+        job = SendJob(request_id=fr.id, document_id=fr.fiscal_document_id, adapter=None)
+        try:
+            job.adapter = adapter_registry.get(fr.fiscal_document.company_id)
+            if fr.attempt_count > 1:
+                metrics.record_retry(job.adapter)
+            job.signed = job.adapter.sign_payload(fr.get_payload() or {})
+            job.http = job.adapter.http_request(job.signed)
+        except Exception as e:
+            logger.exception(f'Error preparing fiscal request {fr.id}: {e}')
+            job.adapter = None
+        jobs.append(job)
+    return jobs
+
+
+def write_results(jobs):
+    """Store responses and statuses of finished jobs in a few queries."""
+    FiscalResponse.objects.bulk_create([
+        FiscalResponse(fiscal_request_id=job.request_id, raw_response=job.raw, parsed=job.parsed)
+        for job in jobs if job.parsed is not None
+    ])
+    by_status = defaultdict(list)
+    for job in jobs:
+        by_status[job.status].append(job)
+    for status, status_jobs in by_status.items():
+        FiscalRequest.objects.filter(id__in=[job.request_id for job in status_jobs]).update(status=status)
+        FiscalDocument.objects.filter(id__in={job.document_id for job in status_jobs}).update(status=status)
+
+
+class AsyncFiscalSender:
+    """Sends claimed fiscal requests concurrently and writes results back in batches."""
+
+    def __init__(self, concurrency=200, per_endpoint=50, batch_size=100, write_batch=100,
+                 flush_interval=0.5, http2=False):
+        self.concurrency = concurrency
+        self.per_endpoint = per_endpoint
+        self.batch_size = batch_size
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.http2 = http2
+        self.stats = SenderStats()
+        self._endpoint_limits = {}
+        self._finished = []
+        self._last_flush = time.monotonic()
+
+    def client(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        return httpx.AsyncClient(http2=self.http2, limits=limits, timeout=60)
+
+    def _endpoint_limit(self, url):
+        key = urlsplit(url).netloc
+        limit = self._endpoint_limits.get(key)
+        if limit is None:
+            limit = self._endpoint_limits[key] = asyncio.Semaphore(self.per_endpoint)
+        return limit
+
+    async def run(self, once=False, idle_interval=1.0, stop=None):
+        """Claim, send and write back until stopped (or until the queue is empty with once=True)."""
+        in_flight = set()
+        async with self.client() as client:
+            while True:
+                stopping = stop is not None and stop.is_set()
+                free = self.concurrency - len(in_flight)
+                if not stopping and free >= min(self.batch_size, self.concurrency):
+                    requests = await sync_to_async(claim)(min(self.batch_size, free))
+                    if requests:
+                        for job in await sync_to_async(prepare)(requests):
+                            if job.adapter is None:
+                                self._finish(job)
+                            else:
+                                in_flight.add(asyncio.ensure_future(self._send(client, job)))
+                        continue
+
+                if not in_flight:
+                    await self.flush(force=True)
+                    if once or stopping:
+                        break
+                    await asyncio.sleep(idle_interval)
+                    continue
+
+                done, in_flight = await asyncio.wait(
+                    in_flight, timeout=self.flush_interval, return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    self._finish(task.result())
+                await self.flush()
+        return self.stats
+
+    async def _send(self, client, job):
+        label = metrics.adapter_label(job.adapter)
+        try:
+            if job.http is None:
+                job.parsed = job.adapter.parse_response(job.adapter.send(job.signed))
+                job.raw = str(job.parsed)
+            else:
+                request = job.http
+                async with self._endpoint_limit(request['url']):
+                    metrics.requests_total.inc(adapter=label)
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            request['url'], content=request['content'], headers=request['headers'],
+                            timeout=request['timeout'],
+                        )
+                        response.raise_for_status()
+                    finally:
+                        metrics.stage_seconds.observe(time.perf_counter() - start, adapter=label, stage='http')
+                job.raw = response.text
+                start = time.perf_counter()
+                job.parsed = job.adapter.parse_http_response(job.signed, job.raw)
+                metrics.stage_seconds.observe(time.perf_counter() - start, adapter=label, stage='parse')
+                if not metrics.response_ok(job.parsed):
+                    metrics.failures_total.inc(adapter=label, reason='rejected')
+            job.status = 'sent' if metrics.response_ok(job.parsed) else 'failed'
+        except Exception as e:
+            if job.http is not None:
+                metrics.failures_total.inc(adapter=label, reason=type(e).__name__)
+            logger.error(f'Error sending fiscal request {job.request_id}: {type(e).__name__}: {e}')
+            job.status = 'error'
+        return job
+
+    def _finish(self, job):
+        self._finished.append(job)
+        if job.status == 'sent':
+            self.stats.sent += 1
+        elif job.status == 'failed':
+            self.stats.failed += 1
+        else:
+            self.stats.errors += 1
+
+    async def flush(self, force=False):
+        due = time.monotonic() - self._last_flush >= self.flush_interval
+        if not self._finished or not (force or due or len(self._finished) >= self.write_batch):
+            return
+        jobs, self._finished = self._finished, []
+        await sync_to_async(write_results)(jobs)
+        self.stats.batches_written += 1
+        self._last_flush = time.monotonic()
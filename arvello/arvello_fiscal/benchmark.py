@@ -0,0 +1,408 @@
+"""Fiscalization throughput benchmark against a local stub CIS/FINA server.
+
+Pieces used by `manage.py fiscal_benchmark` (and the tests):
+
+- `StubFiscalServer` is a threaded HTTP server that answers F1 RacunZahtjev
+  messages like CIS (RacunOdgovor with a JIR) and F2 SendInvoiceRequest
+  messages like FINA eRačun. It adds a configurable latency (plus jitter)
+  and returns SOAP faults with HTTP 500 at a configurable error rate.
+- `create_benchmark_data` generates a company with a production FiscalConfig
+  pointing at the stub, a freshly generated self-signed key and certificate,
+  and N synthetic F1/F2 invoices with line items.
+- `run_benchmark` drives `FiscalService.fiscalize_invoice` for the invoices,
+  sequentially or from a number of threads. `StageTimer` wraps the cached
+  adapters' methods to split each fiscalization into stages: fiscal data
+  (database), payload, ZKI, XML-DSig, HTTP and response parsing.
+
+Results are plain dicts (JSON-serializable), so runs can be saved and compared
+across commits.
+"""
+import datetime
+import functools
+import math
+import queue
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.db import connection
+
+STAGES = ('document', 'payload', 'zki', 'xmldsig', 'http', 'parse', 'other')
+
+VAT_RATES = (25, 13, 5)
+
+CIS_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>
+<tns:RacunOdgovor xmlns:tns="http://www.apis-it.hr/fin/2012/types/f73">
+<tns:Zaglavlje><tns:IdPoruke>{message_id}</tns:IdPoruke><tns:DatumVrijeme>{timestamp}</tns:DatumVrijeme></tns:Zaglavlje>
+<tns:Jir>{jir}</tns:Jir>
+</tns:RacunOdgovor></soap:Body></soap:Envelope>'''
+
+FINA_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>
+<send:SendInvoiceResponse xmlns:send="http://fina.hr/eracun/sendInvoice">
+<send:Status>OK</send:Status><send:DocumentReference>FINA-STUB-{reference}</send:DocumentReference>
+</send:SendInvoiceResponse></soap:Body></soap:Envelope>'''
+
+SOAP_FAULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>
+<soap:Fault><faultcode>soap:Server</faultcode><faultstring>Stub error</faultstring></soap:Fault>
+</soap:Body></soap:Envelope>'''
+
+
+class StubFiscalServer:
+    """Local HTTP server imitating CIS (F1) and FINA eRačun (F2) SOAP endpoints.
+
+    Use as a context manager; `url` is the endpoint for FiscalConfig.endpoint.
+    Both message types go to the same URL and are told apart by their body.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = defaultdict(int)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/fiscal'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+
+            def setup(self):
+                super().setup()
+                # Headers and body are separate writes; without this, Nagle's algorithm and
+                # delayed ACKs add ~40 ms to every response on a kept-alive connection
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, response = stub.respond(body)
+                data = response.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def respond(self, body):
+        """Return (HTTP status, SOAP response) for a request body, after the simulated latency."""
+        with self._lock:
+            delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+
+        kind = 'f1' if b'RacunZahtjev' in body else 'f2' if b'SendInvoiceRequest' in body else 'unknown'
+        with self._lock:
+            self.requests[kind] += 1
+            if fail:
+                self.requests['errors'] += 1
+        if fail or kind == 'unknown':
+            return 500, SOAP_FAULT
+        if kind == 'f1':
+            return 200, CIS_RESPONSE.format(
+                message_id=uuid.uuid4(),
+                timestamp=datetime.datetime.now().strftime('%d.%m.%YT%H:%M:%S'),
+                jir=uuid.uuid4(),
+            )
+        return 200, FINA_RESPONSE.format(reference=uuid.uuid4().hex[:12].upper())
+
+
+class StageTimer:
+    """Collects exclusive time per stage by wrapping methods of adapters and modules.
+
+    Nested stages (ZKI inside payload, parse inside HTTP) are subtracted from
+    their parent, so the stage times of one fiscalization add up. Wrappers are
+    removed on `restore()` / leaving the context manager.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wrapped = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.restore()
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        timer = self
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            stack = timer._stack()
+            stack.append(0.0)  # time spent in nested stages
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                with timer._lock:
+                    timer.totals[stage] += elapsed - nested
+
+        # Instance attributes shadow methods; module functions are replaced
+        had_attribute = name in vars(owner)
+        self._wrapped.append((owner, name, original if had_attribute else None))
+        setattr(owner, name, timed)
+
+    def restore(self):
+        for owner, name, original in reversed(self._wrapped):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._wrapped = []
+
+    def reset(self):
+        with self._lock:
+            self.totals = defaultdict(float)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+
+def instrument(timer, adapters):
+    """Wrap fiscal data loading and the stages of the given adapters."""
+    from .services import fiscal_service
+
+    timer.wrap(fiscal_service, 'build_fiscal_document', 'document')
+    for adapter in adapters:
+        timer.wrap(adapter, 'prepare_payload', 'payload')
+        timer.wrap(adapter, 'sign_payload', 'xmldsig')
+        timer.wrap(adapter, 'send', 'http')
+        timer.wrap(adapter, 'parse_response', 'parse')
+        if hasattr(adapter, '_calculate_security_code'):
+            timer.wrap(adapter, '_calculate_security_code', 'zki')
+        if hasattr(adapter, '_parse_soap_response'):
+            timer.wrap(adapter, '_parse_soap_response', 'parse')
+
+
+def generate_test_certificate(directory, common_name='Arvello fiscal benchmark'):
+    """Write a self-signed RSA key and certificate (PEM) and return their paths."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    key_path = directory / 'benchmark_key.pem'
+    cert_path = directory / 'benchmark_cert.pem'
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ))
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    return cert_path, key_path
+
+
+def create_benchmark_data(count, endpoint, cert_name, key_name, lines=3, f2_ratio=0.5, seed=0):
+    """Create a company with a production FiscalConfig and `count` invoices ready for fiscalization.
+
+    cert_name/key_name are storage names (relative to MEDIA_ROOT) of the
+    certificate files. Invoices are bulk-created, so the automatic
+    fiscalization signal does not fire. Returns (company_id, invoice ids).
+    """
+    from arvelloapp.models import Client, Company, Invoice, InvoiceProduct, Product
+    from .models import FiscalConfig
+
+    rnd = random.Random(seed)
+    company = Company.objects.create(
+        clientName='Benchmark d.o.o.', addressLine1='Ilica 1', town='Zagreb',
+        province='GRAD ZAGREB', postalCode='10000', phoneNumber='+38510000000',
+        emailAddress='benchmark@example.com', clientUniqueId='BENCH',
+        clientType='Pravna osoba', OIB='12345678903', IBAN='HR1210010051863000160',
+    )
+    FiscalConfig.objects.create(
+        company_id=str(company.id), adapter='fiskalizacija_v1', mode='production',
+        status='configured', endpoint=endpoint, operator_oib='12345678903',
+        certificate_file=cert_name, private_key_file=key_name,
+    )
+    retail_client = Client.objects.create(
+        clientName='Kupac građanin', addressLine1='Vukovarska 2', province='GRAD ZAGREB',
+        postalCode='10000', clientUniqueId='BENCH-F1', clientType='Fizička osoba', OIB='98765432106',
+    )
+    business_client = Client.objects.create(
+        clientName='Kupac d.o.o.', addressLine1='Riva 3', province='SPLITSKO-DALMATINSKA ŽUPANIJA',
+        postalCode='21000', clientUniqueId='BENCH-F2', clientType='Pravna osoba', OIB='11111111119',
+        VATID='HR11111111119',
+    )
+    products = [
+        Product.objects.create(title=f'Artikl {rate}%', price=10 + rate, taxPercent=rate, barid=f'BENCH{rate}')
+        for rate in VAT_RATES
+    ]
+
+    today = datetime.date.today()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    invoices = []
+    for index in range(count):
+        wholesale = rnd.random() < f2_ratio
+        unique_id = uuid.uuid4().hex[:12]
+        invoices.append(Invoice(
+            title='Benchmark', number=f'{index + 1}/POS1/1', date=today,
+            dueDate=today + datetime.timedelta(days=30), date_created=now, last_updated=now,
+            client=business_client if wholesale else retail_client, subject=company,
+            uniqueId=unique_id, slug=f'benchmark-{unique_id}',
+            sales_channel='wholesale' if wholesale else 'retail',
+            invoice_type='veleprodajni' if wholesale else 'maloprodajni',
+            payment_method='bank_transfer' if wholesale else 'card',
+            fiscal_location='POS1', fiscal_device_id='1',
+        ))
+    invoices = Invoice.objects.bulk_create(invoices)
+    InvoiceProduct.objects.bulk_create([
+        InvoiceProduct(
+            invoice=invoice, product=products[line % len(products)],
+            quantity=Decimal(rnd.randint(1, 5)), discount=Decimal(rnd.choice((0, 0, 10))),
+        )
+        for invoice in invoices
+        for line in range(lines)
+    ])
+    return str(company.id), [invoice.pk for invoice in invoices]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_benchmark(invoice_ids, concurrency=1, timer=None):
+    """Fiscalize the invoices through FiscalService and return the measurements.
+
+    With concurrency > 1 the invoices are shared by that many threads, each
+    with its own database connection. Exceptions and non-OK responses count
+    as errors; their latency is included.
+    """
+    from arvelloapp.models import Invoice
+    from .services.fiscal_service import FiscalService
+
+    if timer is not None:
+        timer.reset()
+    work = queue.Queue()
+    for pk in invoice_ids:
+        work.put(pk)
+    latencies = []
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                try:
+                    pk = work.get_nowait()
+                except queue.Empty:
+                    return
+                invoice = Invoice.objects.select_related('subject', 'client').get(pk=pk)
+                start = time.perf_counter()
+                try:
+                    result = FiscalService.fiscalize_invoice(invoice)
+                    error = None if str(result.get('status', '')).upper() == 'OK' else result.get('status', 'unknown')
+                except Exception as e:
+                    error = type(e).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if error:
+                        errors[str(error)] += 1
+        finally:
+            if concurrency > 1:
+                connection.close()
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        worker()
+    wall = time.perf_counter() - started
+
+    count = len(latencies)
+    result = {
+        'concurrency': concurrency,
+        'invoices': count,
+        'errors': sum(errors.values()),
+        'error_types': dict(errors),
+        'wall_s': round(wall, 4),
+        'throughput_per_s': round(count / wall, 2) if wall else None,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 50)),
+            'p95': _ms(percentile(latencies, 95)),
+            'max': _ms(max(latencies) if latencies else None),
+            'mean': _ms(sum(latencies) / count if count else None),
+        },
+    }
+    if timer is not None and count:
+        stages = dict(timer.totals)
+        stages['other'] = max(0.0, sum(latencies) - sum(stages.values()))
+        result['stages_ms'] = {stage: _ms(stages.get(stage, 0.0) / count) for stage in STAGES}
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
@@ -0,0 +1,274 @@
+"""Fiscal document data built in a single pass over an invoice.
+
+`build_fiscal_document` loads the invoice with its subject and client and the
+line items with their products in at most two queries, then computes line
+amounts, VAT buckets and totals in one Decimal pass. The result is an
+immutable `FiscalDocumentData` that every adapter consumes, so readiness
+checks, payload preparation and logging share one computation instead of
+re-querying the line items for each total.
+
+Amounts use the same rounding as `InvoiceProduct.pretotal()/tax()/total()`
+and `Invoice.pretax()/tax()/price_with_vat()`.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional, Tuple
+
+ZERO = Decimal('0')
+
+
+@dataclass(frozen=True)
+class FiscalParty:
+    oib: Optional[str]
+    name: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    postal_code: Optional[str]
+    vat_id: Optional[str]
+    client_type: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class FiscalLine:
+    name: str
+    quantity: Decimal
+    unit_price: Decimal
+    discount: Decimal
+    rebate: Decimal
+    vat_rate: Decimal
+    base_amount: Decimal
+    vat_amount: Decimal
+    total_amount: Decimal
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'quantity': float(self.quantity),
+            'unit_price': float(self.unit_price),
+            'discount': float(self.discount),
+            'rebate': float(self.rebate),
+            'vat_rate': float(self.vat_rate),
+            'base_amount': float(self.base_amount),
+            'vat_amount': float(self.vat_amount),
+            'total_amount': float(self.total_amount),
+        }
+
+
+@dataclass(frozen=True)
+class VatBucket:
+    rate: Decimal
+    base_amount: Decimal
+    vat_amount: Decimal
+    lines: Tuple[FiscalLine, ...]
+
+
+@dataclass(frozen=True)
+class FiscalInvoice:
+    id: int
+    number: Optional[str]
+    date: Optional[str]  # ISO format
+    due_date: Optional[str]
+    created_at: Optional[str]
+    sales_channel: Optional[str]
+    payment_method: Optional[str]
+    fiscal_location: str
+    fiscal_device_id: str
+    fiscal_operator_oib: Optional[str]
+    notes: Optional[str]
+    is_paid: bool
+    payment_date: Optional[str]
+
+
+@dataclass(frozen=True)
+class FiscalDocumentData:
+    invoice: FiscalInvoice
+    issuer: FiscalParty
+    buyer: Optional[FiscalParty]
+    lines: Tuple[FiscalLine, ...]
+    vat_buckets: Tuple[VatBucket, ...]
+    pretax_amount: Decimal
+    vat_amount: Decimal
+    total_amount: Decimal
+    errors: Tuple[str, ...]  # reasons the invoice cannot be fiscalized yet
+
+    @property
+    def is_ready(self):
+        return not self.errors
+
+    def as_dict(self):
+        """Return the mapping format of `Invoice.get_fiscal_data()` used by the XML builders."""
+        # vat_summary items are the same dicts as in 'items'
+        items = {id(line): line.as_dict() for line in self.lines}
+        return {
+            'issuer_data': {
+                'oib': self.issuer.oib,
+                'name': self.issuer.name,
+                'address': self.issuer.address,
+                'city': self.issuer.city,
+                'postal_code': self.issuer.postal_code,
+                'vat_id': self.issuer.vat_id,
+            },
+            'buyer_data': {
+                'oib': self.buyer.oib,
+                'name': self.buyer.name,
+                'address': self.buyer.address,
+                'city': self.buyer.city,
+                'postal_code': self.buyer.postal_code,
+                'vat_id': self.buyer.vat_id,
+                'client_type': self.buyer.client_type,
+            } if self.buyer else None,
+            'invoice_data': {
+                'id': self.invoice.id,
+                'number': self.invoice.number,
+                'date': self.invoice.date,
+                'due_date': self.invoice.due_date,
+                'sales_channel': self.invoice.sales_channel,
+                'payment_method': self.invoice.payment_method,
+                'fiscal_location': self.invoice.fiscal_location,
+                'fiscal_device_id': self.invoice.fiscal_device_id,
+                'fiscal_operator_oib': self.invoice.fiscal_operator_oib,
+                'notes': self.invoice.notes,
+                'is_paid': self.invoice.is_paid,
+                'payment_date': self.invoice.payment_date,
+            },
+            'items': [items[id(line)] for line in self.lines],
+            'vat_summary': {
+                float(bucket.rate): {
+                    'base_amount': bucket.base_amount,
+                    'vat_amount': bucket.vat_amount,
+                    'items': [items[id(line)] for line in bucket.lines],
+                }
+                for bucket in self.vat_buckets
+            },
+            'totals': {
+                'pretax_amount': float(self.pretax_amount),
+                'vat_amount': float(self.vat_amount),
+                'total_amount': float(self.total_amount),
+            },
+        }
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def load_invoice(invoice):
+    """Return the invoice with subject and client loaded (one query if they are not cached)."""
+    from arvelloapp.models import Invoice
+
+    if isinstance(invoice, Invoice):
+        missing = [
+            name for name in ('subject', 'client')
+            if not Invoice._meta.get_field(name).is_cached(invoice)
+        ]
+        if not missing:
+            return invoice
+        loaded = Invoice.objects.select_related(*missing).get(pk=invoice.pk)
+        for name in missing:
+            setattr(invoice, name, getattr(loaded, name))
+        return invoice
+    return Invoice.objects.select_related('subject', 'client').get(pk=invoice)
+
+
+def _readiness_errors(invoice, line_count):
+    errors = []
+    if not invoice.sales_channel:
+        errors.append('Kanal prodaje nije postavljen')
+    if not invoice.subject.OIB:
+        errors.append('Subjekt nema OIB')
+    if not invoice.number:
+        errors.append('Račun nema broj')
+    if not invoice.date:
+        errors.append('Račun nema datum')
+    if not line_count:
+        errors.append('Račun nema stavki')
+    return tuple(errors)
+
+
+def _party(company_or_client, city, vat_id, client_type=None):
+    return FiscalParty(
+        oib=company_or_client.OIB,
+        name=company_or_client.clientName,
+        address=company_or_client.addressLine1,
+        city=city,
+        postal_code=company_or_client.postalCode,
+        vat_id=vat_id,
+        client_type=client_type,
+    )
+
+
+def build_fiscal_document(invoice):
+    """Build `FiscalDocumentData` for an invoice instance or primary key.
+
+    At most two queries: the invoice with subject and client (skipped when
+    they are already loaded) and the line items with their products.
+    """
+    from arvelloapp.models import InvoiceProduct
+
+    invoice = load_invoice(invoice)
+    subject = invoice.subject
+    client = invoice.client
+
+    lines = []
+    buckets = {}
+    pretax_sum = vat_sum = total_sum = ZERO
+    invoice_products = (
+        InvoiceProduct.objects.filter(invoice_id=invoice.pk).select_related('product').order_by('pk')
+    )
+    for invoice_product in invoice_products:
+        product = invoice_product.product
+        base_amount = invoice_product.pretotal()
+        gross = base_amount * (Decimal(product.taxPercent) / 100 + 1)
+        total_amount = round(gross, 2)
+        vat_amount = round(gross - base_amount, 2)
+        vat_rate = Decimal(str(product.taxPercent))
+
+        line = FiscalLine(
+            name=product.title,
+            quantity=invoice_product.quantity,
+            unit_price=Decimal(str(product.price)),
+            discount=invoice_product.discount or ZERO,
+            rebate=invoice_product.rabat or ZERO,
+            vat_rate=vat_rate,
+            base_amount=base_amount,
+            vat_amount=vat_amount,
+            total_amount=total_amount,
+        )
+        lines.append(line)
+        pretax_sum += base_amount
+        vat_sum += vat_amount
+        total_sum += total_amount
+
+        bucket = buckets.setdefault(vat_rate, [ZERO, ZERO, []])
+        bucket[0] += base_amount
+        bucket[1] += vat_amount
+        bucket[2].append(line)
+
+    return FiscalDocumentData(
+        invoice=FiscalInvoice(
+            id=invoice.pk,
+            number=invoice.number,
+            date=_isoformat(invoice.date),
+            due_date=_isoformat(invoice.dueDate),
+            created_at=_isoformat(invoice.date_created),
+            sales_channel=invoice.sales_channel,
+            payment_method=invoice.payment_method,
+            fiscal_location=invoice.fiscal_location or '1',
+            fiscal_device_id=invoice.fiscal_device_id or '1',
+            fiscal_operator_oib=invoice.fiscal_operator_oib or subject.OIB,
+            notes=invoice.notes,
+            is_paid=invoice.is_paid,
+            payment_date=_isoformat(invoice.payment_date),
+        ),
+        issuer=_party(subject, subject.town, f'HR{subject.OIB}' if subject.OIB else None),
+        buyer=_party(client, client.province, client.VATID, client.clientType) if client else None,
+        lines=tuple(lines),
+        vat_buckets=tuple(
+            VatBucket(rate=rate, base_amount=base, vat_amount=vat, lines=tuple(bucket_lines))
+            for rate, (base, vat, bucket_lines) in buckets.items()
+        ),
+        pretax_amount=round(pretax_sum, 2),
+        vat_amount=round(vat_sum, 2),
+        total_amount=round(total_sum, 2),
+        errors=_readiness_errors(invoice, len(lines)),
+    )
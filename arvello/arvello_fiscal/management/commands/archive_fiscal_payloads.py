@@ -0,0 +1,70 @@
+"""
+Management command za arhiviranje fiskalnih poruka u komprimirane datoteke.
+Korištenje: python manage.py archive_fiscal_payloads [--days N] [--codec zstd|gzip] [--dry-run] [--prune]
+
+Payload zahtjeva (FiscalRequest) i sirovi odgovori (FiscalResponse) stariji od
+N dana zapisuju se u arhivu imenovanu po SHA-256 sadržaja, a u retku ostaje samo
+referenca; modeli ih po potrebi učitavaju (get_payload/get_raw_response).
+Zahtjevi koji još čekaju slanje se preskaču. Naredba se može prekinuti i ponovno
+pokrenuti. Uz --prune brišu se arhivske datoteke na koje više ne upućuje nijedan
+redak (npr. nakon brisanja starih dokumenata).
+
+Politika se postavlja u settings.FISCAL_ARCHIVE.
+"""
+from django.core.management.base import BaseCommand
+
+from arvello_fiscal.archive import archive_old_payloads, archive_root, default_codec, prune_orphans
+
+
+class Command(BaseCommand):
+    help = 'Arhivira stare payloade fiskalnih zahtjeva i sirove odgovore u komprimirane datoteke'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Arhiviraj poruke starije od zadanog broja dana (zamjenjuje postavku)',
+        )
+        parser.add_argument(
+            '--codec',
+            choices=['zstd', 'gzip'],
+            help='Kompresija novih arhivskih datoteka (zadano prema postavci)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Broj redaka po upitu (zadano 500)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Samo prikaži izvještaj bez promjena u bazi i na disku',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Obriši arhivske datoteke na koje više ne upućuje nijedan zapis',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        codec = options['codec'] or default_codec()
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Probni rad - baza i datoteke se neće mijenjati'))
+
+        result = archive_old_payloads(
+            days=options['days'], batch_size=options['batch_size'], codec=codec, dry_run=dry_run,
+        )
+        for label, key in (('Zahtjevi', 'requests'), ('Odgovori', 'responses')):
+            self.stdout.write(
+                f"{label}: arhivirano {result[key]['count']} ({self.format_size(result[key]['bytes'])} nekomprimirano)"
+            )
+
+        if options['prune']:
+            removed = prune_orphans(dry_run=dry_run)
+            self.stdout.write(f'Obrisano nereferenciranih datoteka: {removed}')
+
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Arhiviranje završeno ({codec}, {archive_root()})'))
+
+    def format_size(self, size):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024 or unit == 'GB':
+                return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+            size /= 1024
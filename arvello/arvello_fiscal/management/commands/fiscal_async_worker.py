@@ -0,0 +1,126 @@
+"""
+Management command za asinkrono slanje fiskalnih zahtjeva iz reda.
+Korištenje: python manage.py fiscal_async_worker [--once] [--concurrency 200] [--per-endpoint 50] [--http2]
+                                                [--metrics-port 9108]
+
+Jedan proces preuzima zahtjeve u statusu 'queued' u serijama i drži do
+--concurrency SOAP zahtjeva istovremeno u tijeku preko zajedničkih HTTP veza
+(httpx, HTTP/1.1 ili HTTP/2 uz paket h2), s najviše --per-endpoint zahtjeva
+prema istom CIS/FINA poslužitelju. Rezultati se upisuju u bazu u serijama.
+Zamjena je za Celery zadatak send_fiscal_request kada treba iskoristiti puni
+propusni kapacitet servisa. Oba se mogu pokretati istovremeno: zahtjev šalje
+samo onaj koji ga prvi preuzme (status 'queued' -> 'sending' uvjetnim
+UPDATE-om), pa se isti račun ne šalje CIS/FINA-i dvaput.
+
+Uz --metrics-port worker izlaže svoje fiskalne metrike (zahtjevi, greške,
+trajanje faza) na http://<--metrics-addr>:<port>/metrics za Prometheus; web
+proces na /metrics vidi samo zahtjeve poslane u web procesu.
+
+Bez --once radi neprekidno; SIGTERM/Ctrl+C dovršava zahtjeve u tijeku i
+upisuje njihove rezultate prije izlaska.
+"""
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from arvello_fiscal import metrics
+from arvello_fiscal.async_sender import AsyncFiscalSender, http2_available
+
+
+class Command(BaseCommand):
+    help = 'Asinkrono šalje fiskalne zahtjeve iz reda uz mnogo istovremenih HTTP zahtjeva'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Pošalji sve zahtjeve koji su trenutno u redu i završi',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=200,
+            help='Najveći broj zahtjeva u tijeku (zadano 200)',
+        )
+        parser.add_argument(
+            '--per-endpoint',
+            type=int,
+            default=50,
+            help='Najveći broj zahtjeva u tijeku prema jednom poslužitelju (zadano 50)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Broj zahtjeva preuzetih iz reda u jednoj seriji (zadano 100)',
+        )
+        parser.add_argument(
+            '--write-batch',
+            type=int,
+            default=100,
+            help='Broj rezultata upisanih u bazu odjednom (zadano 100)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Pauza u sekundama kada je red prazan (zadano 1)',
+        )
+        parser.add_argument(
+            '--http2',
+            action='store_true',
+            help='Koristi HTTP/2 (zahtijeva paket h2)',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            help='Port na kojem worker izlaže metrike u Prometheus formatu (/metrics)',
+        )
+        parser.add_argument(
+            '--metrics-addr',
+            default='127.0.0.1',
+            help='Adresa za --metrics-port (zadano 127.0.0.1)',
+        )
+
+    def handle(self, *args, **options):
+        if options['http2'] and not http2_available():
+            raise CommandError('HTTP/2 zahtijeva paket h2 (pip install "httpx[http2]")')
+
+        sender = AsyncFiscalSender(
+            concurrency=max(1, options['concurrency']),
+            per_endpoint=max(1, options['per_endpoint']),
+            batch_size=max(1, options['batch_size']),
+            write_batch=max(1, options['write_batch']),
+            http2=options['http2'],
+        )
+        metrics_server = None
+        if options['metrics_port'] is not None:
+            try:
+                metrics_server = metrics.start_http_server(options['metrics_port'], options['metrics_addr'])
+            except OSError as e:
+                raise CommandError(f'Metrike nije moguće izložiti na portu {options["metrics_port"]}: {e}')
+            host, port = metrics_server.server_address[:2]
+            self.stdout.write(f'Metrike: http://{host}:{port}/metrics')
+        try:
+            stats = asyncio.run(self.run(sender, options))
+        finally:
+            if metrics_server:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Slanje završeno - poslano {stats.sent}, odbijeno {stats.failed}, greška {stats.errors} '
+            f'({stats.rate:.1f} zahtjeva/s)'
+        ))
+
+    async def run(self, sender, options):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows or not in the main thread: Ctrl+C stops without draining
+                pass
+        return await sender.run(once=options['once'], idle_interval=options['interval'], stop=stop)
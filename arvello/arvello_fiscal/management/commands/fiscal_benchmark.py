@@ -0,0 +1,181 @@
+"""
+Management command za mjerenje propusnosti fiskalizacije prema lokalnom CIS/FINA stubu.
+Korištenje: python manage.py fiscal_benchmark [--count 200] [--concurrency 8] [--latency 20]
+            [--jitter 0] [--error-rate 0] [--output rezultat.json] [--compare prethodni.json]
+
+Naredba stvara privremenu testnu bazu (kao test runner; za PostgreSQL korisnik
+treba pravo CREATEDB), generira samopotpisani ključ i certifikat, tvrtku s
+produkcijskom FiscalConfig koja pokazuje na lokalni stub te --count računa
+(F1 i F2 prema --f2-ratio). Zatim ih fiskalizira kroz FiscalService
+slijedno i iz --concurrency dretvi i ispisuje p50/p95 latenciju,
+propusnost i vrijeme po fazama (podaci, payload, ZKI, XML-DSig, HTTP,
+parsiranje). Rezultat u JSON-u (--output) uspoređuje se s prethodnim
+mjerenjem (--compare), npr. između dva commita. Prava baza se ne dira.
+"""
+import json
+import subprocess
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.utils import timezone
+
+from arvello_fiscal.benchmark import (
+    STAGES, StageTimer, StubFiscalServer, create_benchmark_data, generate_test_certificate,
+    instrument, run_benchmark,
+)
+from arvello_fiscal.services.adapter_registry import adapter_registry
+
+STAGE_LABELS = {
+    'document': 'podaci',
+    'payload': 'payload',
+    'zki': 'ZKI',
+    'xmldsig': 'XML-DSig',
+    'http': 'HTTP',
+    'parse': 'parsiranje',
+    'other': 'ostalo',
+}
+
+
+class Command(BaseCommand):
+    help = 'Mjeri propusnost i latenciju fiskalizacije prema lokalnom CIS/FINA stubu u privremenoj bazi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Broj računa po mjerenju (zadano 200)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Broj dretvi za istodobno mjerenje; 1 = samo slijedno (zadano 8)')
+        parser.add_argument('--lines', type=int, default=3, help='Broj stavki po računu (zadano 3)')
+        parser.add_argument('--f2-ratio', type=float, default=0.5, help='Udio F2 (veleprodajnih) računa (zadano 0.5)')
+        parser.add_argument('--latency', type=float, default=20, help='Latencija stuba u ms (zadano 20)')
+        parser.add_argument('--jitter', type=float, default=0, help='Dodatna slučajna latencija do N ms')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Udio odgovora s greškom (HTTP 500, SOAP Fault), npr. 0.01')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Broj računa prije mjerenja (učitavanje ključeva, HTTP veze)')
+        parser.add_argument('--seed', type=int, default=0, help='Sjeme generatora podataka i grešaka')
+        parser.add_argument('--output', type=str, help='Spremi rezultat u JSON datoteku')
+        parser.add_argument('--compare', type=str, help='Usporedi s rezultatom iz JSON datoteke')
+        parser.add_argument('--json', action='store_true', help='Ispiši rezultat kao JSON')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('--count mora biti barem 1.')
+        previous = self._load(options['compare']) if options['compare'] else None
+
+        with tempfile.TemporaryDirectory(prefix='fiscal_benchmark_') as tmp, override_settings(MEDIA_ROOT=tmp):
+            old_config = self._setup_database(tmp)
+            try:
+                report = self._run(options, Path(tmp))
+            finally:
+                adapter_registry.clear()
+                teardown_databases(old_config, verbosity=0)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            self._print(report, previous)
+
+    def _setup_database(self, tmp):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor == 'sqlite':
+            # Datoteka umjesto dijeljene memorijske baze, kako bi dretve mogle pisati istodobno (WAL);
+            # IMMEDIATE transakcije čekaju busy_timeout umjesto trenutne greške "database is locked"
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / 'benchmark.sqlite3')
+            connection.settings_dict['OPTIONS'] = {
+                **connection.settings_dict.get('OPTIONS', {}), 'transaction_mode': 'IMMEDIATE',
+            }
+        return setup_databases(
+            verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS}, serialized_aliases=set()
+        )
+
+    def _run(self, options, tmp):
+        count, warmup = options['count'], max(0, options['warmup'])
+        with StubFiscalServer(
+            latency_ms=options['latency'], jitter_ms=options['jitter'],
+            error_rate=options['error_rate'], seed=options['seed'],
+        ) as stub:
+            generate_test_certificate(tmp / 'fiscal_certs')
+            company_id, invoice_ids = create_benchmark_data(
+                warmup + count, stub.url,
+                cert_name='fiscal_certs/benchmark_cert.pem', key_name='fiscal_certs/benchmark_key.pem',
+                lines=options['lines'], f2_ratio=options['f2_ratio'], seed=options['seed'],
+            )
+            adapters = [
+                adapter_registry.get(company_id, 'fiskalizacija_v1'),
+                adapter_registry.get(company_id, 'fiskalizacija_v2'),
+            ]
+            with StageTimer() as timer:
+                instrument(timer, adapters)
+                run_benchmark(invoice_ids[:warmup])
+                measured = invoice_ids[warmup:]
+                runs = [run_benchmark(measured, concurrency=1, timer=timer)]
+                if options['concurrency'] > 1:
+                    runs.append(run_benchmark(measured, concurrency=options['concurrency'], timer=timer))
+            stub_requests = dict(stub.requests)
+
+        return {
+            'benchmark': 'fiscal_throughput',
+            'created_at': timezone.now().isoformat(),
+            'revision': self._revision(),
+            'database': connections[DEFAULT_DB_ALIAS].vendor,
+            'parameters': {
+                key: options[key]
+                for key in ('count', 'concurrency', 'lines', 'f2_ratio', 'latency', 'jitter', 'error_rate', 'warmup', 'seed')
+            },
+            'stub_requests': stub_requests,
+            'runs': runs,
+        }
+
+    def _print(self, report, previous):
+        parameters = report['parameters']
+        self.stdout.write(
+            f"{parameters['count']} računa ({parameters['f2_ratio']:.0%} F2), {parameters['lines']} stavki, "
+            f"stub {parameters['latency']:g} ms (+{parameters['jitter']:g}), greške {parameters['error_rate']:.1%}, "
+            f"baza {report['database']}, revizija {report['revision'] or '-'}"
+        )
+        previous_runs = {run['concurrency']: run for run in previous['runs']} if previous else {}
+        for run in report['runs']:
+            latency = run['latency_ms']
+            self.stdout.write(
+                f"\n{'slijedno' if run['concurrency'] == 1 else str(run['concurrency']) + ' dretvi'}: "
+                f"{run['throughput_per_s']} računa/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                f"greške {run['errors']}/{run['invoices']}"
+            )
+            stages = run.get('stages_ms', {})
+            self.stdout.write('  ' + ', '.join(f"{STAGE_LABELS[stage]} {stages.get(stage, 0):.2f} ms" for stage in STAGES))
+            before = previous_runs.get(run['concurrency'])
+            if before:
+                self.stdout.write(
+                    f"  prema {previous.get('revision') or 'prethodnom'}: "
+                    f"propusnost {self._change(before['throughput_per_s'], run['throughput_per_s'])}, "
+                    f"p95 {self._change(before['latency_ms']['p95'], latency['p95'])}"
+                )
+        self.stdout.write(self.style.SUCCESS('\nMjerenje završeno'))
+
+    @staticmethod
+    def _change(before, after):
+        if not before or after is None:
+            return '-'
+        return f'{(after - before) / before:+.1%}'
+
+    @staticmethod
+    def _load(path):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Ne mogu učitati {path}: {e}')
+
+    @staticmethod
+    def _revision():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5, check=True,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
@@ -0,0 +1,160 @@
+"""
+Management command za mjerenje izrade i potpisivanja F1/F2 SOAP poruka.
+Korištenje: python manage.py fiscal_payload_benchmark [--count 1000] [--lines 5] [--sign] [--json]
+
+Za svaki adapter (F1 RacunZahtjev, F2 UBL eRačun) mjeri dva puta na istim
+sintetičkim podacima, bez baze i bez mreže:
+- predložak: build_payload (kopija unaprijed parsiranog kostura) + sign_payload,
+  potpis na mjestu unutar omotnice i jedna serijalizacija;
+- iz bajtova: zaseban XML dokument (_create_racun_zahtjev_xml/_create_ubl_invoice)
+  koji sign_payload ponovno parsira i umotava, kao prije predložaka.
+Uz --sign potpisuje se testnim certifikatom iz arvello_fiscal/test_certs
+(produkcijski način, RSA potpis po računu), inače sandbox način bez potpisa.
+"""
+import json
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from arvello_fiscal.adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
+from arvello_fiscal.adapters.fiskalizacija_v2 import FINAeRacunAdapter
+
+TEST_CERTS = Path(__file__).resolve().parents[2] / 'test_certs'
+
+VAT_RATES = (Decimal('25.00'), Decimal('13.00'), Decimal('5.00'))
+
+
+def synthetic_fiscal_data(index, lines=5):
+    """Podaci u obliku Invoice.get_fiscal_data() za jedan sintetički račun."""
+    vat_summary = {}
+    pretax = vat = Decimal('0.00')
+    items = []
+    for line in range(lines):
+        rate = VAT_RATES[line % len(VAT_RATES)]
+        base_amount = Decimal(10 + (index + line) % 90) + Decimal('0.50')
+        vat_amount = (base_amount * rate / 100).quantize(Decimal('0.01'))
+        item = {
+            'name': f'Artikl {line + 1}',
+            'quantity': 1.0,
+            'unit_price': float(base_amount),
+            'base_amount': float(base_amount),
+            'vat_amount': float(vat_amount),
+            'total_amount': float(base_amount + vat_amount),
+        }
+        items.append(item)
+        bucket = vat_summary.setdefault(float(rate), {
+            'base_amount': Decimal('0.00'), 'vat_amount': Decimal('0.00'), 'items': [],
+        })
+        bucket['base_amount'] += base_amount
+        bucket['vat_amount'] += vat_amount
+        bucket['items'].append(item)
+        pretax += base_amount
+        vat += vat_amount
+
+    return {
+        'issuer_data': {
+            'oib': '12345678903', 'name': 'Benchmark d.o.o.', 'address': 'Ilica 1',
+            'city': 'Zagreb', 'postal_code': '10000', 'vat_id': 'HR12345678903',
+        },
+        'buyer_data': {
+            'oib': '98765432106', 'name': 'Kupac d.o.o.', 'address': 'Vukovarska 2',
+            'city': 'Split', 'postal_code': '21000', 'vat_id': 'HR98765432106',
+            'client_type': 'Pravna osoba',
+        },
+        'invoice_data': {
+            'id': index,
+            'number': f'{index}/POS1/1',
+            'date': '2025-01-15',
+            'due_date': '2025-02-14',
+            'payment_method': 'bank_transfer',
+            'fiscal_location': 'POS1',
+            'fiscal_device_id': '1',
+            'fiscal_operator_oib': '12345678903',
+            'notes': None,
+        },
+        'items': items,
+        'vat_summary': vat_summary,
+        'totals': {
+            'pretax_amount': float(pretax),
+            'vat_amount': float(vat),
+            'total_amount': float(pretax + vat),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mjeri izradu i potpisivanje F1/F2 SOAP poruka iz predložaka i iz zasebnih XML dokumenata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Broj računa po mjerenju (zadano 1000)')
+        parser.add_argument('--lines', type=int, default=5, help='Broj stavki po računu (zadano 5)')
+        parser.add_argument(
+            '--sign',
+            action='store_true',
+            help='Potpiši poruke testnim certifikatom (produkcijski način)',
+        )
+        parser.add_argument('--json', action='store_true', help='Ispiši rezultate kao JSON')
+
+    def handle(self, *args, **options):
+        count = max(1, options['count'])
+        documents = [synthetic_fiscal_data(index, options['lines']) for index in range(1, count + 1)]
+
+        if options['sign']:
+            mode = 'production'
+            cert_meta = {
+                'cert_path': str(TEST_CERTS / 'test_cert.pem'),
+                'key_path': str(TEST_CERTS / 'test_key.pem'),
+            }
+        else:
+            mode, cert_meta = 'sandbox', {}
+        f1 = FiskalizacijaV1Adapter(mode=mode, cert_meta=cert_meta)
+        f2 = FINAeRacunAdapter(mode=mode, cert_meta=cert_meta)
+
+        results = [
+            self._measure('F1', 'predložak', documents, f1.build_payload, f1.sign_payload),
+            self._measure('F1', 'iz bajtova', documents, f1._create_racun_zahtjev_xml, f1.sign_payload),
+            self._measure('F2', 'predložak', documents, f2.build_payload, f2.sign_payload),
+            self._measure('F2', 'iz bajtova', documents, f2._create_ubl_invoice, f2.sign_payload),
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'count': count, 'lines': options['lines'], 'mode': mode, 'results': results,
+            }, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(f'{count} računa, {options["lines"]} stavki po računu, način: {mode}')
+        for result in results:
+            self.stdout.write(
+                f"{result['format']} {result['pipeline']:<10}  "
+                f"izrada {result['build_ms']:8.1f} ms  potpis {result['sign_ms']:8.1f} ms  "
+                f"ukupno {result['ms_per_1000']:8.1f} ms/1000  "
+                f"({result['us_per_invoice']:.0f} µs/račun, {result['bytes']} B)"
+            )
+        self.stdout.write(self.style.SUCCESS('Mjerenje završeno'))
+
+    @staticmethod
+    def _measure(fmt, pipeline, documents, build, sign):
+        build_time = sign_time = 0.0
+        for fiscal_data in documents:
+            start = time.perf_counter()
+            payload = build(fiscal_data)
+            built = time.perf_counter()
+            signed = sign(payload)
+            sign_time += time.perf_counter() - built
+            build_time += built - start
+        if isinstance(signed, dict):
+            signed = signed['soap_envelope']
+
+        total = build_time + sign_time
+        return {
+            'format': fmt,
+            'pipeline': pipeline,
+            'build_ms': round(build_time * 1000, 3),
+            'sign_ms': round(sign_time * 1000, 3),
+            'ms_per_1000': round(total * 1000 * 1000 / len(documents), 3),
+            'us_per_invoice': round(total * 1e6 / len(documents), 1),
+            'bytes': len(signed),
+        }
@@ -0,0 +1,86 @@
+"""
+Management command za periodičnu provjeru dostupnosti fiskalnih servisa.
+Korištenje: python manage.py fiscal_probe [--company OIB] [--interval 60] [--keep-days 30]
+
+Za svaku fiskalnu konfiguraciju poziva health_check adaptera (isti adapter i
+HTTP sesija kao pri fiskalizaciji) i bilježi rezultat i trajanje u
+FiscalHealthProbe. Zadnji rezultati izlažu se na /metrics i na nadzornoj ploči
+fiskalizacije. Bez --interval radi jednom (npr. iz crona), inače ponavlja
+provjeru svakih N sekundi. Zapisi stariji od --keep-days dana se brišu.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from arvello_fiscal.models import FiscalConfig, FiscalHealthProbe
+from arvello_fiscal.services.adapter_registry import adapter_registry
+
+
+class Command(BaseCommand):
+    help = 'Provjerava dostupnost fiskalnih servisa i bilježi vrijeme odziva'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            action='append',
+            help='Provjeri samo zadani subjekt (company_id konfiguracije); može se ponoviti',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Ponavljaj provjeru svakih N sekundi (zadano 0 - jednom)',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=30,
+            help='Broj dana čuvanja rezultata provjera (zadano 30)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                self.probe_all(options['company'])
+                FiscalHealthProbe.objects.filter(
+                    checked_at__lt=timezone.now() - timedelta(days=options['keep_days'])
+                ).delete()
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Provjera fiskalnih servisa završena'))
+
+    def probe_all(self, companies):
+        configs = FiscalConfig.objects.order_by('company_id')
+        if companies:
+            configs = configs.filter(company_id__in=companies)
+
+        probes = [self.probe(cfg) for cfg in configs]
+        FiscalHealthProbe.objects.bulk_create(probes)
+        for probe in probes:
+            status = 'OK' if probe.ok else f'GREŠKA {probe.error or ""}'.strip()
+            self.stdout.write(f'{probe.fiscal_config.company_id} ({probe.adapter}): {status}, {probe.rtt_ms:.1f} ms')
+        return probes
+
+    def probe(self, cfg):
+        ok, error = False, None
+        start = time.perf_counter()
+        try:
+            adapter = adapter_registry.get(cfg.company_id)
+            ok = bool(adapter.health_check())
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        return FiscalHealthProbe(
+            fiscal_config=cfg,
+            adapter=cfg.adapter,
+            ok=ok,
+            rtt_ms=(time.perf_counter() - start) * 1000,
+            error=error,
+        )
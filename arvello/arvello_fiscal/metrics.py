@@ -0,0 +1,322 @@
+"""In-process fiscal metrics with Prometheus text exposition.
+
+Counters and histograms are kept per process and rendered in the Prometheus
+text format (0.0.4). A scrape only sees the process that served it, so scrape
+every process individually and aggregate with sum() in Prometheus:
+
+- web processes (synchronous sends, Celery fallback) through the `/metrics` view;
+- `fiscal_async_worker --metrics-port N`, which sends the queued requests,
+  through its own endpoint (`start_http_server`).
+
+Requests sent by the Celery task `send_fiscal_request` are counted in the
+Celery worker process, which has no endpoint: they are not visible unless
+that worker calls `start_http_server` itself. Adapters created by the adapter
+registry are instrumented with `instrument_adapter`, so every payload,
+signature, HTTP round trip and response parse is timed per adapter and stage.
+
+Values that live in the database are collected at scrape time: queue depth
+of `FiscalRequest` by status and the latest `fiscal_probe` result per company
+(`FiscalHealthProbe`), which is recorded by a separate process. They are
+rendered by the web `/metrics` view only, so worker endpoints do not repeat them.
+"""
+import functools
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (method, stage) pairs timed on instrumented adapters
+STAGE_METHODS = (
+    ('prepare_payload', 'payload'),
+    ('_calculate_security_code', 'zki'),
+    ('sign_payload', 'sign'),
+    ('send', 'http'),
+    ('parse_response', 'parse'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def label_values(self):
+        with self._lock:
+            return list(self._values)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for the exposition."""
+        raise NotImplementedError()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield '', list(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def snapshot(self, **labels):
+        """Return {'count', 'sum', 'counts'} (non-cumulative bucket counts) or None."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return None if state is None else {**state, 'counts': list(state['counts'])}
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile from the buckets (linear within a bucket, like histogram_quantile)."""
+        state = self.snapshot(**labels)
+        if not state or not state['count']:
+            return None
+        rank = q * state['count']
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, state['counts']):
+            if count and cumulative + count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            if bound != math.inf:
+                lower = bound
+        return lower
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, {**state, 'counts': list(state['counts'])}) for key, state in self._values.items())
+        for key, state in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                yield '_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield '_sum', labels, state['sum']
+            yield '_count', labels, state['count']
+
+
+class MetricsRegistry:
+    """Metrics of this process plus collectors evaluated at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """Register a function returning metrics built at scrape time (decorator)."""
+        self._collectors.append(func)
+        return func
+
+    def collect(self):
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+        return metrics
+
+    def render(self, collectors=True):
+        lines = []
+        for metric in (self.collect() if collectors else self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter(
+    'arvello_fiscal_requests_total', 'Requests sent to the fiscal provider.', ['adapter'],
+))
+failures_total = registry.register(Counter(
+    'arvello_fiscal_failures_total',
+    'Failed fiscal requests by reason (exception class or "rejected" by the provider).',
+    ['adapter', 'reason'],
+))
+retries_total = registry.register(Counter(
+    'arvello_fiscal_retries_total', 'Repeated attempts to fiscalize a document.', ['adapter'],
+))
+stage_seconds = registry.register(Histogram(
+    'arvello_fiscal_stage_seconds', 'Duration of fiscalization stages.', ['adapter', 'stage'],
+))
+
+
+def adapter_label(adapter):
+    return getattr(adapter, 'metrics_label', None) or type(adapter).__name__
+
+
+def response_ok(parsed):
+    """Whether a parsed provider response is a success (sandbox 'ok' or CIS/FINA status OK)."""
+    if not isinstance(parsed, dict):
+        return False
+    return bool(parsed.get('ok')) or str(parsed.get('status', '')).upper() == 'OK'
+
+
+def record_retry(adapter):
+    retries_total.inc(adapter=adapter_label(adapter))
+
+
+def instrument_adapter(adapter, label):
+    """Time the stages of an adapter instance and count its requests and failures."""
+    adapter.metrics_label = label
+    for method_name, stage in STAGE_METHODS:
+        original = getattr(adapter, method_name, None)
+        if original is not None:
+            setattr(adapter, method_name, _timed(original, label, stage))
+    return adapter
+
+
+def _timed(method, label, stage):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        if stage == 'http':
+            requests_total.inc(adapter=label)
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as exc:
+            if stage in ('http', 'parse'):
+                failures_total.inc(adapter=label, reason=type(exc).__name__)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, adapter=label, stage=stage)
+        if stage == 'parse' and not response_ok(result):
+            failures_total.inc(adapter=label, reason='rejected')
+        return result
+    return timed
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render(collectors=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr='127.0.0.1'):
+    """Serve the metrics of this process on http://addr:port/metrics from a daemon thread.
+
+    For worker processes without the Django web stack. Database collectors are
+    left to the web `/metrics` view. Returns the server; call `shutdown()` to stop it.
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fiscal-metrics', daemon=True).start()
+    return server
+
+
+@registry.collector
+def database_metrics():
+    from django.db.models import Count
+
+    from .models import FiscalHealthProbe, FiscalRequest
+
+    queue_depth = Gauge('arvello_fiscal_queue_depth', 'Fiscal requests by status.', ['status'])
+    for row in FiscalRequest.objects.order_by().values('status').annotate(total=Count('id')):
+        queue_depth.set(row['total'], status=row['status'])
+
+    labels = ['company', 'adapter']
+    up = Gauge('arvello_fiscal_health_up', 'Result of the latest fiscal_probe health check.', labels)
+    rtt = Gauge('arvello_fiscal_health_rtt_seconds', 'Round-trip time of the latest fiscal_probe health check.', labels)
+    checked = Gauge(
+        'arvello_fiscal_health_checked_timestamp_seconds', 'Time of the latest fiscal_probe health check.', labels,
+    )
+    for probe in FiscalHealthProbe.latest():
+        probe_labels = {'company': probe.fiscal_config.company_id, 'adapter': probe.adapter}
+        up.set(1 if probe.ok else 0, **probe_labels)
+        rtt.set(probe.rtt_ms / 1000, **probe_labels)
+        checked.set(int(probe.checked_at.timestamp()), **probe_labels)
+    return [queue_depth, up, rtt, checked]
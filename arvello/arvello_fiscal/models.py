@@ -1,5 +1,8 @@
+import json
+
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from django.db.models import JSONField
 
@@ -21,6 +24,9 @@ class FiscalRequest(models.Model):
     fiscal_document = models.ForeignKey(FiscalDocument, on_delete=models.CASCADE, related_name='requests')
     idempotency_key = models.CharField(max_length=128, db_index=True)
     payload = JSONField(null=True, blank=True)
+    # Set when the payload has been moved to the compressed archive (see archive.py)
+    payload_ref = models.CharField(max_length=80, null=True, blank=True, help_text="Arhivirani payload (codec:sha256)")
+    archived_at = models.DateTimeField(null=True, blank=True)
     attempt_count = models.IntegerField(default=0)
     last_attempt_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=32, default='queued')
@@ -30,10 +36,25 @@ class FiscalRequest(models.Model):
         verbose_name = 'Fiscal Request'
         verbose_name_plural = 'Fiscal Requests'
 
+    @staticmethod
+    def encode_payload(payload):
+        return json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+    def get_payload(self):
+        """Return the payload, loading it from the archive on first access if it was archived."""
+        if self.payload is None and self.payload_ref:
+            if not hasattr(self, '_archived_payload'):
+                from .archive import load
+                self._archived_payload = json.loads(load(self.payload_ref))
+            return self._archived_payload
+        return self.payload
+
 
 class FiscalResponse(models.Model):
     fiscal_request = models.ForeignKey(FiscalRequest, on_delete=models.CASCADE, related_name='responses')
     raw_response = models.TextField(null=True, blank=True)
+    raw_response_ref = models.CharField(max_length=80, null=True, blank=True, help_text="Arhivirani odgovor (codec:sha256)")
+    archived_at = models.DateTimeField(null=True, blank=True)
     response_code = models.CharField(max_length=64, null=True, blank=True)
     parsed = JSONField(null=True, blank=True)
     received_at = models.DateTimeField(default=timezone.now)
@@ -42,6 +63,15 @@ class FiscalResponse(models.Model):
         verbose_name = 'Fiscal Response'
         verbose_name_plural = 'Fiscal Responses'
 
+    def get_raw_response(self):
+        """Return the raw response, loading it from the archive on first access if it was archived."""
+        if self.raw_response is None and self.raw_response_ref:
+            if not hasattr(self, '_archived_raw_response'):
+                from .archive import load
+                self._archived_raw_response = load(self.raw_response_ref).decode('utf-8')
+            return self._archived_raw_response
+        return self.raw_response
+
 
 class FiscalCertificate(models.Model):
     owner = models.CharField(max_length=128)
@@ -137,6 +167,31 @@ class FiscalConfig(models.Model):
         self.save(update_fields=['status', 'last_test_at', 'last_test_result', 'updated_at'])
 
 
+class FiscalHealthProbe(models.Model):
+    """Result of one `fiscal_probe` health check of a company's fiscal provider."""
+    fiscal_config = models.ForeignKey(FiscalConfig, on_delete=models.CASCADE, related_name='health_probes')
+    adapter = models.CharField(max_length=64)
+    ok = models.BooleanField(default=False)
+    rtt_ms = models.FloatField(help_text="Trajanje provjere u milisekundama")
+    error = models.TextField(blank=True, null=True)
+    checked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Fiscal Health Probe'
+        verbose_name_plural = 'Fiscal Health Probes'
+        ordering = ['-checked_at']
+        indexes = [models.Index(fields=['fiscal_config', 'checked_at'], name='fiscal_probe_cfg_time_idx')]
+
+    def __str__(self):
+        return f"{self.fiscal_config_id} {'OK' if self.ok else 'FAIL'} {self.rtt_ms:.0f} ms"
+
+    @classmethod
+    def latest(cls):
+        """Latest probe of every config (one query)."""
+        latest_ids = cls.objects.order_by().values('fiscal_config').annotate(last=models.Max('id')).values('last')
+        return cls.objects.filter(id__in=latest_ids).select_related('fiscal_config')
+
+
 class FiscalLocation(models.Model):
     """Business location (Poslovni prostor) for fiscalization."""
     
@@ -209,7 +264,42 @@ class FiscalDevice(models.Model):
         return f"{self.device_id} - {self.name} ({self.location.location_id})"
     
     def get_next_sequence(self):
-        """Get and increment the next invoice sequence number."""
-        self.current_sequence += 1
-        self.save(update_fields=['current_sequence', 'updated_at'])
-        return self.current_sequence
+        """Get and increment the next invoice sequence number (atomic, safe for concurrent devices)."""
+        from .sequences import reserve_sequence
+        number, _ = reserve_sequence(self.pk)
+        self.current_sequence = number
+        return number
+
+
+class FiscalSequenceBlock(models.Model):
+    """Block of invoice sequence numbers reserved at once by one worker.
+
+    Used for gap accounting: numbers of a released block that were not issued
+    (used_count < size) are gaps in the device's numbering; blocks that were
+    never released belong to workers that stopped without releasing them.
+    """
+    device = models.ForeignKey(FiscalDevice, on_delete=models.CASCADE, related_name='sequence_blocks')
+    first_number = models.IntegerField(help_text="Prvi rezervirani redni broj")
+    last_number = models.IntegerField(help_text="Zadnji rezervirani redni broj")
+    used_count = models.IntegerField(default=0, help_text="Broj izdanih brojeva iz bloka")
+    worker = models.CharField(max_length=100, blank=True, help_text="Proces koji je rezervirao blok")
+    reserved_at = models.DateTimeField(default=timezone.now)
+    released_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Fiscal Sequence Block'
+        verbose_name_plural = 'Fiscal Sequence Blocks'
+        ordering = ['device', 'first_number']
+        indexes = [models.Index(fields=['device', 'released_at'], name='fiscal_seqblock_dev_rel_idx')]
+
+    def __str__(self):
+        return f"{self.device_id}: {self.first_number}-{self.last_number} ({self.used_count}/{self.size})"
+
+    @property
+    def size(self):
+        return self.last_number - self.first_number + 1
+
+    @property
+    def unused_count(self):
+        """Numbers reserved but never issued (0 while the block is still in use)."""
+        return self.size - self.used_count if self.released_at else 0
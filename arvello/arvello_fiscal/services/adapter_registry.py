@@ -0,0 +1,128 @@
+"""Registry of configured fiscal adapter instances.
+
+`FiscalService` used to query `FiscalConfig`, resolve certificate paths and
+construct a new adapter for every invoice and every queued request. The
+registry keeps one adapter per `(company_id, adapter_name, config.updated_at)`
+in the process, together with its HTTP session (keep-alive connections to
+CIS/FINA) and its keys, which the adapter loads on first use. Adapters are
+instrumented for the fiscal metrics (see metrics.py).
+
+The version of the company's `FiscalConfig` (id, adapter, mode, updated_at)
+is kept in the Django cache for `settings.FISCAL_CONFIG_CACHE_SECONDS` and
+dropped on save/delete (see signals.py). The full row, with the certificate
+password, is read from the database only to build an adapter and never goes
+to the shared cache. Because `updated_at` is part of the key, a changed config
+always gets a fresh adapter, also in processes that only see the change once
+their cached version expires.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from ..metrics import instrument_adapter
+from ..models import FiscalConfig
+
+FISCAL_CONFIG_CACHE_KEY = 'fiscal_config:{}'
+# FiscalConfig fields kept in the shared cache (no secrets)
+CONFIG_VERSION_FIELDS = ('id', 'adapter', 'mode', 'updated_at')
+# Cache marker for companies without a FiscalConfig
+_NO_CONFIG = 'none'
+
+
+class AdapterRegistry:
+    """Process-local cache of adapter instances keyed by company, adapter and config version."""
+
+    def __init__(self):
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def config_version(self, company_id):
+        """Return the company's config version as a dict of CONFIG_VERSION_FIELDS (cached) or None."""
+        cache_key = FISCAL_CONFIG_CACHE_KEY.format(company_id)
+        version = cache.get(cache_key)
+        if version is None:
+            version = (
+                FiscalConfig.objects.filter(company_id=company_id).values(*CONFIG_VERSION_FIELDS).first()
+                or _NO_CONFIG
+            )
+            cache.set(cache_key, version, getattr(settings, 'FISCAL_CONFIG_CACHE_SECONDS', 300))
+        return None if version == _NO_CONFIG else version
+
+    def get(self, company_id, adapter_name=None):
+        """Return the cached adapter for a company.
+
+        adapter_name overrides FiscalConfig.adapter (invoices pick F1/F2 themselves);
+        without it the configured adapter is used, or the sandbox without a config.
+        """
+        company_id = str(company_id)
+        version = self.config_version(company_id)
+        if adapter_name is None:
+            adapter_name = version['adapter'] if version else 'sandbox'
+        key = (company_id, adapter_name, version['updated_at'] if version else None)
+
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            with self._lock:
+                adapter = self._adapters.get(key)
+                if adapter is None:
+                    # Adapters for an older version of this company's config are obsolete
+                    for old_key in [k for k in self._adapters if k[0] == company_id and k[2] != key[2]]:
+                        del self._adapters[old_key]
+                    cfg = FiscalConfig.objects.filter(pk=version['id']).first() if version else None
+                    adapter = self._adapters[key] = create_adapter(adapter_name, cfg)
+        return adapter
+
+    def invalidate(self, company_id):
+        """Drop the cached config version and adapters of a company."""
+        company_id = str(company_id)
+        cache.delete(FISCAL_CONFIG_CACHE_KEY.format(company_id))
+        with self._lock:
+            for key in [k for k in self._adapters if k[0] == company_id]:
+                # Sessions are not closed here: a request may still be using them;
+                # their connections are released when the adapter is garbage collected
+                del self._adapters[key]
+
+    def clear(self):
+        """Drop all cached adapters (configs expire from the cache or are invalidated per company)."""
+        with self._lock:
+            self._adapters.clear()
+
+
+def create_adapter(adapter_name, cfg):
+    """Construct an adapter for a FiscalConfig (None = no config, sandbox mode)."""
+    mode = cfg.mode if cfg else 'sandbox'
+    if adapter_name == 'fiskalizacija_v1':
+        from ..adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
+        adapter = FiskalizacijaV1Adapter(
+            endpoint=(cfg.endpoint if cfg else None),
+            cert_meta=_cert_meta(cfg),
+            mode=mode
+        )
+    elif adapter_name == 'fiskalizacija_v2':
+        from ..adapters.fiskalizacija_v2 import FINAeRacunAdapter
+        adapter = FINAeRacunAdapter(
+            endpoint=(cfg.endpoint if cfg else None),
+            cert_meta=_cert_meta(cfg),
+            mode=mode
+        )
+    else:
+        # sandbox, None or unknown adapter name
+        from ..adapters.sandbox import SandboxAdapter
+        return instrument_adapter(SandboxAdapter(mode=mode), 'sandbox')
+    adapter.session = requests.Session()
+    return instrument_adapter(adapter, adapter_name)
+
+
+def _cert_meta(cfg):
+    if cfg is None:
+        return None
+    return {
+        'cert_path': cfg.certificate_file.path if cfg.certificate_file else None,
+        'key_path': cfg.private_key_file.path if cfg.private_key_file else None,
+        'password': cfg.certificate_password,
+    }
+
+
+adapter_registry = AdapterRegistry()
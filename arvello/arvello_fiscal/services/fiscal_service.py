@@ -1,7 +1,11 @@
 """Core fiscal service: prepare payloads and create fiscal requests."""
 from decimal import Decimal
 import hashlib
-from ..models import FiscalDocument, FiscalRequest, FiscalConfig
+from ..documents import build_fiscal_document
+from ..metrics import record_retry, response_ok
+from ..models import FiscalDocument, FiscalRequest
+from .adapter_registry import adapter_registry
+from django.db.models import F
 from django.utils import timezone
 import logging
 
@@ -43,65 +47,72 @@ class FiscalService:
         return fr
 
     @staticmethod
-    def get_adapter_for_invoice(invoice):
-        """Resolve adapter instance for given invoice based on fiscalization type (F1/F2)."""
-        company_id = str(invoice.subject.id)
-        
-        # Determine adapter based on invoice's get_fiscal_adapter_type method
-        adapter_name = invoice.get_fiscal_adapter_type()
-        
-        # Get config for the company
+    def claim_request(fiscal_request_id):
+        """Take a queued request for sending; returns it, or None if another sender already took it.
+
+        The Celery task, the synchronous send and fiscal_async_worker all claim with
+        the same conditional UPDATE (status 'queued' -> 'sending'), so a request is
+        submitted to CIS/FINA by exactly one of them.
+        """
+        claimed = FiscalRequest.objects.filter(pk=fiscal_request_id, status='queued').update(
+            status='sending', last_attempt_at=timezone.now(), attempt_count=F('attempt_count') + 1,
+        )
+        if not claimed:
+            return None
+        return FiscalRequest.objects.select_related('fiscal_document').get(pk=fiscal_request_id)
+
+    @staticmethod
+    def send_now(fr, adapter, payload):
+        """Claim and send a queued request in this process; returns the updated request."""
+        claimed = FiscalService.claim_request(fr.id)
+        if claimed is None:
+            logger.info(f'FiscalRequest {fr.id} is already being sent by another worker')
+            return fr
+        from ..models import FiscalResponse
         try:
-            cfg = FiscalConfig.objects.get(company_id=company_id)
-            mode = cfg.mode
-        except FiscalConfig.DoesNotExist:
-            cfg = None
-            mode = 'sandbox'
-        
-        # Map adapter names to classes
-        if adapter_name == 'sandbox' or adapter_name is None:
-            from ..adapters.sandbox import SandboxAdapter as _SA
-            return _SA(mode=mode)
-        if adapter_name == 'fiskalizacija_v1':
-            from ..adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
-            return FiskalizacijaV1Adapter(
-                endpoint=(cfg.endpoint if cfg else None), 
-                cert_meta={
-                    'cert_path': cfg.certificate_file.path if cfg and cfg.certificate_file else None,
-                    'key_path': cfg.private_key_file.path if cfg and cfg.private_key_file else None,
-                } if cfg else None, 
-                mode=mode
-            )
-        if adapter_name == 'fiskalizacija_v2':
-            from ..adapters.fiskalizacija_v2 import FINAeRacunAdapter
-            return FINAeRacunAdapter(
-                endpoint=(cfg.endpoint if cfg else None), 
-                cert_meta={
-                    'cert_path': cfg.certificate_file.path if cfg and cfg.certificate_file else None,
-                    'key_path': cfg.private_key_file.path if cfg and cfg.private_key_file else None,
-                    'password': cfg.certificate_password if cfg else None,
-                } if cfg else None,
-                mode=mode
-            )
-
-        # Fallback to sandbox
-        from ..adapters.sandbox import SandboxAdapter as _SA2
-        return _SA2(mode=mode)
+            signed = adapter.sign_payload(payload)
+            raw = adapter.send(signed)
+            parsed = adapter.parse_response(raw)
+            FiscalResponse.objects.create(fiscal_request=claimed, raw_response=str(raw), parsed=parsed)
+            claimed.status = 'sent' if response_ok(parsed) else 'failed'
+        except Exception as e:
+            # Same as the Celery task: do not leave the claimed request in 'sending'
+            # until fiscal_async_worker reclaims it after the lease
+            logger.exception(f'Error sending fiscal request {claimed.id}: {e}')
+            claimed.status = 'error'
+        claimed.save()
+        claimed.fiscal_document.status = claimed.status
+        claimed.fiscal_document.save()
+        return claimed
 
     @staticmethod
-    def fiscalize_invoice(invoice):
-        """Fiscalize an invoice based on its fiscalization type (F1/F2)."""
-        # Validate that invoice is ready for fiscalization
-        is_ready, message = invoice.is_fiscal_ready()
-        if not is_ready:
-            raise ValueError(f"Invoice not ready for fiscalization: {message}")
+    def get_adapter_for_invoice(invoice):
+        """Resolve adapter instance for given invoice based on fiscalization type (F1/F2).
+
+        Adapters are cached per company, adapter and config version (see adapter_registry).
+        """
+        return adapter_registry.get(invoice.subject_id, invoice.get_fiscal_adapter_type())
+
+    @staticmethod
+    def fiscalize_invoice(invoice, retry=False):
+        """Fiscalize an invoice based on its fiscalization type (F1/F2).
+
+        retry=True marks a repeated attempt (counted in the fiscal metrics).
+        """
+        # Build fiscal data once (invoice, parties and line items in two queries);
+        # readiness check and adapter payload share it
+        fiscal_document = build_fiscal_document(invoice)
+        if fiscal_document.errors:
+            raise ValueError(f"Invoice not ready for fiscalization: {'; '.join(fiscal_document.errors)}")
         
         # Get the appropriate adapter based on fiscalization type
         adapter = FiscalService.get_adapter_for_invoice(invoice)
         ftype = invoice.get_fiscalization_type()
+        if retry:
+            record_retry(adapter)
         
         # Fiscalize the invoice
-        result = adapter.fiscalize(invoice)
+        result = adapter.fiscalize(fiscal_document)
         
         # Update invoice fiscal status and type-specific fields
         invoice.fiscal_status = 'processed'
@@ -129,45 +140,8 @@ class FiscalService:
 
     @staticmethod
     def get_adapter_for_company(company_id: str):
-        """Resolve adapter instance for a company based on its FiscalConfig."""
-        try:
-            cfg = FiscalConfig.objects.get(company_id=company_id)
-            mode = cfg.mode
-            adapter_name = cfg.adapter
-        except FiscalConfig.DoesNotExist:
-            # Fallback to sandbox if no config exists
-            from ..adapters.sandbox import SandboxAdapter as _SA
-            return _SA(mode='sandbox')
-        
-        if adapter_name == 'sandbox' or adapter_name is None:
-            from ..adapters.sandbox import SandboxAdapter as _SA
-            return _SA(mode=mode)
-        if adapter_name == 'fiskalizacija_v1':
-            from ..adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
-            return FiskalizacijaV1Adapter(
-                endpoint=(cfg.endpoint if cfg else None), 
-                cert_meta={
-                    'cert_path': cfg.certificate_file.path if cfg and cfg.certificate_file else None,
-                    'key_path': cfg.private_key_file.path if cfg and cfg.private_key_file else None,
-                    'password': cfg.certificate_password if cfg else None,
-                } if cfg else None, 
-                mode=mode
-            )
-        if adapter_name == 'fiskalizacija_v2':
-            from ..adapters.fiskalizacija_v2 import FINAeRacunAdapter
-            return FINAeRacunAdapter(
-                endpoint=(cfg.endpoint if cfg else None), 
-                cert_meta={
-                    'cert_path': cfg.certificate_file.path if cfg and cfg.certificate_file else None,
-                    'key_path': cfg.private_key_file.path if cfg and cfg.private_key_file else None,
-                    'password': cfg.certificate_password if cfg else None,
-                } if cfg else None,
-                mode=mode
-            )
-        
-        # Fallback to sandbox
-        from ..adapters.sandbox import SandboxAdapter as _SA2
-        return _SA2(mode=mode)
+        """Resolve adapter instance for a company based on its FiscalConfig (cached)."""
+        return adapter_registry.get(company_id)
 
     @staticmethod
     def submit_and_enqueue(document_type: str, document_id: str, company_id: str, payload: dict, enqueue=True):
@@ -192,23 +166,7 @@ class FiscalService:
             except Exception as e:
                 logger.warning(f'Celery not available or task dispatch failed: {e}. Falling back to sync send.')
                 # fallback to synchronous send
-                signed = adapter.sign_payload(payload)
-                raw = adapter.send(signed)
-                parsed = adapter.parse_response(raw)
-                from ..models import FiscalResponse
-                FiscalResponse.objects.create(fiscal_request=fr, raw_response=str(raw), parsed=parsed)
-                fr.status = 'sent' if parsed.get('ok') else 'failed'
-                fr.save()
-                fiscal_doc.status = fr.status
-                fiscal_doc.save()
+                fr = FiscalService.send_now(fr, adapter, payload)
         else:
-            signed = adapter.sign_payload(payload)
-            raw = adapter.send(signed)
-            parsed = adapter.parse_response(raw)
-            from ..models import FiscalResponse
-            FiscalResponse.objects.create(fiscal_request=fr, raw_response=str(raw), parsed=parsed)
-            fr.status = 'sent' if parsed.get('ok') else 'failed'
-            fr.save()
-            fiscal_doc.status = fr.status
-            fiscal_doc.save()
+            fr = FiscalService.send_now(fr, adapter, payload)
         return fr
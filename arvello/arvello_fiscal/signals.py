@@ -0,0 +1,13 @@
+"""Signals for arvello_fiscal: keep the adapter registry in sync with FiscalConfig."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FiscalConfig
+from .services.adapter_registry import adapter_registry
+
+
+@receiver(post_save, sender=FiscalConfig)
+@receiver(post_delete, sender=FiscalConfig)
+def invalidate_fiscal_adapters(sender, instance, **kwargs):
+    """Drop cached config and adapters so the next fiscalization uses the new config."""
+    adapter_registry.invalidate(instance.company_id)
@@ -1,7 +1,7 @@
 from celery import shared_task
+from .metrics import record_retry, response_ok
 from .models import FiscalRequest, FiscalResponse
 from .services.fiscal_service import FiscalService
-from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,28 +9,32 @@ logger = logging.getLogger(__name__)
 
 @shared_task(bind=True)
 def send_fiscal_request(self, fiscal_request_id):
-    try:
-        fr = FiscalRequest.objects.get(pk=fiscal_request_id)
-    except FiscalRequest.DoesNotExist:
-        logger.error(f'FiscalRequest {fiscal_request_id} not found')
+    # Same claim as fiscal_async_worker: only one sender submits a queued request
+    fr = FiscalService.claim_request(fiscal_request_id)
+    if fr is None:
+        if FiscalRequest.objects.filter(pk=fiscal_request_id).exists():
+            logger.info(f'FiscalRequest {fiscal_request_id} is already being sent by another worker')
+        else:
+            logger.error(f'FiscalRequest {fiscal_request_id} not found')
         return False
 
+    # Cached adapter (session, keys) - no per-request config work
     adapter = FiscalService.get_adapter_for_company(fr.fiscal_document.company_id)
-    fr.attempt_count += 1
-    fr.last_attempt_at = timezone.now()
-    fr.save()
+    if fr.attempt_count > 1:
+        record_retry(adapter)
 
     try:
-        signed = adapter.sign_payload(fr.payload or {})
+        signed = adapter.sign_payload(fr.get_payload() or {})
         raw = adapter.send(signed)
         parsed = adapter.parse_response(raw)
 
         FiscalResponse.objects.create(fiscal_request=fr, raw_response=str(raw), parsed=parsed)
-        fr.status = 'sent' if parsed.get('ok') else 'failed'
+        ok = response_ok(parsed)
+        fr.status = 'sent' if ok else 'failed'
         fr.save()
         fr.fiscal_document.status = fr.status
         fr.fiscal_document.save()
-        return parsed.get('ok', False)
+        return ok
     except Exception as e:
         logger.exception(f'Error sending fiscal request {fr.id}: {e}')
         fr.status = 'error'
@@ -120,3 +120,71 @@ class AdapterTests(TestCase):
         mock_post.assert_called_once()
         args, kwargs = mock_post.call_args
         self.assertEqual(kwargs['headers']['Content-Type'], 'text/xml; charset=utf-8')
+
+
+class TemplatePayloadTests(TestCase):
+    """F1/F2 payloads built from precompiled templates and signed inside the envelope."""
+
+    def setUp(self):
+        from arvello_fiscal.management.commands.fiscal_payload_benchmark import TEST_CERTS
+        self.cert_meta = {
+            'cert_path': str(TEST_CERTS / 'test_cert.pem'),
+            'key_path': str(TEST_CERTS / 'test_key.pem'),
+        }
+
+    def _fiscal_data(self):
+        from arvello_fiscal.management.commands.fiscal_payload_benchmark import synthetic_fiscal_data
+        return synthetic_fiscal_data(1, lines=3)
+
+    def _verify(self, envelope):
+        self.assertEqual(envelope.count(b'<?xml'), 1)
+        root = etree.fromstring(envelope)
+        self.assertEqual(root.tag, '{http://schemas.xmlsoap.org/soap/envelope/}Envelope')
+        signature = root.find('.//{http://www.w3.org/2000/09/xmldsig#}Signature')
+        self.assertIsNotNone(signature)
+        ctx = xmlsec.SignatureContext()
+        for element in root.iter():
+            if element.get('Id'):
+                ctx.register_id(element, 'Id')
+        ctx.key = xmlsec.Key.from_file(self.cert_meta['cert_path'], xmlsec.KeyFormat.CERT_PEM)
+        ctx.verify(signature)  # raises xmlsec.Error if the signature is invalid
+        return root
+
+    def test_v1_signed_envelope_verifies(self):
+        fiscal_data = self._fiscal_data()
+        a = FiskalizacijaV1Adapter(mode='production', cert_meta=self.cert_meta)
+        root = self._verify(a.sign_payload(a.build_payload(fiscal_data)))
+        porezi = root.findall('.//{http://www.apis-it.hr/fin/2012/types/f73}Porez')
+        self.assertEqual(len(porezi), len(fiscal_data['vat_summary']))
+
+    def test_v2_signed_envelope_verifies(self):
+        fiscal_data = self._fiscal_data()
+        a = FiskalizacijaV2Adapter(mode='production', cert_meta=self.cert_meta)
+        payload = a.build_payload(fiscal_data)
+        signed = a.sign_payload(payload)
+        self.assertEqual(signed['uuid'], payload.uuid)
+        root = self._verify(signed['soap_envelope'])
+        cac = '{urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2}'
+        self.assertEqual(len(root.findall(f'.//{cac}InvoiceLine')), 3)
+        # Templates are copied, not shared between documents
+        self.assertEqual(len(a.build_payload(fiscal_data).document.findall(f'{cac}InvoiceLine')), 3)
+
+    def test_v2_without_buyer_and_due_date(self):
+        fiscal_data = self._fiscal_data()
+        fiscal_data['buyer_data'] = None
+        fiscal_data['invoice_data']['due_date'] = None
+        document = FiskalizacijaV2Adapter(mode='sandbox').build_payload(fiscal_data).document
+        cac = '{urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2}'
+        cbc = '{urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2}'
+        self.assertIsNone(document.find(f'{cbc}DueDate'))
+        self.assertEqual(len(document.find(f'{cac}AccountingCustomerParty/{cac}Party')), 0)
+
+    def test_payload_benchmark_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        import json
+        out = StringIO()
+        call_command('fiscal_payload_benchmark', count=3, json=True, stdout=out)
+        results = json.loads(out.getvalue())['results']
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result['ms_per_1000'] > 0 for result in results))
@@ -0,0 +1,143 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from arvello_fiscal import archive
+from arvello_fiscal.models import FiscalDocument, FiscalRequest, FiscalResponse
+
+RAW_RESPONSE = '<soap:Envelope><RacunOdgovor><Jir>abc-123</Jir></RacunOdgovor></soap:Envelope>'
+
+
+class FiscalArchiveTests(TestCase):
+    """Compressed, content-addressed archive of request payloads and raw responses."""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(FISCAL_ARCHIVE={'ARCHIVE_DIR': self.root.name, 'ARCHIVE_AFTER_DAYS': 30})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.document = FiscalDocument.objects.create(document_type='invoice', document_id='1', company_id='1')
+
+    def _exchange(self, age_days, number, status='sent'):
+        created = timezone.now() - timedelta(days=age_days)
+        request = FiscalRequest.objects.create(
+            fiscal_document=self.document, idempotency_key=f'key-{number}', status=status,
+            payload={'invoice_data': {'number': f'{number}/POS1/1'}, 'total': '12.50'}, created_at=created,
+        )
+        response = FiscalResponse.objects.create(
+            fiscal_request=request, raw_response=RAW_RESPONSE, parsed={'ok': True}, received_at=created,
+        )
+        return request, response
+
+    def test_store_and_load_gzip(self):
+        """Test blobs round-trip, are deduplicated by content and verified on load."""
+        ref = archive.store(b'<xml/>' * 100, codec='gzip')
+        self.assertTrue(ref.startswith('gzip:'))
+        self.assertEqual(archive.store(b'<xml/>' * 100, codec='gzip'), ref)
+        self.assertEqual(archive.load(ref), b'<xml/>' * 100)
+        self.assertLess(os.path.getsize(archive.blob_path(ref)), 600)
+
+        with open(archive.blob_path(ref), 'wb') as blob:
+            blob.write(archive.compress(b'tampered', 'gzip'))
+        with self.assertRaises(archive.ArchiveError):
+            archive.load(ref)
+        with self.assertRaises(archive.ArchiveError):
+            archive.load('gzip:' + '0' * 64)
+
+    @skipUnless(archive.zstandard, 'zstandard not installed')
+    def test_store_and_load_zstd(self):
+        """Test the zstd codec round-trips."""
+        ref = archive.store(RAW_RESPONSE.encode(), codec='zstd')
+        self.assertEqual(archive.load(ref), RAW_RESPONSE.encode())
+
+    def test_archive_old_payloads(self):
+        """Test old blobs move to the archive, recent and queued ones stay inline, and reads are lazy."""
+        old_request, old_response = self._exchange(60, 1)
+        queued_request, _ = self._exchange(60, 2, status='queued')
+        new_request, new_response = self._exchange(1, 3)
+
+        result = archive.archive_old_payloads(codec='gzip')
+        self.assertEqual(result['requests']['count'], 1)
+        # Identical responses are archived as one file
+        self.assertEqual(result['responses']['count'], 2)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.root.name)), 2)
+
+        old_request = FiscalRequest.objects.get(pk=old_request.pk)
+        self.assertIsNone(old_request.payload)
+        self.assertIsNotNone(old_request.archived_at)
+        self.assertEqual(old_request.get_payload()['invoice_data']['number'], '1/POS1/1')
+        old_response = FiscalResponse.objects.get(pk=old_response.pk)
+        self.assertIsNone(old_response.raw_response)
+        self.assertEqual(old_response.get_raw_response(), RAW_RESPONSE)
+
+        self.assertIsNotNone(FiscalRequest.objects.get(pk=queued_request.pk).payload)
+        self.assertEqual(FiscalRequest.objects.get(pk=new_request.pk).get_payload()['total'], '12.50')
+        self.assertIsNone(FiscalResponse.objects.get(pk=new_response.pk).raw_response_ref)
+
+        # Rerun is a no-op
+        self.assertEqual(archive.archive_old_payloads(codec='gzip')['requests']['count'], 0)
+
+    def test_command_dry_run_and_prune(self):
+        """Test the command reports without changes in dry-run and prunes unreferenced blobs."""
+        request, _ = self._exchange(60, 1)
+        out = StringIO()
+        call_command('archive_fiscal_payloads', '--dry-run', '--codec', 'gzip', stdout=out)
+        self.assertIn('Zahtjevi: arhivirano 1', out.getvalue())
+        self.assertIsNone(FiscalRequest.objects.get(pk=request.pk).payload_ref)
+
+        call_command('archive_fiscal_payloads', '--codec', 'gzip', stdout=StringIO())
+        request.refresh_from_db()
+        path = archive.blob_path(request.payload_ref)
+        self.assertTrue(os.path.exists(path))
+
+        request.delete()
+        self.assertEqual(archive.prune_orphans(min_age_seconds=0), 2)
+        self.assertFalse(os.path.exists(path))
+
+    def test_admin_lists_do_not_load_blobs(self):
+        """Test admin changelists select neither payloads nor raw responses."""
+        self._exchange(1, 1)
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(user)
+
+        for model in ('fiscalrequest', 'fiscalresponse'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:arvello_fiscal_{model}_changelist'))
+            self.assertEqual(response.status_code, 200)
+            selects = [q['sql'] for q in queries.captured_queries if 'fiscalrequest' in q['sql'].lower()]
+            self.assertTrue(selects)
+            for sql in selects:
+                self.assertNotIn('"payload"', sql)
+                self.assertNotIn('"raw_response"', sql)
+
+    def test_admin_change_pages_show_missing_blobs(self):
+        """Test change pages of rows whose archived blob is gone show the reference instead of failing."""
+        request, response = self._exchange(40, 1)
+        call_command('archive_fiscal_payloads', '--codec', 'gzip', stdout=StringIO())
+        request.refresh_from_db()
+        response.refresh_from_db()
+        os.unlink(archive.blob_path(request.payload_ref))
+        # Oštećen zapis odgovora (ne može se dekomprimirati)
+        with open(archive.blob_path(response.raw_response_ref), 'wb') as blob:
+            blob.write(b'not gzip')
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(user)
+
+        for model, obj, ref in (('fiscalrequest', request, request.payload_ref),
+                                ('fiscalresponse', response, response.raw_response_ref)):
+            page = self.client.get(reverse(f'admin:arvello_fiscal_{model}_change', args=[obj.pk]))
+            self.assertEqual(page.status_code, 200)
+            self.assertContains(page, 'Arhivirani zapis nije dostupan')
+            self.assertContains(page, ref)
@@ -0,0 +1,124 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from arvello_fiscal.adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
+from arvello_fiscal.async_sender import CLAIM_LEASE_SECONDS, claim
+from arvello_fiscal.benchmark import StubFiscalServer, generate_test_certificate
+from arvello_fiscal.management.commands.fiscal_payload_benchmark import synthetic_fiscal_data
+from arvello_fiscal.models import FiscalConfig, FiscalDocument, FiscalRequest, FiscalResponse
+from arvello_fiscal.services.adapter_registry import adapter_registry
+from arvello_fiscal.services.fiscal_service import FiscalService
+
+
+class AsyncFiscalSenderTests(TransactionTestCase):
+    """fiscal_async_worker: batched claiming, concurrent sending and batched write-back."""
+
+    def setUp(self):
+        cache.clear()
+        adapter_registry.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        generate_test_certificate(f'{self.media.name}/fiscal_certs')
+        settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _queue(self, company_id, count, payload=None):
+        builder = FiskalizacijaV1Adapter(mode='sandbox')
+        for index in range(1, count + 1):
+            document = FiscalDocument.objects.create(
+                document_type='invoice', document_id=str(index), company_id=company_id,
+            )
+            xml = builder._create_racun_zahtjev_xml(synthetic_fiscal_data(index, lines=2)).decode('utf-8')
+            FiscalRequest.objects.create(
+                fiscal_document=document, idempotency_key=f'{company_id}-{index}',
+                payload=payload if payload is not None else xml, status='queued',
+            )
+
+    def _config(self, company_id, endpoint):
+        return FiscalConfig.objects.create(
+            company_id=company_id, adapter='fiskalizacija_v1', mode='production', endpoint=endpoint,
+            certificate_file='fiscal_certs/benchmark_cert.pem', private_key_file='fiscal_certs/benchmark_key.pem',
+        )
+
+    def test_sends_queue_concurrently(self):
+        """Test every queued request is signed, sent once and written back with its response."""
+        with StubFiscalServer(latency_ms=20) as stub:
+            self._config('c1', stub.url)
+            self._queue('c1', 30)
+            out = StringIO()
+            call_command(
+                'fiscal_async_worker', '--once', '--concurrency', '12', '--per-endpoint', '6',
+                '--batch-size', '5', '--write-batch', '7', stdout=out,
+            )
+
+        self.assertIn('poslano 30', out.getvalue())
+        self.assertEqual(stub.requests['f1'], 30)
+        self.assertEqual(set(FiscalRequest.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(set(FiscalRequest.objects.values_list('attempt_count', flat=True)), {1})
+        self.assertEqual(set(FiscalDocument.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(FiscalResponse.objects.count(), 30)
+        response = FiscalResponse.objects.first()
+        self.assertIn('RacunOdgovor', response.raw_response)
+        self.assertTrue(response.parsed['jir'])
+
+    def test_errors_and_sandbox(self):
+        """Test HTTP errors mark requests as error and sandbox configs are answered without HTTP."""
+        with StubFiscalServer(error_rate=1.0) as stub:
+            self._config('c1', stub.url)
+            self._queue('c1', 3)
+            FiscalConfig.objects.create(company_id='c2', adapter='sandbox', mode='sandbox')
+            self._queue('c2', 2, payload={'document_id': 'x'})
+            call_command('fiscal_async_worker', '--once', stdout=StringIO())
+
+        statuses = dict(FiscalRequest.objects.values_list('idempotency_key', 'status'))
+        self.assertEqual({statuses[f'c1-{i}'] for i in range(1, 4)}, {'error'})
+        self.assertEqual({statuses[f'c2-{i}'] for i in range(1, 3)}, {'sent'})
+        self.assertEqual(FiscalResponse.objects.count(), 2)
+
+    def test_claim_skips_requests_in_flight(self):
+        """Test claim takes queued and expired requests but not ones another worker is sending."""
+        self._queue('c1', 3, payload={})
+        first, second, third = FiscalRequest.objects.order_by('id')
+        FiscalRequest.objects.filter(pk=second.pk).update(status='sending', last_attempt_at=timezone.now())
+        FiscalRequest.objects.filter(pk=third.pk).update(
+            status='sending', last_attempt_at=timezone.now() - timedelta(seconds=CLAIM_LEASE_SECONDS + 1),
+        )
+
+        claimed = claim(10)
+        self.assertEqual([fr.pk for fr in claimed], [first.pk, third.pk])
+        self.assertEqual(claim(10), [])
+
+    def test_single_request_claim_is_exclusive(self):
+        """Test the Celery task's claim and the worker's batch claim never take the same request."""
+        self._queue('c1', 2, payload={})
+        first, second = FiscalRequest.objects.order_by('id')
+
+        claimed = FiscalService.claim_request(first.pk)
+        self.assertEqual((claimed.status, claimed.attempt_count), ('sending', 1))
+        self.assertIsNone(FiscalService.claim_request(first.pk))
+        self.assertEqual([fr.pk for fr in claim(10)], [second.pk])
+        self.assertIsNone(FiscalService.claim_request(second.pk))
+
+    def test_send_now_marks_failures_and_accepts_status_ok(self):
+        """Test the synchronous send judges responses like the worker and never leaves a request in 'sending'."""
+        self._queue('c1', 2, payload={})
+        first, second = FiscalRequest.objects.order_by('id')
+
+        # CIS/FINA odgovor bez 'ok' ključa, samo sa statusom OK
+        adapter = mock.Mock()
+        adapter.parse_response.return_value = {'status': 'OK', 'jir': 'abc'}
+        self.assertEqual(FiscalService.send_now(first, adapter, {}).status, 'sent')
+
+        # Greška adaptera nakon preuzimanja zahtjeva
+        adapter.send.side_effect = RuntimeError('timeout')
+        self.assertEqual(FiscalService.send_now(second, adapter, {}).status, 'error')
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.fiscal_document.status), ('error', 'error'))
@@ -0,0 +1,56 @@
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from arvello_fiscal.benchmark import (
+    STAGES, StageTimer, StubFiscalServer, create_benchmark_data, generate_test_certificate,
+    instrument, run_benchmark,
+)
+from arvello_fiscal.services.adapter_registry import adapter_registry
+
+
+class FiscalBenchmarkTests(TestCase):
+    """Benchmark harness: stub CIS/FINA server driven through FiscalService."""
+
+    def setUp(self):
+        cache.clear()
+        adapter_registry.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        generate_test_certificate(f'{self.media.name}/fiscal_certs')
+
+    def _data(self, stub, count):
+        return create_benchmark_data(
+            count, stub.url, 'fiscal_certs/benchmark_cert.pem', 'fiscal_certs/benchmark_key.pem', lines=2,
+        )
+
+    def test_sequential_run_with_stages(self):
+        """Test F1 and F2 invoices are signed, sent to the stub and timed per stage."""
+        with override_settings(MEDIA_ROOT=self.media.name), StubFiscalServer() as stub:
+            company_id, invoice_ids = self._data(stub, 6)
+            adapters = [adapter_registry.get(company_id, name) for name in ('fiskalizacija_v1', 'fiskalizacija_v2')]
+            send = adapters[0].send
+            with StageTimer() as timer:
+                instrument(timer, adapters)
+                result = run_benchmark(invoice_ids, timer=timer)
+            # Wrappers are removed again
+            self.assertIs(adapters[0].send, send)
+
+        self.assertEqual(result['invoices'], 6)
+        self.assertEqual(result['errors'], 0, result['error_types'])
+        self.assertEqual(stub.requests['f1'] + stub.requests['f2'], 6)
+        self.assertEqual(set(result['stages_ms']), set(STAGES))
+        self.assertGreater(result['stages_ms']['xmldsig'], 0)
+        self.assertGreater(result['stages_ms']['http'], 0)
+        self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p95'])
+
+    def test_stub_errors_are_counted(self):
+        """Test HTTP 500 SOAP faults from the stub are reported as errors."""
+        with override_settings(MEDIA_ROOT=self.media.name), StubFiscalServer(error_rate=1.0) as stub:
+            company_id, invoice_ids = self._data(stub, 3)
+            result = run_benchmark(invoice_ids)
+
+        self.assertEqual(result['errors'], 3)
+        self.assertEqual(result['error_types'], {'HTTPError': 3})
+        self.assertNotIn('stages_ms', result)
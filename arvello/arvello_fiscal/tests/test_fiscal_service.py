@@ -12,6 +12,12 @@ class FiscalServiceTests(TestCase):
 
     def setUp(self):
         """Set up test data."""
+        # Cached configs/adapters from other tests (rolled back without delete signals)
+        from django.core.cache import cache
+        from arvello_fiscal.services.adapter_registry import adapter_registry
+        cache.clear()
+        adapter_registry.clear()
+
         self.company = Company.objects.create(
             clientName="Test Company",
             addressLine1="Test Address",
@@ -239,4 +245,85 @@ class FiscalServiceTests(TestCase):
         invoice_wholesale = self._create_invoice_with_product(self.business_client)
         badge_wholesale = invoice_wholesale.get_fiscalization_type_badge()
         self.assertIn('bg-success', badge_wholesale)
-        self.assertIn('F2', badge_wholesale)
\ No newline at end of file
+        self.assertIn('F2', badge_wholesale)
+
+    def test_build_fiscal_document_single_pass(self):
+        """Test fiscal document is built in two queries with totals matching the invoice."""
+        from dataclasses import FrozenInstanceError
+        from decimal import Decimal
+        from arvello_fiscal.documents import build_fiscal_document
+
+        invoice = self._create_invoice_with_product(self.individual_client)
+        reduced = Product.objects.create(title="Reduced", price=10.0, taxPercent=13, barid="TEST002")
+        InvoiceProduct.objects.create(invoice=invoice, product=reduced, quantity=3, discount=10)
+
+        with self.assertNumQueries(2):
+            document = build_fiscal_document(invoice.pk)
+
+        self.assertTrue(document.is_ready)
+        self.assertEqual(len(document.lines), 2)
+        self.assertEqual(document.pretax_amount, invoice.pretax())
+        self.assertEqual(document.vat_amount, invoice.tax())
+        self.assertEqual(document.total_amount, invoice.price_with_vat())
+        rates = {bucket.rate: bucket for bucket in document.vat_buckets}
+        self.assertEqual(rates[Decimal('13')].base_amount, Decimal('27.00'))
+        self.assertEqual(rates[Decimal('13')].vat_amount, Decimal('3.51'))
+        with self.assertRaises(FrozenInstanceError):
+            document.total_amount = Decimal('0')
+
+        # Subject and client already loaded: only the line items are queried
+        loaded = Invoice.objects.select_related('subject', 'client').get(pk=invoice.pk)
+        with self.assertNumQueries(1):
+            build_fiscal_document(loaded)
+
+    def test_adapter_registry_caches_and_invalidates(self):
+        """Test adapters are reused per config version and rebuilt when the config changes."""
+        import requests
+        from arvello_fiscal.adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
+        from arvello_fiscal.adapters.sandbox import SandboxAdapter
+        from django.core.cache import cache
+        from arvello_fiscal.services.adapter_registry import CONFIG_VERSION_FIELDS, FISCAL_CONFIG_CACHE_KEY
+
+        company_id = str(self.company.id)
+        config = FiscalConfig.objects.create(company_id=company_id, adapter='fiskalizacija_v1', mode='sandbox')
+        invoice = self._create_invoice_with_product(self.individual_client)
+
+        adapter = FiscalService.get_adapter_for_company(company_id)
+        self.assertIsInstance(adapter, FiskalizacijaV1Adapter)
+        self.assertIsInstance(adapter.session, requests.Session)
+        with self.assertNumQueries(0):
+            self.assertIs(FiscalService.get_adapter_for_company(company_id), adapter)
+            self.assertIs(FiscalService.get_adapter_for_invoice(invoice), adapter)
+
+        # Only the config version is shared through the cache, not the certificate password
+        cached = cache.get(FISCAL_CONFIG_CACHE_KEY.format(company_id))
+        self.assertEqual(set(cached), set(CONFIG_VERSION_FIELDS))
+
+        # Saving the config (post_save) drops the cached adapter
+        config.mode = 'production'
+        config.save()
+        updated = FiscalService.get_adapter_for_company(company_id)
+        self.assertIsNot(updated, adapter)
+        self.assertEqual(updated.mode, 'production')
+
+        config.delete()
+        self.assertIsInstance(FiscalService.get_adapter_for_company(company_id), SandboxAdapter)
+
+    def test_adapter_loads_signing_keys_once(self):
+        """Test a cached adapter loads its key and certificate only on first use."""
+        from unittest import mock
+        import xmlsec
+        from arvello_fiscal.adapters.fiskalizacija_v1 import FiskalizacijaV1Adapter
+        from arvello_fiscal.management.commands.fiscal_payload_benchmark import TEST_CERTS, synthetic_fiscal_data
+
+        adapter = FiskalizacijaV1Adapter(mode='production', cert_meta={
+            'cert_path': str(TEST_CERTS / 'test_cert.pem'),
+            'key_path': str(TEST_CERTS / 'test_key.pem'),
+        })
+        with mock.patch.object(adapter, '_load_signing_key', wraps=adapter._load_signing_key) as signing_key, \
+                mock.patch.object(adapter, '_load_private_key', wraps=adapter._load_private_key) as private_key:
+            for index in range(3):
+                adapter.sign_payload(adapter.build_payload(synthetic_fiscal_data(index)))
+        self.assertEqual(signing_key.call_count, 1)
+        self.assertEqual(private_key.call_count, 1)
+        self.assertIsInstance(adapter._keys['xmlsec'], xmlsec.Key)
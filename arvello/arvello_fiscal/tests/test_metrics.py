@@ -0,0 +1,131 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from arvello_fiscal import metrics
+from arvello_fiscal.models import FiscalConfig, FiscalDocument, FiscalHealthProbe, FiscalRequest
+from arvello_fiscal.services.adapter_registry import adapter_registry
+
+
+class MetricsPrimitivesTests(TestCase):
+    """Counters, histograms and the Prometheus text format."""
+
+    def test_counter_and_histogram_exposition(self):
+        """Test samples are rendered with escaped labels and cumulative buckets."""
+        counter = metrics.Counter('test_total', 'Test counter.', ['adapter'])
+        counter.inc(adapter='a"b')
+        counter.inc(2, adapter='a"b')
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', ['stage'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value, stage='http')
+
+        text = '\n'.join(counter.render() + histogram.render())
+        self.assertIn('# TYPE test_total counter', text)
+        self.assertIn('test_total{adapter="a\\"b"} 3', text)
+        self.assertIn('test_seconds_bucket{stage="http",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="http",le="1"} 3', text)
+        self.assertIn('test_seconds_bucket{stage="http",le="+Inf"} 4', text)
+        self.assertIn('test_seconds_count{stage="http"} 4', text)
+
+        self.assertAlmostEqual(histogram.quantile(0.5, stage='http'), 0.55)
+        self.assertIsNone(histogram.quantile(0.5, stage='sign'))
+        with self.assertRaises(ValueError):
+            counter.inc(stage='http')
+
+
+    def test_worker_http_server(self):
+        """Test a worker process serves its own metrics without the database collectors."""
+        import urllib.error
+        import urllib.request
+
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        metrics.requests_total.inc(adapter='fina')
+        server = metrics.start_http_server(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        with urllib.request.urlopen(url + '/metrics') as response:
+            text = response.read().decode()
+        self.assertIn('arvello_fiscal_requests_total{adapter="fina"} 1', text)
+        self.assertNotIn('arvello_fiscal_queue_depth', text)
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/other')
+
+
+class FiscalMetricsTests(TestCase):
+    """Adapter instrumentation, /metrics, the dashboard and fiscal_probe."""
+
+    def setUp(self):
+        cache.clear()
+        adapter_registry.clear()
+        metrics.registry.clear()
+        self.config = FiscalConfig.objects.create(company_id='12345678903', adapter='sandbox', mode='sandbox')
+
+    def test_instrumented_adapter_counts_requests_and_failures(self):
+        """Test stages are timed and rejected responses counted as failures."""
+        adapter = adapter_registry.get(self.config.company_id)
+        adapter.fiscalize({'type': 'invoice', 'id': 1})
+
+        self.assertEqual(metrics.requests_total.value(adapter='sandbox'), 1)
+        for stage in ('payload', 'sign', 'http', 'parse'):
+            self.assertEqual(metrics.stage_seconds.snapshot(adapter='sandbox', stage=stage)['count'], 1)
+        self.assertEqual(metrics.failures_total.label_values(), [])
+
+        with mock.patch.object(type(adapter), 'send', return_value={'status': 'error'}):
+            adapter_registry.clear()
+            adapter_registry.get(self.config.company_id).fiscalize({'type': 'invoice', 'id': 2})
+        self.assertEqual(metrics.failures_total.value(adapter='sandbox', reason='rejected'), 1)
+
+    def test_probe_command_and_metrics_endpoint(self):
+        """Test fiscal_probe records results that /metrics exposes with the queue depth."""
+        document = FiscalDocument.objects.create(document_type='invoice', document_id='1', company_id='12345678903')
+        FiscalRequest.objects.create(fiscal_document=document, idempotency_key='k1', status='queued')
+
+        out = StringIO()
+        call_command('fiscal_probe', stdout=out)
+        self.assertIn('12345678903 (sandbox): OK', out.getvalue())
+        probe = FiscalHealthProbe.objects.get()
+        self.assertTrue(probe.ok)
+
+        url = reverse('fiscal_metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(FISCAL_METRICS_TOKEN='secret-token'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret-token')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('arvello_fiscal_queue_depth{status="queued"} 1', text)
+        self.assertIn('arvello_fiscal_health_up{company="12345678903",adapter="sandbox"} 1', text)
+        self.assertIn('# TYPE arvello_fiscal_stage_seconds histogram', text)
+
+    def test_probe_records_failures(self):
+        """Test a health check exception is recorded as a failed probe."""
+        with mock.patch('arvello_fiscal.adapters.sandbox.SandboxAdapter.health_check', side_effect=OSError('down')):
+            call_command('fiscal_probe', stdout=StringIO())
+        probe = FiscalHealthProbe.objects.get()
+        self.assertFalse(probe.ok)
+        self.assertIn('OSError: down', probe.error)
+
+    def test_dashboard_for_staff(self):
+        """Test the dashboard shows adapter stages and probes to staff users only."""
+        adapter_registry.get(self.config.company_id).fiscalize({'type': 'invoice', 'id': 1})
+        call_command('fiscal_probe', stdout=StringIO())
+
+        user = get_user_model().objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('fiscal_dashboard')).status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('fiscal_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['adapter_rows'][0]['requests'], 1)
+        self.assertEqual(len(response.context['probes']), 1)
+        self.assertEqual(response.context['probes'][0]['last_24h']['total'], 1)
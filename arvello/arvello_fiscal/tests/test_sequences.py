@@ -0,0 +1,122 @@
+import threading
+import time
+
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from arvello_fiscal.models import FiscalConfig, FiscalDevice, FiscalLocation, FiscalSequenceBlock
+from arvello_fiscal.sequences import SequenceAllocator, reserve_sequence, sequence_gaps
+
+
+def _create_device():
+    config = FiscalConfig.objects.create(company_id='seq-company', adapter='fiskalizacija_v1', mode='sandbox')
+    location = FiscalLocation.objects.create(fiscal_config=config, location_id='POS1', name='Poslovnica')
+    return FiscalDevice.objects.create(location=location, device_id='1', name='Kasa 1')
+
+
+class SequenceAllocatorTests(TestCase):
+    """Device sequence numbers: atomic increments, block reservation and gap accounting."""
+
+    def setUp(self):
+        self.device = _create_device()
+
+    def test_get_next_sequence_increments(self):
+        """Test get_next_sequence returns consecutive numbers and updates the instance."""
+        self.assertEqual(self.device.get_next_sequence(), 1)
+        self.assertEqual(self.device.get_next_sequence(), 2)
+        self.assertEqual(self.device.current_sequence, 2)
+        self.assertEqual(reserve_sequence(self.device.pk, 3), (3, 5))
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_sequence, 5)
+
+    def test_unknown_device(self):
+        """Test reserving for a missing device raises DoesNotExist."""
+        with self.assertRaises(FiscalDevice.DoesNotExist):
+            reserve_sequence(self.device.pk + 1000)
+
+    def test_blocks_and_gaps(self):
+        """Test numbers come from reserved blocks and unused numbers are reported as gaps."""
+        with SequenceAllocator(block_size=5, worker='w1') as allocator:
+            numbers = [allocator.next(self.device.pk) for _ in range(7)]
+            # Second block is still held by the worker
+            self.assertEqual(len(sequence_gaps(self.device.pk)['open_blocks']), 1)
+        self.assertEqual(numbers, list(range(1, 8)))
+
+        # Another register keeps numbering after the reserved blocks
+        self.assertEqual(self.device.get_next_sequence(), 11)
+
+        blocks = list(FiscalSequenceBlock.objects.filter(device=self.device))
+        self.assertEqual([(b.first_number, b.last_number, b.used_count) for b in blocks], [(1, 5, 5), (6, 10, 2)])
+        self.assertTrue(all(b.released_at for b in blocks))
+
+        report = sequence_gaps(self.device.pk)
+        self.assertEqual(report['gaps'], [(8, 10)])
+        self.assertEqual(report['unused'], 3)
+        self.assertEqual(report['open_blocks'], [])
+
+
+class SequenceConcurrencyTests(TransactionTestCase):
+    """Stress test: many workers allocating numbers for the same device at once."""
+
+    WORKERS = 8
+    NUMBERS_PER_WORKER = 40
+
+    def setUp(self):
+        self.device = _create_device()
+
+    @staticmethod
+    def _retry(func, *args, **kwargs):
+        # SQLite in-memory test databases use a shared cache, where a
+        # concurrent writer fails with "table is locked" instead of waiting
+        for _ in range(500):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+                time.sleep(0.002)
+        raise AssertionError('database stayed locked')
+
+    def _worker(self, index, results, errors, barrier):
+        try:
+            barrier.wait()
+            issued = []
+            allocator = SequenceAllocator(block_size=7, worker=f'w{index}')
+            for position in range(self.NUMBERS_PER_WORKER):
+                if position % 10 == 0:
+                    # Mix in single reservations (registers without an allocator)
+                    issued.append(self._retry(reserve_sequence, self.device.pk)[0])
+                else:
+                    issued.append(self._retry(allocator.next, self.device.pk))
+            self._retry(allocator.release)
+            results[index] = issued
+        except Exception as exc:  # reported from the main thread
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_no_duplicate_numbers(self):
+        """Test concurrent workers never issue the same number and every number is accounted for."""
+        results, errors = {}, []
+        barrier = threading.Barrier(self.WORKERS)
+        threads = [
+            threading.Thread(target=self._worker, args=(index, results, errors, barrier))
+            for index in range(self.WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        issued = [number for numbers in results.values() for number in numbers]
+        self.assertEqual(len(issued), self.WORKERS * self.NUMBERS_PER_WORKER)
+        self.assertEqual(len(set(issued)), len(issued))
+
+        self.device.refresh_from_db()
+        report = sequence_gaps(self.device.pk)
+        self.assertEqual(report['open_blocks'], [])
+        # Issued numbers and unused block rests cover 1..current_sequence exactly
+        gap_numbers = {n for first, last in report['gaps'] for n in range(first, last + 1)}
+        self.assertFalse(gap_numbers & set(issued))
+        self.assertEqual(set(issued) | gap_numbers, set(range(1, self.device.current_sequence + 1)))
@@ -1,6 +1,16 @@
+import hmac
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from .models import FiscalDocument, FiscalRequest
+from django.db.models import Avg, Count, Max, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import never_cache
+from . import metrics
+from .models import FiscalDocument, FiscalHealthProbe, FiscalRequest
 from .services.fiscal_service import FiscalService
 from django.contrib import messages
 
@@ -24,3 +34,72 @@ def submit_fiscal_document(request, doc_id):
     fr = FiscalService.submit_and_enqueue(doc.document_type, doc.document_id, doc.company_id, payload, enqueue=True)
     messages.success(request, f'Fiscal request {fr.id} submitted (sandbox-first).')
     return redirect('fiscal_documents')
+
+
+@never_cache
+def prometheus_metrics(request):
+    """Fiscal metrics in the Prometheus text format (staff session or bearer token)."""
+    token = getattr(settings, 'FISCAL_METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized and token and authorization.startswith('Bearer '):
+        authorized = hmac.compare_digest(authorization[len('Bearer '):].encode(), token.encode())
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def fiscal_dashboard(request):
+    """Staff dashboard: requests, failures and stage latencies per adapter, queue depth and health probes."""
+    adapters = sorted(
+        {key[0] for key in metrics.requests_total.label_values()}
+        | {key[0] for key in metrics.stage_seconds.label_values()}
+    )
+    failures = {}
+    for adapter, reason in metrics.failures_total.label_values():
+        failures.setdefault(adapter, []).append((reason, metrics.failures_total.value(adapter=adapter, reason=reason)))
+
+    adapter_rows = []
+    for adapter in adapters:
+        requests_count = metrics.requests_total.value(adapter=adapter)
+        failed = sum(count for _, count in failures.get(adapter, []))
+        stages = []
+        for _, stage in metrics.STAGE_METHODS:
+            snapshot = metrics.stage_seconds.snapshot(adapter=adapter, stage=stage)
+            if snapshot:
+                stages.append({
+                    'stage': stage,
+                    'count': snapshot['count'],
+                    'avg_ms': snapshot['sum'] / snapshot['count'] * 1000,
+                    'p50_ms': metrics.stage_seconds.quantile(0.5, adapter=adapter, stage=stage) * 1000,
+                    'p95_ms': metrics.stage_seconds.quantile(0.95, adapter=adapter, stage=stage) * 1000,
+                })
+        adapter_rows.append({
+            'adapter': adapter,
+            'requests': requests_count,
+            'failures': failed,
+            'failure_reasons': failures.get(adapter, []),
+            'failure_rate': failed / requests_count * 100 if requests_count else 0,
+            'retries': metrics.retries_total.value(adapter=adapter),
+            'stages': stages,
+        })
+
+    since = timezone.now() - timedelta(hours=24)
+    probe_stats = {
+        row['fiscal_config']: row
+        for row in FiscalHealthProbe.objects.filter(checked_at__gte=since).order_by().values('fiscal_config').annotate(
+            total=Count('id'), failed=Count('id', filter=Q(ok=False)), avg_ms=Avg('rtt_ms'), max_ms=Max('rtt_ms'),
+        )
+    }
+    probes = [
+        {'probe': probe, 'last_24h': probe_stats.get(probe.fiscal_config_id)}
+        for probe in FiscalHealthProbe.latest().order_by('fiscal_config__company_id')
+    ]
+
+    context = {
+        'adapter_rows': adapter_rows,
+        'queue': FiscalRequest.objects.order_by('status').values('status').annotate(total=Count('id')),
+        'probes': probes,
+    }
+    return render(request, 'fiscal_dashboard.html', context)
@@ -40,6 +40,19 @@ class SalaryAdmin(SimpleHistoryAdmin):
     list_filter = ('period_year', 'period_month')
     search_fields = ('employee__first_name', 'employee__last_name')
 
+@admin.register(PayslipDelivery)
+class PayslipDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('salary', 'recipient', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('salary__employee__first_name', 'salary__employee__last_name', 'recipient')
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'company', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('attempts', 'last_error', 'sent_at', 'created_at')
+
 @admin.register(LocalIncomeTax)
 class LocalIncomeTaxAdmin(SimpleHistoryAdmin):
     list_display = ('city_name', 'tax_rate_lower', 'tax_rate_higher', 'valid_from')
@@ -1,7 +1,9 @@
-from .models import Invoice, InvoiceProduct, Offer, OfferProduct, Product, Supplier, Expense, Company, Inventory, Client, Employee, Salary
+from .models import Invoice, InvoiceProduct, Offer, OfferProduct, Product, Supplier, Expense, Company, Inventory, Client, Employee, Salary, SearchDocument
 from django.db.models import Q
 from django.utils import timezone
 from simple_history.utils import get_history_model_for_model
+from .utils.history_diff import get_stored_changes
+from .utils.search_index import filter_queryset
 
 
 def filter_invoices_to_string(**criteria):
@@ -10,7 +12,7 @@ def filter_invoices_to_string(**criteria):
     
     Supported criteria:
     - client_id: Filter by client ID
-    - client_name: Filter by client name (partial match)
+    - client_name: Filter by client name (words or word prefixes, diacritics ignored)
     - subject_id: Filter by subject (company) ID
     - is_paid: Filter by payment status (True/False)
     - due_date_from: Filter invoices with due date from this date (YYYY-MM-DD)
@@ -19,7 +21,7 @@ def filter_invoices_to_string(**criteria):
     - date_to: Filter invoices created to this date (YYYY-MM-DD)
     - number: Filter by invoice number (partial match)
     - product_id: Filter by product ID (invoices containing this product)
-    - product_title: Filter by product title (partial match, invoices containing products with this title)
+    - product_title: Filter by product title (words or word prefixes, invoices containing products with this title)
     - invoice_type: Filter by invoice type ('maloprodajni' for F1 retail, 'veleprodajni' for F2 wholesale)
     - payment_method: Filter by payment method ('cash', 'card', 'bank_transfer', 'other')
     """
@@ -28,7 +30,7 @@ def filter_invoices_to_string(**criteria):
     if 'client_id' in criteria:
         queryset = queryset.filter(client_id=criteria['client_id'])
     if 'client_name' in criteria:
-        queryset = queryset.filter(client__clientName__icontains=criteria['client_name'])
+        queryset = queryset.filter(client__in=filter_queryset(Client.objects.all(), 'client', criteria['client_name']))
     if 'subject_id' in criteria:
         queryset = queryset.filter(subject_id=criteria['subject_id'])
     if 'is_paid' in criteria:
@@ -52,7 +54,7 @@ def filter_invoices_to_string(**criteria):
         queryset = queryset.filter(id__in=invoice_ids)
     if 'product_title' in criteria:
         invoice_ids = InvoiceProduct.objects.filter(
-            product__title__icontains=criteria['product_title']
+            product__in=filter_queryset(Product.objects.all(), 'product', criteria['product_title'])
         ).values_list('invoice_id', flat=True)
         queryset = queryset.filter(id__in=invoice_ids)
     
@@ -102,7 +104,7 @@ def filter_offers_to_string(**criteria):
     
     Supported criteria:
     - client_id: Filter by client ID
-    - client_name: Filter by client name (partial match)
+    - client_name: Filter by client name (words or word prefixes, diacritics ignored)
     - subject_id: Filter by subject (company) ID
     - due_date_from: Filter offers with expiration date from this date (YYYY-MM-DD)
     - due_date_to: Filter offers with expiration date to this date (YYYY-MM-DD)
@@ -110,14 +112,14 @@ def filter_offers_to_string(**criteria):
     - date_to: Filter offers created to this date (YYYY-MM-DD)
     - number: Filter by offer number (partial match)
     - product_id: Filter by product ID (offers containing this product)
-    - product_title: Filter by product title (partial match, offers containing products with this title)
+    - product_title: Filter by product title (words or word prefixes, offers containing products with this title)
     """
     queryset = Offer.objects.all()
     
     if 'client_id' in criteria:
         queryset = queryset.filter(client_id=criteria['client_id'])
     if 'client_name' in criteria:
-        queryset = queryset.filter(client__clientName__icontains=criteria['client_name'])
+        queryset = queryset.filter(client__in=filter_queryset(Client.objects.all(), 'client', criteria['client_name']))
     if 'subject_id' in criteria:
         queryset = queryset.filter(subject_id=criteria['subject_id'])
     if 'due_date_from' in criteria:
@@ -139,7 +141,7 @@ def filter_offers_to_string(**criteria):
         queryset = queryset.filter(id__in=offer_ids)
     if 'product_title' in criteria:
         offer_ids = OfferProduct.objects.filter(
-            product__title__icontains=criteria['product_title']
+            product__in=filter_queryset(Product.objects.all(), 'product', criteria['product_title'])
         ).values_list('offer_id', flat=True)
         queryset = queryset.filter(id__in=offer_ids)
     
@@ -292,13 +294,13 @@ def filter_clients_to_string(**criteria):
     Filters clients based on provided criteria and returns all matching client data as a formatted string.
     
     Supported criteria:
-    - name: Filter by client name (partial match)
+    - name: Filter by client name (words or word prefixes, diacritics ignored)
     - province: Filter by province/county (partial match)
     """
     queryset = Client.objects.all()
     
     if 'name' in criteria:
-        queryset = queryset.filter(clientName__icontains=criteria['name'])
+        queryset = filter_queryset(queryset, 'client', criteria['name'])
     if 'province' in criteria:
         queryset = queryset.filter(province__icontains=criteria['province'])
     
@@ -329,7 +331,7 @@ def filter_products_to_string(**criteria):
     Filters products based on provided criteria and returns all matching product data as a formatted string.
     
     Supported criteria:
-    - title: Filter by product title (partial match)
+    - title: Filter by product title (words or word prefixes, diacritics ignored)
     - price_min: Filter products with price >= this value
     - price_max: Filter products with price <= this value
     - currency: Filter by currency (€, $, £)
@@ -337,24 +339,14 @@ def filter_products_to_string(**criteria):
     queryset = Product.objects.all()
     
     if 'title' in criteria:
-        # Case-insensitive search that works with Croatian characters (SQLite doesn't handle Unicode case folding)
-        search_term = criteria['title'].lower()
-        queryset = [p for p in queryset if search_term in p.title.lower()]
-    # If title filter was applied, queryset is now a list - convert remaining filters to list comprehension
-    if isinstance(queryset, list):
-        if 'price_min' in criteria:
-            queryset = [p for p in queryset if p.price >= criteria['price_min']]
-        if 'price_max' in criteria:
-            queryset = [p for p in queryset if p.price <= criteria['price_max']]
-        if 'currency' in criteria:
-            queryset = [p for p in queryset if p.currency == criteria['currency']]
-    else:
-        if 'price_min' in criteria:
-            queryset = queryset.filter(price__gte=criteria['price_min'])
-        if 'price_max' in criteria:
-            queryset = queryset.filter(price__lte=criteria['price_max'])
-        if 'currency' in criteria:
-            queryset = queryset.filter(currency=criteria['currency'])
+        # Search index matching is case-insensitive and ignores Croatian diacritics
+        queryset = filter_queryset(queryset, 'product', criteria['title'])
+    if 'price_min' in criteria:
+        queryset = queryset.filter(price__gte=criteria['price_min'])
+    if 'price_max' in criteria:
+        queryset = queryset.filter(price__lte=criteria['price_max'])
+    if 'currency' in criteria:
+        queryset = queryset.filter(currency=criteria['currency'])
     
     result = []
     for product in queryset:
@@ -523,7 +515,7 @@ def filter_change_history_to_string(**criteria):
     for name, model_class in models_to_query.items():
         try:
             history_model = get_history_model_for_model(model_class)
-            queryset = history_model.objects.all().order_by('-history_date')
+            queryset = history_model.objects.select_related('history_user').order_by('-history_date')
             
             # Apply date filters
             if 'date_from' in criteria and criteria['date_from']:
@@ -555,6 +547,13 @@ def filter_change_history_to_string(**criteria):
                 elif hasattr(record, 'number'):
                     data += f"Number: {record.number}\n"
                 
+                # Promijenjena polja (spremljena pri zapisivanju povijesti)
+                stored_changes = get_stored_changes(record) if record.history_type == '~' else None
+                if stored_changes:
+                    data += "Changed Fields:\n"
+                    for field, old_value, new_value in stored_changes:
+                        data += f"  {field.verbose_name or field.name}: {old_value} -> {new_value}\n"
+                
                 data += "-----\n"
                 result.append(data)
         except Exception as e:
@@ -568,6 +567,43 @@ def filter_change_history_to_string(**criteria):
         return "No change history found matching the criteria."
 
 
+def search_records(query, record_type=None, limit=10):
+    """
+    Searches the local retrieval index (BM25) over invoices, offers, clients, products,
+    expenses, suppliers and change history, and returns only the best matching records as a formatted string.
+
+    Parameters:
+    - query: Free text to search for, e.g. client name, invoice number, product, note or OIB (REQUIRED)
+    - record_type: Restrict results to one type ('invoice', 'offer', 'client', 'product', 'expense', 'supplier', 'history')
+    - limit: Maximum number of results (default 10, max 50)
+    """
+    from .utils.search_index import search
+
+    record_types = dict(SearchDocument.RECORD_TYPES)
+    if record_type:
+        record_type = str(record_type).lower()
+        if record_type not in record_types:
+            return f"Unknown record type: {record_type}. Available types: {', '.join(record_types)}"
+
+    matches = search(query, record_types=[record_type] if record_type else None, limit=limit)
+
+    result = []
+    for document, score in matches:
+        data = f"Type: {document.record_type}\n"
+        data += f"ID: {document.object_id}\n"
+        data += f"Title: {document.title}\n"
+        data += f"{document.summary}\n"
+        data += f"Relevance: {score:.2f}\n"
+        data += "-----\n"
+        result.append(data)
+
+    if result:
+        header = f"Found {len(result)} records matching '{query}':\n\n"
+        return header + "\n".join(result)
+    else:
+        return f"No records found matching '{query}'."
+
+
 # =============================================================================
 # ACTION PROPOSAL FUNCTIONS
 # These functions don't execute changes - they return structured action proposals
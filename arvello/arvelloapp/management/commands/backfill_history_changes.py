@@ -0,0 +1,76 @@
+"""
+Management command za izračun spremljenih razlika postojećih zapisa povijesti.
+Korištenje: python manage.py backfill_history_changes [--force] [--batch-size 500]
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from arvelloapp.utils.history_diff import compute_changes, supports_stored_changes
+
+
+class Command(BaseCommand):
+    help = 'Izračunava i sprema promijenjena polja za postojeće zapise povijesti'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Ponovno izračunaj i zapise koji već imaju spremljene razlike',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Broj zapisa po jednom ažuriranju baze (zadano 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        for model in apps.get_models():
+            if not hasattr(model, 'history'):
+                continue
+            history_model = model.history.model
+            if not supports_stored_changes(history_model):
+                continue
+
+            updated = self.backfill_model(model, history_model, options['force'], batch_size)
+            total += updated
+            if updated:
+                self.stdout.write(f'  {model._meta.verbose_name}: {updated}')
+
+        self.stdout.write(self.style.SUCCESS(f'Spremljene razlike za {total} zapisa povijesti'))
+
+    def backfill_model(self, model, history_model, force, batch_size):
+        # Jedan prolaz kroz povijest poredanu po objektu i vremenu - prethodna
+        # verzija je uvijek prethodni zapis istog objekta, bez dodatnih upita
+        records = (
+            history_model.objects
+            .order_by('id', 'history_date', 'history_id')
+            .iterator(chunk_size=batch_size)
+        )
+
+        pending = []
+        updated = 0
+        previous = None
+        for record in records:
+            if previous is not None and previous.id != record.id:
+                previous = None
+
+            if force or record.history_changes is None:
+                if record.history_type == '~':
+                    record.history_changes = compute_changes(record, previous, model)
+                else:
+                    record.history_changes = []
+                pending.append(record)
+
+            if len(pending) >= batch_size:
+                history_model.objects.bulk_update(pending, ['history_changes'])
+                updated += len(pending)
+                pending = []
+            previous = record
+
+        if pending:
+            history_model.objects.bulk_update(pending, ['history_changes'])
+            updated += len(pending)
+        return updated
@@ -0,0 +1,130 @@
+"""
+Management command za skupno osvježavanje podataka klijenata i dobavljača iz Sudskog registra.
+Korištenje: python manage.py enrich_clients_from_registry [--concurrency 4] [--force] [--apply]
+
+Za sve OIB-e klijenata i dobavljača dohvaća podatke iz registra (paralelno, uz
+ograničen broj istovremenih zahtjeva preko jedne HTTP sesije) i sprema ih u
+trajni cache. Uz --apply popunjava prazna polja adrese i kontakta.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from arvelloapp.models import Client, CourtRegistryCache, Supplier
+from arvelloapp.utils.court_registry import (
+    CourtRegistryError,
+    CourtRegistryNotFound,
+    fetch_company_data_by_oib,
+    get_court_registry_client,
+    store_cached_lookup,
+)
+
+# Polja koja se popunjavaju podacima iz registra (samo ako su prazna)
+CLIENT_FIELDS = ['addressLine1', 'postalCode', 'province', 'phoneNumber', 'emailAddress']
+SUPPLIER_FIELDS = ['addressLine1', 'town', 'postalCode', 'province', 'phoneNumber', 'emailAddress']
+
+
+class Command(BaseCommand):
+    help = 'Osvježava podatke iz Sudskog registra za sve OIB-e klijenata i dobavljača'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Najveći broj istovremenih zahtjeva prema registru (zadano 4)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Osvježi i OIB-e koji u cacheu imaju svježe podatke',
+        )
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Popuni prazna polja klijenata i dobavljača podacima iz registra',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+
+        try:
+            registry = get_court_registry_client()
+        except CourtRegistryError as e:
+            raise CommandError(str(e))
+
+        oibs = self.collect_oibs()
+        if not options['force']:
+            fresh_after = timezone.now() - timedelta(seconds=settings.COURT_REGISTRY_CACHE['TTL'])
+            fresh = set(
+                CourtRegistryCache.objects.filter(
+                    lookup_type='oib', lookup_key__in=oibs, fetched_at__gte=fresh_after
+                ).values_list('lookup_key', flat=True)
+            )
+            oibs = oibs - fresh
+            if fresh:
+                self.stdout.write(f'Preskočeno {len(fresh)} OIB-a sa svježim podacima u cacheu')
+
+        refreshed, not_found, failed = 0, 0, 0
+        if oibs:
+            registry.configure_pool(concurrency)
+            self.stdout.write(f'Dohvaćanje {len(oibs)} OIB-a ({concurrency} istovremenih zahtjeva)...')
+
+            # Dretve rade samo mrežne zahtjeve; cache se sprema u glavnoj dretvi
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(self.fetch, registry, oib): oib for oib in oibs}
+                for future in as_completed(futures):
+                    oib = futures[future]
+                    try:
+                        store_cached_lookup('oib', oib, future.result())
+                        refreshed += 1
+                    except CourtRegistryNotFound:
+                        store_cached_lookup('oib', oib, None)
+                        not_found += 1
+                    except CourtRegistryError as e:
+                        failed += 1
+                        self.stderr.write(f'  {oib}: {e}')
+
+        self.stdout.write(f'Osvježeno: {refreshed}, nije pronađeno: {not_found}, greške: {failed}')
+
+        if options['apply']:
+            updated = self.apply_registry_data(Client, 'client', CLIENT_FIELDS)
+            updated += self.apply_registry_data(Supplier, 'supplier', SUPPLIER_FIELDS)
+            self.stdout.write(f'Ažurirano zapisa: {updated}')
+
+        self.stdout.write(self.style.SUCCESS('Obogaćivanje podataka iz Sudskog registra završeno'))
+
+    def fetch(self, registry, oib):
+        try:
+            return registry.fetch_oib_payload(oib)
+        finally:
+            # Osvježavanje tokena može otvoriti vezu prema bazi u dretvi
+            connection.close()
+
+    def collect_oibs(self):
+        oibs = set(Client.objects.exclude(OIB__isnull=True).values_list('OIB', flat=True))
+        oibs |= set(Supplier.objects.exclude(OIB__isnull=True).values_list('OIB', flat=True))
+        return {oib for oib in oibs if oib and len(oib) == 11 and oib.isdigit()}
+
+    def apply_registry_data(self, model, entity_type, fields):
+        updated = 0
+        for obj in model.objects.exclude(OIB__isnull=True).exclude(OIB=''):
+            try:
+                # Podaci se čitaju iz cachea napunjenog iznad
+                data = fetch_company_data_by_oib(obj.OIB, entity_type=entity_type)
+            except CourtRegistryError:
+                continue
+
+            changed = False
+            for field in fields:
+                if not getattr(obj, field) and data.get(field):
+                    setattr(obj, field, data[field])
+                    changed = True
+            if changed:
+                obj.save()
+                updated += 1
+        return updated
@@ -0,0 +1,45 @@
+"""
+Management command za provjeru planova izvršavanja čestih upita.
+Korištenje: python manage.py explain_hot_queries [--query invoice_book ...] [--verbose]
+
+Završava greškom ako neki upit iz utils/hot_queries.py čita cijelu tablicu
+umjesto da koristi indeks.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from arvelloapp.utils.hot_queries import HOT_QUERIES, check_hot_queries
+
+
+class Command(BaseCommand):
+    help = 'Pokreće EXPLAIN za česte upite i javlja grešku ako neki čita cijelu tablicu'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query',
+            action='append',
+            choices=sorted(HOT_QUERIES),
+            help='Provjeri samo navedeni upit (može se ponoviti)',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Ispiši cijeli plan izvršavanja svakog upita',
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        for query, plan, tables in check_hot_queries(options['query']):
+            if tables:
+                failures.append(f"{query.name} ({', '.join(tables)})")
+                self.stdout.write(self.style.ERROR(
+                    f"{query.name}: čitanje cijele tablice {', '.join(tables)} - {query.description}"
+                ))
+            else:
+                self.stdout.write(f"{query.name}: koristi indeks - {query.description}")
+            if options['verbose']:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+        if failures:
+            raise CommandError(f"Upiti bez indeksa: {'; '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('Svi česti upiti koriste indekse'))
@@ -0,0 +1,225 @@
+"""
+Management command za sažimanje i arhiviranje povijesti promjena (simple_history).
+Korištenje: python manage.py history_compact [--dry-run] [--years N] [--no-vacuum]
+
+Koraci:
+1. Uklanja zapise izmjene (~) u kojima se nijedno praćeno polje nije promijenilo
+2. Zapise starije od N godina sprema u komprimirane JSONL datoteke i briše ih iz baze
+3. Pokreće VACUUM/ANALYZE kako bi se oslobođeni prostor vratio i statistike osvježile
+
+Politika se postavlja u settings.HISTORY_RETENTION.
+"""
+import gzip
+import json
+import os
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from arvelloapp.utils.history_diff import compute_changes, supports_stored_changes
+from arvelloapp.utils.search_index import remove_history_records
+
+DELETE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Sažima povijest promjena: uklanja prazne izmjene, arhivira stare zapise i oslobađa prostor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Samo prikaži izvještaj bez promjena u bazi i na disku',
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            help='Arhiviraj zapise starije od zadanog broja godina (zamjenjuje postavku)',
+        )
+        parser.add_argument(
+            '--archive-dir',
+            type=str,
+            help='Direktorij za arhivske datoteke (zamjenjuje postavku)',
+        )
+        parser.add_argument(
+            '--no-vacuum',
+            action='store_true',
+            help='Preskoči VACUUM/ANALYZE',
+        )
+
+    def handle(self, *args, **options):
+        policy = getattr(settings, 'HISTORY_RETENTION', {})
+        years = options['years'] if options['years'] is not None else policy.get('ARCHIVE_AFTER_YEARS')
+        archive_dir = options['archive_dir'] or policy.get('ARCHIVE_DIR')
+        collapse_noop = policy.get('COLLAPSE_NOOP', True)
+        dry_run = options['dry_run']
+
+        cutoff = timezone.now() - relativedelta(years=years) if years else None
+        size_before = self.database_size()
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Probni rad - baza i datoteke se neće mijenjati'))
+
+        total_collapsed = 0
+        total_archived = 0
+        reclaimed_estimate = 0
+
+        for model in apps.get_models():
+            if not hasattr(model, 'history'):
+                continue
+            history_model = model.history.model
+
+            collapsed, collapsed_bytes = (0, 0)
+            if collapse_noop:
+                collapsed, collapsed_bytes = self.collapse_noop_records(model, history_model, dry_run)
+
+            archived, archived_bytes = (0, 0)
+            if cutoff:
+                archived, archived_bytes = self.archive_old_records(history_model, cutoff, archive_dir, dry_run)
+
+            if collapsed or archived:
+                self.stdout.write(
+                    f'  {model._meta.verbose_name}: uklonjeno praznih izmjena {collapsed}, arhivirano {archived}'
+                )
+            total_collapsed += collapsed
+            total_archived += archived
+            reclaimed_estimate += collapsed_bytes + archived_bytes
+
+        if not dry_run and not options['no_vacuum']:
+            self.vacuum(apps.get_models())
+
+        self.stdout.write(f'Uklonjeno praznih izmjena: {total_collapsed}')
+        self.stdout.write(f'Arhivirano zapisa: {total_archived}' + (f' (stariji od {cutoff:%d.%m.%Y.})' if cutoff else ''))
+        if dry_run:
+            free_bytes = self.free_space()
+            self.stdout.write(
+                f'Procijenjeni oslobođeni prostor: ~{self.format_size(reclaimed_estimate + free_bytes)} '
+                f'(zapisi ~{self.format_size(reclaimed_estimate)}, slobodne stranice {self.format_size(free_bytes)})'
+            )
+        else:
+            size_after = self.database_size()
+            if size_before is not None and size_after is not None:
+                self.stdout.write(
+                    f'Veličina baze: {self.format_size(size_before)} -> {self.format_size(size_after)} '
+                    f'(oslobođeno {self.format_size(max(size_before - size_after, 0))})'
+                )
+            self.stdout.write(self.style.SUCCESS('Sažimanje povijesti završeno'))
+
+    def collapse_noop_records(self, model, history_model, dry_run):
+        # Jedan prolaz po objektu i vremenu; izmjena bez promijenjenih polja je suvišna
+        records = history_model.objects.order_by('id', 'history_date', 'history_id').iterator(chunk_size=1000)
+
+        noop_ids = []
+        estimated_bytes = 0
+        previous = None
+        for record in records:
+            if previous is not None and previous.id != record.id:
+                previous = None
+
+            if record.history_type == '~' and previous is not None:
+                changes = record.history_changes if supports_stored_changes(history_model) else None
+                if changes is None:
+                    changes = compute_changes(record, previous, model)
+                if not changes:
+                    noop_ids.append(record.history_id)
+                    estimated_bytes += self.record_size(record)
+                    # Prethodna verzija ostaje ista jer se ništa nije promijenilo
+                    continue
+            previous = record
+
+        if not dry_run:
+            self.delete_records(history_model, noop_ids)
+        return len(noop_ids), estimated_bytes
+
+    def archive_old_records(self, history_model, cutoff, archive_dir, dry_run):
+        queryset = history_model.objects.filter(history_date__lt=cutoff).order_by('history_date', 'history_id')
+        if not queryset.exists():
+            return 0, 0
+
+        count = 0
+        estimated_bytes = 0
+        archived_ids = []
+        archive_file = None
+        if not dry_run:
+            os.makedirs(archive_dir, exist_ok=True)
+            filename = f"{history_model._meta.label_lower}-{cutoff:%Y%m%d}-{timezone.now():%Y%m%d%H%M%S}.jsonl.gz"
+            archive_file = gzip.open(os.path.join(archive_dir, filename), 'wt', encoding='utf-8')
+
+        try:
+            for record in queryset.iterator(chunk_size=1000):
+                line = self.serialize_record(record)
+                estimated_bytes += len(line)
+                count += 1
+                archived_ids.append(record.history_id)
+                if archive_file:
+                    archive_file.write(line + '\n')
+        finally:
+            if archive_file:
+                archive_file.close()
+
+        if not dry_run:
+            # Briši tek nakon što je arhiva uspješno zapisana
+            self.delete_records(history_model, archived_ids)
+        return count, estimated_bytes
+
+    def delete_records(self, history_model, history_ids):
+        # Zapisi se brišu zajedno s dokumentima u indeksu pretraživanja da ih pretraga više ne vraća
+        for start in range(0, len(history_ids), DELETE_BATCH_SIZE):
+            batch = history_ids[start:start + DELETE_BATCH_SIZE]
+            with transaction.atomic():
+                history_model.objects.filter(history_id__in=batch).delete()
+                remove_history_records(history_model, batch)
+
+    def serialize_record(self, record):
+        data = serializers.serialize('python', [record])[0]
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+    def record_size(self, record):
+        return len(self.serialize_record(record))
+
+    def vacuum(self, models):
+        history_tables = [m.history.model._meta.db_table for m in models if hasattr(m, 'history')]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'postgresql':
+                for table in history_tables:
+                    cursor.execute(f'VACUUM ANALYZE {connection.ops.quote_name(table)}')
+            else:
+                for table in history_tables:
+                    cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(table)}')
+
+    def database_size(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA page_count')
+                page_count = cursor.fetchone()[0]
+                cursor.execute('PRAGMA page_size')
+                return page_count * cursor.fetchone()[0]
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_database_size(current_database())')
+                return cursor.fetchone()[0]
+        return None
+
+    def free_space(self):
+        # Prostor koji SQLite već drži slobodnim i koji VACUUM vraća odmah
+        if connection.vendor != 'sqlite':
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA freelist_count')
+            free_pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return free_pages * cursor.fetchone()[0]
+
+    def format_size(self, size):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024 or unit == 'GB':
+                return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+            size /= 1024
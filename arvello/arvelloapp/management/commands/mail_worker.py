@@ -0,0 +1,69 @@
+"""
+Management command za slanje poruka iz reda odlazne e-pošte.
+Korištenje: python manage.py mail_worker [--once] [--batch-size 50] [--interval 5]
+
+Bez --once radi neprekidno: šalje poruke čim postanu spremne, a SMTP veze po
+subjektu drži otvorenima između serija (settings.MAIL_QUEUE['KEEPALIVE_SECONDS']).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from arvelloapp.utils.mail_queue import MailDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Šalje poruke iz reda odlazne e-pošte'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Pošalji sve trenutno spremne poruke i završi',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Broj poruka preuzetih u jednoj seriji (zadano 50)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Pauza u sekundama kada nema poruka za slanje (zadano 5)',
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = MailDispatcher()
+        batch_size = max(1, options['batch_size'])
+        total_sent = total_retried = total_failed = 0
+
+        try:
+            while True:
+                close_old_connections()
+                stats = dispatcher.deliver(batch_size)
+                total_sent += stats.sent
+                total_retried += stats.retried
+                total_failed += stats.failed
+                if stats.processed:
+                    self.stdout.write(
+                        f'Poslano: {stats.sent}, za ponovni pokušaj: {stats.retried}, neuspjelo: {stats.failed}'
+                    )
+
+                if stats.processed == batch_size:
+                    # Red nije prazan, nastavi odmah
+                    continue
+                if options['once']:
+                    break
+                dispatcher.close_idle()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            dispatcher.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Slanje završeno - poslano {total_sent}, za ponovni pokušaj {total_retried}, neuspjelo {total_failed}'
+        ))
@@ -0,0 +1,151 @@
+"""
+Management command za prijenos postojeće SQLite baze u PostgreSQL.
+Korištenje: python manage.py migrate_sqlite_to_postgres putanja/db.sqlite3 [--batch-size 2000] [--dry-run]
+
+Ciljna baza je 'default' iz postavki (DATABASE_URL ili DB_* varijable) i mora
+biti migrirana (manage.py migrate) i prazna; izvorna mora biti migrirana na
+istu verziju koda. Zapisi se čitaju i upisuju u serijama od --batch-size
+redova, s izvornim primarnim ključevima, u jednoj transakciji: provjera
+stranih ključeva u PostgreSQL-u odgođena je do kraja transakcije, pa redoslijed
+tablica ne mora zadovoljiti kružne veze. Signali se ne okidaju (nema
+fiskalizacije ni novih zapisa povijesti), a auto_now polja zadržavaju izvorne
+vrijednosti.
+"""
+from pathlib import Path
+
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers import sort_dependencies
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SOURCE_ALIAS = 'sqlite_source'
+
+# migrate ih sam stvara u ciljnoj bazi; brišu se i prenose s izvornim ključevima
+# kako bi strani ključevi (dozvole, povijest, admin log) ostali ispravni
+AUTO_CREATED_MODELS = (Permission, ContentType)
+
+# Najveći broj parametara jednog upita u PostgreSQL-u
+MAX_QUERY_PARAMS = 65535
+
+
+class Command(BaseCommand):
+    help = 'Prenosi podatke iz SQLite baze u PostgreSQL bazu iz postavki, u serijama'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=str, help='Putanja izvorne SQLite datoteke')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Broj redova po seriji čitanja i upisa (zadano 2000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Samo ispiši broj redova po tablici, bez upisa',
+        )
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if not source.is_file():
+            raise CommandError(f'SQLite datoteka {source} ne postoji.')
+
+        target = connections[DEFAULT_DB_ALIAS]
+        if target.vendor != 'postgresql':
+            raise CommandError(
+                'Ciljna baza nije PostgreSQL. Postavite DATABASE_URL ili DB_NAME/DB_USER/DB_PASSWORD.'
+            )
+        self._register_source(source)
+
+        batch_size = max(1, options['batch_size'])
+        models = self._models()
+        if options['dry_run']:
+            for model in models:
+                count = model._base_manager.using(SOURCE_ALIAS).count()
+                self.stdout.write(f'{model._meta.label}: {count}')
+            return
+
+        self._check_target_empty(models)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            for model in AUTO_CREATED_MODELS:
+                model._base_manager.using(DEFAULT_DB_ALIAS).all().delete()
+            ContentType.objects.clear_cache()
+            total = 0
+            for model in models:
+                copied = self._copy_model(model, batch_size)
+                total += copied
+                if copied:
+                    self.stdout.write(f'{model._meta.label}: {copied}')
+            self._reset_sequences(models)
+
+        # Pomoćne tablice pretraživanja nisu modeli; indeks se gradi iznova
+        call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Preneseno {total} redova iz {source}'))
+
+    def _register_source(self, path):
+        databases = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            SOURCE_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)},
+        })
+        connections.settings[SOURCE_ALIAS] = databases[SOURCE_ALIAS]
+
+    def _models(self):
+        """Modeli s vlastitim tablicama, poredani tako da referencirani dolaze prvi."""
+        app_list = [(app_config, None) for app_config in apps.get_app_configs()]
+        models = []
+        for model in sort_dependencies(app_list, allow_cycles=True):
+            if not model._meta.managed or model._meta.proxy:
+                continue
+            models.append(model)
+            # Automatski stvorene M2M tablice (npr. User.groups) nisu u popisu aplikacije
+            for field in model._meta.local_many_to_many:
+                through = field.remote_field.through
+                if through._meta.auto_created:
+                    models.append(through)
+        return models
+
+    def _check_target_empty(self, models):
+        auto_created = set(AUTO_CREATED_MODELS)
+        for model in models:
+            if model in auto_created:
+                continue
+            if model._base_manager.using(DEFAULT_DB_ALIAS).exists():
+                raise CommandError(
+                    f'Ciljna tablica {model._meta.db_table} nije prazna. Prijenos zahtijeva praznu, migriranu bazu.'
+                )
+
+    def _copy_model(self, model, batch_size):
+        fields = model._meta.local_concrete_fields
+        queryset = model._base_manager.using(SOURCE_ALIAS).order_by('pk')
+        manager = model._base_manager.db_manager(DEFAULT_DB_ALIAS)
+        copied = 0
+        batch = []
+        for instance in queryset.iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) == batch_size:
+                copied += self._insert(manager, batch, fields)
+                batch = []
+        if batch:
+            copied += self._insert(manager, batch, fields)
+        return copied
+
+    @staticmethod
+    def _insert(manager, batch, fields):
+        # raw=True kao kod loaddata: vrijednosti se upisuju kakve jesu (bez auto_now)
+        rows_per_insert = max(1, MAX_QUERY_PARAMS // len(fields))
+        for start in range(0, len(batch), rows_per_insert):
+            manager._insert(
+                batch[start:start + rows_per_insert], fields=fields, using=DEFAULT_DB_ALIAS, raw=True
+            )
+        return len(batch)
+
+    def _reset_sequences(self, models):
+        target = connections[DEFAULT_DB_ALIAS]
+        statements = target.ops.sequence_reset_sql(no_style(), models)
+        with target.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,30 @@
+"""
+Management command za ponovnu izgradnju lokalnog indeksa pretraživanja.
+Korištenje: python manage.py rebuild_search_index [--no-history]
+"""
+from django.core.management.base import BaseCommand
+from arvelloapp.utils.search_backends import get_backend
+from arvelloapp.utils.search_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Ponovno gradi lokalni indeks pretraživanja (računi, ponude, klijenti, proizvodi, troškovi, dobavljači, povijest)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-history',
+            action='store_true',
+            help='Ne indeksiraj povijest promjena',
+        )
+
+    def handle(self, *args, **options):
+        stats = rebuild_index(include_history=not options['no_history'])
+
+        for record_type, count in stats.items():
+            self.stdout.write(f'  {record_type}: {count}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Indeks pretraživanja izgrađen ({sum(stats.values())} dokumenata, backend: {get_backend().name})'
+            )
+        )
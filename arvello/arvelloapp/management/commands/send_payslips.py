@@ -0,0 +1,56 @@
+"""
+Management command za skupnu izradu i slanje platnih lista za obračunsko razdoblje.
+Korištenje: python manage.py send_payslips --year 2025 --month 1 [--company OIB] [--zip putanja.zip] [--no-email]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from arvelloapp.models import Company
+from arvelloapp.utils.payslip_batch import build_payslip_zip, process_period
+
+
+class Command(BaseCommand):
+    help = 'Izrađuje platne liste za razdoblje, šalje ih zaposlenicima i po želji sprema ZIP arhivu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help='Godina obračuna')
+        parser.add_argument('--month', type=int, required=True, help='Mjesec obračuna (1-12)')
+        parser.add_argument('--company', type=str, help='OIB tvrtke (zadano sve tvrtke)')
+        parser.add_argument('--zip', type=str, help='Putanja ZIP arhive s PDF-ovima platnih lista')
+        parser.add_argument(
+            '--no-email',
+            action='store_true',
+            help='Samo izradi PDF-ove (i ZIP), bez slanja e-mailova',
+        )
+
+    def handle(self, *args, **options):
+        year, month = options['year'], options['month']
+        if not 1 <= month <= 12:
+            raise CommandError('Mjesec mora biti između 1 i 12.')
+
+        company = None
+        if options['company']:
+            company = Company.objects.filter(OIB=options['company']).first()
+            if company is None:
+                raise CommandError(f"Tvrtka s OIB-om {options['company']} nije pronađena.")
+
+        salaries, result = process_period(year, month, company, send=not options['no_email'])
+        if not salaries:
+            self.stdout.write(self.style.WARNING(f'Nema plaća za razdoblje {month:02d}/{year}'))
+            return
+
+        self.stdout.write(f'Izrađeno platnih lista: {len(result.pdfs)} od {len(salaries)}')
+        for salary_id, error in result.render_errors.items():
+            self.stderr.write(f'  Plaća {salary_id}: {error}')
+
+        if not options['no_email']:
+            self.stdout.write(
+                f'U redu za slanje: {result.queued}, greške: {result.failed}, preskočeno (bez e-maila): {result.skipped}'
+            )
+            self.stdout.write('Poruke šalje naredba mail_worker.')
+
+        if options['zip']:
+            with open(options['zip'], 'wb') as zip_file:
+                zip_file.write(build_payslip_zip(salaries, result.pdfs))
+            self.stdout.write(f"ZIP arhiva spremljena: {options['zip']}")
+
+        self.stdout.write(self.style.SUCCESS(f'Obrada platnih lista za {month:02d}/{year} završena'))
@@ -1,5 +1,6 @@
 from threading import local
 from django.utils.deprecation import MiddlewareMixin
+from .utils.request_profiler import RequestProfile, finish_profile, profiling_enabled
 
 _thread_locals = local()
 
@@ -7,6 +8,22 @@ def get_current_request():
     return getattr(_thread_locals, 'request', None)
 
 class RequestMiddleware(MiddlewareMixin):
+    """
+    Sprema trenutni zahtjev u thread-local (get_current_request).
+
+    Uz settings.REQUEST_PROFILING['ENABLED'] i profilira zahtjev: SQL upite,
+    predloške i odlazne HTTP pozive (vidi utils.request_profiler), dodaje
+    zaglavlje Server-Timing i zbraja mjerenja po viewu.
+    """
+
+    def __call__(self, request):
+        if self.async_mode or not profiling_enabled():
+            return super().__call__(request)
+        profile = RequestProfile()
+        with profile.activate():
+            response = super().__call__(request)
+        return finish_profile(profile, request, response)
+
     def process_request(self, request):
         _thread_locals.request = request
         return None
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 from uuid import uuid4
@@ -10,6 +11,7 @@ from decimal import Decimal
 from datetime import datetime, date
 from .utils.text_utils import standardize_city_name
 from django.db.models import Q
+from django.db.models.functions import Upper
 from simple_history.models import HistoricalRecords
 from django.contrib.auth import get_user_model
 from .middleware import get_current_request
@@ -35,6 +37,24 @@ class KPDCode(models.Model):
         return f"{self.code} - {self.name}"
 
 
+class HistoryChangesModel(models.Model):
+    """
+    Apstraktna baza za povijesne tablice (simple_history).
+
+    Dodaje polje s unaprijed izračunatim promjenama polja u odnosu na prethodnu
+    verziju zapisa (vidi utils/history_diff.py).
+    """
+    history_changes = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name="Promijenjena polja"
+    )
+
+    class Meta:
+        abstract = True
+
+
 class HistoryMixin:
     def get_history_user(self):
         # Dohvaća trenutnog korisnika iz zahtjeva
@@ -190,7 +210,7 @@ class Company(models.Model):
     slug = models.SlugField(max_length=500, unique=True, blank=True, null=True)
     date_created = models.DateTimeField(blank=True, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
 
     def __str__(self):
@@ -289,7 +309,7 @@ class Client(models.Model):
     slug = models.SlugField(max_length=500, unique=True, blank=True, null=True)
     date_created = models.DateTimeField(blank=True, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
 
     def __str__(self):
@@ -345,7 +365,7 @@ class Product(models.Model):
     slug = models.SlugField(max_length=500, unique=True, blank=True, null=True)
     date_created = models.DateTimeField(blank=True, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     def price_with_vat(self):
         # Izračunava cijenu s PDV-om
@@ -397,7 +417,7 @@ class Offer(models.Model):
     date_created = models.DateTimeField(blank=False, null=True)
     date = models.DateField(blank=False, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     def poziv_na_broj(self):
         # Generira poziv na broj za ponudu
@@ -426,27 +446,35 @@ class Offer(models.Model):
 
     def pretax(self):
         # Izračunava iznos ponude bez PDV-a
-        ofrprdt = OfferProduct.objects.filter(offer=self)
+        ofrprdt = self.offerproduct_set.all()
         return round(sum(offer_product.pretotal() for offer_product in ofrprdt), 2)
     
     def price_with_vat(self):
         # Izračunava ukupan iznos ponude s PDV-om
-        ofrprdt = OfferProduct.objects.filter(offer=self)
+        ofrprdt = self.offerproduct_set.all()
         return round(sum(offer_product.total() for offer_product in ofrprdt), 2)
     
     def tax(self):
         # Izračunava ukupan iznos PDV-a za ponudu
-        ofrprdt = OfferProduct.objects.filter(offer=self)
+        ofrprdt = self.offerproduct_set.all()
         return round(sum(offer_product.tax() for offer_product in ofrprdt), 2)
     
+    def _first_item(self):
+        # Prva stavka ponude; koristi prefetchane stavke ako su učitane
+        return min(self.offerproduct_set.all(), key=lambda item: item.pk, default=None)
+
+    def _items_with(self, field):
+        # Stavke ponude s pozitivnim rabatom/popustom; koristi prefetchane stavke ako su učitane
+        return [item for item in self.offerproduct_set.all() if (getattr(item, field) or 0) > 0]
+
     def curr(self):
         # Vraća simbol valute prvog proizvoda na ponudi
-        first_product = OfferProduct.objects.filter(offer=self).first()
+        first_product = self._first_item()
         return first_product.product.currency
     
     def currtext(self):
         # Vraća kod valute prvog proizvoda na ponudi
-        first_product = OfferProduct.objects.filter(offer=self).first()
+        first_product = self._first_item()
         return first_product.product.get_currency_code()
         
     def total100(self):
@@ -455,17 +483,17 @@ class Offer(models.Model):
     
     def tolrabat(self):
         # Izračunava ukupan iznos rabata za ponudu
-        ofrprdt = OfferProduct.objects.filter(offer=self, rabat__gt=0)
+        ofrprdt = self._items_with('rabat')
         return round(sum((Decimal(offer_product.product.price) * Decimal(offer_product.quantity) * Decimal(offer_product.rabat/100)) for offer_product in ofrprdt), 2)
 
     def toldiscount(self):
         # Izračunava ukupan iznos popusta za ponudu
-        ofrprdt = OfferProduct.objects.filter(offer=self, discount__gt=0)
+        ofrprdt = self._items_with('discount')
         return round(sum((Decimal(offer_product.product.price) * Decimal(offer_product.quantity) * Decimal(offer_product.discount/100)) for offer_product in ofrprdt), 2)
     
     def hasDiscount(self):
         # Provjerava ima li ponuda popust
-        ofrprdt = OfferProduct.objects.filter(offer=self, discount__gt=0)
+        ofrprdt = self._items_with('discount')
         if ofrprdt:
             return True
         else:
@@ -473,7 +501,7 @@ class Offer(models.Model):
         
     def hasRabat(self):
         # Provjerava ima li ponuda rabat
-        ofrprdt = OfferProduct.objects.filter(offer=self, rabat__gt=0)
+        ofrprdt = self._items_with('rabat')
         if ofrprdt:
             return True
         else:
@@ -527,7 +555,7 @@ class Invoice(models.Model):
     date_created = models.DateTimeField(blank=False, null=True)
     date = models.DateField(blank=False, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
     is_paid = models.BooleanField(default=False, verbose_name="Plaćen")
     payment_date = models.DateField(null=True, blank=True, verbose_name="Datum plaćanja")
     
@@ -607,6 +635,32 @@ class Invoice(models.Model):
         null=True,
         verbose_name="UBL XML referenca"
     )
+    # Slanje računa e-mailom (emailed_at postavlja mail_worker kad pošalje poruku)
+    email = models.ForeignKey(
+        'OutgoingEmail',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='invoices',
+        verbose_name="Poruka s računom"
+    )
+    emailed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Poslano e-mailom"
+    )
+
+    class Meta:
+        # Provjera korištenja: manage.py explain_hot_queries (utils/hot_queries.py)
+        indexes = [
+            # Knjiga izlaznih računa: računi subjekta u razdoblju
+            models.Index(fields=['subject', 'date'], name='invoice_subject_date_idx'),
+            # Popis računa i nadzorna ploča: razdoblje i poredak po datumu
+            models.Index(fields=['date'], name='invoice_date_idx'),
+            # Neplaćeni i dospjeli računi; parcijalni indeks ostaje malen jer je većina računa plaćena
+            models.Index(fields=['dueDate'], condition=Q(is_paid=False), name='invoice_unpaid_due_idx'),
+            models.Index(fields=['fiscal_status'], name='invoice_fiscal_status_idx'),
+        ]
 
     def poziv_na_broj(self):
         # Generira poziv na broj za račun
@@ -635,27 +689,35 @@ class Invoice(models.Model):
 
     def pretax(self):
         # Izračunava iznos računa bez PDV-a
-        invprdt = InvoiceProduct.objects.filter(invoice=self)
+        invprdt = self.invoiceproduct_set.all()
         return round(sum(invoice_product.pretotal() for invoice_product in invprdt), 2)
     
     def price_with_vat(self):
         # Izračunava ukupan iznos računa s PDV-om
-        invprdt = InvoiceProduct.objects.filter(invoice=self)
+        invprdt = self.invoiceproduct_set.all()
         return round(sum(invoice_product.total() for invoice_product in invprdt), 2)
     
     def tax(self):
         # Izračunava ukupan iznos PDV-a za račun
-        invprdt = InvoiceProduct.objects.filter(invoice=self)
+        invprdt = self.invoiceproduct_set.all()
         return round(sum(invoice_product.tax() for invoice_product in invprdt), 2)
     
+    def _first_item(self):
+        # Prva stavka računa; koristi prefetchane stavke ako su učitane
+        return min(self.invoiceproduct_set.all(), key=lambda item: item.pk, default=None)
+
+    def _items_with(self, field):
+        # Stavke računa s pozitivnim rabatom/popustom; koristi prefetchane stavke ako su učitane
+        return [item for item in self.invoiceproduct_set.all() if (getattr(item, field) or 0) > 0]
+
     def curr(self):
         # Vraća simbol valute prvog proizvoda na računu
-        first_product = InvoiceProduct.objects.filter(invoice=self).first()
+        first_product = self._first_item()
         return first_product.product.currency
     
     def currtext(self):
         # Vraća kod valute prvog proizvoda na računu
-        first_product = InvoiceProduct.objects.filter(invoice=self).first()
+        first_product = self._first_item()
         return first_product.product.get_currency_code()
         
     def total100(self):
@@ -664,17 +726,17 @@ class Invoice(models.Model):
     
     def tolrabat(self):
         # Izračunava ukupan iznos rabata za račun
-        invprdt = InvoiceProduct.objects.filter(invoice=self, rabat__gt=0)
+        invprdt = self._items_with('rabat')
         return round(sum((Decimal(invoice_product.product.price) * Decimal(invoice_product.quantity) * (Decimal(invoice_product.rabat)/Decimal(100))) for invoice_product in invprdt), 2)
 
     def toldiscount(self):
         # Izračunava ukupan iznos popusta za račun
-        invprdt = InvoiceProduct.objects.filter(invoice=self, discount__gt=0)
+        invprdt = self._items_with('discount')
         return round(sum((Decimal(invoice_product.product.price) * Decimal(invoice_product.quantity) * (Decimal(invoice_product.discount)/Decimal(100))) for invoice_product in invprdt), 2)
     
     def hasDiscount(self):
         # Provjerava ima li račun popust
-        invprdt = InvoiceProduct.objects.filter(invoice=self, discount__gt=0)
+        invprdt = self._items_with('discount')
         if invprdt:
             return True
         else:
@@ -682,7 +744,7 @@ class Invoice(models.Model):
     
     def hasRabat(self):
         # Provjerava ima li račun rabat
-        invprdt = InvoiceProduct.objects.filter(invoice=self, rabat__gt=0)
+        invprdt = self._items_with('rabat')
         if invprdt:
             return True
         else:
@@ -701,90 +763,13 @@ class Invoice(models.Model):
 
     def get_fiscal_data(self):
         """Priprema potpune podatke za fiskalizaciju u formatu za adaptere."""
-        from decimal import Decimal
-        
-        # Prikupi stavke računa po PDV stopama
-        vat_summary = {}
-        items = []
-        
-        invoice_products = InvoiceProduct.objects.filter(invoice=self)
-        for ip in invoice_products:
-            vat_rate = Decimal(str(ip.product.taxPercent))
-            base_amount = ip.pretotal()
-            vat_amount = ip.tax()
-            total_amount = ip.total()
-            
-            item = {
-                'name': ip.product.title,
-                'quantity': float(ip.quantity),
-                'unit_price': float(ip.product.price),
-                'discount': float(ip.discount or 0),
-                'rebate': float(ip.rabat or 0),
-                'vat_rate': float(vat_rate),
-                'base_amount': float(base_amount),
-                'vat_amount': float(vat_amount),
-                'total_amount': float(total_amount),
-            }
-            items.append(item)
-            
-            # Agregiraj po PDV stopi
-            vat_key = float(vat_rate)
-            if vat_key not in vat_summary:
-                vat_summary[vat_key] = {
-                    'base_amount': Decimal('0'),
-                    'vat_amount': Decimal('0'),
-                    'items': []
-                }
-            vat_summary[vat_key]['base_amount'] += base_amount
-            vat_summary[vat_key]['vat_amount'] += vat_amount
-            vat_summary[vat_key]['items'].append(item)
-        
-        return {
-            'issuer_data': {
-                'oib': self.subject.OIB,
-                'name': self.subject.clientName,
-                'address': self.subject.addressLine1,
-                'city': self.subject.town,
-                'postal_code': self.subject.postalCode,
-                'vat_id': f'HR{self.subject.OIB}' if self.subject.OIB else None,
-            },
-            'buyer_data': {
-                'oib': self.client.OIB,
-                'name': self.client.clientName,
-                'address': self.client.addressLine1,
-                'city': self.client.province,
-                'postal_code': self.client.postalCode,
-                'vat_id': self.client.VATID,
-                'client_type': self.client.clientType,
-            } if self.client else None,
-            'invoice_data': {
-                'id': self.id,
-                'number': self.number,
-                'date': self.date.isoformat() if self.date else None,
-                'due_date': self.dueDate.isoformat() if self.dueDate else None,
-                'sales_channel': self.sales_channel,
-                'payment_method': self.payment_method,
-                'fiscal_location': self.fiscal_location or '1',
-                'fiscal_device_id': self.fiscal_device_id or '1',
-                'fiscal_operator_oib': self.fiscal_operator_oib or self.subject.OIB,
-                'notes': self.notes,
-                'is_paid': self.is_paid,
-                'payment_date': self.payment_date.isoformat() if self.payment_date else None,
-            },
-            'items': items,
-            'vat_summary': vat_summary,
-            'totals': {
-                'pretax_amount': float(self.pretax()),
-                'vat_amount': float(self.tax()),
-                'total_amount': float(self.price_with_vat()),
-            }
-        }
+        from arvello_fiscal.documents import build_fiscal_document
+        return build_fiscal_document(self).as_dict()
 
     def get_invoice_products(self):
         """Vraća stavke računa s detaljima za fiskalizaciju."""
-        from .models import InvoiceProduct
         items = []
-        for ip in InvoiceProduct.objects.filter(invoice=self):
+        for ip in self.invoiceproduct_set.all():
             items.append({
                 'name': ip.product.title,
                 'quantity': float(ip.quantity),
@@ -806,26 +791,10 @@ class Invoice(models.Model):
 
     def is_fiscal_ready(self):
         """Provjerava je li račun spreman za fiskalizaciju."""
-        errors = []
-        
-        if not self.sales_channel:
-            errors.append('Kanal prodaje nije postavljen')
-        
-        if not self.subject.OIB:
-            errors.append('Subjekt nema OIB')
-        
-        if not self.number:
-            errors.append('Račun nema broj')
-        
-        if not self.date:
-            errors.append('Račun nema datum')
-        
-        products = InvoiceProduct.objects.filter(invoice=self)
-        if not products.exists():
-            errors.append('Račun nema stavki')
-        
-        if errors:
-            return False, '; '.join(errors)
+        from arvello_fiscal.documents import build_fiscal_document
+        document = build_fiscal_document(self)
+        if document.errors:
+            return False, '; '.join(document.errors)
         return True, 'Račun je spreman za fiskalizaciju'
 
     def auto_detect_sales_channel(self):
@@ -915,7 +884,7 @@ class Inventory(models.Model):
     subject = models.ForeignKey(Company, blank=True, null=True, on_delete=models.SET_NULL)
     date_created = models.DateTimeField(blank=True, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     def __str__(self):
         # Tekstualna reprezentacija stavke inventara
@@ -936,7 +905,7 @@ class InvoiceProduct(models.Model):
     quantity = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=False, default=0)
     discount = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=True, default=0)
     rabat = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=True, default=0)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     def save(self, *args, **kwargs):
         # Sprema stavku računa
@@ -972,7 +941,7 @@ class OfferProduct(models.Model):
     quantity = models.DecimalField(max_digits=6, decimal_places=3, null=False, blank=False, default=1)
     discount = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=True)
     rabat = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     def save(self, *args, **kwargs):
         # Sprema stavku ponude
@@ -1061,7 +1030,7 @@ class Supplier(models.Model):
     IBAN = models.CharField(verbose_name="IBAN", null=True, blank=True, max_length=34)
     notes = models.TextField(verbose_name="Bilješke", null=True, blank=True)
     
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
     
     uniqueId = models.CharField(null=True, blank=True, max_length=100)
     slug = models.SlugField(max_length=500, unique=True, blank=True, null=True)
@@ -1125,7 +1094,7 @@ class Expense(models.Model):
     date_created = models.DateTimeField(blank=True, null=True)
     last_updated = models.DateTimeField(blank=True, null=True)
 
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     invoice_number = models.CharField(max_length=30, blank=True, null=True, verbose_name='Broj računa')
     invoice_date = models.DateField(null=True, blank=True, verbose_name='Datum računa')
@@ -1167,6 +1136,10 @@ class Expense(models.Model):
         verbose_name = "Trošak"
         verbose_name_plural = "Troškovi"
         ordering = ['-date']
+        indexes = [
+            # Knjiga ulaznih računa: troškovi subjekta u razdoblju
+            models.Index(fields=['subject', 'date'], name='expense_subject_date_idx'),
+        ]
 
     def __str__(self):
         # Tekstualna reprezentacija troška
@@ -1234,7 +1207,7 @@ class Employee(HistoryMixin, models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Aktivan")
     date_created = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
     
     class Meta:
         verbose_name = "Zaposlenik"
@@ -1446,7 +1419,7 @@ class Salary(HistoryMixin, models.Model):
         default=dict, 
         verbose_name="Porezni parametri pri obračunu"
     )
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
     
     payment_date = models.DateField(
         verbose_name='Datum isplate',
@@ -1473,6 +1446,14 @@ class Salary(HistoryMixin, models.Model):
     lower_tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     higher_tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
+    class Meta:
+        indexes = [
+            # Obračun i platne liste za razdoblje
+            models.Index(fields=['period_year', 'period_month'], name='salary_period_idx'),
+            # JOPPD: plaće isplaćene u mjesecu
+            models.Index(fields=['payment_date'], name='salary_payment_date_idx'),
+        ]
+
     @property
     def total_cost(self):
         """Izračunava ukupne troškove plaće uključujući bruto plaću, doprinose i neoporezive naknade."""
@@ -1528,7 +1509,6 @@ class Salary(HistoryMixin, models.Model):
 
         # Dohvati porezne stope za grad zaposlenika i godinu obračuna
         try:
-            from .utils.salary_calculator import standardize_city_name
             from django.utils import timezone
             
             # Osiguraj da je payment_date_obj tipa datetime.date
@@ -1548,10 +1528,7 @@ class Salary(HistoryMixin, models.Model):
             monthly_threshold = Decimal(str(threshold_param.value))
 
             # Dohvati lokalne stope
-            local_tax = LocalIncomeTax.objects.filter(
-                city_name__iexact=standardize_city_name(self.employee.city),
-                valid_from__lte=payment_date_obj
-            ).latest('valid_from')
+            local_tax = LocalIncomeTax.valid_for_city(self.employee.city, payment_date_obj).latest('valid_from')
 
             # Spremi korištene porezne stope
             self.lower_tax_rate_used = local_tax.tax_rate_lower
@@ -1674,6 +1651,38 @@ class Salary(HistoryMixin, models.Model):
         return self.higher_tax_amount or Decimal('0.00')
 
 
+
+class PayslipDelivery(models.Model):
+    # Evidencija slanja platne liste zaposleniku e-mailom
+    STATUS_CHOICES = [
+        ('queued', 'U redu'),
+        ('sent', 'Poslano'),
+        ('failed', 'Greška'),
+        ('skipped', 'Preskočeno'),
+    ]
+
+    salary = models.ForeignKey(Salary, on_delete=models.CASCADE, related_name='payslip_deliveries', verbose_name="Plaća")
+    email = models.ForeignKey(
+        'OutgoingEmail',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='payslip_deliveries',
+        verbose_name="Poruka"
+    )
+    recipient = models.EmailField(blank=True, verbose_name="Primatelj")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Status")
+    error = models.TextField(blank=True, verbose_name="Greška")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Vrijeme")
+
+    class Meta:
+        verbose_name = "Slanje platne liste"
+        verbose_name_plural = "Slanja platnih lista"
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"{self.salary} - {self.get_status_display()}"
+
 class NonTaxablePaymentType(models.Model):
     # Model za vrstu neoporezivog primitka
     name = models.CharField(max_length=200, verbose_name="Naziv")
@@ -1682,7 +1691,7 @@ class NonTaxablePaymentType(models.Model):
     max_annual_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Maksimalni godišnji iznos (EUR)")
     max_monthly_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Maksimalni mjesečni iznos (EUR)")
     active = models.BooleanField(default=True, verbose_name="Aktivno")
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
     
     class Meta:
         verbose_name = "Vrsta neoporezivog primitka"
@@ -1728,7 +1737,7 @@ class TaxParameter(models.Model):
     
     def __str__(self):
         return f"{self.get_parameter_type_display()} ({self.year}): {self.value}"
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
 
 class EmailConfig(models.Model):
@@ -1779,7 +1788,7 @@ class EmailConfig(models.Model):
     )
     date_created = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     class Meta:
         verbose_name = "Email konfiguracija"
@@ -1795,6 +1804,62 @@ class EmailConfig(models.Model):
         return self.from_email
 
 
+
+class OutgoingEmail(models.Model):
+    """Poruka u redu za slanje (šalje je naredba mail_worker)."""
+    STATUS_CHOICES = [
+        ('queued', 'U redu'),
+        ('sent', 'Poslano'),
+        ('failed', 'Greška'),
+    ]
+
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Subjekt",
+        related_name='outgoing_emails'
+    )
+    subject = models.CharField(max_length=255, verbose_name="Naslov")
+    body = models.TextField(verbose_name="Sadržaj")
+    content_subtype = models.CharField(max_length=20, default='html', verbose_name="Vrsta sadržaja")
+    from_email = models.CharField(max_length=255, blank=True, verbose_name="Pošiljatelj")
+    to = models.JSONField(default=list, verbose_name="Primatelji")
+    reply_to = models.JSONField(default=list, blank=True, verbose_name="Odgovor na")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Broj pokušaja")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Sljedeći pokušaj")
+    last_error = models.TextField(blank=True, verbose_name="Zadnja greška")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Kreirano")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Poslano")
+
+    class Meta:
+        verbose_name = "Odlazna poruka"
+        verbose_name_plural = "Odlazne poruke"
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoing_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.get_status_display()})"
+
+
+class OutgoingEmailAttachment(models.Model):
+    """Privitak poruke u redu za slanje."""
+    email = models.ForeignKey(OutgoingEmail, on_delete=models.CASCADE, related_name='attachments')
+    filename = models.CharField(max_length=255, verbose_name="Naziv datoteke")
+    content = models.BinaryField(verbose_name="Sadržaj")
+    mimetype = models.CharField(max_length=100, default='application/pdf', verbose_name="MIME tip")
+
+    class Meta:
+        verbose_name = "Privitak odlazne poruke"
+        verbose_name_plural = "Privitci odlaznih poruka"
+
+    def __str__(self):
+        return self.filename
+
 class LocalIncomeTax(models.Model):
     # Model za lokalnu poreznu stopu
     CITY_TYPE_CHOICES = [
@@ -1814,16 +1879,34 @@ class LocalIncomeTax(models.Model):
     valid_until = models.DateField(null=True, blank=True, verbose_name="Vrijedi do")
     account_number = models.CharField(max_length=50, blank=True, null=True, verbose_name="Uplatni račun")
     official_gazette = models.CharField(max_length=20, blank=True, null=True, verbose_name="Broj NN")
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     class Meta:
         verbose_name = "Lokalna porezna stopa"
         verbose_name_plural = "Lokalne porezne stope"
+        indexes = [
+            # Stopa za grad na datum isplate (vidi valid_for_city)
+            models.Index(Upper('city_name'), 'valid_from', name='local_tax_city_valid_idx'),
+        ]
 
     def __str__(self):
         # Tekstualna reprezentacija lokalne porezne stope
         return f"{self.city_name} - {self.tax_rate_lower}%/{self.tax_rate_higher}%"
 
+    @classmethod
+    def valid_for_city(cls, city, on_date):
+        """
+        Stope grada koje vrijede na zadani datum; najnovija se dobiva s
+        .latest('valid_from').
+
+        Naziv se uspoređuje kao UPPER(city_name), jednako kao city_name__iexact,
+        ali tako da upit koristi indeks local_tax_city_valid_idx.
+        """
+        return cls.objects.alias(city_upper=Upper('city_name')).filter(
+            city_upper=standardize_city_name(city),
+            valid_from__lte=on_date,
+        )
+
     def get_rate_limits_2025(self):
         # Vraća limite poreznih stopa za 2025. ovisno o vrsti JLS
         if self.city_type == 'OPCINA':
@@ -2081,7 +2164,7 @@ class CourtRegistryConfig(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Kreirano")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Ažurirano")
-    history = HistoricalRecords()
+    history = HistoricalRecords(bases=[HistoryChangesModel])
 
     class Meta:
         verbose_name = "Konfiguracija sudskog registra"
@@ -2096,3 +2179,81 @@ class CourtRegistryConfig(models.Model):
         if self.is_active:
             CourtRegistryConfig.objects.filter(is_active=True).exclude(pk=self.pk).update(is_active=False)
         super().save(*args, **kwargs)
+
+
+class CourtRegistryCache(models.Model):
+    """
+    Trajni cache odgovora API-ja Sudskog registra.
+
+    Sprema sirovi odgovor API-ja po vrsti i ključu upita. Zapis je svjež do
+    isteka TTL-a, nakon toga se do isteka STALE_TTL-a vraća odmah i osvježava
+    u pozadini (stale-while-revalidate). Postavke su u settings.COURT_REGISTRY_CACHE.
+    """
+    LOOKUP_TYPES = [
+        ('oib', 'OIB'),
+        ('mbs', 'MBS'),
+        ('name', 'Naziv'),
+    ]
+
+    lookup_type = models.CharField(max_length=10, choices=LOOKUP_TYPES, verbose_name="Vrsta upita")
+    lookup_key = models.CharField(max_length=255, verbose_name="Ključ upita")
+    payload = models.JSONField(null=True, blank=True, verbose_name="Odgovor API-ja")
+    not_found = models.BooleanField(default=False, verbose_name="Nije pronađeno")
+    fetched_at = models.DateTimeField(verbose_name="Dohvaćeno")
+
+    class Meta:
+        verbose_name = "Cache sudskog registra"
+        verbose_name_plural = "Cache sudskog registra"
+        unique_together = ('lookup_type', 'lookup_key')
+
+    def __str__(self):
+        return f"{self.get_lookup_type_display()} {self.lookup_key} ({self.fetched_at:%d.%m.%Y. %H:%M})"
+
+
+class SearchDocument(models.Model):
+    """
+    Dokument lokalnog indeksa za pretraživanje (BM25) poslovnih zapisa.
+
+    Svaki zapis (račun, ponuda, klijent, proizvod, trošak, dobavljač ili stavka
+    povijesti) ima jedan dokument; indeks se ažurira signalima pri spremanju i
+    brisanju.
+    """
+    RECORD_TYPES = [
+        ('invoice', 'Račun'),
+        ('offer', 'Ponuda'),
+        ('client', 'Klijent'),
+        ('product', 'Proizvod'),
+        ('expense', 'Trošak'),
+        ('supplier', 'Dobavljač'),
+        ('history', 'Povijest'),
+    ]
+
+    record_type = models.CharField(max_length=20, choices=RECORD_TYPES, verbose_name="Vrsta zapisa")
+    object_id = models.CharField(max_length=100, verbose_name="ID zapisa")
+    title = models.CharField(max_length=255, blank=True, verbose_name="Naslov")
+    summary = models.TextField(blank=True, verbose_name="Sažetak")
+    text = models.TextField(blank=True, default='', verbose_name="Normalizirani tekst")
+    length = models.PositiveIntegerField(default=0, verbose_name="Broj tokena")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Ažurirano")
+
+    class Meta:
+        verbose_name = "Dokument indeksa pretraživanja"
+        verbose_name_plural = "Dokumenti indeksa pretraživanja"
+        unique_together = ('record_type', 'object_id')
+
+    def __str__(self):
+        return f"{self.get_record_type_display()} {self.object_id}: {self.title}"
+
+
+class SearchTerm(models.Model):
+    """Pojam (token) s frekvencijom unutar dokumenta indeksa pretraživanja."""
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64, db_index=True)
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Pojam indeksa pretraživanja"
+        verbose_name_plural = "Pojmovi indeksa pretraživanja"
+
+    def __str__(self):
+        return f"{self.term} ({self.frequency})"
@@ -3,17 +3,43 @@ Signali za automatsku fiskalizaciju računa i kreiranje korisničkih profila.
 
 Ovaj modul definira Django signale koji se aktiviraju pri kreiranju ili
 ažuriranju računa, i automatski pokreću proces fiskalizacije.
-Također automatski kreira UserProfile za nove korisnike.
+Također automatski kreira UserProfile za nove korisnike, sprema razlike
+polja uz zapise povijesti i održava lokalni indeks pretraživanja ažurnim
+(uključujući FTS tablicu/indekse koje stvara nakon migracija).
+Pri izmjeni email konfiguracije briše je iz cachea reda odlazne e-pošte.
+Svakoj novoj SQLite vezi postavlja PRAGMA vrijednosti iz settings.SQLITE_PRAGMAS.
 """
-from django.db.models.signals import post_save, pre_save
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_save, post_delete, post_migrate
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Invoice, UserProfile
+from simple_history.signals import pre_create_historical_record, post_create_historical_record
+from .models import EmailConfig, Invoice, Offer, InvoiceProduct, OfferProduct, UserProfile
+from .utils import search_index
+from .utils.email_utils import invalidate_email_config
+from .utils.history_diff import attach_history_changes, supports_stored_changes
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# ----- Database Connection Signals -----
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Postavlja PRAGMA vrijednosti (WAL, synchronous, mmap...) na novu SQLite vezu."""
+    # Samo baza aplikacije; ostale veze (npr. izvor za migrate_sqlite_to_postgres)
+    # ne smiju promijeniti način dnevnika tuđe datoteke
+    if connection.vendor != 'sqlite' or connection.alias != DEFAULT_DB_ALIAS:
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
 # ----- User Profile Signals -----
 
 @receiver(post_save, sender=User)
@@ -128,3 +154,111 @@ def enqueue_invoice_for_fiscalization(sender, instance, created, **kwargs):
                 instance.fiscal_status = 'failed'
                 instance.save(update_fields=['fiscal_status'])
                 delattr(instance, '_updating_fiscal_status')
+
+
+# ----- History Signals -----
+
+
+@receiver(pre_create_historical_record)
+def store_history_changes(sender, instance, history_instance, **kwargs):
+    """
+    Izračunava promijenjena polja jednom, pri zapisivanju povijesti.
+
+    Razlike se postavljaju prije spremanja povijesnog zapisa pa se spremaju
+    istim INSERT upitom, bez naknadnog ažuriranja.
+    """
+    if not supports_stored_changes(type(history_instance)):
+        return
+    try:
+        attach_history_changes(history_instance)
+    except Exception as e:
+        logger.error(f"Greška pri izračunu promjena za povijest {sender.__name__}: {e}")
+
+
+# ----- Search Index Signals -----
+
+
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Osvježava dokument zapisa u indeksu pretraživanja nakon spremanja."""
+    # Preskoči učitavanje fixturea i interna ažuriranja fiskalnog statusa
+    if raw or hasattr(instance, '_updating_fiscal_status'):
+        return
+    try:
+        search_index.index_instance(instance)
+    except Exception as e:
+        logger.error(f"Greška pri indeksiranju {sender.__name__} {instance.pk}: {e}")
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    """Uklanja zapis iz indeksa pretraživanja nakon brisanja."""
+    try:
+        search_index.remove_instance(instance)
+    except Exception as e:
+        logger.error(f"Greška pri uklanjanju {sender.__name__} {instance.pk} iz indeksa: {e}")
+
+
+def update_document_items_search_index(sender, instance, raw=False, **kwargs):
+    """Ponovno indeksira račun ili ponudu kada se promijene njihove stavke."""
+    # Preskoči stavke čiji roditelj se indeksira jednom nakon spremanja svih stavki
+    if raw or hasattr(instance, '_skip_parent_search_index'):
+        return
+    if sender is InvoiceProduct:
+        parent = Invoice.objects.filter(pk=instance.invoice_id).first()
+    else:
+        parent = Offer.objects.filter(pk=instance.offer_id).first()
+    if parent is None:
+        return
+    try:
+        search_index.index_instance(parent)
+    except Exception as e:
+        logger.error(f"Greška pri indeksiranju {parent.__class__.__name__} {parent.pk}: {e}")
+
+
+def update_related_search_index(sender, instance, raw=False, **kwargs):
+    """Osvježava dokumente koji prikazuju podatke zapisa (npr. račune klijenta)."""
+    if raw or kwargs.get('created'):
+        return
+    try:
+        search_index.index_related(instance)
+    except Exception as e:
+        logger.error(f"Greška pri indeksiranju zapisa povezanih s {sender.__name__} {instance.pk}: {e}")
+
+
+@receiver(post_migrate)
+def create_search_schema(sender, **kwargs):
+    """Stvara FTS tablicu ili indekse backenda pretraživanja nakon migracija."""
+    if sender.name != 'arvelloapp':
+        return
+    search_index.ensure_schema()
+
+
+@receiver(post_create_historical_record)
+def index_history_record(sender, instance, history_instance, **kwargs):
+    """Dodaje novi zapis povijesti promjena u indeks pretraživanja."""
+    if not search_index.is_history_record(history_instance):
+        return
+    try:
+        search_index.index_instance(history_instance)
+    except Exception as e:
+        logger.error(f"Greška pri indeksiranju povijesti {history_instance.history_id}: {e}")
+
+
+for _model in search_index.DOCUMENT_BUILDERS:
+    post_save.connect(update_search_index, sender=_model, dispatch_uid=f'search_index_save_{_model.__name__}')
+    post_delete.connect(remove_from_search_index, sender=_model, dispatch_uid=f'search_index_delete_{_model.__name__}')
+
+for _model in search_index.RELATED_DOCUMENTS:
+    post_save.connect(update_related_search_index, sender=_model, dispatch_uid=f'search_index_related_{_model.__name__}')
+
+for _model in (InvoiceProduct, OfferProduct):
+    post_save.connect(update_document_items_search_index, sender=_model, dispatch_uid=f'search_index_items_save_{_model.__name__}')
+    post_delete.connect(update_document_items_search_index, sender=_model, dispatch_uid=f'search_index_items_delete_{_model.__name__}')
+
+
+# ----- Email Config Cache Signals -----
+
+@receiver(post_save, sender=EmailConfig)
+@receiver(post_delete, sender=EmailConfig)
+def invalidate_email_config_cache(sender, instance, **kwargs):
+    """Briše konfiguraciju subjekta iz cachea kako bi se odmah koristila nova."""
+    invalidate_email_config(instance.company_id)
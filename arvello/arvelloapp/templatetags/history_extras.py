@@ -1,5 +1,6 @@
 from django import template
 from django.urls import reverse
+from arvelloapp.utils.history_diff import get_stored_changes
 
 register = template.Library()
 
@@ -48,6 +49,18 @@ def get_field_changes(current, previous):
         dict: Rječnik s promjenama, gdje je ključ naziv polja, a vrijednost 
               rječnik s 'name', 'old' i 'new' vrijednostima.
     """
+    # Koristi spremljene razlike ako su izračunate pri zapisivanju povijesti
+    stored_changes = get_stored_changes(current)
+    if stored_changes is not None:
+        return {
+            field.name: {
+                'name': field.verbose_name or field.name,
+                'old': old_value if old_value is not None else "(prazno)",
+                'new': new_value if new_value is not None else "(prazno)"
+            }
+            for field, old_value, new_value in stored_changes
+        }
+
     # Ako nema prethodne verzije, nema promjena
     if not previous:
         return {}
@@ -0,0 +1,268 @@
+"""
+Bulk data factory for performance tests.
+
+Generates realistic volumes (thousands of invoices with line items, offers,
+expenses, employees with a year of salaries) through bulk inserts, together
+with the simple_history rows the history views read: a creation record for
+every object and update records for paid invoices and edited products.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history
+
+from arvelloapp.models import (
+    Client, Company, Employee, Expense, Invoice, InvoiceProduct, Inventory, LocalIncomeTax, Offer,
+    OfferProduct, Product, Salary, Supplier, TaxParameter,
+)
+
+BATCH_SIZE = 500
+TOWNS = [
+    ('Zagreb', '10000', 'GRAD ZAGREB'),
+    ('Split', '21000', 'SPLITSKO-DALMATINSKA ŽUPANIJA'),
+    ('Rijeka', '51000', 'PRIMORSKO-GORANSKA ŽUPANIJA'),
+    ('Osijek', '31000', 'OSJEČKO-BARANJSKA ŽUPANIJA'),
+    ('Zadar', '23000', 'ZADARSKA ŽUPANIJA'),
+]
+SERVICES = ['Održavanje', 'Savjetovanje', 'Montaža', 'Servis', 'Dostava', 'Licenca', 'Najam', 'Izrada']
+FIRST_NAMES = ['Ana', 'Ivan', 'Marko', 'Petra', 'Luka', 'Maja', 'Josip', 'Iva', 'Tomislav', 'Lucija']
+LAST_NAMES = ['Horvat', 'Kovačević', 'Babić', 'Marić', 'Jurić', 'Novak', 'Knežević', 'Vuković']
+TAX_PARAMETERS = [
+    ('base_deduction', Decimal('600')),
+    ('monthly_tax_threshold', Decimal('5000')),
+    ('health_insurance', Decimal('0.165')),
+    ('pension_rate_1', Decimal('0.15')),
+    ('pension_rate_2', Decimal('0.05')),
+]
+
+
+def oib(number):
+    """Valid OIB (ISO 7064 MOD 11,10 check digit) for a sequence number."""
+    digits = f'{number:010d}'[-10:]
+    remainder = 10
+    for digit in digits:
+        remainder = (remainder + int(digit)) % 10 or 10
+        remainder = (remainder * 2) % 11
+    check = (11 - remainder) % 10
+    return f'{digits}{check}'
+
+
+@dataclass
+class PerformanceData:
+    user: User
+    companies: list = field(default_factory=list)
+    clients: list = field(default_factory=list)
+    products: list = field(default_factory=list)
+    suppliers: list = field(default_factory=list)
+    invoices: list = field(default_factory=list)
+    offers: list = field(default_factory=list)
+    expenses: list = field(default_factory=list)
+    inventory: list = field(default_factory=list)
+    employees: list = field(default_factory=list)
+    salaries: list = field(default_factory=list)
+
+
+class PerformanceDataFactory:
+    """
+    Builds a deterministic data set (same seed, same rows) with bulk inserts.
+
+    Volumes are keyword arguments of build(); the defaults approximate a few
+    years of a small company with a dozen employees.
+    """
+
+    def __init__(self, seed=2025, user=None):
+        self.random = random.Random(seed)
+        self.user = user
+        self.now = timezone.now()
+
+    def build(self, companies=2, clients=300, products=150, suppliers=40, invoices=2000,
+              lines_per_invoice=4, offers=400, expenses=600, inventory=200, employees=24,
+              salary_months=12):
+        user = self.user or User.objects.create_user(username='perf', password='perf', is_staff=True, is_superuser=True)
+        data = PerformanceData(user=user)
+        self._create_tax_data()
+        data.companies = self._create(Company, [self._company(i) for i in range(companies)], user)
+        data.clients = self._create(Client, [self._client(i) for i in range(clients)], user)
+        data.products = self._create(Product, [self._product(i) for i in range(products)], user)
+        data.suppliers = self._create(Supplier, [self._supplier(i) for i in range(suppliers)], user)
+        data.invoices = self._create(Invoice, [self._invoice(i, data) for i in range(invoices)], user)
+        self._create(InvoiceProduct, [
+            InvoiceProduct(
+                invoice=invoice, product=self.random.choice(data.products),
+                quantity=Decimal(self.random.randint(1, 20)), discount=Decimal(self.random.choice([0, 0, 5, 10])),
+            )
+            for invoice in data.invoices for _ in range(lines_per_invoice)
+        ], user)
+        data.offers = self._create(Offer, [self._offer(i, data) for i in range(offers)], user)
+        self._create(OfferProduct, [
+            OfferProduct(offer=offer, product=self.random.choice(data.products), quantity=Decimal(self.random.randint(1, 10)))
+            for offer in data.offers for _ in range(lines_per_invoice)
+        ], user)
+        data.expenses = self._create(Expense, [self._expense(i, data) for i in range(expenses)], user)
+        data.inventory = self._create(Inventory, [
+            Inventory(title=f'{self.random.choice(SERVICES)} oprema {i}', quantity=self.random.randint(0, 50),
+                      subject=self.random.choice(data.companies), date_created=self.now, last_updated=self.now)
+            for i in range(inventory)
+        ], user)
+        data.employees = self._create(Employee, [self._employee(i, data) for i in range(employees)], user)
+        data.salaries = self._create(Salary, [
+            self._salary(employee, month, user)
+            for employee in data.employees for month in self._salary_periods(salary_months)
+        ], user)
+        self._record_updates(data, user)
+        return data
+
+    def _create(self, model, objects, user):
+        """Bulk insert with a creation history record per object."""
+        return bulk_create_with_history(
+            objects, model, batch_size=BATCH_SIZE, default_user=user, default_date=self.now,
+        )
+
+    def _record_updates(self, data, user):
+        # Paid invoices and repriced products get a second ('~') history record
+        paid = data.invoices[::3]
+        for invoice in paid:
+            invoice.is_paid = True
+            invoice.payment_date = invoice.dueDate
+        Invoice.objects.bulk_update(paid, ['is_paid', 'payment_date'], batch_size=BATCH_SIZE)
+        Invoice.history.bulk_history_create(
+            paid, batch_size=BATCH_SIZE, update=True, default_user=user, default_date=self.now + timedelta(minutes=1),
+        )
+        changed = data.products[::2]
+        for product in changed:
+            product.price = round(product.price * 1.1, 2)
+        Product.objects.bulk_update(changed, ['price'], batch_size=BATCH_SIZE)
+        Product.history.bulk_history_create(
+            changed, batch_size=BATCH_SIZE, update=True, default_user=user, default_date=self.now + timedelta(minutes=1),
+        )
+
+    def _create_tax_data(self):
+        if not LocalIncomeTax.objects.exists():
+            LocalIncomeTax.objects.bulk_create([
+                LocalIncomeTax(city_name=town, tax_rate=Decimal('0'), tax_rate_lower=Decimal('20.00'),
+                               tax_rate_higher=Decimal('30.00'))
+                for town, _, _ in TOWNS
+            ])
+        if not TaxParameter.objects.exists():
+            TaxParameter.objects.bulk_create([
+                TaxParameter(parameter_type=parameter_type, value=value, year=year)
+                for year in (self.now.year - 1, self.now.year)
+                for parameter_type, value in TAX_PARAMETERS
+            ])
+
+    def _place(self):
+        return self.random.choice(TOWNS)
+
+    def _company(self, index):
+        town, postal_code, province = self._place()
+        return Company(
+            clientName=f'Arvello Test {index} d.o.o.', addressLine1=f'Ilica {index + 1}', town=town,
+            province=province, postalCode=postal_code, phoneNumber='+38511234567',
+            emailAddress=f'ured{index}@example.com', clientUniqueId=f'{index + 1:04d}',
+            clientType='Pravna osoba', OIB=oib(900000 + index), SustavPDVa=True,
+            IBAN='HR1723600001101234565', uniqueId=f'company{index}', slug=f'company-{index}',
+            date_created=self.now, last_updated=self.now,
+        )
+
+    def _client(self, index):
+        _, postal_code, province = self._place()
+        legal = index % 3 != 0
+        return Client(
+            clientName=f'Klijent {index}' + (' d.o.o.' if legal else ''), addressLine1=f'Vukovarska {index + 1}',
+            province=province, postalCode=postal_code, emailAddress=f'klijent{index}@example.com',
+            clientUniqueId=f'{index + 100:04d}', clientType='Pravna osoba' if legal else 'Fizička osoba',
+            OIB=oib(100000 + index), VATID=f'HR{oib(100000 + index)}', SustavPDVa=legal,
+            IBAN='HR1723600001101234565', uniqueId=f'client{index}', slug=f'client-{index}',
+            date_created=self.now, last_updated=self.now,
+        )
+
+    def _product(self, index):
+        return Product(
+            title=f'{self.random.choice(SERVICES)} {index}', description='Usluga prema ponudi',
+            price=round(self.random.uniform(5, 800), 2), taxPercent=self.random.choice([25, 25, 13, 5]),
+            barid=f'{index + 1:06d}', uniqueId=f'product{index}', slug=f'product-{index}',
+            date_created=self.now, last_updated=self.now,
+        )
+
+    def _supplier(self, index):
+        town, postal_code, province = self._place()
+        return Supplier(
+            supplierName=f'Dobavljač {index}', addressLine1=f'Savska {index + 1}', town=town,
+            province=province, postalCode=postal_code, OIB=oib(500000 + index),
+            uniqueId=f'supplier{index}', slug=f'supplier-{index}', date_created=self.now, last_updated=self.now,
+        )
+
+    def _document_date(self, index):
+        # Documents are spread over the last three years
+        return (self.now - timedelta(days=index % 1095)).date()
+
+    def _invoice(self, index, data):
+        issued = self._document_date(index)
+        company = data.companies[index % len(data.companies)]
+        return Invoice(
+            title=f'Račun {index + 1}', number=f'{index + 1}-1-{issued:%y}', dueDate=issued + timedelta(days=15),
+            client=self.random.choice(data.clients), subject=company, uniqueId=f'invoice{index}',
+            slug=f'invoice-{index}', date=issued, date_created=self.now, last_updated=self.now,
+            payment_method=self.random.choice(['bank_transfer', 'bank_transfer', 'card', 'cash']),
+            fiscal_status='exempt',
+        )
+
+    def _offer(self, index, data):
+        issued = self._document_date(index)
+        return Offer(
+            title=f'Ponuda {index + 1}', number=f'{index + 1}-1-{issued:%y}', dueDate=issued + timedelta(days=30),
+            client=self.random.choice(data.clients), subject=data.companies[index % len(data.companies)],
+            uniqueId=f'offer{index}', slug=f'offer-{index}', date=issued, date_created=self.now, last_updated=self.now,
+        )
+
+    def _expense(self, index, data):
+        amount = Decimal(self.random.randint(1000, 250000)) / 100
+        base = (amount / Decimal('1.25')).quantize(Decimal('0.01'))
+        issued = self._document_date(index)
+        return Expense(
+            title=f'Trošak {index + 1}', amount=amount, date=issued,
+            category=self.random.choice(['office', 'travel', 'utilities', 'equipment', 'services', 'other']),
+            subject=data.companies[index % len(data.companies)], supplier=self.random.choice(data.suppliers),
+            uniqueId=f'expense{index}', slug=f'expense-{index}', invoice_number=f'{index + 1}/1/1',
+            invoice_date=issued, pretax_amount=base, tax_base_25=base, tax_25_deductible=amount - base,
+            date_created=self.now, last_updated=self.now,
+        )
+
+    def _employee(self, index, data):
+        town, postal_code, _ = self._place()
+        return Employee(
+            first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES),
+            date_of_birth=date(1970 + index % 30, index % 12 + 1, 1), email=f'zaposlenik{index}@example.com',
+            oib=oib(700000 + index), address=f'Radnička {index + 1}', city=town, postal_code=postal_code,
+            company=data.companies[index % len(data.companies)], hourly_rate=Decimal(self.random.randint(700, 2500)) / 100,
+            date_of_employment=date(2015 + index % 8, 1, 1), job_title='Referent', iban='HR1723600001101234565',
+        )
+
+    def _salary_periods(self, months):
+        year, month = self.now.year, self.now.month
+        periods = []
+        for _ in range(months):
+            month -= 1
+            if month == 0:
+                year, month = year - 1, 12
+            periods.append((year, month))
+        return periods
+
+    def _salary(self, employee, period, user):
+        year, month = period
+        gross = (employee.hourly_rate * 168).quantize(Decimal('0.01'))
+        contributions = (gross * Decimal('0.20')).quantize(Decimal('0.01'))
+        tax = ((gross - contributions - Decimal('600.00')) * Decimal('0.20')).quantize(Decimal('0.01'))
+        return Salary(
+            employee=employee, period_month=month, period_year=year, regular_hours=Decimal('168'),
+            gross_salary=gross, regular_amount=gross, pension_pillar_1=(gross * Decimal('0.15')).quantize(Decimal('0.01')),
+            pension_pillar_2=(gross * Decimal('0.05')).quantize(Decimal('0.01')),
+            health_insurance=(gross * Decimal('0.165')).quantize(Decimal('0.01')), total_contributions=contributions,
+            income_tax_base=gross - contributions - Decimal('600.00'), tax_deduction=Decimal('600.00'),
+            income_tax=max(tax, Decimal('0')), net_salary=gross - contributions - max(tax, Decimal('0')),
+            payment_date=date(year, month, 1) + timedelta(days=40), created_by=user,
+        )
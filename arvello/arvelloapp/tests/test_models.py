@@ -10,6 +10,7 @@ invoke fiscalization. To prevent this during tests:
 
 See: arvelloapp/tests/test_forms.py for FiscalSafeMixin implementation
 """
+from io import StringIO
 from django.test import TestCase
 from django.utils import timezone
 from django.db.models.signals import post_save
@@ -344,3 +345,356 @@ class LocalIncomeTaxModelTest(TestCase):
         self.assertEqual(local_income_tax.city_name, 'Test City')
         self.assertEqual(local_income_tax.tax_rate, 10.0)
         self.assertEqual(LocalIncomeTax.objects.count(), 1)
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.client_data = {
+            'clientName': 'Vodovod Dubrovnik',
+            'addressLine1': 'Ulica 1',
+            'province': 'DUBROVAČKO-NERETVANSKA ŽUPANIJA',
+            'postalCode': '20000',
+            'emailAddress': 'info@example.com',
+            'clientUniqueId': '0001',
+            'clientType': 'Pravna osoba',
+            'OIB': '12345678901',
+            'VATID': 'HR12345678901'
+        }
+
+    def test_index_updated_on_save_and_delete(self):
+        """Provjera da signali održavaju indeks pretraživanja ažurnim"""
+        from arvelloapp.utils.search_index import search
+        client = Client.objects.create(**self.client_data)
+        Product.objects.create(title='Čišćenje cijevi', price=50, taxPercent=25, barid='1')
+
+        results = search('vodovod', record_types=['client'])
+        self.assertEqual([doc.object_id for doc, _ in results], [str(client.pk)])
+        # Pretraga bez dijakritika pronalazi zapis s dijakriticima
+        self.assertEqual(search('ciscenje', record_types=['product'])[0][0].title, 'Čišćenje cijevi')
+
+        client.clientName = 'Plinara Split'
+        client.save()
+        self.assertEqual(search('vodovod', record_types=['client']), [])
+        self.assertEqual(len(search('plinara', record_types=['client'])), 1)
+
+        client.delete()
+        self.assertEqual(search('plinara', record_types=['client']), [])
+        # Povijest promjena ostaje pretraživa
+        self.assertTrue(search('plinara', record_types=['history']))
+
+    def _check_filter_queryset(self):
+        from arvelloapp.utils.search_index import filter_queryset
+        client = Client.objects.create(**self.client_data)
+        other = Client.objects.create(**{
+            **self.client_data, 'clientName': 'Plinara Split', 'clientUniqueId': '0002',
+            'OIB': '12345678902', 'VATID': 'HR12345678902',
+        })
+        clients = Client.objects.all()
+
+        # Svi pojmovi kao prefiksi, bez obzira na dijakritike
+        self.assertEqual(list(filter_queryset(clients, 'client', 'vodo DUBR')), [client])
+        self.assertEqual(list(filter_queryset(clients, 'client', 'vodovod split')), [])
+        self.assertEqual(list(filter_queryset(clients, 'client', 'dubrovačko')), [client, other])
+        self.assertEqual(filter_queryset(clients, 'client', '').count(), 2)
+        # Pogoci se filtriraju podupitom u bazi, bez liste ID-ova kao parametara
+        self.assertIn('IN (SELECT', str(filter_queryset(clients, 'client', 'dubr').query))
+
+        # Promjena klijenta osvježava dokumente ponuda koji sadrže njegov naziv
+        company = Company.objects.create(
+            clientName='Test Company', addressLine1='Company Address', town='Zagreb',
+            province='GRAD ZAGREB', postalCode='10000', clientUniqueId='0003',
+            clientType='Pravna osoba', OIB='98765432109', IBAN='HR1723600001101234565'
+        )
+        offer = Offer.objects.create(number='1-1-25', client=client, subject=company)
+        offers = Offer.objects.all()
+        self.assertEqual(list(filter_queryset(offers, 'offer', 'vodovod')), [offer])
+        self.assertEqual(list(filter_queryset(offers, 'offer', '1-1-25', exact_fields=['number'])), [offer])
+        client.clientName = 'Vodoopskrba Dubrovnik'
+        client.save()
+        self.assertEqual(list(filter_queryset(offers, 'offer', 'vodoopskrba')), [offer])
+
+    def test_filter_queryset_terms_backend(self):
+        from django.test import override_settings
+        from arvelloapp.utils.search_backends import get_backend, reset_backend
+
+        with override_settings(SEARCH_BACKEND='terms'):
+            reset_backend()
+            self.addCleanup(reset_backend)
+            self.assertEqual(get_backend().name, 'terms')
+            self._check_filter_queryset()
+
+    def test_filter_queryset_sqlite_fts_backend(self):
+        from django.db import connection
+        from arvelloapp.utils.search_backends import get_backend, reset_backend
+        from arvelloapp.utils.search_index import search
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite FTS5')
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.assertEqual(get_backend().name, 'sqlite_fts')
+        self._check_filter_queryset()
+        self.assertEqual(search('vodoopskrba', record_types=['client'])[0][0].title, 'Vodoopskrba Dubrovnik')
+
+class HistoryChangesTest(TestCase):
+    def test_changes_stored_when_history_written(self):
+        """Provjera da se promijenjena polja spremaju uz zapis povijesti"""
+        product = Product.objects.create(title='Usluga', price=10.0, taxPercent=25, barid='1')
+        product.price = 12.5
+        product.save()
+
+        latest = product.history.first()
+        self.assertEqual(latest.history_changes, [['price', 10.0, 12.5]])
+        self.assertEqual(product.history.last().history_changes, [])
+
+    def test_backfill_command(self):
+        """Provjera da naredba backfill_history_changes nadopunjuje stare zapise"""
+        from django.core.management import call_command
+        product = Product.objects.create(title='Usluga', price=10.0, taxPercent=25, barid='1')
+        product.title = 'Nova usluga'
+        product.save()
+        product.history.update(history_changes=None)
+
+        call_command('backfill_history_changes', stdout=StringIO())
+
+        self.assertIn(['title', 'Usluga', 'Nova usluga'], product.history.first().history_changes)
+
+    def test_history_compact_collapses_noop_records(self):
+        """Provjera da history_compact uklanja izmjene bez promijenjenih polja"""
+        from django.core.management import call_command
+        product = Product.objects.create(title='Usluga', price=10.0, taxPercent=25, barid='1')
+        product.save()
+        self.assertEqual(product.history.count(), 2)
+
+        out = StringIO()
+        call_command('history_compact', '--dry-run', '--years', '0', stdout=out)
+        self.assertIn('Uklonjeno praznih izmjena: 1', out.getvalue())
+        self.assertEqual(product.history.count(), 2)
+
+        call_command('history_compact', '--no-vacuum', '--years', '0', stdout=StringIO())
+        self.assertEqual(product.history.count(), 1)
+
+    def test_history_compact_archives_old_records(self):
+        """Provjera da history_compact arhivira stare zapise u JSONL datoteku"""
+        import gzip, json, os, tempfile
+        from datetime import timedelta
+        from django.core.management import call_command
+        from arvelloapp.models import SearchDocument
+        product = Product.objects.create(title='Usluga', price=10.0, taxPercent=25, barid='1')
+        product.history.update(history_date=timezone.now() - timedelta(days=800))
+        history_documents = SearchDocument.objects.filter(record_type='history')
+        self.assertEqual(history_documents.count(), 1)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command('history_compact', '--no-vacuum', '--years', '2', '--archive-dir', archive_dir, stdout=StringIO())
+            files = os.listdir(archive_dir)
+            self.assertEqual(len(files), 1)
+            with gzip.open(os.path.join(archive_dir, files[0]), 'rt', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual(rows[0]['fields']['title'], 'Usluga')
+        self.assertEqual(product.history.count(), 0)
+        # Arhivirani zapis se uklanja i iz indeksa pretraživanja
+        self.assertFalse(history_documents.exists())
+
+
+class CourtRegistryCacheTest(TestCase):
+    """Tests for the persistent court registry cache"""
+
+    def setUp(self):
+        from arvelloapp.utils.court_registry import CourtRegistryClient
+        self.registry = CourtRegistryClient(client_id='test', client_secret='test')
+
+    def test_fresh_entry_served_without_request(self):
+        from unittest.mock import patch
+        from arvelloapp.utils.court_registry import store_cached_lookup
+
+        store_cached_lookup('oib', '12345678901', {'oib': '12345678901'})
+        with patch.object(self.registry, '_make_request', side_effect=AssertionError('network')):
+            payload = self.registry._cached_payload('oib', '12345678901', lambda: self.registry._make_request('x'))
+        self.assertEqual(payload, {'oib': '12345678901'})
+
+    def test_not_found_is_cached(self):
+        from arvelloapp.models import CourtRegistryCache
+        from arvelloapp.utils.court_registry import CourtRegistryNotFound
+
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            raise CourtRegistryNotFound('not found')
+
+        for _ in range(2):
+            with self.assertRaises(CourtRegistryNotFound):
+                self.registry._cached_payload('oib', '10987654321', fetch)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(CourtRegistryCache.objects.get(lookup_key='10987654321').not_found)
+
+    def test_expired_entry_served_when_registry_unavailable(self):
+        from datetime import timedelta
+        from arvelloapp.models import CourtRegistryCache
+        from arvelloapp.utils.court_registry import CourtRegistryError, store_cached_lookup
+
+        store_cached_lookup('oib', '11111111111', {'oib': '11111111111'})
+        CourtRegistryCache.objects.filter(lookup_key='11111111111').update(
+            fetched_at=timezone.now() - timedelta(days=365)
+        )
+
+        def fetch():
+            raise CourtRegistryError('unavailable')
+
+        payload = self.registry._cached_payload('oib', '11111111111', fetch)
+        self.assertEqual(payload, {'oib': '11111111111'})
+
+
+class PdfRenderPoolTest(TestCase):
+    """Tests for the PDF rendering pool helpers"""
+
+    def test_inline_render_without_workers(self):
+        from django.test import override_settings
+        from arvelloapp.utils import pdf_pool
+
+        with override_settings(PDF_RENDER_POOL={'WORKERS': 0, 'TIMEOUT': 10}):
+            self.assertIsNone(pdf_pool.get_pool())
+            future = pdf_pool.submit('<p>Test</p>')
+            self.assertTrue(future.done())
+            self.assertTrue(pdf_pool.wait(future).startswith(b'%PDF'))
+
+    def test_job_timeout(self):
+        import time
+        from unittest.mock import patch
+        from arvelloapp.utils import pdf_pool
+
+        with patch.object(pdf_pool, 'html_to_pdf', side_effect=lambda *args: time.sleep(2)):
+            with self.assertRaises(pdf_pool.PdfRenderTimeout):
+                pdf_pool._render_job('<p>Test</p>', '/', 0.1)
+
+
+class OutgoingEmailQueueTest(TestCase):
+    """Tests for the outgoing email queue and retry handling"""
+
+    def _queue(self):
+        from arvelloapp.utils.email_utils import queue_email
+        return queue_email(
+            'Test', '<p>Test</p>', ['ana@example.com'], from_email='test@example.com',
+            attachments=[('test.pdf', b'%PDF-test', 'application/pdf')]
+        )
+
+    def test_deliver_sends_queued_email(self):
+        from django.core import mail
+        from arvelloapp.utils.mail_queue import MailDispatcher
+
+        outgoing = self._queue()
+        stats = MailDispatcher().deliver()
+        self.assertEqual(stats.sent, 1)
+        self.assertEqual(mail.outbox[0].attachments[0], ('test.pdf', b'%PDF-test', 'application/pdf'))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, 'sent')
+        self.assertEqual(outgoing.attempts, 1)
+
+    def test_dispatcher_ignores_stale_cached_config(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from arvelloapp.models import EmailConfig
+        from arvelloapp.utils.email_utils import EMAIL_CONFIG_CACHE_KEY, get_email_config
+        from arvelloapp.utils.mail_queue import MailDispatcher
+
+        company = Company.objects.create(
+            clientName='Test Company', addressLine1='Adresa', town='Zagreb', province='GRAD ZAGREB',
+            postalCode='10000', clientUniqueId='0002', clientType='Pravna osoba', OIB='98765432109'
+        )
+        EmailConfig.objects.create(company=company, smtp_host='smtp.example.com', is_active=True)
+        # Cache procesa u kojem konfiguracija nije poništena (npr. spremljena u web procesu)
+        cache.set(EMAIL_CONFIG_CACHE_KEY.format(company.pk), 'none')
+        self.assertIsNone(get_email_config(company))
+
+        outgoing = self._queue()
+        outgoing.company = company
+        outgoing.save()
+        with patch('arvelloapp.utils.mail_queue.connection_for_config') as connection_for_config:
+            MailDispatcher().deliver()
+        self.assertEqual(connection_for_config.call_args[0][0].smtp_host, 'smtp.example.com')
+
+    def test_transient_error_is_retried_later(self):
+        import smtplib
+        from unittest.mock import patch
+        from django.utils import timezone
+        from arvelloapp.utils.mail_queue import MailDispatcher
+
+        outgoing = self._queue()
+        error = smtplib.SMTPResponseException(421, b'Service not available')
+        with patch('arvelloapp.utils.mail_queue.build_email_message', side_effect=error):
+            stats = MailDispatcher().deliver()
+        self.assertEqual(stats.retried, 1)
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, 'queued')
+        self.assertEqual(outgoing.attempts, 1)
+        self.assertGreater(outgoing.next_attempt_at, timezone.now())
+        # Poruka nije spremna dok ne prođe odmak
+        self.assertEqual(MailDispatcher().deliver().processed, 0)
+
+    def test_permanent_error_fails(self):
+        import smtplib
+        from unittest.mock import patch
+        from arvelloapp.utils.mail_queue import MailDispatcher
+
+        outgoing = self._queue()
+        error = smtplib.SMTPResponseException(550, b'Mailbox unavailable')
+        with patch('arvelloapp.utils.mail_queue.build_email_message', side_effect=error):
+            MailDispatcher().deliver()
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, 'failed')
+
+
+class HotQueriesTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        """Česti upiti (utils/hot_queries.py) ne smiju čitati cijelu tablicu"""
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('Svi česti upiti koriste indekse', out.getvalue())
+
+    def test_full_scan_is_detected(self):
+        from arvelloapp.utils.hot_queries import explain, full_scans
+
+        plan = explain(Expense.objects.filter(title='Najam'))
+        self.assertEqual(full_scans(plan), ['arvelloapp_expense'])
+
+
+class DatabaseSettingsTest(TestCase):
+    def test_sqlite_pragmas_applied(self):
+        """Nova SQLite veza dobiva PRAGMA vrijednosti iz settings.SQLITE_PRAGMAS"""
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_sqlite_pragmas_skip_other_aliases(self):
+        """Izvorna baza migracije (drugi alias) ne prelazi u WAL način"""
+        import copy
+        import tempfile
+        from django.db import connections
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = copy.deepcopy(connections['default'].settings_dict)
+            settings_dict.update(NAME=f'{directory}/source.sqlite3', TEST={})
+            source = DatabaseWrapper(settings_dict, alias='sqlite_source')
+            try:
+                with source.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'delete')
+            finally:
+                source.close()
+
+    def test_sqlite_to_postgres_requires_postgres_target(self):
+        import tempfile
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3') as source:
+            with self.assertRaisesMessage(CommandError, 'nije PostgreSQL'):
+                call_command('migrate_sqlite_to_postgres', source.name, stdout=StringIO())
@@ -0,0 +1,230 @@
+"""
+Query-count and time budgets for every URL in arvello/urls.py.
+
+Each named URL gets a test that requests it against a realistic data set
+(PerformanceDataFactory: thousands of invoices with line items, offers,
+expenses, employees with a year of salaries and their history rows) and
+fails when the request runs more SQL queries or takes longer than its
+budget. Query counts are exact measurements plus a little headroom, so a
+new N+1 loop over a page of rows fails immediately; time budgets are loose
+and only catch gross regressions (scale them on slow machines with
+ARVELLO_PERF_TIME_FACTOR).
+
+A new URL without a budget fails test_every_url_has_budget.
+"""
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+
+from arvelloapp.models import Invoice
+from arvelloapp.tests.factories import PerformanceDataFactory
+from arvelloapp.utils.request_profiler import RequestProfile
+
+TIME_FACTOR = float(os.environ.get('ARVELLO_PERF_TIME_FACTOR', '1'))
+
+
+@dataclass
+class Budget:
+    queries: int
+    ms: int = 1000
+    method: str = 'get'
+    args: Optional[Callable[[Any], list]] = None
+    kwargs: Optional[Callable[[Any], dict]] = None
+    data: Optional[Callable[[Any], dict]] = None
+    status: tuple = (200,)
+
+
+def first(collection):
+    return lambda data: [getattr(data, collection)[0].pk]
+
+
+def period(data):
+    salary = data.salaries[0]
+    return {'year': salary.period_year, 'month': salary.period_month}
+
+
+REDIRECT = (302,)
+
+# Session and user lookups cost 2 queries on every authenticated request.
+BUDGETS = {
+    # Auth
+    'dashboard': Budget(queries=17, ms=3000),
+    'login': Budget(queries=2),
+    'logout': Budget(queries=4, method='post', status=REDIRECT),
+    # Core lists (paginated or small tables)
+    'invoices': Budget(queries=6),
+    'offers': Budget(queries=7),
+    'products': Budget(queries=5),
+    'clients': Budget(queries=5),
+    'companies': Budget(queries=4),
+    'inventory': Budget(queries=5),
+    # Documents
+    'create_invoice': Budget(queries=7),
+    'create_offer': Budget(queries=6),
+    'invoice_pdf': Budget(queries=5, args=first('invoices')),
+    'offer_pdf': Budget(queries=5, args=first('offers')),
+    'inventory_label': Budget(queries=3, args=first('inventory')),
+    'product_label': Budget(queries=3, args=first('products')),
+    'send_invoice_email': Budget(queries=11, method='post', args=first('invoices'), status=REDIRECT),
+    # 5 writes per queued invoice (savepoint, e-mail, attachment, release, invoice.email)
+    'send_invoice_emails': Budget(
+        queries=58, ms=5000, method='post', status=REDIRECT,
+        data=lambda data: {'invoice_ids': [invoice.pk for invoice in data.invoices[:10]]},
+    ),
+    # Each offer line is saved with its history row (and that row's search document);
+    # the new invoice is indexed once, after the last line
+    'mark_offer_finished': Budget(queries=46, method='post', args=first('offers'), status=REDIRECT),
+    # Table exports (streamed; the budget includes generating the whole file)
+    'export_inventory_to_excel': Budget(queries=3),
+    'export_inventory_to_csv': Budget(queries=3),
+    'export_table': Budget(queries=3, ms=3000, args=lambda data: ['invoices', 'csv']),
+    # Finance
+    'expenses': Budget(queries=9),
+    'delete_expense': Budget(queries=19, method='post', args=first('expenses')),
+    'suppliers': Budget(queries=5),
+    'tax_parameters': Budget(queries=6),
+    # HR
+    'employees': Budget(queries=6),
+    'salaries': Budget(queries=8),
+    'salary_payslip': Budget(queries=10, args=first('salaries')),
+    'send_payslip': Budget(queries=13, method='post', args=first('salaries'), status=REDIRECT),
+    # 5 writes per employee (savepoint, e-mail, attachment, release, PayslipDelivery);
+    # tax rates are loaded once per year and city
+    'send_period_payslips': Budget(queries=131, ms=5000, method='post', data=period, status=REDIRECT),
+    'download_period_payslips': Budget(queries=9, ms=5000, data=period),
+    'employee_api': Budget(queries=6, args=first('employees')),
+    # Reports
+    'outgoing_invoices_book_view': Budget(queries=5),
+    'incoming_invoice_book': Budget(queries=4),
+    'joppd_report': Budget(queries=3),
+    # History (one page of records; predecessors of old '~' records without stored
+    # changes are loaded together, one query per model)
+    'history_user': Budget(queries=9, kwargs=lambda data: {'user_id': data.user.pk}),
+    'view_history_detail': Budget(queries=9, args=lambda data: ['invoice', data.invoices[0].pk]),
+    'history_model': Budget(queries=8, args=lambda data: ['invoice']),
+    'view_history': Budget(queries=8),
+    'history_general': Budget(queries=8),
+    # Info
+    'pension_info': Budget(queries=3),
+    'tax_changes_2025': Budget(queries=3),
+    'tax_changes_2026': Budget(queries=3),
+    # API (external services are not called: only request validation is measured)
+    'get_local_tax_data': Budget(queries=3, args=lambda data: [0], status=(404,)),
+    # The invoice and its new history record are both re-indexed for search
+    'mark_invoice_paid': Budget(queries=30, method='post', args=first('invoices'), status=REDIRECT),
+    'ai_chat': Budget(queries=2, status=(405,)),
+    'ai_execute_action': Budget(queries=2, status=(405,)),
+    'fetch_client_from_registry': Budget(queries=2, status=(400,)),
+    'search_kpd_codes': Budget(queries=4, data=lambda data: {'q': 'usluge'}),
+    # Fiscal
+    'fiscal_configs': Budget(queries=8),
+    'retry_fiscalization': Budget(queries=5, method='post', args=first('invoices'), status=REDIRECT),
+    'fiscal_dashboard': Budget(queries=6),
+    'fiscal_metrics': Budget(queries=4),
+    # Admin
+    'email_config': Budget(queries=6),
+    'court_registry_config': Budget(queries=4),
+    'profiling_stats': Budget(queries=2),
+    # User
+    'user_profile': Budget(queries=5),
+}
+
+
+def url_names():
+    """Names of the project's URL patterns (included apps such as Django admin are skipped)."""
+    return {
+        pattern.name for pattern in get_resolver().url_patterns
+        if isinstance(pattern, URLPattern) and pattern.name
+    }
+
+
+class ViewBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from arvelloapp.signals import enqueue_invoice_for_fiscalization
+
+        # Invoices saved by the views must not be fiscalized
+        post_save.disconnect(enqueue_invoice_for_fiscalization, sender=Invoice)
+        cls.addClassCleanup(post_save.connect, enqueue_invoice_for_fiscalization, sender=Invoice)
+        settings_override = override_settings(PDF_RENDER_POOL={'WORKERS': 0, 'TIMEOUT': 60})
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = PerformanceDataFactory().build()
+
+    def setUp(self):
+        # Counts must not depend on which test warmed the caches first,
+        # including the PDF files cached under MEDIA_ROOT
+        cache.clear()
+        ContentType.objects.clear_cache()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.client.force_login(self.data.user)
+        for patcher in (
+            mock.patch('arvelloapp.utils.pdf_pool.html_to_pdf', return_value=b'%PDF-test'),
+            # Batch e-mail jobs run inside the request so their queries are counted
+            mock.patch('arvelloapp.utils.invoice_batch.queue_email_job', lambda job, description: job()),
+            mock.patch('arvelloapp.utils.payslip_batch.queue_email_job', lambda job, description: job()),
+            mock.patch('arvelloapp.utils.pdf_generator.queue_email_job', lambda job, description: job()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, name, budget):
+        url = reverse(
+            name,
+            args=budget.args(self.data) if budget.args else None,
+            kwargs=budget.kwargs(self.data) if budget.kwargs else None,
+        )
+        data = budget.data(self.data) if budget.data else None
+        profile = RequestProfile()
+        with profile.activate():
+            response = getattr(self.client, budget.method)(url, data)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        return response, profile
+
+    def assertWithinBudget(self, name):
+        budget = BUDGETS[name]
+        response, profile = self.request(name, budget)
+        self.assertIn(response.status_code, budget.status, name)
+        repeated = '\n'.join(
+            f'  {count}x {sql[:200]}' for sql, count, _ in profile.repeated_queries(threshold=2)
+        )
+        self.assertLessEqual(
+            profile.db_count, budget.queries,
+            f'{name}: {profile.db_count} SQL queries, budget {budget.queries}\n{repeated}',
+        )
+        self.assertLessEqual(
+            profile.total_ms, budget.ms * TIME_FACTOR,
+            f'{name}: {profile.total_ms:.0f} ms, budget {budget.ms * TIME_FACTOR:.0f} ms',
+        )
+
+    def test_every_url_has_budget(self):
+        self.assertEqual(sorted(url_names() - set(BUDGETS)), [])
+        self.assertEqual(sorted(set(BUDGETS) - url_names()), [])
+
+
+def _budget_test(name):
+    def test(self):
+        self.assertWithinBudget(name)
+    test.__name__ = f'test_{name}'
+    return test
+
+
+for _name in BUDGETS:
+    setattr(ViewBudgetTest, f'test_{_name}', _budget_test(_name))
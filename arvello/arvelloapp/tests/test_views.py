@@ -20,4 +20,382 @@ class TaxChanges2025ViewTest(TestCase):
     def test_tax_changes_view_accessible(self):
         response = self.client.get(reverse('tax_changes_2025'))
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'tax_changes_2025.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'tax_changes_2025.html')
+
+
+class HistoryPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_history_pages_follow_cursor(self):
+        from arvelloapp.models import Product
+        from arvelloapp.utils.history_query import fetch_history_page
+        for i in range(30):
+            Product.objects.create(title=f'Proizvod {i}', price=10, taxPercent=25, barid=str(i))
+
+        first = fetch_history_page([Product])
+        self.assertEqual(len(first.records), 25)
+        self.assertIsNone(first.newer_cursor)
+
+        second = fetch_history_page([Product], before=first.older_cursor)
+        self.assertEqual(len(second.records), 5)
+        self.assertIsNone(second.older_cursor)
+        seen = {r.history_id for r in first.records} | {r.history_id for r in second.records}
+        self.assertEqual(len(seen), 30)
+
+        back = fetch_history_page([Product], after=second.newer_cursor)
+        self.assertEqual([r.history_id for r in back.records], [r.history_id for r in first.records])
+
+        response = self.client.get(reverse('history_general'), {'before': first.older_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['history_records']), 5)
+
+    def test_previous_records_match_prev_record(self):
+        """Bulk-loaded predecessors are the same records simple_history's prev_record returns."""
+        from arvelloapp.models import Product
+        from arvelloapp.utils.history_query import attach_previous_records, fetch_history_page
+        for i in range(3):
+            product = Product.objects.create(title=f'Proizvod {i}', price=10, taxPercent=25, barid=str(i))
+            for price in (11, 12):
+                product.price = price
+                product.save()
+
+        records = fetch_history_page([Product]).records
+        with self.assertNumQueries(2):
+            attach_previous_records(records)
+        for record in records:
+            expected = record.prev_record
+            self.assertEqual(
+                getattr(record.previous_record, 'history_id', None),
+                getattr(expected, 'history_id', None),
+            )
+
+
+class InvoicePdfViewTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from django.utils import timezone
+        from arvelloapp.models import Client, Company, Invoice, InvoiceProduct, Product
+        from arvelloapp.signals import enqueue_invoice_for_fiscalization
+        from django.db.models.signals import post_save
+
+        post_save.disconnect(enqueue_invoice_for_fiscalization, sender=Invoice)
+        self.addCleanup(post_save.connect, enqueue_invoice_for_fiscalization, sender=Invoice)
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        client = Client.objects.create(
+            clientName='Test Client', addressLine1='Test Address', province='GRAD ZAGREB',
+            postalCode='10000', clientUniqueId='0001', clientType='Fizička osoba', OIB='12345678901'
+        )
+        company = Company.objects.create(
+            clientName='Test Company', addressLine1='Company Address', town='Zagreb',
+            province='GRAD ZAGREB', postalCode='10000', clientUniqueId='0002',
+            clientType='Pravna osoba', OIB='98765432109', IBAN='HR1723600001101234565'
+        )
+        self.invoice = Invoice.objects.create(
+            number='1-1-25', date=timezone.now().date(), dueDate=timezone.now().date(),
+            client=client, subject=company
+        )
+        product = Product.objects.create(title='Proizvod', price=10, taxPercent=25, barid='1')
+        InvoiceProduct.objects.create(invoice=self.invoice, product=product, quantity=2)
+
+    def test_pdf_rendered_once_per_version(self):
+        from unittest.mock import patch
+
+        with patch('arvelloapp.utils.document_pdf.render_pdf', return_value=b'%PDF-test') as render:
+            response = self.client.get(reverse('invoice_pdf', args=[self.invoice.pk]))
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertEqual(response.content, b'%PDF-test')
+
+            response = self.client.get(reverse('invoice_pdf', args=[self.invoice.pk]), {'download': 1})
+            self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+            self.assertEqual(render.call_count, 1)
+
+            self.invoice.notes = 'Izmjena'
+            self.invoice.save()
+            self.client.get(reverse('invoice_pdf', args=[self.invoice.pk]))
+            self.assertEqual(render.call_count, 2)
+
+    def test_pdf_cached_per_referent(self):
+        from unittest.mock import patch
+        from arvelloapp.utils.document_pdf import get_invoice_pdf
+
+        other = User.objects.create_user(username='drugi', password='testpassword', first_name='Ana', last_name='Horvat')
+        with patch('arvelloapp.utils.document_pdf.render_pdf', return_value=b'%PDF-test') as render:
+            for _ in range(2):
+                get_invoice_pdf(self.invoice, referent=self.user)
+                get_invoice_pdf(self.invoice, referent=other)
+                get_invoice_pdf(self.invoice)
+            # Referenti ne istiskuju tuđe verzije iz cachea
+            self.assertEqual(render.call_count, 3)
+
+    def test_bulk_email_skips_sent_invoices(self):
+        from unittest.mock import patch
+        from django.core import mail
+        from django.test import override_settings
+        from arvelloapp.utils.invoice_batch import process_invoices
+        from arvelloapp.utils.mail_queue import MailDispatcher
+
+        self.invoice.client.emailAddress = 'klijent@example.com'
+        self.invoice.client.save()
+
+        with override_settings(PDF_RENDER_POOL={'WORKERS': 0, 'TIMEOUT': 60}), \
+                patch('arvelloapp.utils.pdf_pool.html_to_pdf', return_value=b'%PDF-test'):
+            _, result = process_invoices([self.invoice.pk], referent=self.user)
+            self.assertEqual(result.queued, 1)
+            self.assertEqual(result.pdfs, {})
+            # Poruka čeka u redu, pa se račun ne šalje ponovno
+            self.assertEqual(process_invoices([self.invoice.pk], referent=self.user)[1].queued, 0)
+
+        MailDispatcher().deliver()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][1], b'%PDF-test')
+        self.invoice.refresh_from_db()
+        self.assertIsNotNone(self.invoice.emailed_at)
+        self.assertEqual(process_invoices([self.invoice.pk])[0], [])
+
+
+    def test_bulk_email_requires_selection(self):
+        from unittest.mock import patch
+
+        with patch('arvelloapp.views.queue_invoice_batch') as queue:
+            response = self.client.post(reverse('send_invoice_emails'), {'all_unsent': '1'})
+        self.assertRedirects(response, reverse('invoices'), fetch_redirect_response=False)
+        # Računi bez emailed_at nisu nužno neposlani (stari računi), pa se ne šalju svi odjednom
+        queue.assert_not_called()
+
+
+class PayslipPdfTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from datetime import date
+        from decimal import Decimal
+        from django.test import override_settings
+        from arvelloapp.models import Company, Employee, Salary
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name, PDF_RENDER_POOL={'WORKERS': 0, 'TIMEOUT': 60}
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        company = Company.objects.create(
+            clientName='Test Company', addressLine1='Company Address', town='Zagreb',
+            province='GRAD ZAGREB', postalCode='10000', clientUniqueId='0002',
+            clientType='Pravna osoba', OIB='98765432109', IBAN='HR1723600001101234565'
+        )
+        employee = Employee.objects.create(
+            first_name='Ana', last_name='Anić', date_of_birth=date(1990, 1, 1), oib='12345678903',
+            address='Ilica 1', city='Zagreb', postal_code='10000', company=company,
+            date_of_employment=date(2020, 1, 1), job_title='Referent',
+            iban='HR1723600001101234565', hourly_rate=Decimal('10.00'), email='ana@example.com'
+        )
+        self.salary = Salary.objects.create(employee=employee, period_month=1, period_year=2025, created_by=self.user)
+
+    def test_pdf_view_does_not_send_email(self):
+        from unittest.mock import patch
+
+        with patch('arvelloapp.utils.pdf_generator.render_html', return_value=b'%PDF-test') as render, \
+                patch('arvelloapp.utils.pdf_generator.send_payslip_email') as send:
+            url = reverse('salary_payslip', args=[self.salary.pk])
+            response = self.client.get(url, {'format': 'pdf'})
+            self.assertEqual(response.content, b'%PDF-test')
+            self.client.get(url, {'format': 'pdf'})
+            self.assertEqual(render.call_count, 1)
+            send.assert_not_called()
+
+    def test_send_payslip_queues_email(self):
+        from unittest.mock import patch
+
+        with patch('arvelloapp.utils.pdf_generator.queue_payslip_email') as queue:
+            response = self.client.post(reverse('send_payslip', args=[self.salary.pk]))
+        self.assertRedirects(response, reverse('salaries'), fetch_redirect_response=False)
+        queue.assert_called_once_with(self.salary)
+
+    def test_period_batch_queues_email_and_records_delivery(self):
+        from unittest.mock import patch
+        from django.core import mail
+        from arvelloapp.models import OutgoingEmail, PayslipDelivery
+        from arvelloapp.utils.mail_queue import MailDispatcher
+        from arvelloapp.utils.payslip_batch import process_period
+
+        with patch('arvelloapp.utils.pdf_pool.html_to_pdf', return_value=b'%PDF-test'):
+            salaries, result = process_period(2025, 1)
+
+        self.assertEqual(len(salaries), 1)
+        self.assertEqual(result.queued, 1)
+        self.assertEqual(len(mail.outbox), 0)
+        delivery = PayslipDelivery.objects.get(salary=self.salary)
+        self.assertEqual(delivery.status, 'queued')
+        self.assertEqual(delivery.email.to, ['ana@example.com'])
+
+        MailDispatcher().deliver()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][1], b'%PDF-test')
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'sent')
+        self.assertEqual(OutgoingEmail.objects.get().status, 'sent')
+
+    def test_period_zip(self):
+        import io
+        import zipfile
+        from unittest.mock import patch
+        from arvelloapp.models import Salary
+
+        # Drugi zaposlenik istog imena u istom razdoblju
+        namesake = self.salary.employee
+        namesake.pk = None
+        namesake.oib = '69435151530'
+        namesake.save()
+        Salary.objects.create(employee=namesake, period_month=1, period_year=2025, created_by=self.user)
+
+        with patch('arvelloapp.utils.pdf_pool.html_to_pdf', return_value=b'%PDF-test'):
+            response = self.client.get(reverse('download_period_payslips'), {'year': 2025, 'month': 1})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            self.assertEqual(len(set(archive.namelist())), 2)
+
+
+class TableExportViewTest(TestCase):
+    def setUp(self):
+        from arvelloapp.models import Company, Inventory
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        company = Company.objects.create(
+            clientName='Test Company', addressLine1='Company Address', town='Zagreb',
+            province='GRAD ZAGREB', postalCode='10000', clientUniqueId='0002',
+            clientType='Pravna osoba', OIB='98765432109', IBAN='HR1723600001101234565'
+        )
+        Inventory.objects.create(title='Stolica', quantity=3, subject=company)
+        Inventory.objects.create(title='Stol', quantity=1)
+
+    def test_inventory_csv_is_streamed(self):
+        response = self.client.get(reverse('export_inventory_to_csv'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'Naziv,Količina,Datum dodavanja,Zadnje ažuriranje,Subjekt')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('Stolica,3.0,') and lines[1].endswith(',Test Company'))
+        self.assertTrue(lines[2].endswith(','))
+
+    def test_xlsx_export(self):
+        import io
+        from openpyxl import load_workbook
+
+        response = self.client.get(reverse('export_table', args=['inventory', 'xlsx']))
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], 'Naziv')
+        self.assertEqual(rows[1][0], 'Stolica')
+        self.assertEqual(len(rows), 3)
+
+    def test_all_exports(self):
+        from arvelloapp.utils.table_export import EXPORTS
+
+        for name in EXPORTS:
+            for file_format in ('csv', 'xlsx'):
+                response = self.client.get(reverse('export_table', args=[name, file_format]))
+                self.assertEqual(response.status_code, 200, (name, file_format))
+                b''.join(response.streaming_content)
+
+    def test_unknown_export(self):
+        response = self.client.get(reverse('export_table', args=['users', 'csv']))
+        self.assertEqual(response.status_code, 404)
+
+
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        from arvelloapp.utils.request_profiler import PROFILE_STATS
+
+        PROFILE_STATS.reset()
+        self.user = User.objects.create_user(username='staff', password='testpassword', is_staff=True)
+        self.client.login(username='staff', password='testpassword')
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('invoices'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_server_timing_and_stats(self):
+        from django.test import override_settings
+
+        with override_settings(REQUEST_PROFILING={'ENABLED': True, 'SLOW_MS': 60000}):
+            response = self.client.get(reverse('invoices'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* SQL"')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        rows = self.client.get(reverse('profiling_stats')).json()['views']
+        self.assertEqual([row['view'] for row in rows], ['invoices'])
+        self.assertEqual(rows[0]['requests'], 1)
+        self.assertGreater(rows[0]['avg_queries'], 0)
+
+        self.client.post(reverse('profiling_stats'))
+        self.assertEqual(self.client.get(reverse('profiling_stats')).json()['views'], [])
+
+    def test_stats_require_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('profiling_stats')).status_code, 302)
+
+    def test_repeated_queries_logged(self):
+        from django.test import override_settings
+        from arvelloapp.utils.request_profiler import RequestProfile, finish_profile, normalize_sql
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+
+        profile = RequestProfile()
+        with profile.activate():
+            for user_id in range(5):
+                list(User.objects.filter(pk=user_id))
+            list(User.objects.filter(pk__in=[1, 2, 3]))
+            list(User.objects.filter(pk__in=[4]))
+        (sql, count, _), = profile.repeated_queries(threshold=3)
+        self.assertEqual(count, 5)
+        self.assertEqual(profile.db_count, 7)
+        self.assertEqual(profile.repeated_queries(threshold=2)[1][1], 2)
+        self.assertEqual(normalize_sql('WHERE id IN (%s, %s,%s)'), 'WHERE id IN (...)')
+
+        request = RequestFactory().get('/invoices/')
+        with override_settings(REQUEST_PROFILING={'SLOW_MS': 60000, 'REPEATED_QUERY_THRESHOLD': 5}):
+            with self.assertLogs('arvelloapp.utils.request_profiler', 'WARNING') as logs:
+                finish_profile(profile, request, HttpResponse())
+        self.assertIn('Ponovljeni upiti: GET /invoices/', logs.output[0])
+        self.assertIn('  5x (', logs.output[0])
+
+    def test_outbound_http_counted(self):
+        from unittest import mock
+        import requests
+        from arvelloapp.utils.request_profiler import RequestProfile
+
+        def fake_send(adapter, request, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{}'
+            response.request = request
+            response.url = request.url
+            return response
+
+        profile = RequestProfile()
+        with mock.patch('requests.adapters.HTTPAdapter.send', fake_send), profile.activate():
+            requests.get('http://example.invalid/a')
+            requests.post('http://example.invalid/b', data='x')
+        self.assertEqual(profile.http_count, 2)
+        self.assertGreaterEqual(profile.http_ms, 0)
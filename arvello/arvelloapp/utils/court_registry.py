@@ -12,12 +12,15 @@ Token endpoint: https://sudreg-data.gov.hr/api/oauth/token
 
 import requests
 import re
+import threading
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from django.core.cache import cache
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -354,9 +357,6 @@ class CourtRegistryClient:
     # Timeout for API requests (seconds)
     TIMEOUT = 30
     
-    # Cache timeout (seconds) - cache results for 1 hour
-    CACHE_TIMEOUT = 3600
-    
     # Token expires in 6 hours, but refresh 5 minutes early
     TOKEN_REFRESH_BUFFER = 300
     
@@ -570,7 +570,7 @@ class CourtRegistryClient:
             elif status_code == 403:
                 raise CourtRegistryError("Pristup API-ju nije dozvoljen (403).")
             elif status_code == 404:
-                raise CourtRegistryError("Subjekt nije pronađen u registru (404).")
+                raise CourtRegistryNotFound("Subjekt nije pronađen u registru (404).")
             elif status_code == 429:
                 raise CourtRegistryError("Previše zahtjeva (429). Pokušajte ponovo kasnije.")
             elif status_code is None:
@@ -591,6 +591,7 @@ class CourtRegistryClient:
         Search for a company by OIB (Personal Identification Number).
         
         Uses the /detalji_subjekta endpoint which properly filters by OIB.
+        Results are served from the persistent registry cache when possible.
         
         Args:
             oib: 11-digit OIB number
@@ -601,30 +602,11 @@ class CourtRegistryClient:
         if not oib or len(oib) != 11 or not oib.isdigit():
             raise CourtRegistryError("OIB mora sadržavati točno 11 znamenki.")
         
-        # Check cache first
-        cache_key = f"court_registry_oib_{oib}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            logger.debug(f"Returning cached data for OIB {oib}")
-            return cached_data
-        
         try:
-            # Use detalji_subjekta endpoint with OIB identifier
-            # This correctly filters by OIB unlike /subjekti?oib=
-            response = self._make_request(
-                '/detalji_subjekta',
-                params={
-                    'tip_identifikatora': 'oib',
-                    'identifikator': oib
-                }
-            )
-            
-            if response:
+            payload = self._cached_payload('oib', oib, lambda: self.fetch_oib_payload(oib))
+            if payload:
                 # detalji_subjekta returns a single object, not a list
-                company_data = self._parse_details_response(response)
-                if company_data:
-                    cache.set(cache_key, company_data, self.CACHE_TIMEOUT)
-                return company_data
+                return self._parse_details_response(payload)
                 
         except CourtRegistryError:
             raise
@@ -634,6 +616,22 @@ class CourtRegistryClient:
         
         return None
     
+    def fetch_oib_payload(self, oib: str) -> Optional[Dict]:
+        """
+        Fetch the raw /detalji_subjekta response for an OIB, bypassing the cache.
+        
+        Network only (no database access), so it is safe to call from worker threads.
+        """
+        # Use detalji_subjekta endpoint with OIB identifier
+        # This correctly filters by OIB unlike /subjekti?oib=
+        return self._make_request(
+            '/detalji_subjekta',
+            params={
+                'tip_identifikatora': 'oib',
+                'identifikator': oib
+            }
+        ) or None
+    
     def _parse_details_response(self, data: Dict) -> Optional[CompanyData]:
         """
         Parse detalji_subjekta API response into CompanyData object.
@@ -731,17 +729,9 @@ class CourtRegistryClient:
         if not mbs:
             raise CourtRegistryError("MBS je obavezan.")
         
-        # Check cache first
-        cache_key = f"court_registry_mbs_{mbs}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return cached_data
-        
         try:
             # Use path parameter: /subjekti/{mbs}
-            response = self._make_request(
-                f'/subjekti/{mbs}'
-            )
+            response = self._cached_payload('mbs', mbs, lambda: self._make_request(f'/subjekti/{mbs}') or None)
             
             if response:
                 # If the API returns a list, take the first result
@@ -750,10 +740,7 @@ class CourtRegistryClient:
                         return None
                     response = response[0]
                 
-                company_data = self._parse_company_response(response)
-                if company_data:
-                    cache.set(cache_key, company_data, self.CACHE_TIMEOUT)
-                return company_data
+                return self._parse_company_response(response)
                 
         except CourtRegistryError:
             raise
@@ -778,12 +765,11 @@ class CourtRegistryClient:
             raise CourtRegistryError("Naziv mora sadržavati najmanje 3 znaka.")
         
         try:
-            # Use the name search endpoint
-            response = self._make_request(
-                '/subjekti',
-                params={
-                    'naziv': name
-                }
+            # Use the name search endpoint (cached by normalized name)
+            response = self._cached_payload(
+                'name',
+                ' '.join(name.lower().split())[:255],
+                lambda: self._make_request('/subjekti', params={'naziv': name})
             )
             
             results = []
@@ -808,12 +794,83 @@ class CourtRegistryClient:
             
             return results
             
+        except CourtRegistryNotFound:
+            # No subject matches the name
+            return []
         except CourtRegistryError:
             raise
         except Exception as e:
             logger.error(f"Error searching by name '{name}': {e}")
             raise CourtRegistryError(f"Greška pri pretraživanju: {str(e)}")
     
+    def _cached_payload(self, lookup_type: str, lookup_key: str, fetch: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the raw API payload for a lookup using the persistent registry cache.
+        
+        - fresh entry (younger than TTL): returned without a network call
+        - stale entry (younger than STALE_TTL): returned immediately, refreshed in background
+        - missing/expired entry: fetched synchronously; on API failure an expired
+          entry is still returned rather than failing the lookup
+        
+        Raises:
+            CourtRegistryNotFound: If the subject is (cached as) not found
+        """
+        entry = get_cached_lookup(lookup_type, lookup_key)
+        if entry is not None:
+            state = cache_entry_state(entry)
+            if state == 'stale':
+                self._revalidate_in_background(lookup_type, lookup_key, fetch)
+            if state in ('fresh', 'stale'):
+                if entry.not_found:
+                    raise CourtRegistryNotFound("Subjekt nije pronađen u registru.")
+                return entry.payload
+        
+        try:
+            payload = fetch()
+        except CourtRegistryNotFound:
+            store_cached_lookup(lookup_type, lookup_key, None)
+            raise
+        except CourtRegistryError:
+            if entry is not None and not entry.not_found:
+                logger.warning(f"Court registry unavailable, serving expired cache for {lookup_type} {lookup_key}")
+                return entry.payload
+            raise
+        
+        store_cached_lookup(lookup_type, lookup_key, payload)
+        return payload
+    
+    def _revalidate_in_background(self, lookup_type: str, lookup_key: str, fetch: Callable[[], Optional[Any]]) -> None:
+        """Refresh a stale cache entry in a background thread (once per key)."""
+        cache_id = (lookup_type, lookup_key)
+        with _revalidating_lock:
+            if cache_id in _revalidating:
+                return
+            _revalidating.add(cache_id)
+        
+        def revalidate():
+            try:
+                store_cached_lookup(lookup_type, lookup_key, fetch())
+            except CourtRegistryNotFound:
+                store_cached_lookup(lookup_type, lookup_key, None)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {lookup_type} {lookup_key}: {e}")
+            finally:
+                with _revalidating_lock:
+                    _revalidating.discard(cache_id)
+                connection.close()
+        
+        threading.Thread(target=revalidate, daemon=True).start()
+    
+    def configure_pool(self, max_connections: int) -> None:
+        """
+        Size the session's connection pool for concurrent requests and
+        obtain the access token up front, so worker threads share it.
+        """
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._get_access_token()
+    
     def _parse_company_response(self, data: Dict) -> Optional[CompanyData]:
         """
         Parse API response into CompanyData object.
@@ -909,6 +966,55 @@ class CourtRegistryError(Exception):
     pass
 
 
+class CourtRegistryNotFound(CourtRegistryError):
+    """Exception raised when the subject does not exist in the court registry."""
+    pass
+
+
+# Keys currently being refreshed in background threads
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def _cache_setting(name: str, default: int) -> int:
+    return getattr(settings, 'COURT_REGISTRY_CACHE', {}).get(name, default)
+
+
+def get_cached_lookup(lookup_type: str, lookup_key: str):
+    """Return the CourtRegistryCache entry for a lookup, or None."""
+    from arvelloapp.models import CourtRegistryCache
+    return CourtRegistryCache.objects.filter(lookup_type=lookup_type, lookup_key=lookup_key).first()
+
+
+def cache_entry_state(entry) -> str:
+    """
+    Classify a cache entry by age: 'fresh', 'stale' (usable, needs refresh) or 'expired'.
+    Not-found entries use the shorter NOT_FOUND_TTL and are never served stale.
+    """
+    age = (timezone.now() - entry.fetched_at).total_seconds()
+    if entry.not_found:
+        return 'fresh' if age < _cache_setting('NOT_FOUND_TTL', 24 * 3600) else 'expired'
+    if age < _cache_setting('TTL', 7 * 24 * 3600):
+        return 'fresh'
+    if age < _cache_setting('STALE_TTL', 90 * 24 * 3600):
+        return 'stale'
+    return 'expired'
+
+
+def store_cached_lookup(lookup_type: str, lookup_key: str, payload: Optional[Any]) -> None:
+    """Store a raw API payload (None means not found) in the persistent registry cache."""
+    from arvelloapp.models import CourtRegistryCache
+    CourtRegistryCache.objects.update_or_create(
+        lookup_type=lookup_type,
+        lookup_key=lookup_key,
+        defaults={
+            'payload': payload,
+            'not_found': payload is None,
+            'fetched_at': timezone.now(),
+        }
+    )
+
+
 def get_court_registry_client() -> CourtRegistryClient:
     """
     Get a configured CourtRegistryClient instance using stored credentials.
@@ -0,0 +1,246 @@
+"""
+Izrada PDF dokumenata računa i ponuda na poslužitelju.
+
+Svaki dokument se renderira jednom (WeasyPrint) i sprema pod MEDIA_ROOT kao
+datoteka adresirana sadržajem: naziv datoteke sadrži sažetak (hash) verzije
+dokumenta izračunat iz `last_updated` računa/ponude, stavki, klijenta i
+subjekta. Ispis, preuzimanje i slanje e-mailom tada poslužuju iste spremljene
+bajtove, a nova verzija nastaje samo kad se dokument promijeni. Referent je
+ispisan na dokumentu pa svaki referent ima svoju datoteku (naziv počinje
+ključem referenta) i ne istiskuje datoteke drugih referenata.
+
+Samo renderiranje odvija se u bazenu procesa (vidi pdf_pool).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.template.loader import render_to_string
+
+from ..templatetags.user_extras import full_name_with_title
+from .barcode import generate_hub3_barcode_base64
+from .pdf_pool import PdfRenderError, render_html  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = 'pdf_cache'
+
+
+def render_pdf_html(template_name, context):
+    """Renderira HTML predložak u oblik namijenjen izradi PDF-a."""
+    return render_to_string(template_name, {**context, 'pdf_render': True})
+
+
+def render_pdf(template_name, context):
+    """Renderira HTML predložak u PDF bajtove (u bazenu procesa za PDF)."""
+    return render_html(render_pdf_html(template_name, context))
+
+
+def _referent_key(referent):
+    return hashlib.sha256(full_name_with_title(referent).encode('utf-8')).hexdigest()[:8]
+
+
+def _document_version(document, items, referent):
+    # Ključ referenta + sažetak svih podataka koji utječu na izgled dokumenta
+    parts = [
+        document.pk, document.number, document.last_updated,
+        document.client_id, document.client.last_updated,
+        document.subject_id, document.subject.last_updated,
+    ]
+    for item in items:
+        parts.append((
+            item.pk, item.product_id, item.product.last_updated,
+            item.quantity, item.discount, item.rabat,
+        ))
+    digest = hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+    return f"{_referent_key(referent)}-{digest}"
+
+
+def _cache_path(kind, object_id, version):
+    directory = os.path.join(settings.MEDIA_ROOT, PDF_CACHE_DIR, kind)
+    return directory, os.path.join(directory, f"{object_id}-{version}.pdf")
+
+
+def _read_cached(path):
+    try:
+        with open(path, 'rb') as pdf_file:
+            return pdf_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def _store(directory, path, pdf_bytes):
+    os.makedirs(directory, exist_ok=True)
+    # Atomično zapisivanje kako se nikad ne bi poslužila napola zapisana datoteka
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(pdf_bytes)
+    os.replace(tmp_path, path)
+
+    # Ukloni prethodne verzije istog dokumenta (za istog referenta, ako je dio verzije)
+    current = os.path.basename(path)
+    prefix = current.rsplit('-', 1)[0] + '-'
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix) and filename.endswith('.pdf') and filename != current:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def read_cached_pdf(kind, object_id, version):
+    """Vraća spremljeni PDF za danu verziju dokumenta ili None."""
+    _, path = _cache_path(kind, object_id, version)
+    return _read_cached(path)
+
+
+def store_cached_pdf(kind, object_id, version, pdf_bytes):
+    """Sprema PDF za danu verziju dokumenta i uklanja starije verzije."""
+    directory, path = _cache_path(kind, object_id, version)
+    try:
+        _store(directory, path, pdf_bytes)
+    except OSError as e:
+        # Dokument je izrađen; neuspjelo spremanje samo znači novo renderiranje idući put
+        logger.warning(f"PDF za {kind} {object_id} nije spremljen u cache: {e}")
+
+
+def get_cached_pdf(kind, object_id, version, render):
+    """
+    Vraća PDF dokumenta iz cachea ili ga izrađuje i sprema.
+
+    Args:
+        kind: vrsta dokumenta (poddirektorij cachea), npr. 'invoice'
+        object_id: primarni ključ dokumenta
+        version: sažetak podataka o kojima ovisi izgled dokumenta
+        render: funkcija bez argumenata koja vraća PDF bajtove
+
+    Returns:
+        bytes: sadržaj PDF datoteke
+    """
+    pdf_bytes = read_cached_pdf(kind, object_id, version)
+    if pdf_bytes is None:
+        pdf_bytes = render()
+        store_cached_pdf(kind, object_id, version, pdf_bytes)
+    return pdf_bytes
+
+
+def _hub3_barcode(document, description):
+    subject = document.subject
+    client = document.client
+    return generate_hub3_barcode_base64(
+        iban=subject.IBAN or "",
+        amount=Decimal(str(document.price_with_vat())),
+        payer_name=client.clientName,
+        payer_address=client.addressLine1,
+        payer_city=f"{client.postalCode} {client.province}",
+        receiver_name=subject.clientName[:25],
+        receiver_address=subject.addressLine1,
+        receiver_city=f"{subject.postalCode} {subject.town}",
+        reference_model="HR00",
+        reference_number=f"{client.clientUniqueId}-{document.number.replace('/', '-')}",
+        purpose_code="OTHR",
+        description=description,
+        currency=document.currtext()
+    )
+
+
+def _document_context(kind, document, items, description, referent):
+    return {
+        kind: document,
+        'products': items,
+        'client': document.client,
+        'subject': document.subject,
+        'barcode_image': _hub3_barcode(document, description),
+        'referent': referent,
+    }
+
+
+def _document_pdf(kind, document, items, template_name, description, referent):
+    def render():
+        return render_pdf(template_name, _document_context(kind, document, items, description, referent))
+
+    version = _document_version(document, items, referent)
+    return get_cached_pdf(kind, document.pk, version, render)
+
+
+def get_invoice_pdf(invoice, referent=None):
+    """
+    Vraća PDF računa, iz cachea ako postoji verzija za trenutno stanje računa.
+
+    Args:
+        invoice: Invoice objekt
+        referent: korisnik koji se ispisuje kao referent na dokumentu
+
+    Returns:
+        bytes: sadržaj PDF datoteke
+
+    Raises:
+        PdfRenderError: ako izrada PDF-a ne uspije
+    """
+    return _document_pdf(
+        'invoice', invoice, invoice_items(invoice), 'invoice_export_view.html',
+        _invoice_description(invoice), referent,
+    )
+
+
+def _document_items(document, lookup):
+    """
+    Stavke dokumenta s proizvodima, redoslijedom ispisa na dokumentu.
+
+    Stavke se učitavaju u prefetch cache dokumenta pa metode modela koje
+    predložak poziva (curr, tolrabat, hasDiscount...) ne šalju nove upite.
+    """
+    if lookup not in getattr(document, '_prefetched_objects_cache', {}):
+        items = getattr(document, lookup).model.objects.select_related('product').order_by('pk')
+        prefetch_related_objects([document], Prefetch(lookup, queryset=items))
+    return list(getattr(document, lookup).all())
+
+
+def invoice_items(invoice):
+    """Stavke računa s proizvodima, redoslijedom ispisa na dokumentu."""
+    return _document_items(invoice, 'invoiceproduct_set')
+
+
+def _invoice_description(invoice):
+    return f"Uplata po računu {invoice.number}"
+
+
+def invoice_pdf_version(invoice, items, referent=None):
+    """Sažetak verzije PDF-a računa (ključ cachea 'invoice')."""
+    return _document_version(invoice, items, referent)
+
+
+def render_invoice_html(invoice, items, referent=None):
+    """HTML računa za izradu PDF-a, npr. za skupno renderiranje u pdf_pool."""
+    context = _document_context('invoice', invoice, items, _invoice_description(invoice), referent)
+    return render_pdf_html('invoice_export_view.html', context)
+
+
+def get_offer_pdf(offer, referent=None):
+    """
+    Vraća PDF ponude, iz cachea ako postoji verzija za trenutno stanje ponude.
+
+    Args:
+        offer: Offer objekt
+        referent: korisnik koji se ispisuje kao referent na dokumentu
+
+    Returns:
+        bytes: sadržaj PDF datoteke
+
+    Raises:
+        PdfRenderError: ako izrada PDF-a ne uspije
+    """
+    items = _document_items(offer, 'offerproduct_set')
+    return _document_pdf(
+        'offer', offer, items, 'offer_export_view.html',
+        f"Uplata po ponudi {offer.number}", referent,
+    )
+
+
+def pdf_filename(prefix, number):
+    """Naziv datoteke za preuzimanje, npr. Racun_1-1-1.pdf."""
+    return f"{prefix}_{number.replace('/', '-')}.pdf"
@@ -1,12 +1,61 @@
 import os
 import logging
+from django.core.cache import cache
 from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
 
+EMAIL_CONFIG_CACHE_KEY = 'email_config:{}'
+# Oznaka u cacheu za tvrtke bez aktivne konfiguracije
+_NO_CONFIG = 'none'
+
+
+def get_email_config(company, use_cache=True):
+    """
+    Vraća aktivnu EmailConfig za tvrtku ili None (iz cachea).
+
+    Cache se poništava pri spremanju ili brisanju konfiguracije (vidi signals.py),
+    ali samo u procesu koji je konfiguraciju spremio ako cache nije dijeljen
+    (zadani locmem). Zasebni procesi poput mail_workera zato čitaju iz baze
+    (use_cache=False) kako ne bi slali sa zastarjelim SMTP postavkama.
+    """
+    if company is None:
+        return None
+    company_id = getattr(company, 'pk', company)
+    cache_key = EMAIL_CONFIG_CACHE_KEY.format(company_id)
+    email_config = cache.get(cache_key) if use_cache else None
+    if email_config is None:
+        from arvelloapp.models import EmailConfig
+        email_config = EmailConfig.objects.select_related('company').filter(
+            company_id=company_id, is_active=True
+        ).first() or _NO_CONFIG
+        timeout = getattr(settings, 'MAIL_QUEUE', {}).get('CONFIG_CACHE_SECONDS', 300)
+        cache.set(cache_key, email_config, timeout)
+    return None if email_config == _NO_CONFIG else email_config
+
+
+def invalidate_email_config(company_id):
+    """Briše konfiguraciju tvrtke iz cachea."""
+    cache.delete(EMAIL_CONFIG_CACHE_KEY.format(company_id))
+
+
+def connection_for_config(email_config):
+    """Vraća SMTP vezu za konfiguraciju ili vezu prema globalnim postavkama."""
+    if email_config is None:
+        return get_connection()
+    return get_connection(
+        host=email_config.smtp_host,
+        port=email_config.smtp_port,
+        username=email_config.smtp_user,
+        password=email_config.smtp_password,
+        use_tls=email_config.use_tls,
+        use_ssl=email_config.use_ssl,
+    )
+
+
 def get_email_backend_for_company(company):
     """
     Vraća email backend konfiguriran za specifičnu tvrtku.
@@ -14,22 +63,61 @@ def get_email_backend_for_company(company):
     Inače koristi globalne postavke iz settings.py.
     """
     try:
-        from arvelloapp.models import EmailConfig
-        email_config = EmailConfig.objects.get(company=company, is_active=True)
-        
-        return get_connection(
-            host=email_config.smtp_host,
-            port=email_config.smtp_port,
-            username=email_config.smtp_user,
-            password=email_config.smtp_password,
-            use_tls=email_config.use_tls,
-            use_ssl=email_config.use_ssl,
-        ), email_config
+        email_config = get_email_config(company)
+        if email_config is None:
+            return None, None
+        return connection_for_config(email_config), email_config
     except Exception:
         # Fallback na globalne postavke
         return None, None
 
 
+def queue_email(subject, body, to, from_email='', reply_to=None, company=None, attachments=(), content_subtype='html'):
+    """
+    Stavlja poruku u red za slanje (šalje je naredba mail_worker).
+
+    Args:
+        to (list): E-mail adrese primatelja.
+        attachments: Niz (naziv, sadržaj, mime_tip) privitaka.
+
+    Returns:
+        OutgoingEmail: spremljena poruka
+    """
+    from arvelloapp.models import OutgoingEmail, OutgoingEmailAttachment
+
+    with transaction.atomic():
+        email = OutgoingEmail.objects.create(
+            company=company,
+            subject=subject,
+            body=body,
+            content_subtype=content_subtype,
+            from_email=from_email,
+            to=list(to),
+            reply_to=[address for address in (reply_to or []) if address],
+        )
+        OutgoingEmailAttachment.objects.bulk_create([
+            OutgoingEmailAttachment(email=email, filename=name, content=content, mimetype=mimetype)
+            for name, content, mimetype in attachments
+        ])
+    return email
+
+
+def build_email_message(outgoing, connection=None):
+    """Sastavlja EmailMessage iz poruke u redu."""
+    email = EmailMessage(
+        subject=outgoing.subject,
+        body=outgoing.body,
+        from_email=outgoing.from_email or None,
+        to=outgoing.to,
+        reply_to=outgoing.reply_to or None,
+        connection=connection,
+    )
+    email.content_subtype = outgoing.content_subtype
+    for attachment in outgoing.attachments.all():
+        email.attach(attachment.filename, bytes(attachment.content), attachment.mimetype)
+    return email
+
+
 def send_test_email(email_config, recipient_email):
     """
     Šalje testni email koristeći danu konfiguraciju.
@@ -42,14 +130,8 @@ def send_test_email(email_config, recipient_email):
         tuple: (bool success, str message)
     """
     try:
-        connection = get_connection(
-            host=email_config.smtp_host,
-            port=email_config.smtp_port,
-            username=email_config.smtp_user,
-            password=email_config.smtp_password,
-            use_tls=email_config.use_tls,
-            use_ssl=email_config.use_ssl,
-        )
+        # Testni email se šalje odmah (ne preko reda) kako bi korisnik vidio rezultat
+        connection = connection_for_config(email_config)
         
         email = EmailMessage(
             subject='Arvello - Test email konfiguracije',
@@ -79,86 +161,72 @@ def send_test_email(email_config, recipient_email):
         return False, f'Greška pri slanju testnog emaila: {str(e)}'
 
 
-def send_payslip_email(subject, message, recipient_email, pdf_path, sender_name, reply_to_email, salary):
+def send_payslip_email(subject, message, recipient_email, pdf_content, pdf_filename, sender_name, reply_to_email, salary):
     """
-    Šalje e-mail s PDF privitkom koristeći HTML predložak.
+    Stavlja e-mail s PDF platnom listom u red za slanje.
     Koristi email konfiguraciju za tvrtku ako postoji.
 
     Args:
         subject (str): Naslov e-maila.
-        message (str): Poruka e-maila.
+        message (str): HTML poruka e-maila.
         recipient_email (str): E-mail adresa primatelja.
-        pdf_path (str): Putanja do PDF datoteke za privitak.
+        pdf_content (bytes): Sadržaj PDF privitka.
+        pdf_filename (str): Naziv PDF privitka.
         sender_name (str): Ime pošiljatelja (npr. ime firme).
         reply_to_email (str): E-mail adresa za odgovor.
         salary (Salary): Objekt modela Salary koji sadrži podatke o plaći.
 
     Returns:
-        bool: True ako je e-mail uspješno poslan, False inače.
+        OutgoingEmail: poruka u redu ili None ako je došlo do greške.
     """
     try:
-        # Pokušaj dohvatiti email konfiguraciju za tvrtku
-        connection, email_config = get_email_backend_for_company(salary.employee.company)
-        
+        company = salary.employee.company
+        email_config = get_email_config(company)
+
         # Odredi from_email na temelju konfiguracije
         if email_config:
             from_email = email_config.get_from_email_formatted()
         else:
             from_email = f"{sender_name} <{settings.EMAIL_HOST_USER}>"
-        
-        # Renderiraj HTML predložak koristeći podatke iz modela Salary
-        html_message = render_to_string('email_templates/payslip_email.html', 
-            context={
-            'employee_name': salary.employee.get_full_name(),
-            'period_month': f"{salary.period_month:02d}",
-            'period_year': salary.period_year,
-            'company_name': salary.employee.company.clientName,
-            'issued_by_name': salary.created_by.get_full_name(),
-        })
 
-        email = EmailMessage(
+        return queue_email(
             subject=subject,
-            body=html_message,
-            from_email=from_email,
+            body=message,
             to=[recipient_email],
+            from_email=from_email,
             reply_to=[reply_to_email],
-            connection=connection,
+            company=company,
+            attachments=[(pdf_filename, pdf_content, 'application/pdf')],
         )
-        email.content_subtype = "html"  # Postavi sadržaj na HTML
-        email.attach_file(pdf_path)
-        email.send()
-        return True
     except Exception as e:
-        logger.error(f"Greška pri slanju e-maila: {e}")
-        return False
+        logger.error(f"Greška pri stavljanju e-maila u red: {e}")
+        return None
 
 def send_email_with_attachment(subject, body, recipient_email, attachment, attachment_name, sender_name, reply_to_email, company=None):
     """
-    Šalje e-mail s privitkom.
+    Stavlja e-mail s privitkom u red za slanje.
     Koristi email konfiguraciju za tvrtku ako je proslijeđena.
+
+    Returns:
+        OutgoingEmail: poruka u redu ili None ako je došlo do greške.
     """
     try:
-        connection = None
         from_email = f"{sender_name} <{settings.EMAIL_HOST_USER}>"
-        
+
         # Ako je proslijeđena tvrtka, pokušaj dohvatiti njenu email konfiguraciju
-        if company:
-            connection, email_config = get_email_backend_for_company(company)
-            if email_config:
-                from_email = email_config.get_from_email_formatted()
-        
-        email = EmailMessage(
+        email_config = get_email_config(company)
+        if email_config:
+            from_email = email_config.get_from_email_formatted()
+
+        return queue_email(
             subject=subject,
             body=body,
-            from_email=from_email,
             to=[recipient_email],
+            from_email=from_email,
             reply_to=[reply_to_email],
-            connection=connection,
+            company=company,
+            attachments=[(attachment_name, attachment, 'application/pdf')],
         )
-        email.attach(attachment_name, attachment, 'application/pdf')
-        email.content_subtype = "html"
-        email.send()
-        return True
     except Exception as e:
-        logger.error(f"Greška pri slanju e-maila: {e}")
-        return False
+        logger.error(f"Greška pri stavljanju e-maila u red: {e}")
+        return None
@@ -0,0 +1,128 @@
+"""
+Unaprijed izračunate razlike između uzastopnih zapisa povijesti (simple_history).
+
+Pri zapisivanju novog povijesnog zapisa izračuna se popis promijenjenih polja
+u odnosu na prethodnu verziju objekta i spremi u polje `history_changes` kao
+kompaktan JSON: [[naziv_polja, stara_vrijednost, nova_vrijednost], ...].
+Stranice povijesti i AI alati tada samo čitaju spremljene razlike umjesto da
+uspoređuju parove zapisa pri svakom prikazu.
+
+`history_changes` je None za zapise za koje razlike još nisu izračunate
+(vidi naredbu `backfill_history_changes`).
+"""
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import models
+
+logger = logging.getLogger(__name__)
+
+# Interna polja povijesti i vremenske oznake koje se mijenjaju pri svakom spremanju
+EXCLUDED_FIELDS = {
+    'id', 'history_id', 'history_date', 'history_type', 'history_user',
+    'history_change_reason', 'history_changes', 'last_updated', 'date_created',
+}
+
+_JSON_SAFE_TYPES = (str, int, float, bool, Decimal, date, datetime, time, UUID, dict, list)
+_TYPED_FIELDS = (
+    models.DateField, models.DateTimeField, models.TimeField,
+    models.DecimalField, models.UUIDField,
+)
+
+
+def tracked_fields(model):
+    """Vraća polja modela koja se prate u razlikama povijesti."""
+    return [f for f in model._meta.concrete_fields if f.name not in EXCLUDED_FIELDS]
+
+
+def supports_stored_changes(history_model):
+    """Provjerava ima li povijesna tablica polje za spremljene razlike."""
+    return any(f.name == 'history_changes' for f in history_model._meta.concrete_fields)
+
+
+def _stored_value(record, field):
+    # Strani ključevi se spremaju kao čitljiv naziv povezanog objekta
+    if field.is_relation:
+        if getattr(record, field.attname) is None:
+            return None
+        try:
+            return str(getattr(record, field.name))
+        except ObjectDoesNotExist:
+            return str(getattr(record, field.attname))
+    value = getattr(record, field.attname, None)
+    if value is None or isinstance(value, _JSON_SAFE_TYPES):
+        return value
+    return str(value)
+
+
+def compute_changes(current, previous, model):
+    """
+    Izračunava promijenjena polja između dvije verzije zapisa povijesti.
+
+    Returns:
+        list: [[naziv_polja, stara_vrijednost, nova_vrijednost], ...]
+    """
+    if previous is None:
+        return []
+    changes = []
+    for field in tracked_fields(model):
+        if getattr(previous, field.attname, None) != getattr(current, field.attname, None):
+            changes.append([field.name, _stored_value(previous, field), _stored_value(current, field)])
+    return changes
+
+
+def previous_history_record(history_instance):
+    """Dohvaća prethodnu spremljenu verziju objekta za (još nespremljeni) povijesni zapis."""
+    history_model = type(history_instance)
+    queryset = history_model.objects.filter(id=history_instance.id)
+    if history_instance.history_id:
+        queryset = queryset.exclude(history_id=history_instance.history_id).filter(
+            history_date__lte=history_instance.history_date
+        )
+    return queryset.order_by('-history_date', '-history_id').first()
+
+
+def attach_history_changes(history_instance):
+    """Postavlja history_changes na povijesni zapis prije njegovog spremanja."""
+    if history_instance.history_type != '~':
+        history_instance.history_changes = []
+        return
+    previous = previous_history_record(history_instance)
+    history_instance.history_changes = compute_changes(
+        history_instance, previous, history_instance.instance_type
+    )
+
+
+def _restore_value(field, value):
+    # JSON ne čuva tipove datuma i decimalnih brojeva pa ih vrati iz teksta
+    if value is None or field.is_relation or not isinstance(field, _TYPED_FIELDS):
+        return value
+    try:
+        return field.to_python(value)
+    except (ValidationError, TypeError, ValueError):
+        return value
+
+
+def get_stored_changes(record):
+    """
+    Vraća spremljene razlike zapisa povijesti s vraćenim tipovima vrijednosti.
+
+    Returns:
+        list: [(polje, stara_vrijednost, nova_vrijednost), ...] ili None ako
+              razlike za taj zapis nisu izračunate
+    """
+    changes = getattr(record, 'history_changes', None)
+    if changes is None:
+        return None
+    fields = {f.name: f for f in tracked_fields(record.instance_type)}
+    result = []
+    for field_name, old_value, new_value in changes:
+        field = fields.get(field_name)
+        if field is None:
+            # Polje je u međuvremenu uklonjeno iz modela
+            continue
+        result.append((field, _restore_value(field, old_value), _restore_value(field, new_value)))
+    return result
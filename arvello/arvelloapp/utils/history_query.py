@@ -0,0 +1,187 @@
+"""
+Dohvat povijesti promjena (simple_history) sa straničenjem po ključu (keyset).
+
+Zapisi se poredaju po (history_date, model, history_id) silazno. Za pregled
+više modela odjednom povijesne tablice se spajaju u bazi (UNION ALL) pa se
+iz baze čita samo jedna stranica ključeva; puni zapisi se zatim dohvaćaju
+samo za tu stranicu, neovisno o tome koliko je povijesti nakupljeno.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Value
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 25
+
+
+@dataclass
+class HistoryPage:
+    """Jedna stranica zapisa povijesti s kursorima za susjedne stranice."""
+    records: List = field(default_factory=list)
+    newer_cursor: Optional[str] = None
+    older_cursor: Optional[str] = None
+
+
+def _related_fields(history_model):
+    """Strani ključevi povijesnog modela; prikaz zapisa čita povezane objekte (klijent, tvrtka...)."""
+    return [
+        f.name for f in history_model._meta.fields
+        if f.many_to_one and f.name != 'history_user'
+    ]
+
+
+def encode_cursor(history_date, model_key, history_id):
+    """Kodira ključ zapisa povijesti u string za URL parametar."""
+    return f"{history_date.isoformat()}|{model_key}|{history_id}"
+
+
+def decode_cursor(value):
+    """Dekodira kursor iz URL parametra; vraća None za neispravan kursor."""
+    if not value:
+        return None
+    try:
+        date_part, model_key, history_id = value.split('|')
+        return datetime.fromisoformat(date_part), int(model_key), int(history_id)
+    except (ValueError, TypeError):
+        logger.debug(f"Neispravan kursor povijesti: {value}")
+        return None
+
+
+def _keyset_filter(model_key, cursor, older):
+    # Filtar za jednu tablicu: model_key je u njoj konstantan pa se usporedba
+    # trojke (datum, model, id) svodi na jednostavne uvjete nad indeksom datuma
+    cursor_date, cursor_model, cursor_id = cursor
+    if older:
+        if model_key < cursor_model:
+            return Q(history_date__lte=cursor_date)
+        if model_key > cursor_model:
+            return Q(history_date__lt=cursor_date)
+        return Q(history_date__lt=cursor_date) | Q(history_date=cursor_date, history_id__lt=cursor_id)
+    if model_key > cursor_model:
+        return Q(history_date__gte=cursor_date)
+    if model_key < cursor_model:
+        return Q(history_date__gt=cursor_date)
+    return Q(history_date__gt=cursor_date) | Q(history_date=cursor_date, history_id__gt=cursor_id)
+
+
+def fetch_history_page(models, filters=None, before=None, after=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Dohvaća jednu stranicu povijesti promjena za zadane modele.
+
+    Args:
+        models (list): Modeli s HistoricalRecords
+        filters (dict): Dodatni filtri za povijesne tablice (npr. {'history_user_id': 1})
+        before (str): Kursor - dohvati starije zapise od ovog
+        after (str): Kursor - dohvati novije zapise od ovog
+        page_size (int): Broj zapisa po stranici
+
+    Returns:
+        HistoryPage: zapisi (s atributom model_class) i kursori susjednih stranica
+    """
+    before = decode_cursor(before)
+    after = decode_cursor(after) if not before else None
+    older = after is None
+
+    key_querysets = []
+    models_by_key = {}
+    content_types = ContentType.objects.get_for_models(*models)
+    for model in models:
+        model_key = content_types[model].id
+        models_by_key[model_key] = model
+        queryset = model.history.filter(**(filters or {}))
+        cursor = before or after
+        if cursor:
+            queryset = queryset.filter(_keyset_filter(model_key, cursor, older))
+        key_querysets.append(
+            queryset.order_by()
+            .annotate(model_key=Value(model_key, output_field=IntegerField()))
+            .values_list('history_date', 'model_key', 'history_id')
+        )
+
+    if not key_querysets:
+        return HistoryPage()
+
+    combined = key_querysets[0]
+    if len(key_querysets) > 1:
+        combined = combined.union(*key_querysets[1:], all=True)
+    if older:
+        combined = combined.order_by('-history_date', '-model_key', '-history_id')
+    else:
+        combined = combined.order_by('history_date', 'model_key', 'history_id')
+
+    keys = list(combined[:page_size + 1])
+    has_more = len(keys) > page_size
+    keys = keys[:page_size]
+    if not older:
+        keys.reverse()
+
+    # Dohvati pune zapise samo za prikazanu stranicu
+    ids_by_model = {}
+    for _, model_key, history_id in keys:
+        ids_by_model.setdefault(model_key, []).append(history_id)
+
+    loaded = {}
+    for model_key, history_ids in ids_by_model.items():
+        model = models_by_key[model_key]
+        records = model.history.filter(history_id__in=history_ids).select_related(
+            'history_user__profile', *_related_fields(model.history.model)
+        )
+        for record in records:
+            record.model_class = model
+            loaded[(model_key, record.history_id)] = record
+
+    page = HistoryPage(
+        records=[loaded[(model_key, history_id)] for _, model_key, history_id in keys
+                 if (model_key, history_id) in loaded]
+    )
+    if keys:
+        has_older = has_more if older else True
+        has_newer = (before is not None) if older else has_more
+        if has_older:
+            page.older_cursor = encode_cursor(*keys[-1])
+        if has_newer:
+            page.newer_cursor = encode_cursor(*keys[0])
+    return page
+
+
+def attach_previous_records(records):
+    """
+    Postavlja atribut previous_record (kao prev_record simple_historyja) na
+    zadane zapise povijesti.
+
+    Umjesto jednog upita po zapisu, identifikatori prethodnih zapisa računaju
+    se podupitom, a sami zapisi (s povezanim objektima) dohvaćaju se jednim
+    upitom po modelu.
+
+    Args:
+        records (list): Zapisi povijesti s atributom model_class
+    """
+    records_by_model = {}
+    for record in records:
+        records_by_model.setdefault(record.model_class, []).append(record)
+
+    for model, model_records in records_by_model.items():
+        history_model = model.history.model
+        pk_name = model._meta.pk.attname
+        previous_id = (
+            history_model.objects.filter(
+                **{pk_name: OuterRef(pk_name)}, history_date__lt=OuterRef('history_date')
+            )
+            .order_by('-history_date', '-history_id')
+            .values('history_id')[:1]
+        )
+        previous_ids = dict(
+            history_model.objects.filter(history_id__in=[r.history_id for r in model_records])
+            .annotate(previous_id=Subquery(previous_id))
+            .values_list('history_id', 'previous_id')
+        )
+        previous = history_model.objects.select_related(
+            *_related_fields(history_model)
+        ).in_bulk([pid for pid in previous_ids.values() if pid is not None])
+        for record in model_records:
+            record.previous_record = previous.get(previous_ids.get(record.history_id))
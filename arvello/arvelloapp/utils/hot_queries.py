@@ -0,0 +1,130 @@
+"""
+Registar čestih ("vrućih") upita i provjera njihovih planova izvršavanja.
+
+Svaki upit u HOT_QUERIES odgovara upitu iz aplikacije (knjige računa,
+nadzorna ploča, obračun plaća, JOPPD, lokalne porezne stope) s ogledno
+odabranim parametrima. `manage.py explain_hot_queries` za svaki upit
+pokreće EXPLAIN i javlja grešku ako baza čita cijelu tablicu umjesto da
+koristi indeks, pa se regresija (npr. obrisan indeks ili filter koji ga
+zaobilazi, poput date__year) vidi prije nego što tablice narastu.
+
+Na praznoj ili maloj bazi PostgreSQL radije bira sekvencijalno čitanje,
+zato se provjera tamo izvodi uz `SET LOCAL enable_seqscan = off`: plan
+tada pokazuje može li se indeks uopće iskoristiti.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable
+
+from django.db import connection, transaction
+
+from ..models import Expense, Invoice, LocalIncomeTax, Salary
+
+# Ogledni parametri upita; konkretne vrijednosti ne utječu na plan
+SAMPLE_SUBJECT_ID = 1
+SAMPLE_YEAR = 2025
+SAMPLE_MONTH = 1
+SAMPLE_PERIOD = (date(2025, 1, 1), date(2025, 1, 31))
+SAMPLE_CITY = 'ZAGREB'
+
+# SQLite: "SCAN tablica" bez "USING ... INDEX" znači čitanje cijele tablice
+_SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?!.*\bUSING\b.*\bINDEX\b)')
+# PostgreSQL: "Seq Scan on tablica"
+_POSTGRES_FULL_SCAN = re.compile(r'\bSeq Scan on (\w+)')
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    description: str
+    queryset: Callable  # vraća QuerySet koji se provjerava
+
+
+HOT_QUERIES = {
+    query.name: query
+    for query in (
+        HotQuery(
+            'invoice_book',
+            'Knjiga izlaznih računa subjekta za razdoblje',
+            lambda: Invoice.objects.filter(
+                subject_id=SAMPLE_SUBJECT_ID, date__gte=SAMPLE_PERIOD[0], date__lte=SAMPLE_PERIOD[1]
+            ).order_by('date'),
+        ),
+        HotQuery(
+            'invoices_month',
+            'Računi tekućeg mjeseca (nadzorna ploča)',
+            lambda: Invoice.objects.filter(date__gte=SAMPLE_PERIOD[0], date__lte=SAMPLE_PERIOD[1]),
+        ),
+        HotQuery(
+            'unpaid_invoices',
+            'Neplaćeni računi (nadzorna ploča)',
+            lambda: Invoice.objects.filter(is_paid=False),
+        ),
+        HotQuery(
+            'overdue_invoices',
+            'Dospjeli neplaćeni računi (nadzorna ploča)',
+            lambda: Invoice.objects.filter(is_paid=False, dueDate__lt=SAMPLE_PERIOD[1]),
+        ),
+        HotQuery(
+            'fiscal_backlog',
+            'Računi koji čekaju fiskalizaciju ili ponovni pokušaj',
+            lambda: Invoice.objects.filter(fiscal_status__in=['enqueued', 'failed']),
+        ),
+        HotQuery(
+            'expense_book',
+            'Knjiga ulaznih računa subjekta za razdoblje',
+            lambda: Expense.objects.filter(
+                subject_id=SAMPLE_SUBJECT_ID, date__gte=SAMPLE_PERIOD[0], date__lte=SAMPLE_PERIOD[1]
+            ).order_by('date'),
+        ),
+        HotQuery(
+            'salaries_period',
+            'Plaće obračunskog razdoblja (popis plaća, platne liste)',
+            lambda: Salary.objects.filter(period_year=SAMPLE_YEAR, period_month=SAMPLE_MONTH),
+        ),
+        HotQuery(
+            'salaries_paid_in_month',
+            'Plaće isplaćene u mjesecu (JOPPD)',
+            lambda: Salary.objects.filter(
+                payment_date__gte=SAMPLE_PERIOD[0], payment_date__lte=SAMPLE_PERIOD[1]
+            ),
+        ),
+        HotQuery(
+            'local_income_tax',
+            'Lokalna porezna stopa grada na datum isplate',
+            lambda: LocalIncomeTax.valid_for_city(SAMPLE_CITY, SAMPLE_PERIOD[1]).order_by('-valid_from')[:1],
+        ),
+    )
+}
+
+
+def explain(queryset):
+    """Vraća plan izvršavanja upita kao tekst."""
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+def full_scans(plan):
+    """Vraća nazive tablica koje plan čita u cijelosti."""
+    pattern = _POSTGRES_FULL_SCAN if connection.vendor == 'postgresql' else _SQLITE_FULL_SCAN
+    return sorted({match.group(1) for line in plan.splitlines() for match in pattern.finditer(line)})
+
+
+def check_hot_queries(names=None):
+    """
+    Pokreće EXPLAIN za registrirane upite.
+
+    Returns:
+        list: trojke (HotQuery, plan, tablice čitane u cijelosti)
+    """
+    results = []
+    for name in names or HOT_QUERIES:
+        query = HOT_QUERIES[name]
+        plan = explain(query.queryset())
+        results.append((query, plan, full_scans(plan)))
+    return results
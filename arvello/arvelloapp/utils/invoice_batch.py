@@ -0,0 +1,163 @@
+"""
+Skupno slanje računa e-mailom.
+
+1. Od računa koje je korisnik odabrao uzimaju se oni koji još nisu poslani
+   (emailed_at) i nemaju poruku koja čeka u redu, pa ponovljeno slanje ne šalje
+   isti račun dvaput. Slanje uvijek traži izričit odabir: računi izdani prije
+   praćenja slanja nemaju emailed_at iako su klijentu možda već poslani.
+2. Računi se obrađuju u dijelovima od EMAIL_CHUNK_SIZE: PDF-ovi koji nisu u
+   cacheu renderiraju se paralelno u bazenu procesa (pdf_pool), poruke se
+   stavljaju u red i tek se onda prelazi na idući dio, pa se u memoriji ne
+   drže PDF-ovi cijele serije.
+3. mail_worker šalje poruke iz reda s jednom SMTP vezom po subjektu i nakon
+   slanja postavlja emailed_at računa.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from ..models import Invoice, InvoiceProduct
+from . import pdf_pool
+from .document_pdf import (
+    invoice_pdf_version, pdf_filename, read_cached_pdf, render_invoice_html, store_cached_pdf,
+)
+from .email_utils import send_email_with_attachment
+from .pdf_generator import queue_email_job
+
+logger = logging.getLogger(__name__)
+
+# Broj računa čiji se PDF-ovi izrađuju i stavljaju u red zajedno
+EMAIL_CHUNK_SIZE = 20
+
+
+@dataclass
+class InvoiceBatchResult:
+    pdfs: dict = field(default_factory=dict)  # invoice_id -> PDF bajtovi (samo tekući dio)
+    render_errors: dict = field(default_factory=dict)  # invoice_id -> poruka greške
+    queued: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+def unsent_invoices(queryset=None):
+    """Računi koji nisu poslani e-mailom niti čekaju u redu za slanje."""
+    queryset = Invoice.objects.all() if queryset is None else queryset
+    return queryset.filter(emailed_at__isnull=True).exclude(email__status='queued')
+
+
+def invoices_for_email(invoice_ids):
+    """Neposlani računi od odabranih, s podacima potrebnim za PDF i e-mail."""
+    queryset = unsent_invoices().filter(pk__in=invoice_ids)
+    items = InvoiceProduct.objects.select_related('product').order_by('pk')
+    return queryset.select_related('client', 'subject').prefetch_related(
+        Prefetch('invoiceproduct_set', queryset=items)
+    ).order_by('subject_id', 'pk')
+
+
+def render_invoice_pdfs(invoices, referent=None, result=None):
+    """Izrađuje PDF-ove računa paralelno; gotovi PDF-ovi uzimaju se iz cachea."""
+    result = result or InvoiceBatchResult()
+    pending = {}
+    for invoice in invoices:
+        items = list(invoice.invoiceproduct_set.all())
+        version = invoice_pdf_version(invoice, items, referent)
+        pdf_bytes = read_cached_pdf('invoice', invoice.pk, version)
+        if pdf_bytes is not None:
+            result.pdfs[invoice.pk] = pdf_bytes
+            continue
+        pending[invoice.pk] = (version, pdf_pool.submit(render_invoice_html(invoice, items, referent)))
+
+    for invoice_id, (version, future) in pending.items():
+        try:
+            pdf_bytes = pdf_pool.wait(future)
+        except pdf_pool.PdfRenderError as e:
+            logger.error(f"Greška pri izradi PDF-a za račun {invoice_id}: {e}")
+            result.render_errors[invoice_id] = str(e)
+            continue
+        store_cached_pdf('invoice', invoice_id, version, pdf_bytes)
+        result.pdfs[invoice_id] = pdf_bytes
+    return result
+
+
+def queue_invoice_email(invoice, pdf_bytes):
+    """
+    Stavlja e-mail s računom u red za slanje i povezuje poruku s računom.
+
+    Returns:
+        OutgoingEmail: poruka u redu ili None ako je došlo do greške
+    """
+    sender_name = invoice.subject.clientName
+    email_body = render_to_string('email_templates/invoice_email.html', {
+        'client_name': invoice.client.clientName,
+        'invoice_number': invoice.number,
+        'due_date': invoice.dueDate,
+        'total_amount': invoice.price_with_vat(),
+        'sender_name': sender_name,
+    })
+    outgoing = send_email_with_attachment(
+        subject=f"Račun {invoice.number} - {invoice.client.clientName}",
+        body=email_body,
+        recipient_email=invoice.client.emailAddress,
+        attachment=pdf_bytes,
+        attachment_name=pdf_filename('Racun', invoice.number),
+        sender_name=sender_name,
+        reply_to_email=invoice.subject.emailAddress,
+        company=invoice.subject,
+    )
+    if outgoing:
+        # update() umjesto save(): bez nove verzije PDF-a, povijesti i fiskalnih signala
+        Invoice.objects.filter(pk=invoice.pk).update(email=outgoing)
+    return outgoing
+
+
+def send_invoices(invoices, result):
+    """Stavlja izrađene PDF-ove računa u red odlazne e-pošte."""
+    for invoice in invoices:
+        if invoice.pk in result.render_errors:
+            result.failed += 1
+        elif not invoice.client.emailAddress:
+            logger.warning(f"Klijent računa {invoice.number} nema e-mail adresu")
+            result.skipped += 1
+        elif queue_invoice_email(invoice, result.pdfs[invoice.pk]):
+            result.queued += 1
+        else:
+            result.failed += 1
+    return result
+
+
+def process_invoices(invoice_ids, referent=None):
+    """
+    Izrađuje PDF-ove i stavlja u red e-mailove odabranih neposlanih računa.
+
+    Args:
+        invoice_ids: odabrani računi
+        referent: korisnik koji se ispisuje kao referent na dokumentima
+
+    Returns:
+        tuple: (lista obrađenih računa, InvoiceBatchResult)
+    """
+    invoice_ids = list(dict.fromkeys(invoice_ids))
+    invoices = []
+    result = InvoiceBatchResult()
+    for start in range(0, len(invoice_ids), EMAIL_CHUNK_SIZE):
+        chunk = list(invoices_for_email(invoice_ids[start:start + EMAIL_CHUNK_SIZE]))
+        render_invoice_pdfs(chunk, referent, result)
+        send_invoices(chunk, result)
+        # PDF je spremljen u poruci u redu (i u cacheu), ne treba ga držati do kraja serije
+        result.pdfs.clear()
+        invoices.extend(chunk)
+    return invoices, result
+
+
+def queue_invoice_batch(invoice_ids, referent=None):
+    """Stavlja skupno slanje računa u red i odmah se vraća."""
+    def job():
+        _, result = process_invoices(invoice_ids, referent)
+        logger.info(
+            f"Računi: u redu za slanje {result.queued}, greške {result.failed}, "
+            f"preskočeno (bez e-maila) {result.skipped}"
+        )
+
+    return queue_email_job(job, "skupno slanje računa")
@@ -0,0 +1,191 @@
+"""
+Slanje poruka iz reda odlazne e-pošte (OutgoingEmail).
+
+Poruke se preuzimaju u serijama i grupiraju po subjektu; za svaku email
+konfiguraciju drži se jedna otvorena SMTP veza koja se koristi za sve
+njene poruke i ostaje otvorena između serija (KEEPALIVE_SECONDS).
+
+Privremene greške (4xx odgovori, prekinuta ili odbijena veza) ponavljaju se
+s eksponencijalnim odmakom; trajne (5xx) odmah označavaju poruku neuspjelom.
+
+Preuzete poruke dobivaju "zakup": next_attempt_at se pomiče unaprijed pa ih
+drugi mail_worker ne uzima, a ako se worker sruši, poruke nakon isteka zakupa
+ponovno postaju dostupne.
+"""
+import logging
+import smtplib
+import socket
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from ..models import OutgoingEmail
+from .email_utils import build_email_message, connection_for_config, get_email_config
+
+logger = logging.getLogger(__name__)
+
+# Koliko dugo su preuzete poruke rezervirane za worker koji ih šalje
+CLAIM_LEASE_SECONDS = 600
+
+
+def _queue_setting(name, default):
+    return getattr(settings, 'MAIL_QUEUE', {}).get(name, default)
+
+
+def is_transient_error(error):
+    """Provjerava je li SMTP greška privremena (vrijedi ponoviti slanje)."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, (socket.timeout, ConnectionError, OSError))
+
+
+def _is_connection_error(error):
+    return isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout))
+
+
+def retry_delay(attempts):
+    """Odmak prije idućeg pokušaja (eksponencijalno, s gornjom granicom)."""
+    base = _queue_setting('BACKOFF_SECONDS', 60)
+    return min(base * 2 ** max(attempts - 1, 0), _queue_setting('MAX_BACKOFF_SECONDS', 3600))
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    @property
+    def processed(self):
+        return self.sent + self.retried + self.failed
+
+
+class MailDispatcher:
+    """Šalje poruke iz reda i drži otvorene SMTP veze po email konfiguraciji."""
+
+    def __init__(self):
+        self._connections = {}  # ključ konfiguracije -> [veza, vrijeme zadnjeg korištenja]
+
+    def _config_key(self, email_config):
+        # Promjena konfiguracije (last_updated) otvara novu vezu
+        return (email_config.pk, email_config.last_updated) if email_config else None
+
+    def _get_connection(self, email_config):
+        key = self._config_key(email_config)
+        entry = self._connections.get(key)
+        if entry is None:
+            connection = connection_for_config(email_config)
+            connection.open()
+            entry = self._connections[key] = [connection, time.monotonic()]
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def _drop_connection(self, email_config):
+        entry = self._connections.pop(self._config_key(email_config), None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except Exception:
+                pass
+
+    def close_idle(self, max_idle=None):
+        """Zatvara veze koje nisu korištene dulje od max_idle sekundi."""
+        max_idle = _queue_setting('KEEPALIVE_SECONDS', 60) if max_idle is None else max_idle
+        now = time.monotonic()
+        for key, (connection, last_used) in list(self._connections.items()):
+            if now - last_used >= max_idle:
+                self._connections.pop(key)
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def close(self):
+        """Zatvara sve otvorene veze."""
+        self.close_idle(max_idle=0)
+
+    def claim(self, batch_size):
+        """Preuzima poruke spremne za slanje i rezervira ih za ovaj worker."""
+        now = timezone.now()
+        with transaction.atomic():
+            queryset = OutgoingEmail.objects.filter(status='queued', next_attempt_at__lte=now)
+            if db_connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids = list(queryset.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+            OutgoingEmail.objects.filter(id__in=ids).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+            )
+        return list(
+            OutgoingEmail.objects.filter(id__in=ids)
+            .select_related('company')
+            .prefetch_related('attachments')
+            .order_by('company_id', 'id')
+        )
+
+    def deliver(self, batch_size=50):
+        """Šalje jednu seriju poruka iz reda i vraća statistiku."""
+        stats = DeliveryStats()
+        messages = self.claim(batch_size)
+
+        by_company = {}
+        for outgoing in messages:
+            by_company.setdefault(outgoing.company_id, []).append(outgoing)
+
+        for company_messages in by_company.values():
+            # Konfiguracija iz baze (jedan upit po tvrtki i seriji): cache web procesa ovdje nije vidljiv
+            email_config = get_email_config(company_messages[0].company, use_cache=False)
+            for outgoing in company_messages:
+                self._send(outgoing, email_config, stats)
+        return stats
+
+    def _send(self, outgoing, email_config, stats):
+        for attempt in range(2):
+            try:
+                connection = self._get_connection(email_config)
+                build_email_message(outgoing, connection).send()
+            except Exception as e:
+                if _is_connection_error(e):
+                    # Poslužitelj je zatvorio neaktivnu vezu; jednom pokušaj s novom
+                    self._drop_connection(email_config)
+                    if attempt == 0:
+                        continue
+                elif isinstance(e, (smtplib.SMTPConnectError, OSError)):
+                    self._drop_connection(email_config)
+                self._mark_error(outgoing, e, stats)
+                return
+            self._mark_sent(outgoing, stats)
+            return
+
+    def _mark_sent(self, outgoing, stats):
+        outgoing.status = 'sent'
+        outgoing.attempts += 1
+        outgoing.sent_at = timezone.now()
+        outgoing.last_error = ''
+        outgoing.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+        outgoing.payslip_deliveries.update(status='sent', error='')
+        outgoing.invoices.update(emailed_at=outgoing.sent_at)
+        stats.sent += 1
+
+    def _mark_error(self, outgoing, error, stats):
+        outgoing.attempts += 1
+        outgoing.last_error = str(error)[:1000]
+        if is_transient_error(error) and outgoing.attempts < _queue_setting('MAX_ATTEMPTS', 6):
+            outgoing.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(outgoing.attempts))
+            stats.retried += 1
+            logger.warning(f"Privremena greška pri slanju poruke {outgoing.pk}, novi pokušaj kasnije: {error}")
+        else:
+            outgoing.status = 'failed'
+            stats.failed += 1
+            outgoing.payslip_deliveries.update(status='failed', error=outgoing.last_error)
+            logger.error(f"Slanje poruke {outgoing.pk} nije uspjelo: {error}")
+        outgoing.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
@@ -0,0 +1,141 @@
+"""
+Skupna izrada i slanje platnih lista za cijelo obračunsko razdoblje.
+
+1. PDF-ovi koji nisu u cacheu renderiraju se paralelno u bazenu procesa
+   (pdf_pool); HTML se priprema u glavnoj dretvi jer treba bazu.
+2. Poruke se stavljaju u red odlazne e-pošte; mail_worker ih šalje s jednom
+   SMTP vezom po tvrtki (prema njenoj EmailConfig postavci).
+3. Status slanja bilježi se po zaposleniku u PayslipDelivery i ažurira kad
+   mail_worker pošalje poruku.
+4. Svi PDF-ovi mogu se spakirati u ZIP arhivu za knjigovodstvo.
+"""
+import io
+import logging
+import os
+import zipfile
+from dataclasses import dataclass, field
+
+from ..models import PayslipDelivery, Salary
+from . import pdf_pool
+from .document_pdf import read_cached_pdf, store_cached_pdf
+from .pdf_generator import (
+    email_payslip, payslip_filename, payslip_version, queue_email_job, render_payslip_html,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PayslipBatchResult:
+    pdfs: dict = field(default_factory=dict)  # salary_id -> PDF bajtovi
+    render_errors: dict = field(default_factory=dict)  # salary_id -> poruka greške
+    queued: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+def period_salaries(year, month, company=None):
+    """Vraća plaće razdoblja s podacima potrebnim za platne liste."""
+    salaries = Salary.objects.filter(period_year=year, period_month=month).exclude(status='cancelled')
+    if company is not None:
+        salaries = salaries.filter(employee__company=company)
+    return salaries.select_related('employee__company', 'created_by__profile').order_by(
+        'employee__company_id', 'employee__last_name', 'employee__first_name'
+    )
+
+
+def render_payslips(salaries, result=None):
+    """Izrađuje PDF-ove platnih lista paralelno; gotovi PDF-ovi uzimaju se iz cachea."""
+    result = result or PayslipBatchResult()
+    pending = {}
+    rates = {}
+    for salary in salaries:
+        version = payslip_version(salary)
+        pdf_bytes = read_cached_pdf('payslip', salary.pk, version)
+        if pdf_bytes is not None:
+            result.pdfs[salary.pk] = pdf_bytes
+            continue
+        pending[salary.pk] = (version, pdf_pool.submit(render_payslip_html(salary, rates=rates)))
+
+    for salary_id, (version, future) in pending.items():
+        try:
+            pdf_bytes = pdf_pool.wait(future)
+        except pdf_pool.PdfRenderError as e:
+            logger.error(f"Greška pri izradi platne liste {salary_id}: {e}")
+            result.render_errors[salary_id] = str(e)
+            continue
+        store_cached_pdf('payslip', salary_id, version, pdf_bytes)
+        result.pdfs[salary_id] = pdf_bytes
+    return result
+
+
+def _record(salary, status, error='', email=None):
+    PayslipDelivery.objects.create(
+        salary=salary, email=email, recipient=salary.employee.email or '', status=status, error=error
+    )
+
+
+def send_payslips(salaries, result):
+    """Stavlja izrađene platne liste u red odlazne e-pošte."""
+    for salary in salaries:
+        if salary.pk in result.render_errors:
+            _record(salary, 'failed', f"PDF: {result.render_errors[salary.pk]}")
+            result.failed += 1
+        elif not salary.employee.email:
+            _record(salary, 'skipped', 'Zaposlenik nema e-mail adresu')
+            result.skipped += 1
+        else:
+            outgoing = email_payslip(salary, result.pdfs[salary.pk])
+            if outgoing:
+                _record(salary, 'queued', email=outgoing)
+                result.queued += 1
+            else:
+                _record(salary, 'failed', 'Poruka nije stavljena u red')
+                result.failed += 1
+    return result
+
+
+def payslip_zip_entry(salary):
+    """Naziv platne liste u ZIP arhivi; ID obračuna razlikuje zaposlenike istog imena."""
+    name, extension = os.path.splitext(payslip_filename(salary))
+    return f"{name}_{salary.pk}{extension}"
+
+
+def build_payslip_zip(salaries, pdfs):
+    """Pakira PDF-ove platnih lista u ZIP arhivu i vraća njene bajtove."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for salary in salaries:
+            if salary.pk in pdfs:
+                archive.writestr(payslip_zip_entry(salary), pdfs[salary.pk])
+    return buffer.getvalue()
+
+
+def payslip_zip_filename(year, month):
+    return f"platne_liste_{year}_{month:02d}.zip"
+
+
+def process_period(year, month, company=None, send=True):
+    """
+    Izrađuje (i po potrebi šalje) platne liste za razdoblje.
+
+    Returns:
+        tuple: (lista plaća, PayslipBatchResult)
+    """
+    salaries = list(period_salaries(year, month, company))
+    result = render_payslips(salaries)
+    if send:
+        send_payslips(salaries, result)
+    return salaries, result
+
+
+def queue_period_payslips(year, month, company=None):
+    """Stavlja slanje platnih lista razdoblja u red i odmah se vraća."""
+    def job():
+        _, result = process_period(year, month, company)
+        logger.info(
+            f"Platne liste {month:02d}/{year}: u redu za slanje {result.queued}, "
+            f"greške {result.failed}, preskočeno {result.skipped}"
+        )
+
+    return queue_email_job(job, f"platne liste {month:02d}/{year}")
@@ -1,13 +1,38 @@
 from django.utils import timezone
 from decimal import Decimal
 from ..models import TaxParameter, LocalIncomeTax, Salary, Employee, Company, NonTaxablePaymentType 
-from .salary_calculator import update_salary_with_calculations, standardize_city_name # Adjust import if needed
+from .salary_calculator import update_salary_with_calculations # Adjust import if needed
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_payslip_context(salary):
-    """Generira kontekst za platnu listu."""
+def _cached(rates, key, load):
+    # Porezni parametri i lokalne stope zajednički su za cijelo razdoblje pa se
+    # pri skupnoj izradi platnih lista dohvaćaju jednom po ključu
+    if rates is None:
+        return load()
+    if key not in rates:
+        rates[key] = load()
+    return rates[key]
+
+
+def _monthly_threshold(year):
+    return TaxParameter.objects.filter(parameter_type='monthly_tax_threshold', year=year).first()
+
+
+def _local_tax(city, payment_date):
+    return LocalIncomeTax.valid_for_city(city, payment_date).order_by('-valid_from').first()
+
+
+def get_payslip_context(salary, rates=None):
+    """
+    Generira kontekst za platnu listu.
+
+    Args:
+        salary: Salary objekt
+        rates (dict): cache poreznih stopa dijeljen između platnih lista istog
+            razdoblja (npr. pri skupnoj izradi); None za jednu platnu listu
+    """
     # Osiguraj da su osnovni izračuni na salary objektu ažurni
 
     # Izračunaj dodatne vrijednosti za kontekst
@@ -25,15 +50,11 @@ def get_payslip_context(salary):
     # Dohvati mjesečni prag za porez koji je korišten pri izračunu
     monthly_threshold = Decimal('4200.00') # Default
     payment_year = salary.payment_date.year if salary.payment_date else timezone.now().year
-    try:
-        threshold_param = TaxParameter.objects.get(
-            parameter_type='monthly_tax_threshold', 
-            year=payment_year
-        )
+    threshold_param = _cached(rates, ('threshold', payment_year), lambda: _monthly_threshold(payment_year))
+    if threshold_param is not None:
         monthly_threshold = Decimal(str(threshold_param.value))
-    except TaxParameter.DoesNotExist:
+    else:
         logger.warning(f"Nije pronađen mjesečni prag za godinu {payment_year}. Koristi se default vrijednost.")
-        pass 
         
     # Izračunaj porezne osnovice na temelju spremljene income_tax_base i praga
     # Koristimo salary.income_tax_base jer je to vrijednost NAKON odbitka
@@ -46,14 +67,13 @@ def get_payslip_context(salary):
     try:
         # Dohvati stope koje su trebale vrijediti na datum isplate
         payment_date_obj = salary.payment_date or timezone.now().date()
-        local_tax = LocalIncomeTax.objects.filter(
-            city_name__iexact=standardize_city_name(salary.employee.city),
-            valid_from__lte=payment_date_obj
-        ).latest('valid_from')
-        display_lower_tax_rate = local_tax.tax_rate_lower
-        display_higher_tax_rate = local_tax.tax_rate_higher
-    except LocalIncomeTax.DoesNotExist:
-        logger.warning(f"Nisu pronađene lokalne porezne stope za {salary.employee.city} na datum {payment_date_obj}. Prikazuju se default stope.")
+        city = salary.employee.city
+        local_tax = _cached(rates, ('local_tax', city, payment_date_obj), lambda: _local_tax(city, payment_date_obj))
+        if local_tax is not None:
+            display_lower_tax_rate = local_tax.tax_rate_lower
+            display_higher_tax_rate = local_tax.tax_rate_higher
+        else:
+            logger.warning(f"Nisu pronađene lokalne porezne stope za {salary.employee.city} na datum {payment_date_obj}. Prikazuju se default stope.")
     except Exception as e:
         logger.error(f"Greška pri dohvaćanju lokalnih poreznih stopa za prikaz: {e}")
     # Kraj dohvaćanja stopa za prikaz
@@ -1,18 +1,25 @@
 from io import BytesIO
 import os
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.template.loader import get_template, render_to_string
 from xhtml2pdf import pisa
 from django.http import HttpResponse
+from django.db import connection
 from django.utils import timezone
 from decimal import Decimal
-from weasyprint import HTML
+from .document_pdf import get_cached_pdf
+from .pdf_pool import render_html
 from .payslip_context import get_payslip_context 
 from .email_utils import send_payslip_email
 
 logger = logging.getLogger(__name__)
 
+# Priprema e-mailova (platne liste, računi) izvan web zahtjeva
+_email_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='payslip-email')
+
 def html_to_pdf(template_src, context_dict={}):
     """Generira PDF iz HTML predloška.
 
@@ -40,19 +47,61 @@ def html_to_pdf(template_src, context_dict={}):
     # Ako je došlo do greške, vrati None
     return None
 
+def payslip_version(salary):
+    """Sažetak podataka obračuna, zaposlenika i tvrtke o kojima ovisi platna lista."""
+    parts = [getattr(salary, field.attname) for field in salary._meta.concrete_fields]
+    parts += [
+        salary.employee.last_updated,
+        salary.employee.company.last_updated,
+        salary.created_by.get_full_name() if salary.created_by else None,
+    ]
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def payslip_filename(salary):
+    """Naziv PDF datoteke platne liste."""
+    return f"platna_lista_{salary.employee.get_full_name()}_{salary.period_year}_{salary.period_month}.pdf"
+
+
+def render_payslip_html(salary, template_name='salary_payslip_pdf.html', rates=None):
+    """Renderira HTML platne liste za izradu PDF-a (rates: vidi get_payslip_context)."""
+    return get_template(template_name).render(get_payslip_context(salary, rates))
+
+
+def get_payslip_pdf(salary, template_name='salary_payslip_pdf.html'):
+    """
+    Vraća PDF platne liste kao bajtove.
+
+    PDF se renderira jednom (u memoriji) i sprema u cache po verziji obračuna,
+    pa pregled, preuzimanje i slanje e-mailom koriste isti dokument.
+    """
+    return get_cached_pdf(
+        'payslip', salary.pk, payslip_version(salary),
+        lambda: render_html(render_payslip_html(salary, template_name)),
+    )
+
+
 def generate_payslip_pdf(salary, request, template_name='salary_payslip_pdf.html'):
-    """Generira PDF platne liste i šalje ga putem e-maila."""
-    # Dohvati kontekst za platnu listu
-    context = get_payslip_context(salary)
+    """Vraća PDF platne liste kao HTTP odgovor."""
+    pdf_bytes = get_payslip_pdf(salary, template_name)
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{payslip_filename(salary)}"'
+    return response
+
 
-    # Renderiraj HTML sadržaj za PDF
-    template = get_template(template_name)
-    html_content = template.render(context)
+def email_payslip(salary, pdf_bytes=None):
+    """
+    Stavlja e-mail s PDF platnom listom u red za slanje.
 
-    # Kreiraj PDF i spremi na disk
-    pdf_path = f"/tmp/platna_lista_{salary.employee.get_full_name()}_{salary.period_year}_{salary.period_month}.pdf"
-    with open(pdf_path, "wb") as pdf_file:
-        HTML(string=html_content, base_url=request.build_absolute_uri('/')).write_pdf(pdf_file)
+    Args:
+        salary: Salary objekt
+        pdf_bytes: već izrađeni PDF (ako nije zadan, dohvaća se iz cachea)
+
+    Returns:
+        OutgoingEmail: poruka u redu ili None ako je došlo do greške
+    """
+    if pdf_bytes is None:
+        pdf_bytes = get_payslip_pdf(salary)
 
     # Provjeri i formatiraj potrebne varijable
     employee_name = salary.employee.get_full_name() if hasattr(salary.employee, 'get_full_name') else "Nepoznato ime"
@@ -62,7 +111,6 @@ def generate_payslip_pdf(salary, request, template_name='salary_payslip_pdf.html
     issued_by_name = salary.created_by.get_full_name() if salary.created_by else "Nepoznato ime"
     reply_to_email = salary.employee.company.emailAddress if hasattr(salary.employee.company, 'emailAddress') else settings.EMAIL_HOST_USER
 
-
     # Generiraj HTML sadržaj e-maila
     message = render_to_string('email_templates/payslip_email.html', {
         'employee_name': employee_name,
@@ -72,22 +120,50 @@ def generate_payslip_pdf(salary, request, template_name='salary_payslip_pdf.html
         'issued_by_name': issued_by_name,
     })
 
-    #print(message)
-
     # Pošalji e-mail s PDF privitkom
     subject = f"Platna lista za {period_month}/{period_year}"
-    recipient_email = salary.employee.email
-    sender_name = company_name
-
-    email_sent = send_payslip_email(subject, message, recipient_email, pdf_path, sender_name, reply_to_email, salary)
+    outgoing = send_payslip_email(
+        subject, message, salary.employee.email, pdf_bytes, payslip_filename(salary),
+        company_name, reply_to_email, salary
+    )
 
-    if email_sent:
-        logger.info("E-mail uspješno poslan.")
+    if outgoing:
+        logger.info("E-mail stavljen u red za slanje.")
     else:
-        logger.error("Greška pri slanju e-maila.")
+        logger.error("Greška pri stavljanju e-maila u red.")
+    return outgoing
 
-    # Vrati PDF kao HTTP odgovor
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="platna_lista_{salary.employee.get_full_name()}_{salary.period_year}_{salary.period_month}.pdf"'
-    HTML(string=html_content, base_url=request.build_absolute_uri('/')).write_pdf(response)
-    return response
+
+def queue_email_job(job, description):
+    """
+    Izvršava pripremu poruka (izradu PDF-a i stavljanje u red za slanje) u
+    pozadinskoj dretvi kako zahtjev ne bi čekao.
+    """
+    def run():
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"Greška pri slanju ({description}): {e}")
+        finally:
+            connection.close()
+
+    return _email_executor.submit(run)
+
+
+def queue_payslip_email(salary):
+    """Stavlja slanje platne liste u red i odmah se vraća."""
+    from ..models import PayslipDelivery, Salary
+    salary_id = salary.pk
+
+    def job():
+        salary = Salary.objects.select_related('employee__company', 'created_by').get(pk=salary_id)
+        outgoing = email_payslip(salary)
+        PayslipDelivery.objects.create(
+            salary=salary,
+            email=outgoing,
+            recipient=salary.employee.email or '',
+            status='queued' if outgoing else 'failed',
+            error='' if outgoing else 'Poruka nije stavljena u red',
+        )
+
+    return queue_email_job(job, f"platna lista {salary_id}")
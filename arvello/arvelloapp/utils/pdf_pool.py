@@ -0,0 +1,208 @@
+"""
+Izrada PDF-a (WeasyPrint) u bazenu unaprijed zagrijanih procesa.
+
+Renderiranje dokumenta traje od nekoliko stotina milisekundi do nekoliko
+sekundi i opterećuje CPU. Umjesto da blokira web proces, posao se predaje
+bazenu zasebnih procesa u kojima su Django, stylesheet i konfiguracija
+fontova učitani jednom pri pokretanju procesa.
+
+Korištenje:
+    future = submit(html_content)       # ne blokira
+    pdf_bytes = wait(future)            # čeka najdulje PDF_RENDER_POOL['TIMEOUT']
+    pdf_bytes = render_html(html_content)
+
+S PDF_RENDER_POOL['WORKERS'] = 0 renderira se u samom procesu (razvoj, testovi).
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+logger = logging.getLogger(__name__)
+
+# Dodatno vrijeme čekanja iznad vremenskog ograničenja u samom procesu
+RESULT_GRACE_SECONDS = 5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PdfRenderError(Exception):
+    """Greška pri izradi PDF dokumenta."""
+    pass
+
+
+class PdfRenderTimeout(PdfRenderError):
+    """Izrada PDF dokumenta trajala je dulje od dopuštenog."""
+    pass
+
+
+def _pool_setting(name, default):
+    return getattr(settings, 'PDF_RENDER_POOL', {}).get(name, default)
+
+
+@lru_cache(maxsize=1)
+def get_render_resources():
+    """
+    Vraća (stylesheets, font_config) koji se dijele između svih renderiranja.
+
+    Parsiranje bootstrap.min.css traje dulje od samog renderiranja računa pa se
+    radi samo jednom po procesu.
+    """
+    font_config = FontConfiguration()
+    stylesheets = []
+    bootstrap_css_path = finders.find('css/bootstrap.min.css')
+    if bootstrap_css_path:
+        stylesheets.append(CSS(filename=bootstrap_css_path, font_config=font_config))
+    else:
+        logger.warning("bootstrap.min.css nije pronađen među statičkim datotekama.")
+    return stylesheets, font_config
+
+
+def static_url_fetcher(url, *args, **kwargs):
+    """Učitava statičke datoteke izravno s diska umjesto preko HTTP-a."""
+    parsed = urlparse(url)
+    path = unquote(parsed.path)
+    if parsed.scheme in ('', 'file', 'http', 'https') and path.startswith(settings.STATIC_URL):
+        absolute_path = finders.find(path[len(settings.STATIC_URL):].lstrip('/'))
+        if absolute_path:
+            return default_url_fetcher(f'file://{absolute_path}', *args, **kwargs)
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+def html_to_pdf(html_content, base_url='/'):
+    """Renderira HTML u PDF bajtove u trenutnom procesu."""
+    stylesheets, font_config = get_render_resources()
+    try:
+        return HTML(
+            string=html_content,
+            base_url=base_url,
+            url_fetcher=static_url_fetcher,
+        ).write_pdf(stylesheets=stylesheets, font_config=font_config)
+    except PdfRenderError:
+        raise
+    except Exception as e:
+        raise PdfRenderError(str(e)) from e
+
+
+def _init_worker():
+    # Novi proces (spawn) nema učitan Django; učitaj ga i zagrij resurse
+    import django
+    django.setup()
+    get_render_resources()
+
+
+def _raise_timeout(signum, frame):
+    raise PdfRenderTimeout("Izrada PDF-a prekinuta zbog isteka vremena.")
+
+
+def _render_job(html_content, base_url, timeout):
+    # Ograničenje se provodi u samom procesu kako bi se proces oslobodio za idući posao
+    use_alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return html_to_pdf(html_content, base_url)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _ping():
+    return os.getpid()
+
+
+def get_pool():
+    """Vraća zajednički bazen procesa ili None ako je renderiranje u procesu."""
+    global _executor
+    workers = _pool_setting('WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn: procesi ne nasljeđuju otvorene veze prema bazi ni zaključane dretve
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def shutdown_pool(wait=True):
+    """Zaustavlja bazen procesa (npr. nakon što se proces srušio)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def warm_pool():
+    """Pokreće sve procese bazena unaprijed kako prvi zahtjev ne bi čekao."""
+    if not _pool_setting('WARM_ON_START', True):
+        return
+    pool = get_pool()
+    if pool is None:
+        return
+    for _ in range(_pool_setting('WORKERS', 0)):
+        pool.submit(_ping)
+
+
+def submit(html_content, base_url='/', timeout=None):
+    """
+    Predaje HTML na izradu PDF-a bez čekanja.
+
+    Returns:
+        concurrent.futures.Future: rezultat su PDF bajtovi
+    """
+    timeout = timeout or _pool_setting('TIMEOUT', 60)
+    pool = get_pool()
+    if pool is None:
+        future = Future()
+        try:
+            future.set_result(html_to_pdf(html_content, base_url))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    try:
+        return pool.submit(_render_job, html_content, base_url, timeout)
+    except BrokenProcessPool:
+        shutdown_pool(wait=False)
+        return get_pool().submit(_render_job, html_content, base_url, timeout)
+
+
+def wait(future, timeout=None):
+    """
+    Čeka rezultat posla predanog sa submit().
+
+    Raises:
+        PdfRenderTimeout: ako rezultat nije gotov na vrijeme
+        PdfRenderError: ako izrada PDF-a ne uspije
+    """
+    timeout = timeout or _pool_setting('TIMEOUT', 60)
+    try:
+        return future.result(timeout=timeout + RESULT_GRACE_SECONDS)
+    except FutureTimeoutError:
+        future.cancel()
+        raise PdfRenderTimeout("Izrada PDF-a prekinuta zbog isteka vremena.")
+    except BrokenProcessPool as e:
+        logger.error(f"Proces za izradu PDF-a se srušio: {e}")
+        shutdown_pool(wait=False)
+        raise PdfRenderError("Proces za izradu PDF-a se neočekivano zaustavio.")
+
+
+def render_html(html_content, base_url='/', timeout=None):
+    """Renderira HTML u PDF u bazenu procesa i vraća PDF bajtove."""
+    return wait(submit(html_content, base_url, timeout), timeout)
@@ -0,0 +1,252 @@
+"""
+Profiliranje HTTP zahtjeva (uključuje se u settings.REQUEST_PROFILING).
+
+Za svaki zahtjev RequestMiddleware otvara RequestProfile koji bilježi:
+- ukupno trajanje zahtjeva,
+- broj i trajanje SQL upita (connection.execute_wrapper na svim bazama),
+- trajanje renderiranja predložaka (samo vanjski Template.render, bez
+  ugniježđenih include/extends da se vrijeme ne broji dvaput),
+- broj i trajanje odlaznih HTTP poziva preko requests (Session.send, kroz koji
+  prolaze i requests.post/get).
+
+Rezultat se šalje u zaglavlju Server-Timing, zbraja po viewu (PROFILE_STATS,
+prikaz na /profiling/stats/) i zapisuje u log kada je zahtjev spor ili kada
+se isti SQL ponavlja mnogo puta (tipičan N+1 obrazac: upit u petlji).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_active = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+# "IN (%s, %s, %s)" -> "IN (...)" da se upiti s različitim brojem parametara grupiraju
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, ?(?:%s|\?))*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def profiling_settings():
+    return getattr(settings, 'REQUEST_PROFILING', {})
+
+
+def profiling_enabled():
+    return bool(profiling_settings().get('ENABLED', False))
+
+
+def normalize_sql(sql):
+    """SQL bez razlika u broju parametara IN liste i razmacima (ključ za ponovljene upite)."""
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', sql).strip())
+
+
+def current_profile():
+    return getattr(_active, 'profile', None)
+
+
+class RequestProfile:
+    """Mjerenja jednog zahtjeva."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_ms = 0.0
+        self.view = None
+        self.db_count = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.http_count = 0
+        self.http_ms = 0.0
+        self.sql = Counter()
+        self.sql_ms = defaultdict(float)
+        self._template_depth = 0
+
+    @contextmanager
+    def activate(self):
+        """Aktivira profil za tekuću dretvu i prati upite na svim bazama."""
+        install_hooks()
+        previous = current_profile()
+        _active.profile = self
+        # Veze otvorene tek tijekom zahtjeva dobivaju wrapper preko connection_created signala
+        for connection in connections.all(initialized_only=True):
+            connection.execute_wrappers.append(self._execute)
+        try:
+            yield self
+        finally:
+            for connection in connections.all(initialized_only=True):
+                if self._execute in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(self._execute)
+            _active.profile = previous
+            self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    def _execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            key = normalize_sql(sql)
+            self.db_count += 1
+            self.db_ms += elapsed
+            self.sql[key] += 1
+            self.sql_ms[key] += elapsed
+
+    def repeated_queries(self, threshold=2, limit=5):
+        """Najčešće ponovljeni upiti: [(sql, broj izvršavanja, ukupno ms)]."""
+        return [
+            (sql, count, self.sql_ms[sql])
+            for sql, count in self.sql.most_common(limit)
+            if count >= threshold
+        ]
+
+    def server_timing(self):
+        """Vrijednost zaglavlja Server-Timing."""
+        return ', '.join([
+            f'db;dur={self.db_ms:.1f};desc="{self.db_count} SQL"',
+            f'tpl;dur={self.template_ms:.1f};desc="Templates"',
+            f'http;dur={self.http_ms:.1f};desc="{self.http_count} HTTP"',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+
+def _track_new_connection(sender, connection, **kwargs):
+    # Baza otvorena tek usred zahtjeva (npr. druga baza) nije bila omotana u activate()
+    profile = current_profile()
+    if profile is not None and profile._execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile._execute)
+
+
+def install_hooks():
+    """Jednom po procesu omata Template.render i requests Session.send."""
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        from django.db.backends.signals import connection_created
+        from django.template.base import Template
+
+        connection_created.connect(_track_new_connection, dispatch_uid='request_profiler')
+        Template.render = _timed_template_render(Template.render)
+        try:
+            import requests
+        except ImportError:
+            pass
+        else:
+            requests.Session.send = _timed_http_send(requests.Session.send)
+        _installed = True
+
+
+def _timed_template_render(render):
+    def timed_render(self, context):
+        profile = current_profile()
+        if profile is None:
+            return render(self, context)
+        profile._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile._template_depth -= 1
+            if profile._template_depth == 0:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+    timed_render.__wrapped__ = render
+    return timed_render
+
+
+def _timed_http_send(send):
+    def timed_send(self, request, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return send(self, request, **kwargs)
+        start = time.perf_counter()
+        try:
+            return send(self, request, **kwargs)
+        finally:
+            profile.http_count += 1
+            profile.http_ms += (time.perf_counter() - start) * 1000
+    timed_send.__wrapped__ = send
+    return timed_send
+
+
+class ProfileStats:
+    """Zbirna mjerenja po viewu u ovom procesu."""
+
+    FIELDS = ('total_ms', 'db_count', 'db_ms', 'template_ms', 'http_count', 'http_ms')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, profile):
+        with self._lock:
+            stats = self._views.get(profile.view)
+            if stats is None:
+                stats = self._views[profile.view] = {
+                    'requests': 0, 'max_ms': 0.0, **{field: 0 for field in self.FIELDS},
+                }
+            stats['requests'] += 1
+            stats['max_ms'] = max(stats['max_ms'], profile.total_ms)
+            for field in self.FIELDS:
+                stats[field] += getattr(profile, field)
+
+    def snapshot(self):
+        """Lista po viewu s prosjecima, poredana po ukupnom vremenu."""
+        with self._lock:
+            views = {view: dict(stats) for view, stats in self._views.items()}
+        rows = []
+        for view, stats in views.items():
+            count = stats['requests']
+            rows.append({
+                'view': view,
+                'requests': count,
+                'total_ms': round(stats['total_ms'], 1),
+                'avg_ms': round(stats['total_ms'] / count, 1),
+                'max_ms': round(stats['max_ms'], 1),
+                'avg_queries': round(stats['db_count'] / count, 1),
+                'avg_db_ms': round(stats['db_ms'] / count, 1),
+                'avg_template_ms': round(stats['template_ms'] / count, 1),
+                'avg_http_calls': round(stats['http_count'] / count, 2),
+                'avg_http_ms': round(stats['http_ms'] / count, 1),
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+PROFILE_STATS = ProfileStats()
+
+
+def finish_profile(profile, request, response):
+    """Zbraja mjerenja, dodaje Server-Timing i zapisuje spore zahtjeve / ponovljene upite."""
+    options = profiling_settings()
+    if profile.view is None:
+        match = getattr(request, 'resolver_match', None)
+        profile.view = (match.view_name or match._func_path) if match else 'nepoznato'
+    PROFILE_STATS.record(profile)
+
+    if options.get('SERVER_TIMING', True):
+        response['Server-Timing'] = profile.server_timing()
+
+    threshold = options.get('REPEATED_QUERY_THRESHOLD', 10)
+    repeated = profile.repeated_queries(threshold=threshold)
+    slow = profile.total_ms >= options.get('SLOW_MS', 500)
+    if slow or repeated:
+        lines = [
+            f'{"Spor zahtjev" if slow else "Ponovljeni upiti"}: {request.method} {request.path} ({profile.view}) '
+            f'{profile.total_ms:.0f} ms, SQL {profile.db_count} ({profile.db_ms:.0f} ms), '
+            f'predlošci {profile.template_ms:.0f} ms, HTTP {profile.http_count} ({profile.http_ms:.0f} ms)'
+        ]
+        for sql, count, elapsed in (repeated or profile.repeated_queries(threshold=2)):
+            lines.append(f'  {count}x ({elapsed:.0f} ms) {sql[:300]}')
+        logger.warning('\n'.join(lines))
+    return response
@@ -1,6 +1,5 @@
 from decimal import Decimal
 from django.utils import timezone
-from .text_utils import standardize_city_name
 
 def calculate_income_tax(tax_base: Decimal, city: str, payment_date=None) -> Decimal:
     """Izračunaj porez na dohodak koristeći mjesečni prag i lokalne stope"""
@@ -23,9 +22,9 @@ def calculate_income_tax(tax_base: Decimal, city: str, payment_date=None) -> Dec
 
     # Dohvati porezne stope za grad (standardiziraj ime grada za pretragu)
     try:
-        local_tax = LocalIncomeTax.objects.filter(
-            city_name__iexact=standardize_city_name(city),
-            valid_from__lte=payment_date # Dohvati stope koje vrijede na datum isplate
+        local_tax = LocalIncomeTax.valid_for_city(
+            city,
+            payment_date # Dohvati stope koje vrijede na datum isplate
         ).latest('valid_from') # Uzmi najnovije važeće stope
         
         # Izračunaj porez koristeći pragove i stope
@@ -0,0 +1,300 @@
+"""
+Backendi indeksa pretraživanja.
+
+Dokumenti indeksa (SearchDocument) uvijek se spremaju u bazu zajedno s
+normaliziranim tekstom (tokeni malim slovima, bez dijakritika, vidi
+search_index.tokenize). Backend određuje kako se po tom tekstu pretražuje:
+
+- 'terms': tablica pojmova SearchTerm i BM25 bodovanje (radi na svakoj bazi);
+- 'sqlite_fts': SQLite FTS5 virtualna tablica, bm25() računa sama baza;
+- 'postgres': PostgreSQL tsvector (GIN indeks nad izrazom), uz pg_trgm za
+  približno podudaranje kada nema točnih pogodaka.
+
+settings.SEARCH_BACKEND = 'auto' bira backend prema bazi. Nakon promjene
+backenda indeks treba ponovno izgraditi (`manage.py rebuild_search_index`).
+"""
+import heapq
+import logging
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Avg, Count, IntegerField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from ..models import SearchDocument, SearchTerm
+
+logger = logging.getLogger(__name__)
+
+# Standardni BM25 parametri
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class TermSearchBackend:
+    """Pojmovi u tablici SearchTerm, BM25 bodovanje u Pythonu."""
+    name = 'terms'
+
+    def ensure_schema(self):
+        pass
+
+    def is_available(self):
+        return True
+
+    def store(self, document, counts):
+        document.terms.all().delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(document=document, term=term, frequency=frequency)
+            for term, frequency in counts.items()
+        ])
+
+    def delete(self, document_ids):
+        # SearchTerm se briše kaskadno s dokumentom
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, terms, record_types=None, limit=10):
+        """Vraća parove (id dokumenta, bodovi) za dokumente s barem jednim pojmom upita."""
+        documents = SearchDocument.objects.all()
+        if record_types:
+            documents = documents.filter(record_type__in=record_types)
+
+        stats = documents.aggregate(total=Count('id'), avg_length=Avg('length'))
+        total = stats['total']
+        if not total:
+            return []
+        avg_length = stats['avg_length'] or 1
+
+        postings = list(
+            SearchTerm.objects.filter(term__in=terms, document__in=documents)
+            .values_list('document_id', 'term', 'frequency', 'document__length')
+        )
+        document_frequency = Counter(term for _, term, _, _ in postings)
+
+        scores = defaultdict(float)
+        for document_id, term, frequency, length in postings:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[document_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def match(self, terms, record_type):
+        """
+        Podupit s primarnim ključevima zapisa čiji dokument sadrži sve pojmove
+        upita kao prefikse (za `pk__in`, ID-ovi se ne učitavaju u Python).
+        """
+        documents = SearchDocument.objects.filter(record_type=record_type)
+        for term in terms:
+            # Svaki filter() preko relacije dodaje vlastiti JOIN, pa moraju odgovarati svi pojmovi
+            documents = documents.filter(terms__term__startswith=term)
+        return documents.annotate(object_pk=Cast('object_id', IntegerField())).values('object_pk')
+
+
+class SqliteFtsSearchBackend(TermSearchBackend):
+    """SQLite FTS5 virtualna tablica; rowid je id dokumenta."""
+    name = 'sqlite_fts'
+    table = 'arvelloapp_search_fts'
+
+    def ensure_schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "text, record_type UNINDEXED, object_id UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def is_available(self):
+        return self.table in connection.introspection.table_names()
+
+    def store(self, document, counts):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [document.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, text, record_type, object_id) VALUES (%s, %s, %s, %s)",
+                [document.pk, document.text, document.record_type, document.object_id],
+            )
+
+    def delete(self, document_ids):
+        if not document_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(document_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", list(document_ids))
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    @staticmethod
+    def _quote(term, prefix=False):
+        # Tokeni sadrže samo slova i brojeve, navodnici ih štite od FTS5 sintakse (npr. AND, NOT)
+        return f'"{term}"*' if prefix else f'"{term}"'
+
+    def _record_type_filter(self, record_types):
+        if not record_types:
+            return '', []
+        placeholders = ', '.join(['%s'] * len(record_types))
+        return f" AND record_type IN ({placeholders})", list(record_types)
+
+    def search(self, terms, record_types=None, limit=10):
+        type_sql, type_params = self._record_type_filter(record_types)
+        query = ' OR '.join(self._quote(term) for term in terms)
+        with connection.cursor() as cursor:
+            # bm25() vraća manje vrijednosti za bolje pogotke
+            cursor.execute(
+                f"SELECT rowid, -bm25({self.table}) FROM {self.table} "
+                f"WHERE {self.table} MATCH %s{type_sql} ORDER BY bm25({self.table}) LIMIT %s",
+                [query, *type_params, limit],
+            )
+            return cursor.fetchall()
+
+    def match(self, terms, record_type):
+        query = ' '.join(self._quote(term, prefix=True) for term in terms)
+        return RawSQL(
+            f"SELECT CAST(object_id AS INTEGER) FROM {self.table} WHERE {self.table} MATCH %s AND record_type = %s",
+            [query, record_type],
+        )
+
+
+class PostgresSearchBackend(TermSearchBackend):
+    """PostgreSQL tsvector nad SearchDocument.text, s pg_trgm kao rezervom za tipfelere."""
+    name = 'postgres'
+    ts_config = 'simple'  # tekst je već normaliziran, bez jezičnog stemminga
+
+    def __init__(self):
+        self._trigram = None
+
+    @property
+    def _table(self):
+        return SearchDocument._meta.db_table
+
+    @property
+    def _vector(self):
+        return f"to_tsvector('{self.ts_config}', text)"
+
+    def ensure_schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS search_document_tsv_idx ON {self._table} USING GIN ({self._vector})"
+            )
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS search_document_trgm_idx ON {self._table} USING GIN (text gin_trgm_ops)"
+                )
+        except DatabaseError as e:
+            logger.warning(f"pg_trgm nije dostupan, pretraživanje bez približnog podudaranja: {e}")
+
+    def is_available(self):
+        return connection.vendor == 'postgresql'
+
+    def has_trigram(self):
+        if self._trigram is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                self._trigram = cursor.fetchone() is not None
+        return self._trigram
+
+    def store(self, document, counts):
+        # Dovoljan je SearchDocument.text; indeks nad izrazom održava sama baza
+        pass
+
+    def _record_type_filter(self, record_types):
+        if not record_types:
+            return '', []
+        return " AND record_type = ANY(%s)", [list(record_types)]
+
+    def search(self, terms, record_types=None, limit=10):
+        type_sql, type_params = self._record_type_filter(record_types)
+        query = ' | '.join(terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, ts_rank_cd({self._vector}, to_tsquery('{self.ts_config}', %s)) AS score "
+                f"FROM {self._table} WHERE {self._vector} @@ to_tsquery('{self.ts_config}', %s){type_sql} "
+                "ORDER BY score DESC LIMIT %s",
+                [query, query, *type_params, limit],
+            )
+            rows = cursor.fetchall()
+            if rows or not self.has_trigram():
+                return rows
+
+            # Nema točnih pogodaka: približno podudaranje riječi (npr. tipfeleri)
+            text = ' '.join(terms)
+            cursor.execute(
+                f"SELECT id, word_similarity(%s, text) AS score FROM {self._table} "
+                f"WHERE %s <%% text{type_sql} ORDER BY score DESC LIMIT %s",
+                [text, text, *type_params, limit],
+            )
+            return cursor.fetchall()
+
+    def match(self, terms, record_type):
+        query = ' & '.join(f"{term}:*" for term in terms)
+        return RawSQL(
+            f"SELECT object_id::integer FROM {self._table} "
+            f"WHERE record_type = %s AND {self._vector} @@ to_tsquery('{self.ts_config}', %s)",
+            [record_type, query],
+        )
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TermSearchBackend, SqliteFtsSearchBackend, PostgresSearchBackend)
+}
+
+_AUTO_BACKENDS = {
+    'sqlite': SqliteFtsSearchBackend.name,
+    'postgresql': PostgresSearchBackend.name,
+}
+
+_backend = None
+
+
+def _configured_backend():
+    name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = _AUTO_BACKENDS.get(connection.vendor, TermSearchBackend.name)
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Nepoznat SEARCH_BACKEND '{name}'. Dostupni: auto, {', '.join(BACKENDS)}"
+        )
+
+
+def get_backend():
+    """Vraća backend pretraživanja za trenutnu bazu (jednom odabran po procesu)."""
+    global _backend
+    if _backend is None:
+        backend = _configured_backend()
+        if not backend.is_available():
+            logger.warning(
+                f"Backend pretraživanja '{backend.name}' nije spreman (pokrenite migrate), koristi se '{TermSearchBackend.name}'"
+            )
+            backend = TermSearchBackend()
+        _backend = backend
+    return _backend
+
+
+def reset_backend():
+    """Zaboravlja odabrani backend (npr. nakon promjene postavki ili sheme)."""
+    global _backend
+    _backend = None
+
+
+def ensure_schema():
+    """Stvara tablice/indekse konfiguriranog backenda ako ne postoje."""
+    backend = _configured_backend()
+    try:
+        backend.ensure_schema()
+    except DatabaseError as e:
+        logger.error(f"Shema za backend pretraživanja '{backend.name}' nije stvorena: {e}")
+    reset_backend()
+    return get_backend()
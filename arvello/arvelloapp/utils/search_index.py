@@ -0,0 +1,387 @@
+"""
+Lokalni indeks za pretraživanje poslovnih zapisa (BM25).
+
+Indeks pokriva račune, ponude, klijente, proizvode, troškove, dobavljače i
+povijest promjena. Tekst svakog zapisa se tokenizira (mala slova, bez
+dijakritika) i sprema u SearchDocument, a pretraživanje i bodovanje obavlja
+backend odabran prema bazi (SQLite FTS5, PostgreSQL tsvector ili tablica
+pojmova SearchTerm, vidi search_backends). Nema mrežnih poziva ni vanjskih
+servisa.
+
+Osim slobodnog pretraživanja (search) indeks služi i za filtriranje popisa
+(filter_queryset) umjesto `icontains` upita koji pretražuju cijelu tablicu.
+
+Indeks se ažurira inkrementalno iz signala (vidi arvelloapp/signals.py),
+a cijeli se može ponovno izgraditi naredbom `rebuild_search_index`.
+"""
+import logging
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from simple_history.utils import get_history_model_for_model
+
+from ..models import (
+    Invoice, InvoiceProduct, Offer, OfferProduct, Client, Product, Expense,
+    Supplier, Company, Inventory, Employee, Salary, SearchDocument,
+)
+from .search_backends import ensure_schema, get_backend
+from .text_utils import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+MAX_TERM_LENGTH = 64
+MAX_RESULTS = 50
+
+_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+HISTORY_TYPE_LABELS = {
+    '+': 'Kreirano',
+    '~': 'Promijenjeno',
+    '-': 'Obrisano',
+}
+
+
+def tokenize(text):
+    """Razlaže tekst na normalizirane tokene (bez dijakritika, min. 2 znaka)."""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in _TOKEN_PATTERN.findall(normalize_search_text(text))
+        if len(token) > 1
+    ]
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part not in (None, ''))
+
+
+def _build_invoice_document(invoice):
+    products = [
+        item.product.title
+        for item in InvoiceProduct.objects.filter(invoice=invoice).select_related('product')
+    ]
+    title = f"{invoice.number} - {invoice.client.clientName}"
+    summary = (
+        f"Number: {invoice.number}\n"
+        f"Client: {invoice.client.clientName}\n"
+        f"Subject: {invoice.subject.clientName}\n"
+        f"Date: {invoice.date}\n"
+        f"Due Date: {invoice.dueDate}\n"
+        f"Paid: {'Yes' if invoice.is_paid else 'No'}\n"
+        f"Products: {', '.join(products) or 'N/A'}"
+    )
+    text = _join(
+        invoice.number, invoice.title, invoice.notes, invoice.client.clientName,
+        invoice.client.OIB, invoice.subject.clientName, invoice.date,
+        'placen' if invoice.is_paid else 'neplacen', invoice.fiscal_jir, *products
+    )
+    return title, summary, text
+
+
+def _build_offer_document(offer):
+    products = [
+        item.product.title
+        for item in OfferProduct.objects.filter(offer=offer).select_related('product')
+    ]
+    title = f"{offer.number} - {offer.client.clientName}"
+    summary = (
+        f"Number: {offer.number}\n"
+        f"Client: {offer.client.clientName}\n"
+        f"Subject: {offer.subject.clientName}\n"
+        f"Date: {offer.date}\n"
+        f"Due Date: {offer.dueDate}\n"
+        f"Products: {', '.join(products) or 'N/A'}"
+    )
+    text = _join(
+        offer.number, offer.title, offer.notes, offer.client.clientName,
+        offer.client.OIB, offer.subject.clientName, offer.date, *products
+    )
+    return title, summary, text
+
+
+def _build_client_document(client):
+    title = client.clientName
+    summary = (
+        f"Name: {client.clientName}\n"
+        f"Address: {client.addressLine1}, {client.postalCode} ({client.province})\n"
+        f"Email: {client.emailAddress or 'N/A'}\n"
+        f"OIB: {client.OIB or 'N/A'}\n"
+        f"Client Unique ID: {client.clientUniqueId}"
+    )
+    text = _join(
+        client.clientName, client.addressLine1, client.province, client.postalCode,
+        client.emailAddress, client.phoneNumber, client.OIB, client.VATID,
+        client.clientUniqueId, client.clientType
+    )
+    return title, summary, text
+
+
+def _build_product_document(product):
+    title = product.title
+    summary = (
+        f"Title: {product.title}\n"
+        f"Barcode/ID: {product.barid}\n"
+        f"Price: {product.price} {product.currency}\n"
+        f"Tax: {product.taxPercent}%"
+    )
+    text = _join(product.title, product.description, product.barid, product.kpd_code_id)
+    return title, summary, text
+
+
+def _build_expense_document(expense):
+    supplier_name = expense.supplier.supplierName if expense.supplier else None
+    title = expense.title
+    summary = (
+        f"Title: {expense.title}\n"
+        f"Amount: {expense.amount} {expense.currency}\n"
+        f"Date: {expense.date}\n"
+        f"Category: {expense.get_category_display()}\n"
+        f"Supplier: {supplier_name or 'N/A'}"
+    )
+    text = _join(
+        expense.title, expense.description, expense.get_category_display(),
+        supplier_name, expense.invoice_number, expense.date
+    )
+    return title, summary, text
+
+
+def _build_supplier_document(supplier):
+    title = supplier.supplierName
+    summary = (
+        f"Name: {supplier.supplierName}\n"
+        f"Address: {supplier.addressLine1}, {supplier.postalCode} {supplier.town}\n"
+        f"Email: {supplier.emailAddress or 'N/A'}\n"
+        f"OIB: {supplier.OIB or 'N/A'}"
+    )
+    text = _join(
+        supplier.supplierName, supplier.addressLine1, supplier.town, supplier.postalCode,
+        supplier.province, supplier.emailAddress, supplier.phoneNumber, supplier.OIB
+    )
+    return title, summary, text
+
+
+def _build_history_document(record):
+    model_name = record.instance_type._meta.verbose_name
+    label = (
+        getattr(record, 'clientName', None)
+        or getattr(record, 'supplierName', None)
+        or getattr(record, 'number', None)
+        or getattr(record, 'title', None)
+        or (_join(getattr(record, 'first_name', None), getattr(record, 'last_name', None)) or None)
+        or f"ID {record.id}"
+    )
+    change_type = HISTORY_TYPE_LABELS.get(record.history_type, record.history_type)
+    username = record.history_user.username if record.history_user else 'System'
+    title = f"{model_name}: {label}"
+    summary = (
+        f"Model: {record.instance_type.__name__}\n"
+        f"Object ID: {record.id}\n"
+        f"Change Type: {change_type}\n"
+        f"Change Date: {record.history_date}\n"
+        f"Changed By: {username}"
+    )
+    text = _join(
+        model_name, label, change_type, username, record.history_change_reason,
+        record.history_date.date()
+    )
+    return title, summary, text
+
+
+# Modeli koji se indeksiraju: model -> (vrsta zapisa, funkcija za izgradnju dokumenta)
+DOCUMENT_BUILDERS = {
+    Invoice: ('invoice', _build_invoice_document),
+    Offer: ('offer', _build_offer_document),
+    Client: ('client', _build_client_document),
+    Product: ('product', _build_product_document),
+    Expense: ('expense', _build_expense_document),
+    Supplier: ('supplier', _build_supplier_document),
+}
+
+# Dokumenti koji sadrže podatke povezanih zapisa (npr. naziv klijenta na računu):
+# model -> [(indeksirani model, polje veze)]
+RELATED_DOCUMENTS = {
+    Client: [(Invoice, 'client'), (Offer, 'client')],
+    Company: [(Invoice, 'subject'), (Offer, 'subject')],
+    Supplier: [(Expense, 'supplier')],
+}
+
+# Modeli čija se povijest promjena indeksira
+HISTORY_MODELS = (
+    Invoice, Offer, Client, Product, Expense, Supplier, Company, Inventory, Employee, Salary,
+)
+
+
+def _history_object_id(record):
+    return f"{record._meta.model_name}:{record.history_id}"
+
+
+def _store_document(record_type, object_id, title, summary, text):
+    tokens = tokenize(text)
+    with transaction.atomic():
+        document, _ = SearchDocument.objects.update_or_create(
+            record_type=record_type,
+            object_id=object_id,
+            defaults={
+                'title': title[:255],
+                'summary': summary,
+                'text': ' '.join(tokens),
+                'length': len(tokens),
+            }
+        )
+        get_backend().store(document, Counter(tokens))
+    return document
+
+
+def is_history_record(instance):
+    """Provjerava je li instanca zapis povijesti (simple_history) indeksiranog modela."""
+    return getattr(instance, 'instance_type', None) in HISTORY_MODELS and hasattr(instance, 'history_id')
+
+
+def index_instance(instance):
+    """
+    Dodaje ili osvježava dokument za zadani zapis u indeksu.
+
+    Returns:
+        SearchDocument ili None ako model nije indeksiran.
+    """
+    if is_history_record(instance):
+        title, summary, text = _build_history_document(instance)
+        return _store_document('history', _history_object_id(instance), title, summary, text)
+
+    entry = DOCUMENT_BUILDERS.get(type(instance))
+    if entry is None:
+        return None
+    record_type, builder = entry
+    title, summary, text = builder(instance)
+    return _store_document(record_type, str(instance.pk), title, summary, text)
+
+
+def remove_instance(instance):
+    """Uklanja dokument zadanog zapisa iz indeksa."""
+    entry = DOCUMENT_BUILDERS.get(type(instance))
+    if entry is None:
+        return
+    documents = SearchDocument.objects.filter(record_type=entry[0], object_id=str(instance.pk))
+    with transaction.atomic():
+        get_backend().delete(list(documents.values_list('id', flat=True)))
+        documents.delete()
+
+
+def remove_history_records(history_model, history_ids):
+    """Uklanja dokumente obrisanih zapisa povijesti iz indeksa (npr. nakon history_compact)."""
+    object_ids = [f"{history_model._meta.model_name}:{history_id}" for history_id in history_ids]
+    documents = SearchDocument.objects.filter(record_type='history', object_id__in=object_ids)
+    with transaction.atomic():
+        get_backend().delete(list(documents.values_list('id', flat=True)))
+        documents.delete()
+
+
+def index_related(instance):
+    """
+    Ponovno indeksira dokumente koji sadrže podatke zadanog zapisa
+    (npr. račune i ponude klijenta nakon promjene njegovog naziva).
+    """
+    for model, field in RELATED_DOCUMENTS.get(type(instance), ()):
+        queryset = model.objects.filter(**{field: instance}).select_related(
+            *(name for name in ('client', 'subject', 'supplier') if hasattr(model, name))
+        )
+        for document in queryset.iterator(chunk_size=500):
+            index_instance(document)
+
+
+def rebuild_index(include_history=True):
+    """
+    Briše i ponovno gradi cijeli indeks.
+
+    Returns:
+        dict: broj indeksiranih dokumenata po vrsti zapisa
+    """
+    stats = {}
+    backend = ensure_schema()
+    with transaction.atomic():
+        backend.clear()
+        SearchDocument.objects.all().delete()
+
+    for model, (record_type, _) in DOCUMENT_BUILDERS.items():
+        count = 0
+        for instance in model.objects.all().iterator(chunk_size=500):
+            index_instance(instance)
+            count += 1
+        stats[record_type] = count
+
+    if include_history:
+        count = 0
+        for model in HISTORY_MODELS:
+            history_model = get_history_model_for_model(model)
+            for record in history_model.objects.select_related('history_user').iterator(chunk_size=500):
+                index_instance(record)
+                count += 1
+        stats['history'] = count
+
+    return stats
+
+
+def _query_terms(query):
+    # Jedinstveni tokeni upita, redoslijedom pojavljivanja
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def search(query, record_types=None, limit=10):
+    """
+    Pretražuje indeks i boduje rezultate (BM25 ili rang backenda).
+
+    Args:
+        query (str): Upit slobodnim tekstom
+        record_types (list): Ograniči na vrste zapisa (npr. ['invoice', 'client'])
+        limit (int): Najveći broj rezultata
+
+    Returns:
+        list: parovi (SearchDocument, score) poredani od najrelevantnijeg
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(int(limit), MAX_RESULTS))
+
+    top = get_backend().search(terms, record_types, limit)
+    found = SearchDocument.objects.in_bulk([document_id for document_id, _ in top])
+    return [(found[document_id], score) for document_id, score in top if document_id in found]
+
+
+def matching_ids(record_type, query):
+    """
+    Vraća podupit s primarnim ključevima zapisa čiji dokument sadrži sve riječi
+    upita (kao prefikse, npr. "vodo dubr" pronalazi "Vodovod Dubrovnik").
+
+    Podupit se izvršava u bazi zajedno s upitom koji ga koristi (`pk__in`), pa
+    kratak prefiks s mnogo pogodaka ne stvara dugačku listu parametara.
+
+    Returns:
+        podupit (queryset ili RawSQL) ili None ako upit nema nijednu riječ za pretraživanje
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return None
+    return get_backend().match(terms, record_type)
+
+
+def filter_queryset(queryset, record_type, query, exact_fields=()):
+    """
+    Filtrira queryset upitom preko indeksa pretraživanja (umjesto `icontains`).
+
+    Args:
+        queryset: queryset indeksiranog modela
+        record_type: vrsta zapisa u indeksu (npr. 'invoice')
+        query: upit korisnika
+        exact_fields: polja koja se uspoređuju s cijelim upitom (npr. broj računa
+            "1-1-25", čiji su dijelovi prekratki za indeks)
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    matches = matching_ids(record_type, query)
+    condition = Q(pk__in=matches) if matches is not None else Q(pk__in=[])
+    for field in exact_fields:
+        condition |= Q(**{f'{field}__iexact': query})
+    return queryset.filter(condition)
@@ -0,0 +1,253 @@
+"""
+Izvoz tablica (inventar, proizvodi, klijenti, dobavljači, troškovi, računi)
+u CSV i Excel.
+
+Stupci se opisuju deklarativno (ExportColumn), a redovi se čitaju izravno
+iz baze s `.values_list(...).iterator()` uz JOIN za povezane modele, bez
+učitavanja modela i bez privremenih datoteka:
+
+- CSV se šalje kao StreamingHttpResponse, red po red;
+- Excel se piše openpyxl-om u write-only načinu u SpooledTemporaryFile
+  (u memoriji dok je mali, na disku kad naraste).
+
+Potrošnja memorije zato ne ovisi o broju redova.
+"""
+import csv
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.http import FileResponse, StreamingHttpResponse
+
+from ..models import Client, Expense, Inventory, Invoice, Product, Supplier
+
+# Broj redova koje iterator dohvaća iz baze odjednom
+CHUNK_SIZE = 2000
+# Do ove veličine Excel datoteka ostaje u memoriji
+XLSX_SPOOL_SIZE = 5 * 1024 * 1024
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATE_FORMAT = '%Y-%m-%d'
+
+CSV_CONTENT_TYPE = 'text/csv'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def format_datetime(value):
+    return value.strftime(DATETIME_FORMAT) if value else ''
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT) if value else ''
+
+
+def format_bool(value):
+    return 'Da' if value else 'Ne'
+
+
+def choice_label(model, field_name):
+    """Formatter koji vrijednost polja s izborima pretvara u njen naziv."""
+    labels = dict(model._meta.get_field(field_name).flatchoices)
+    return lambda value: labels.get(value, value if value is not None else '')
+
+
+@dataclass(frozen=True)
+class ExportColumn:
+    header: str
+    field: str  # putanja polja za values_list, npr. 'subject__clientName'
+    format: Optional[Callable] = None
+
+
+@dataclass(frozen=True)
+class TableExport:
+    model: type
+    filename: str  # naziv datoteke bez ekstenzije
+    columns: tuple
+    ordering: tuple = ('pk',)
+
+    def queryset(self):
+        return self.model.objects.order_by(*self.ordering)
+
+    def headers(self):
+        return [column.header for column in self.columns]
+
+    def rows(self, queryset=None):
+        """Generator redova s formatiranim vrijednostima."""
+        queryset = self.queryset() if queryset is None else queryset
+        fields = [column.field for column in self.columns]
+        formatters = [column.format for column in self.columns]
+        for values in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+            yield [
+                formatter(value) if formatter else ('' if value is None else value)
+                for formatter, value in zip(formatters, values)
+            ]
+
+
+EXPORTS = {
+    'inventory': TableExport(
+        model=Inventory,
+        filename='inventory',
+        columns=(
+            ExportColumn('Naziv', 'title'),
+            ExportColumn('Količina', 'quantity'),
+            ExportColumn('Datum dodavanja', 'date_created', format_datetime),
+            ExportColumn('Zadnje ažuriranje', 'last_updated', format_datetime),
+            ExportColumn('Subjekt', 'subject__clientName'),
+        ),
+    ),
+    'products': TableExport(
+        model=Product,
+        filename='proizvodi',
+        columns=(
+            ExportColumn('Naziv', 'title'),
+            ExportColumn('Opis', 'description'),
+            ExportColumn('Cijena', 'price'),
+            ExportColumn('Valuta', 'currency'),
+            ExportColumn('PDV (%)', 'taxPercent'),
+            ExportColumn('Šifra', 'barid'),
+            ExportColumn('KPD', 'kpd_code'),
+            ExportColumn('Zadnje ažuriranje', 'last_updated', format_datetime),
+        ),
+    ),
+    'clients': TableExport(
+        model=Client,
+        filename='klijenti',
+        columns=(
+            ExportColumn('Naziv', 'clientName'),
+            ExportColumn('Adresa', 'addressLine1'),
+            ExportColumn('Poštanski broj', 'postalCode'),
+            ExportColumn('Županija', 'province'),
+            ExportColumn('Telefon', 'phoneNumber'),
+            ExportColumn('E-pošta', 'emailAddress'),
+            ExportColumn('Vrsta', 'clientType'),
+            ExportColumn('OIB', 'OIB'),
+            ExportColumn('PDV ID', 'VATID'),
+            ExportColumn('U sustavu PDV-a', 'SustavPDVa', format_bool),
+            ExportColumn('IBAN', 'IBAN'),
+            ExportColumn('Šifra klijenta', 'clientUniqueId'),
+        ),
+        ordering=('clientName', 'pk'),
+    ),
+    'suppliers': TableExport(
+        model=Supplier,
+        filename='dobavljaci',
+        columns=(
+            ExportColumn('Naziv', 'supplierName'),
+            ExportColumn('Adresa', 'addressLine1'),
+            ExportColumn('Grad', 'town'),
+            ExportColumn('Poštanski broj', 'postalCode'),
+            ExportColumn('Županija', 'province'),
+            ExportColumn('Telefon', 'phoneNumber'),
+            ExportColumn('E-pošta', 'emailAddress'),
+            ExportColumn('Vrsta osobe', 'businessType'),
+            ExportColumn('OIB', 'OIB'),
+        ),
+        ordering=('supplierName', 'pk'),
+    ),
+    'expenses': TableExport(
+        model=Expense,
+        filename='troskovi',
+        columns=(
+            ExportColumn('Naslov', 'title'),
+            ExportColumn('Datum', 'date', format_date),
+            ExportColumn('Kategorija', 'category', choice_label(Expense, 'category')),
+            ExportColumn('Iznos', 'amount'),
+            ExportColumn('Valuta', 'currency'),
+            ExportColumn('Iznos bez PDV-a', 'pretax_amount'),
+            ExportColumn('Dobavljač', 'supplier__supplierName'),
+            ExportColumn('Broj računa', 'invoice_number'),
+            ExportColumn('Datum računa', 'invoice_date', format_date),
+            ExportColumn('Subjekt', 'subject__clientName'),
+            ExportColumn('Opis', 'description'),
+        ),
+        ordering=('-date', '-pk'),
+    ),
+    'invoices': TableExport(
+        model=Invoice,
+        filename='racuni',
+        columns=(
+            ExportColumn('Broj računa', 'number'),
+            ExportColumn('Naslov', 'title'),
+            ExportColumn('Datum', 'date', format_date),
+            ExportColumn('Dospijeće', 'dueDate', format_date),
+            ExportColumn('Klijent', 'client__clientName'),
+            ExportColumn('OIB klijenta', 'client__OIB'),
+            ExportColumn('Subjekt', 'subject__clientName'),
+            ExportColumn('Tip računa', 'invoice_type', choice_label(Invoice, 'invoice_type')),
+            ExportColumn('Način plaćanja', 'payment_method', choice_label(Invoice, 'payment_method')),
+            ExportColumn('Plaćen', 'is_paid', format_bool),
+            ExportColumn('Datum plaćanja', 'payment_date', format_date),
+            ExportColumn('Fiskalni status', 'fiscal_status', choice_label(Invoice, 'fiscal_status')),
+            ExportColumn('JIR', 'fiscal_jir'),
+        ),
+        ordering=('-date', '-pk'),
+    ),
+}
+
+FORMATS = ('csv', 'xlsx')
+
+
+class _Echo:
+    """Pseudo-datoteka za csv.writer: write() samo vraća redak."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(export, queryset=None):
+    """Vraća CSV izvoz kao StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+
+    def stream():
+        yield writer.writerow(export.headers())
+        for row in export.rows(queryset):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(stream(), content_type=CSV_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{export.filename}.csv"'
+    return response
+
+
+def write_xlsx(export, output, queryset=None):
+    """Zapisuje Excel izvoz u datoteku (ili datoteci sličan objekt)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=export.filename[:31])
+    sheet.append(export.headers())
+    for row in export.rows(queryset):
+        sheet.append(row)
+    workbook.save(output)
+
+
+def xlsx_response(export, queryset=None):
+    """Vraća Excel izvoz kao FileResponse iz SpooledTemporaryFile."""
+    output = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE)
+    write_xlsx(export, output, queryset)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"{export.filename}.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def export_response(name, file_format, queryset=None):
+    """
+    Vraća HTTP odgovor s izvozom tablice.
+
+    Args:
+        name: ključ u EXPORTS (npr. 'inventory')
+        file_format: 'csv' ili 'xlsx'
+        queryset: po želji filtrirani queryset modela (zadano svi zapisi)
+
+    Raises:
+        KeyError: ako tablica ili format nisu podržani
+    """
+    export = EXPORTS[name]
+    if file_format == 'csv':
+        return csv_response(export, queryset)
+    if file_format == 'xlsx':
+        return xlsx_response(export, queryset)
+    raise KeyError(file_format)
@@ -40,3 +40,32 @@ def standardize_city_name(city_name):
     
     # Vrati standardizirani naziv grada
     return city
+
+
+def normalize_search_text(text):
+    """
+    Normalizira tekst za pretraživanje neovisno o velikim slovima i dijakriticima.
+
+    Pretvara tekst u mala slova i zamjenjuje hrvatske dijakritičke znakove
+    (š, đ, č, ć, ž) njihovim osnovnim latiničnim ekvivalentima, tako da
+    upit "racun" pronalazi "Račun".
+
+    Args:
+        text (str): Tekst koji treba normalizirati.
+
+    Returns:
+        str: Normalizirani tekst ili prazan string ako je ulaz None ili prazan.
+    """
+    if not text:
+        return ""
+
+    text = str(text).lower()
+
+    replacements = {
+        'š': 's', 'đ': 'd', 'č': 'c',
+        'ć': 'c', 'ž': 'z'
+    }
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+
+    return text
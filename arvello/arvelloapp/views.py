@@ -4,7 +4,7 @@ from django.core.cache import cache
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.urls import reverse
-from django.db.models import Sum, Q, Count
+from django.db.models import Sum, Q, Count, Prefetch
 from django.core.paginator import Paginator
 from django.contrib import messages
 from django.contrib.auth.models import User, auth
@@ -13,12 +13,10 @@ from django.utils import timezone
 from django.apps import apps
 from io import BytesIO
 from .forms import *
-import requests
 import json
 import base64
 from barcode import Code128
 from barcode.writer import SVGWriter
-from .utils.barcode import generate_hub3_barcode_base64
 from datetime import datetime, date
 from calendar import monthrange
 import calendar
@@ -26,6 +24,11 @@ from django.utils import timezone
 from decimal import Decimal
 from simple_history.utils import get_history_model_for_model
 from .utils.salary_calculator import update_salary_with_calculations
+from .utils.history_query import attach_previous_records, fetch_history_page
+from .utils import search_index
+from .utils.history_diff import get_stored_changes
+from .utils.table_export import EXPORTS, FORMATS as EXPORT_FORMATS, export_response
+from .utils.document_pdf import get_invoice_pdf, get_offer_pdf, pdf_filename, PdfRenderError
 import logging
 from .utils.payslip_context import get_payslip_context 
 import tempfile
@@ -34,9 +37,7 @@ import re
 import pandas as pd
 from decimal import Decimal, InvalidOperation
 from .utils.joppd_generator import generate_joppd_xml, validate_joppd_xml, mark_salaries_as_reported
-from django.template.loader import render_to_string, get_template
-from weasyprint import HTML, CSS
-from .utils.email_utils import send_email_with_attachment
+from .utils.invoice_batch import queue_invoice_batch, queue_invoice_email, unsent_invoices
 from django.conf import settings
 import os
 import time
@@ -45,6 +46,10 @@ from mistralai import Mistral
 
 logger = logging.getLogger(__name__)
 
+# Stavke s proizvodima za iznose dokumenata (price_with_vat, pretax, tax) bez upita po dokumentu
+INVOICE_LINES = Prefetch('invoiceproduct_set', queryset=InvoiceProduct.objects.select_related('product'))
+OFFER_LINES = Prefetch('offerproduct_set', queryset=OfferProduct.objects.select_related('product'))
+
 def anonymous_required(function=None):
     # Dekorator koji zahtijeva da korisnik bude anoniman (neprijavljen)
     def _dec(view_function):
@@ -79,11 +84,7 @@ def products(request):
     # Search functionality
     q = request.GET.get('q', '')
     if q:
-        queryset = queryset.filter(
-            Q(title__icontains=q) |
-            Q(barid__icontains=q) |
-            Q(description__icontains=q)
-        )
+        queryset = search_index.filter_queryset(queryset, 'product', q, exact_fields=['barid'])
     context['q'] = q
     
     # Pagination
@@ -124,16 +125,12 @@ def products(request):
 def invoices(request):
     # Prikazuje stranicu s računima i omogućuje dodavanje novih (jednostavna forma)
     context = {}
-    queryset = Invoice.objects.all().order_by('-date', '-id')
+    queryset = Invoice.objects.select_related('client', 'subject', 'email').prefetch_related(INVOICE_LINES).order_by('-date', '-id')
     
     # Search functionality
     q = request.GET.get('q', '')
     if q:
-        queryset = queryset.filter(
-            Q(number__icontains=q) |
-            Q(client__clientName__icontains=q) |
-            Q(title__icontains=q)
-        )
+        queryset = search_index.filter_queryset(queryset, 'invoice', q, exact_fields=['number'])
     context['q'] = q
     
     # Date range filters
@@ -252,73 +249,22 @@ def create_invoice(request):
     return render(request, 'makeinvoice.html', context)
 
 
+@login_required
+def export_table(request, name, file_format):
+    # Izvozi tablicu (inventar, proizvodi, klijenti, ...) u CSV ili Excel datoteku
+    if name not in EXPORTS or file_format not in EXPORT_FORMATS:
+        raise Http404("Nepoznati izvoz")
+    return export_response(name, file_format)
+
 @login_required
 def export_inventory_to_excel(request):
     # Izvozi inventar u Excel datoteku
-    inventory_items = Inventory.objects.all()
-
-    # Pripremi podatke za DataFrame
-    data = []
-    for item in inventory_items:
-        data.append({
-            'Naziv': item.title,
-            'Količina': item.quantity,
-            'Datum dodavanja': item.date_created.strftime('%Y-%m-%d %H:%M:%S'),
-            'Zadnje ažuriranje': item.last_updated.strftime('%Y-%m-%d %H:%M:%S'),
-            'Subjekt': item.subject.clientName if item.subject else '',
-        })
-
-    # Kreiraj DataFrame
-    df = pd.DataFrame(data)
-
-    # Kreiraj privremenu Excel datoteku
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-        excel_path = tmp.name
-        df.to_excel(excel_path, index=False)
-
-    # Otvori datoteku za čitanje i pripremi odgovor
-    with open(excel_path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="inventory.xlsx"'
-
-    # Obriši privremenu datoteku
-    os.remove(excel_path)
-
-    return response
+    return export_response('inventory', 'xlsx')
 
 @login_required
 def export_inventory_to_csv(request):
     # Izvozi inventar u CSV datoteku
-    inventory_items = Inventory.objects.all()
-
-    # Pripremi podatke za DataFrame
-    data = []
-    for item in inventory_items:
-        data.append({
-            'Naziv': item.title,
-            'Količina': item.quantity,
-            'Datum dodavanja': item.date_created.strftime('%Y-%m-%d %H:%M:%S'),
-            'Zadnje ažuriranje': item.last_updated.strftime('%Y-%m-%d %H:%M:%S'),
-            'Subjekt': item.subject.clientName if item.subject else '',
-        })
-
-    # Kreiraj DataFrame
-    df = pd.DataFrame(data)
-
-    # Kreiraj privremenu CSV datoteku
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-        csv_path = tmp.name
-        df.to_csv(csv_path, index=False)
-
-    # Otvori datoteku za čitanje i pripremi odgovor
-    with open(csv_path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="inventory.csv"'
-
-    # Obriši privremenu datoteku
-    os.remove(csv_path)
-
-    return response
+    return export_response('inventory', 'csv')
 
 @login_required
 def create_offer(request):
@@ -415,16 +361,12 @@ def companies(request):
 def offers(request):
     # Prikazuje stranicu s ponudama i omogućuje dodavanje novih (jednostavna forma)
     context = {}
-    queryset = Offer.objects.all().order_by('-date', '-id')
+    queryset = Offer.objects.select_related('client', 'subject').order_by('-date', '-id')
     
     # Search functionality
     q = request.GET.get('q', '')
     if q:
-        queryset = queryset.filter(
-            Q(number__icontains=q) |
-            Q(client__clientName__icontains=q) |
-            Q(title__icontains=q)
-        )
+        queryset = search_index.filter_queryset(queryset, 'offer', q, exact_fields=['number'])
     context['q'] = q
     
     # Pagination
@@ -472,11 +414,7 @@ def clients(request):
     # Search functionality
     q = request.GET.get('q', '')
     if q:
-        queryset = queryset.filter(
-            Q(clientName__icontains=q) |
-            Q(clientUniqueId__icontains=q) |
-            Q(emailAddress__icontains=q)
-        )
+        queryset = search_index.filter_queryset(queryset, 'client', q)
     context['q'] = q
     
     # Pagination
@@ -548,61 +486,36 @@ def login(request):
 
     return render(request, 'login.html', context)
 
+def _pdf_response(pdf_bytes, filename, download=False):
+    # PDF se prikazuje u pregledniku (ispis) ili preuzima kao privitak
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    disposition = 'attachment' if download else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    return response
+
 @login_required
 def invoice_pdf(request, pk):
-    # Generira PDF prikaz računa s HUB3 barkodom
-    invoice = get_object_or_404(Invoice, pk=pk)
-    subject = invoice.subject
-    product = InvoiceProduct.objects.filter(invoice=invoice)
-    client = invoice.client
-    
-    # Generiraj HUB3 barkod lokalno
-    barcode_image = generate_hub3_barcode_base64(
-        iban=subject.IBAN or "",
-        amount=Decimal(str(invoice.price_with_vat())),
-        payer_name=client.clientName,
-        payer_address=client.addressLine1,
-        payer_city=f"{client.postalCode} {client.province}",
-        receiver_name=subject.clientName[:25],
-        receiver_address=subject.addressLine1,
-        receiver_city=f"{subject.postalCode} {subject.town}",
-        reference_model="HR00",
-        reference_number=f"{client.clientUniqueId}-{invoice.number.replace('/', '-')}",
-        purpose_code="OTHR",
-        description=f"Uplata po računu {invoice.number}",
-        currency=invoice.currtext()
-    )
-    
-    # Renderiraj HTML predložak s podacima računa i barkodom
-    return render(request, 'invoice_export_view.html', {'invoice': invoice, 'products': product, 'client': client, 'subject': subject, 'barcode_image': barcode_image})
+    # Vraća PDF računa s HUB3 barkodom (iz cachea ako je račun nepromijenjen)
+    invoice = get_object_or_404(Invoice.objects.select_related('client', 'subject'), pk=pk)
+    try:
+        pdf_bytes = get_invoice_pdf(invoice, referent=request.user)
+    except PdfRenderError as e:
+        logger.error(f"Greška pri renderiranju PDF-a za račun {invoice.id}: {e}")
+        messages.error(request, "Greška pri izradi PDF dokumenta.")
+        return redirect('invoices')
+    return _pdf_response(pdf_bytes, pdf_filename('Racun', invoice.number), download='download' in request.GET)
 
 @login_required
 def offer_pdf(request, pk):
-    # Generira PDF prikaz ponude s HUB3 barkodom
-    offer = get_object_or_404(Offer, pk=pk)
-    subject = offer.subject
-    product = OfferProduct.objects.filter(offer=offer)
-    client = offer.client
-    
-    # Generiraj HUB3 barkod lokalno
-    barcode_image = generate_hub3_barcode_base64(
-        iban=subject.IBAN or "",
-        amount=Decimal(str(offer.price_with_vat())),
-        payer_name=client.clientName,
-        payer_address=client.addressLine1,
-        payer_city=f"{client.postalCode} {client.province}",
-        receiver_name=subject.clientName[:25],
-        receiver_address=subject.addressLine1,
-        receiver_city=f"{subject.postalCode} {subject.town}",
-        reference_model="HR00",
-        reference_number=f"{client.clientUniqueId}-{offer.number.replace('/', '-')}",
-        purpose_code="OTHR",
-        description=f"Uplata po ponudi {offer.number}",
-        currency=offer.currtext()
-    )
-    
-    # Renderiraj HTML predložak s podacima ponude i barkodom
-    return render(request, 'offer_export_view.html', {'offer': offer, 'products': product, 'client': client, 'subject': subject, 'barcode_image': barcode_image})
+    # Vraća PDF ponude s HUB3 barkodom (iz cachea ako je ponuda nepromijenjena)
+    offer = get_object_or_404(Offer.objects.select_related('client', 'subject'), pk=pk)
+    try:
+        pdf_bytes = get_offer_pdf(offer, referent=request.user)
+    except PdfRenderError as e:
+        logger.error(f"Greška pri renderiranju PDF-a za ponudu {offer.id}: {e}")
+        messages.error(request, "Greška pri izradi PDF dokumenta.")
+        return redirect('offers')
+    return _pdf_response(pdf_bytes, pdf_filename('Ponuda', offer.number), download='download' in request.GET)
 
 @login_required
 def inventory_label(request, pk):
@@ -641,7 +554,7 @@ def logout(request):
 def inventory(request):
     # Prikazuje stranicu s inventarom i omogućuje dodavanje novih stavki
     context = {}
-    inventory = Inventory.objects.all()
+    inventory = Inventory.objects.select_related('subject')
     
     context['inventory'] = inventory
 
@@ -759,16 +672,12 @@ def expenses(request):
     context = {}
     try:
         # Dohvati sve troškove sortirane po datumu silazno
-        queryset = Expense.objects.all().order_by('-date')
+        queryset = Expense.objects.select_related('subject', 'supplier').order_by('-date')
         
         # Search functionality
         q = request.GET.get('q', '')
         if q:
-            queryset = queryset.filter(
-                Q(title__icontains=q) |
-                Q(supplier__supplierName__icontains=q) |
-                Q(description__icontains=q)
-            )
+            queryset = search_index.filter_queryset(queryset, 'expense', q)
         context['q'] = q
         
         # Pagination
@@ -842,12 +751,7 @@ def suppliers(request):
     # Search functionality
     q = request.GET.get('q', '')
     if q:
-        queryset = queryset.filter(
-            Q(supplierName__icontains=q) |
-            Q(OIB__icontains=q) |
-            Q(emailAddress__icontains=q) |
-            Q(town__icontains=q)
-        )
+        queryset = search_index.filter_queryset(queryset, 'supplier', q)
     context['q'] = q
     
     # Pagination
@@ -1004,7 +908,7 @@ def incoming_invoice_book(request):
 def employees(request):
     # Prikazuje stranicu sa zaposlenicima, omogućuje dodavanje, uređivanje i aktivaciju/deaktivaciju
     companies = Company.objects.all()
-    employees = Employee.objects.all().order_by('last_name', 'first_name')
+    employees = Employee.objects.select_related('company').order_by('last_name', 'first_name')
     context = {'employees': employees}
 
     if request.method == 'POST':
@@ -1101,7 +1005,7 @@ def salaries(request):
     salaries = Salary.objects.filter(
         period_year=selected_year,
         period_month=selected_month
-    ).select_related('employee')
+    ).select_related('employee').prefetch_related('payslip_deliveries')
     
     # Obrada POST zahtjeva (kreiranje ili brisanje plaće)
     if request.method == 'POST':
@@ -1490,17 +1394,13 @@ def employee_api(request, employee_id):
     monthly_threshold = Decimal('4200.00') # Default
     try:
         from .models import LocalIncomeTax, TaxParameter
-        from .utils.salary_calculator import standardize_city_name
         payment_date_obj = timezone.now().date()
         year = payment_date_obj.year
 
         threshold_param = TaxParameter.objects.get(parameter_type='monthly_tax_threshold', year=year)
         monthly_threshold = Decimal(str(threshold_param.value))
 
-        local_tax = LocalIncomeTax.objects.filter(
-            city_name__iexact=standardize_city_name(employee.city),
-            valid_from__lte=payment_date_obj
-        ).latest('valid_from')
+        local_tax = LocalIncomeTax.valid_for_city(employee.city, payment_date_obj).latest('valid_from')
         lower_tax_rate_percent = local_tax.tax_rate_lower
         higher_tax_rate_percent = local_tax.tax_rate_higher
     except (LocalIncomeTax.DoesNotExist, TaxParameter.DoesNotExist):
@@ -1544,6 +1444,68 @@ def salary_payslip(request, salary_id):
 
     return render(request, 'salary_payslip.html', context)
 
+@login_required
+def send_payslip(request, salary_id):
+    """Stavlja slanje platne liste zaposleniku e-mailom u red."""
+    salary = get_object_or_404(Salary.objects.select_related('employee'), id=salary_id)
+    if request.method != "POST":
+        messages.error(request, "Neispravan zahtjev.")
+        return redirect('salaries')
+
+    if not salary.employee.email:
+        messages.error(request, f"Zaposlenik {salary.employee.get_full_name()} nema upisanu e-mail adresu.")
+        return redirect('salaries')
+
+    from .utils.pdf_generator import queue_payslip_email
+    queue_payslip_email(salary)
+    messages.success(request, f"Platna lista za {salary.employee.get_full_name()} stavljena je u red za slanje.")
+    return redirect('salaries')
+
+def _payslip_period(params):
+    # Razdoblje (godina, mjesec) iz parametara zahtjeva ili None
+    try:
+        year, month = int(params.get('year')), int(params.get('month'))
+    except (TypeError, ValueError):
+        return None
+    return (year, month) if 1 <= month <= 12 else None
+
+@login_required
+def send_period_payslips(request):
+    """Stavlja slanje svih platnih lista razdoblja u red."""
+    if request.method != "POST":
+        messages.error(request, "Neispravan zahtjev.")
+        return redirect('salaries')
+
+    period = _payslip_period(request.POST)
+    if period is None:
+        messages.error(request, "Neispravno razdoblje.")
+        return redirect('salaries')
+
+    from .utils.payslip_batch import queue_period_payslips
+    year, month = period
+    queue_period_payslips(year, month)
+    messages.success(request, f"Platne liste za {month:02d}/{year} stavljene su u red za slanje. Status slanja prikazan je uz svaku plaću.")
+    return redirect(f"{reverse('salaries')}?year={year}&month={month}")
+
+@login_required
+def download_period_payslips(request):
+    """Vraća ZIP arhivu s PDF-ovima svih platnih lista razdoblja."""
+    period = _payslip_period(request.GET)
+    if period is None:
+        messages.error(request, "Neispravno razdoblje.")
+        return redirect('salaries')
+
+    from .utils.payslip_batch import build_payslip_zip, payslip_zip_filename, process_period
+    year, month = period
+    salaries, result = process_period(year, month, send=False)
+    if not result.pdfs:
+        messages.error(request, f"Nema platnih lista za {month:02d}/{year}.")
+        return redirect(f"{reverse('salaries')}?year={year}&month={month}")
+
+    response = HttpResponse(build_payslip_zip(salaries, result.pdfs), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{payslip_zip_filename(year, month)}"'
+    return response
+
 @login_required
 def joppd_report(request):
     """Generiranje JOPPD izvještaja (XML)"""
@@ -1566,9 +1528,11 @@ def joppd_report(request):
             month = int(form.cleaned_data['month'])
             year = int(form.cleaned_data['year'])
 
+            # Raspon datuma umjesto __month/__year kako bi upit koristio indeks salary_payment_date_idx
+            _, last_day = monthrange(year, month)
             selected_salaries = Salary.objects.filter(
-                payment_date__month=month,
-                payment_date__year=year
+                payment_date__gte=date(year, month, 1),
+                payment_date__lte=date(year, month, last_day)
             ).select_related('employee', 'employee__company')
 
             if not selected_salaries.exists():
@@ -1671,8 +1635,16 @@ def _prepare_changes_display(current_record, previous_record, model):
     excluded_fields = {'id', 'history_id', 'history_date', 'history_type', 'history_user_id', 
                        'history_change_reason', 'last_updated', 'date_created'}
     
-    # Ako je zapis tipa 'izmjena' (~), izračunaj promjene
-    if current_record.history_type == '~' and previous_record:
+    # Ako je zapis tipa 'izmjena' (~), koristi spremljene razlike (ako postoje)
+    stored_changes = get_stored_changes(current_record) if current_record.history_type == '~' else None
+    if stored_changes is not None:
+        current_record.changes_display = [
+            (field.verbose_name or field.name, format_field_value(old_value), format_field_value(new_value))
+            for field, old_value, new_value in stored_changes
+        ]
+    
+    # Inače izračunaj promjene usporedbom s prethodnim zapisom
+    elif current_record.history_type == '~' and previous_record:
         current_record.changes_display = []
         
         # Dohvati sva polja modela (osim internih polja povijesti)
@@ -1732,6 +1704,11 @@ def view_history(request, model_name='general', object_id=None, user_id=None):
         'nontaxpaymtype':(NonTaxablePaymentType, 'Neoporeziv primitak'),
     }
         
+    # Modeli i filtri za povijesne tablice ovise o vrsti pregleda
+    history_models = [m for m in apps.get_models() if hasattr(m, 'history')]
+    history_filters = {}
+    model_display_name = None
+
     if model_name == 'user':
         # Prikaz povijesti za određenog korisnika
         history_type = 'user'
@@ -1743,57 +1720,14 @@ def view_history(request, model_name='general', object_id=None, user_id=None):
         if user_id:
             user = get_object_or_404(User, pk=user_id)
             title = f"Povijest korisnika: {user.get_full_name() or user.username}"
-            
-            # Dohvati sve modele koji koriste HistoricalRecords
-            model_list = [m for m in apps.get_models() if hasattr(m, 'history')]
-            
-            # Iteriraj kroz modele i dohvati zapise povijesti za ovog korisnika
-            for model in model_list:
-                records = list(model.history.filter(history_user_id=user_id)
-                            .select_related('history_user')
-                            .order_by('-history_date')[:30])
-                
-                # Dodaj naziv modela i instance_name svakom zapisu
-                for record in records:
-                    record.model_name = model._meta.verbose_name
-                    _set_instance_name(record)
-                
-                # Kreiraj parove (trenutni, prethodni) zapis za prikaz promjena
-                for i, current_record in enumerate(records):
-                    previous_record = records[i+1] if i < len(records)-1 else None
-                    _prepare_changes_display(current_record, previous_record, model)
-                    history_records.append((current_record, previous_record))
-            
-            # Sortiraj sve zapise po datumu silazno
-            if history_records:
-                history_records.sort(key=lambda x: x[0].history_date, reverse=True)
+            history_filters['history_user_id'] = user_id
+        else:
+            history_models = []
 
     elif model_name == 'general':
         # Općeniti pregled zadnjih promjena za sve modele
         history_type = 'general'
         title = "Općeniti pregled"
-        model_list = [m for m in apps.get_models() if hasattr(m, 'history')]
-        
-        for model in model_list:
-            history_model = model.history.model
-            # Dohvati zadnjih 20 zapisa povijesti za ovaj model, uključujući korisnika
-            records = list(history_model.objects.all()
-                         .select_related('history_user')
-                         .order_by('-history_date')[:20])
-            
-            # Dodaj naziv modela i instance_name svakom zapisu
-            for record in records:
-                record.model_name = model._meta.verbose_name
-                _set_instance_name(record)
-            
-            # Kreiraj parove (trenutni, prethodni) i pripremi changes_display
-            for i, current_record in enumerate(records):
-                previous_record = records[i+1] if i < len(records)-1 else None
-                _prepare_changes_display(current_record, previous_record, model)
-                history_records.append((current_record, previous_record))
-        
-        # Sortiraj sve zapise po datumu silazno
-        history_records.sort(key=lambda x: x[0].history_date, reverse=True)
         
     else:
         # Prikaz povijesti za određeni model ili specifični objekt tog modela
@@ -1803,33 +1737,43 @@ def view_history(request, model_name='general', object_id=None, user_id=None):
             # Ako model nije pronađen u mapi
             raise Http404("Model nije pronađen")
             
-        model, name = model_tuple # Dohvati model i njegov naziv
+        model, model_display_name = model_tuple # Dohvati model i njegov naziv
+        history_models = [model]
         
         if object_id:
             # Pregled za specifičan objekt
             obj = get_object_or_404(model, pk=object_id)
-            title = f"{name}: {obj}" # Postavi naslov stranice
+            title = f"{model_display_name}: {obj}" # Postavi naslov stranice
             # Filtriraj povijest samo za taj objekt
-            history_query = model.history.filter(id=object_id)
+            history_filters['id'] = object_id
         else:
             # Pregled za cijeli model
-            title = f"Povijest: {name}"
-            # Dohvati svu povijest za taj model
-            history_query = model.history.all()
-        
-        # Dohvati zapise povijesti i sortiraj ih po datumu silazno
-        records = list(history_query.select_related('history_user').order_by('-history_date'))
-        
-        # Dodaj naziv modela i formatiranu reprezentaciju instance svakom zapisu
-        for record in records:
-            record.model_name = name
-            _set_instance_name(record)
-        
-        # Pripremi parove zapisa (trenutni, prethodni) i izračunaj promjene
-        for i, current_record in enumerate(records):
-            previous_record = records[i+1] if i < len(records)-1 else None
-            _prepare_changes_display(current_record, previous_record, model)
-            history_records.append((current_record, previous_record))
+            title = f"Povijest: {model_display_name}"
+    
+    # Dohvati samo jednu stranicu zapisa (keyset straničenje spojeno u bazi)
+    page = fetch_history_page(
+        history_models,
+        filters=history_filters,
+        before=request.GET.get('before'),
+        after=request.GET.get('after'),
+    )
+    
+    # Prethodni zapis treba samo za stare zapise bez spremljenih razlika;
+    # dohvaćaju se zajedno za cijelu stranicu
+    needs_previous = [
+        record for record in page.records
+        if record.history_type == '~' and getattr(record, 'history_changes', None) is None
+    ]
+    attach_previous_records(needs_previous)
+
+    # Razlike se računaju samo za zapise na prikazanoj stranici
+    for current_record in page.records:
+        model = current_record.model_class
+        current_record.model_name = model_display_name or model._meta.verbose_name
+        _set_instance_name(current_record)
+        previous_record = getattr(current_record, 'previous_record', None)
+        _prepare_changes_display(current_record, previous_record, model)
+        history_records.append((current_record, previous_record))
     
     
     # Renderiraj predložak s pripremljenim podacima povijesti
@@ -1838,12 +1782,25 @@ def view_history(request, model_name='general', object_id=None, user_id=None):
         'title': title,
         'object_id': object_id,
         'history_type': history_type,
+        'newer_cursor': page.newer_cursor,
+        'older_cursor': page.older_cursor,
        # 'model_slug': model_list
     })
 
 
 def get_field_changes(current, previous):
     """Pomoćna funkcija: Dohvaća promjene između dvije verzije zapisa povijesti"""
+    # Koristi spremljene razlike ako su izračunate pri zapisivanju povijesti
+    stored_changes = get_stored_changes(current)
+    if stored_changes is not None:
+        return {
+            field.verbose_name or field.name: {
+                'old': format_field_value(old_value),
+                'new': format_field_value(new_value)
+            }
+            for field, old_value, new_value in stored_changes
+        }
+
     if not previous:
         # Ako nema prethodnog zapisa, nema promjena
         return {}
@@ -1904,101 +1861,19 @@ def tax_changes_2026(request):
 def send_invoice_email(request, invoice_id):
     """Šalje račun e-mailom klijentu."""
     if request.method == "POST":
-        invoice = get_object_or_404(Invoice, pk=invoice_id)
-        client = invoice.client # Dohvati klijenta
-        subject = invoice.subject # Dohvati subjekt
-        products = InvoiceProduct.objects.filter(invoice=invoice) # Dohvati proizvode
-        sender_name = invoice.subject.clientName
-        reply_to_email = invoice.subject.emailAddress 
-
-        url = "https://hub3.bigfish.software/api/v2/barcode"
-        headers = {'Content-Type': 'application/json'}
-        data = {
-            "renderer": "image",
-            "options": { "format": "png", "color": "#000000", "bgColor": "#ffffff", "scale": 3, "ratio": 3 },
-            "data": {
-                "amount": int(invoice.total100()),
-                "currency": invoice.currtext(),
-                "sender": {
-                    "name": client.clientName,
-                    "street": client.addressLine1,
-                    "place": client.postalCode + " " + client.province,
-                },
-                "receiver": {
-                    "name": subject.clientName[:25],
-                    "street": subject.addressLine1,
-                    "place": subject.postalCode + " " + subject.town,
-                    "iban": subject.IBAN,
-                    "model": "00",
-                    # Koristi metodu poziv_na_broj i očisti razmake/HR 00
-                    "reference": invoice.poziv_na_broj().replace('HR 00 ', '').replace(' ', ''),
-                },
-                "purpose": "",
-                "description": "Uplata po računu " + invoice.number,
-            }
-        }
-        barcode_image = None # Inicijaliziraj u slučaju greške
-        try:
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            response.raise_for_status() # Provjeri HTTP greške
-            barcode_image = base64.b64encode(response.content).decode()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Greška pri generiranju barkoda za račun {invoice.id}: {e}")
-            messages.error(request, "Greška pri generiranju barkoda za PDF.")
-        except Exception as e:
-             logger.error(f"Neočekivana greška pri generiranju barkoda za račun {invoice.id}: {e}")
-             messages.error(request, "Neočekivana greška pri generiranju barkoda.")
-
-        # Generiraj PDF za račun
-        template = get_template('invoice_export_view.html')
-        context = {
-            'invoice': invoice,
-            'products': products,
-            'client': client,
-            'subject': subject,
-            'barcode_image': barcode_image,
-            'request': request
-        }
-        html_content = template.render(context)
-        pdf_file = BytesIO()
+        invoice = get_object_or_404(Invoice.objects.select_related('client', 'subject'), pk=invoice_id)
+
+        # PDF računa (isti dokument kao za ispis i preuzimanje, iz cachea ako postoji)
         try:
-            bootstrap_css_path = os.path.join(settings.STATICFILES_DIRS[0], 'css/bootstrap.min.css')
-            stylesheets = [CSS(filename=bootstrap_css_path)]
-            # Proslijedi CSS WeasyPrintu
-            HTML(string=html_content).write_pdf(pdf_file, stylesheets=stylesheets)
-        except IndexError:
-             logger.error("STATICFILES_DIRS nije konfiguriran ili je prazan.")
-             messages.error(request, "Greška u konfiguraciji statičkih datoteka.")
-             return redirect('invoices')
-        except Exception as e:
+            pdf_bytes = get_invoice_pdf(invoice, referent=request.user)
+        except PdfRenderError as e:
             logger.error(f"Greška pri renderiranju PDF-a za račun {invoice.id}: {e}")
             messages.error(request, "Greška pri izradi PDF dokumenta.")
             return redirect('invoices') # Preusmjeri ako PDF ne uspije
 
-        # Generiraj sadržaj e-maila
-        email_subject = f"Račun {invoice.number} - {invoice.client.clientName}"
-        email_body = render_to_string('email_templates/invoice_email.html', {
-            'client_name': invoice.client.clientName,
-            'invoice_number': invoice.number,
-            'due_date': invoice.dueDate,
-            'total_amount': invoice.price_with_vat(),
-            'sender_name': sender_name, # Dodaj ime pošiljatelja u kontekst e-maila
-        })
-
-        # Pošalji e-mail (koristi email konfiguraciju za subjekt ako postoji)
-        success = send_email_with_attachment(
-            subject=email_subject,
-            body=email_body,
-            recipient_email=client.emailAddress,
-            attachment=pdf_file.getvalue(),
-            attachment_name=f"Racun_{invoice.number}.pdf",
-            sender_name=sender_name,
-            reply_to_email=reply_to_email,
-            company=subject
-        )
-
-        if success:
-            messages.success(request, f"E-mail s računom {invoice.number} uspješno poslan klijentu.")
+        # Stavi e-mail u red (koristi email konfiguraciju za subjekt ako postoji)
+        if queue_invoice_email(invoice, pdf_bytes):
+            messages.success(request, f"E-mail s računom {invoice.number} stavljen je u red za slanje klijentu.")
         else:
             messages.error(request, f"Greška pri slanju e-maila za račun {invoice.number}.")
 
@@ -2008,6 +1883,28 @@ def send_invoice_email(request, invoice_id):
         messages.error(request, "Neispravan zahtjev.")
         return redirect('invoices')
 
+@login_required
+def send_invoice_emails(request):
+    """Skupno šalje odabrane račune e-mailom (samo one koji još nisu poslani)."""
+    if request.method != "POST":
+        messages.error(request, "Neispravan zahtjev.")
+        return redirect('invoices')
+
+    # Bez izričitog odabira: stari računi nemaju emailed_at iako su možda već poslani
+    invoice_ids = [int(pk) for pk in request.POST.getlist('invoice_ids') if pk.isdigit()]
+    if not invoice_ids:
+        messages.error(request, "Niste odabrali nijedan račun.")
+        return redirect('invoices')
+
+    count = unsent_invoices().filter(pk__in=invoice_ids).count()
+    if not count:
+        messages.info(request, "Odabrani računi su već poslani ili čekaju u redu za slanje.")
+        return redirect('invoices')
+
+    queue_invoice_batch(invoice_ids, referent=request.user)
+    messages.success(request, f"Računi ({count}) stavljeni su u red za slanje. Već poslani računi su preskočeni.")
+    return redirect('invoices')
+
 @login_required
 def mark_invoice_paid(request, invoice_id):
     """Označava račun kao plaćen i postavlja datum plaćanja na trenutni dan."""
@@ -2043,7 +1940,7 @@ def mark_offer_finished(request, offer_id):
         invoice_products = []
         total = Decimal('0.00')
 
-        for offer_product in offer.offerproduct_set.all():
+        for offer_product in offer.offerproduct_set.select_related('product').order_by('pk'):
             # Kreiraj InvoiceProduct slično kao u create_invoice, uključujući sva polja
             invoice_product = InvoiceProduct(
                 invoice=invoice,
@@ -2064,9 +1961,15 @@ def mark_offer_finished(request, offer_id):
                 invoice.delete()  # Obriši nezavršen račun
                 return redirect('invoices')
 
-        # Spremi sve stavke računa
+        # Spremi sve stavke računa; račun se indeksira jednom nakon zadnje stavke
+        # umjesto pri spremanju svake stavke (vidi update_document_items_search_index)
         for invoice_product in invoice_products:
+            invoice_product._skip_parent_search_index = True
             invoice_product.save()
+        try:
+            search_index.index_instance(invoice)
+        except Exception as e:
+            logger.error(f"Greška pri indeksiranju računa {invoice.pk}: {e}")
 
         # Ponuda se zadržava u bazi podataka, samo se kreira kopija kao račun
         messages.success(request, f"Ponuda {offer.number} je pretvorena u račun {invoice.number}. Ponuda je zadržana u sustavu.")
@@ -2244,6 +2147,7 @@ def ai_chat(request):
                 filter_clients_to_string,
                 filter_products_to_string,
                 filter_change_history_to_string,
+                search_records,
                 get_employees_to_string,
                 get_salaries_to_string,
                 filter_offers_to_string,
@@ -2266,6 +2170,7 @@ def ai_chat(request):
                 "filter_clients_to_string": filter_clients_to_string,
                 "filter_products_to_string": filter_products_to_string,
                 "filter_change_history_to_string": filter_change_history_to_string,
+                "search_records": search_records,
                 "get_employees_to_string": get_employees_to_string,
                 "get_salaries_to_string": get_salaries_to_string,
                 "filter_offers_to_string": filter_offers_to_string,
@@ -2288,6 +2193,7 @@ def ai_chat(request):
                 "filter_clients_to_string": "pretraživanje klijenata",
                 "filter_products_to_string": "pretraživanje proizvoda",
                 "filter_change_history_to_string": "pretraživanje povijesti",
+                "search_records": "pretraživanje zapisa",
                 "get_employees_to_string": "dohvaćanje zaposlenika",
                 "get_salaries_to_string": "dohvaćanje plaća",
                 "filter_offers_to_string": "pretraživanje ponuda",
@@ -2575,7 +2481,7 @@ def retry_fiscalization(request, invoice_id):
         invoice = get_object_or_404(Invoice, pk=invoice_id)
         try:
             from arvello_fiscal.services.fiscal_service import FiscalService
-            FiscalService.fiscalize_invoice(invoice)
+            FiscalService.fiscalize_invoice(invoice, retry=True)
             messages.success(request, 'Fiskalizacija ponovno pokrenuta.')
         except Exception as e:
             messages.error(request, f'Greška pri fiskalizaciji: {e}')
@@ -3189,6 +3095,28 @@ def court_registry_config(request):
     return render(request, 'court_registry_config.html', context)
 
 
+def is_staff(user):
+    """Provjera je li korisnik djelatnik (is_staff)."""
+    return user.is_staff
+
+
+@login_required
+@user_passes_test(is_staff, login_url='invoices')
+def profiling_stats(request):
+    """
+    Zbirna mjerenja profiliranja zahtjeva po viewu za ovaj proces (JSON).
+    POST briše prikupljena mjerenja.
+    """
+    from .utils.request_profiler import PROFILE_STATS, profiling_enabled
+
+    if request.method == 'POST':
+        PROFILE_STATS.reset()
+    return JsonResponse({
+        'enabled': profiling_enabled(),
+        'views': PROFILE_STATS.snapshot(),
+    })
+
+
 @login_required
 def dashboard(request):
     """Prikazuje početnu stranicu s pregledom i statistikama."""
@@ -3199,18 +3127,18 @@ def dashboard(request):
     current_month_start = today.replace(day=1)
     
     # Invoice statistics for current month
-    invoices_this_month = Invoice.objects.filter(date__gte=current_month_start, date__lte=today)
+    invoices_this_month = Invoice.objects.filter(date__gte=current_month_start, date__lte=today).prefetch_related(INVOICE_LINES)
     context['invoices_count_month'] = invoices_this_month.count()
     context['revenue_month'] = sum(inv.price_with_vat() for inv in invoices_this_month)
     
     # Unpaid invoices
-    unpaid_invoices = Invoice.objects.filter(is_paid=False)
+    unpaid_invoices = Invoice.objects.filter(is_paid=False).prefetch_related(INVOICE_LINES)
     context['unpaid_count'] = unpaid_invoices.count()
     context['unpaid_amount'] = sum(inv.price_with_vat() for inv in unpaid_invoices)
     
     # Overdue invoices (unpaid and past due date)
-    overdue_invoices = Invoice.objects.filter(is_paid=False, dueDate__lt=today)
-    context['overdue_count'] = overdue_invoices.count()
+    overdue_invoices = [inv for inv in unpaid_invoices if inv.dueDate and inv.dueDate < today]
+    context['overdue_count'] = len(overdue_invoices)
     context['overdue_amount'] = sum(inv.price_with_vat() for inv in overdue_invoices)
     
     # Total counts
@@ -3220,10 +3148,10 @@ def dashboard(request):
     context['total_offers'] = Offer.objects.count()
     
     # Recent invoices (last 5)
-    context['recent_invoices'] = Invoice.objects.all().order_by('-date', '-id')[:5]
+    context['recent_invoices'] = Invoice.objects.select_related('client').prefetch_related(INVOICE_LINES).order_by('-date', '-id')[:5]
     
     # Recent offers (last 5)
-    context['recent_offers'] = Offer.objects.all().order_by('-date', '-id')[:5]
+    context['recent_offers'] = Offer.objects.select_related('client').prefetch_related(OFFER_LINES).order_by('-date', '-id')[:5]
     
     # Month name for display
     croatian_months = {
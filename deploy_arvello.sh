@@ -112,7 +112,7 @@ echo -e "\n${YELLOW}Instaliram stabilnu verziju Pillow-a...${NC}"
 pip install pillow==10.2.0
 
 if pip install -r /opt/arvello/arvello/requirements.txt && 
-   pip install gunicorn psycopg2-binary python-decouple; then
+   pip install gunicorn "psycopg[binary,pool]" python-decouple; then
    echo -e "${GREEN}Python virtualno okruženje uspješno postavljeno.${NC}"
 else
    echo -e "${RED}Neuspjelo postavljanje Python virtualnog okruženja. Molimo provjerite gornje poruke o greškama.${NC}"
@@ -133,6 +133,8 @@ DB_USER=$DB_USER
 DB_PASSWORD=$DB_PASSWORD
 DB_HOST=localhost
 DB_PORT=5432
+DB_CONN_MAX_AGE=60
+DB_POOL=False
 
 # Email postavke
 EMAIL_HOST=$EMAIL_HOST
@@ -149,17 +151,7 @@ cat > /opt/arvello/arvello/arvello/local_settings.py << 'EOF'
 from decouple import config
 import os
 
-# Postavke baze podataka
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432', cast=int),
-    }
-}
+# Baza podataka (PostgreSQL) postavlja se u settings.py iz DB_* varijabli u .env
 
 # Sigurnosne postavke
 DEBUG = config('DJANGO_DEBUG', default=False, cast=bool)
@@ -292,6 +284,25 @@ Restart=on-failure
 WantedBy=multi-user.target
 EOF
 
+# Postavljanje Systemd servisa za slanje e-pošte (računi i platne liste čekaju u redu OutgoingEmail)
+echo -e "\n${YELLOW}Postavljam Systemd servis za slanje e-pošte...${NC}"
+cat > /etc/systemd/system/arvello-mail.service << EOF
+[Unit]
+Description=Arvello mail worker
+After=network.target postgresql.service
+
+[Service]
+User=www-data
+Group=www-data
+WorkingDirectory=/opt/arvello/arvello/arvello
+ExecStart=/opt/arvello/venv/bin/python manage.py mail_worker
+Restart=always
+RestartSec=10
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Postavljanje odgovarajućih dozvola
 echo -e "\n${YELLOW}Postavljam odgovarajuće dozvole za datoteke...${NC}"
 chown -R www-data:www-data /opt/arvello
@@ -299,8 +310,8 @@ chmod -R 750 /opt/arvello
 
 # Pokretanje i omogućavanje servisa
 systemctl daemon-reload
-systemctl enable arvello
-systemctl start arvello
+systemctl enable arvello arvello-mail
+systemctl start arvello arvello-mail
 
 echo -e "\n${GREEN}Arvello instalacija je završena!${NC}"
 echo -e "\n${YELLOW}Informacije o sustavu:${NC}"
@@ -309,6 +320,7 @@ echo -e "    - http://${DOMAIN_NAME}"
 echo -e "    - http://${SERVER_IP}"
 echo -e "  • Direktan pristup Gunicorn-u: http://localhost:$HTTP_PORT (samo s lokalnog računala)"
 echo -e "  • VAŽNO: Za pristup s drugih računala koristite gore navedene URL-ove"
+echo -e "  • E-poštu iz reda šalje servis arvello-mail (systemctl status arvello-mail)"
 
 echo -e "\n${YELLOW}Admin vjerodajnice:${NC}"
 echo -e "  • Korisničko ime: $ADMIN_USER"